@@ -36,6 +36,9 @@ class ExecutorModule( object ):
                                                        *exeName.split( "/" ) )
     cls.__defaults[ 'ReconnectRetries' ] = 10
     cls.__defaults[ 'ReconnectSleep' ] = 5
+    #Tasks processed at the same time, and tasks received at once from the mind
+    cls.__defaults[ 'MaxTasks' ] = 1
+    cls.__defaults[ 'BatchSize' ] = 1
     cls.__defaults[ 'shifterProxy' ] = ''
     cls.__defaults[ 'shifterProxyLocation' ] = os.path.join( cls.__defaults[ 'WorkDirectory' ],
                                                              '.shifterCred' )
@@ -131,19 +134,47 @@ class ExecutorModule( object ):
     return result
 
   def _ex_processTask( self, taskId, taskStub ):
-    self.__properties[ 'shifterProxy' ] = self.ex_getOption( 'shifterProxy' )
-    self.__freezeTime = 0
-    self.__fastTrackEnabled = True
-    self.log.verbose( "Task %s: Received" % str( taskId ) )
-    result = self.__deserialize( taskId, taskStub )
+    result = self._ex_processTasks( [ ( taskId, taskStub ) ] )
     if not result[ 'OK' ]:
-      self.log.error( "Can not deserialize task", "Task %s: %s" % ( str( taskId ), result[ 'Message' ] ) )
       return result
-    taskObj = result[ 'Value' ]
+    return result[ 'Value' ][0][1]
+
+  def _ex_processTasks( self, taskList ):
+    """ Process a list of ( taskId, taskStub ). Returns the list of ( taskId, result )
+        where each result is what _ex_processTask returns for the task
+    """
+    self.__properties[ 'shifterProxy' ] = self.ex_getOption( 'shifterProxy' )
+    taskResults = {}
+    taskObjs = {}
+    for taskId, taskStub in taskList:
+      self.log.verbose( "Task %s: Received" % str( taskId ) )
+      result = self.__deserialize( taskId, taskStub )
+      if not result[ 'OK' ]:
+        self.log.error( "Can not deserialize task", "Task %s: %s" % ( str( taskId ), result[ 'Message' ] ) )
+        taskResults[ taskId ] = result
+      else:
+        taskObjs[ taskId ] = result[ 'Value' ]
     #Shifter proxy?
     result = self.__installShifterProxy()
     if not result[ 'OK' ]:
       return result
+    #Let the executor do what can be done for all the tasks at once
+    try:
+      result = self.prepareTasks( taskObjs )
+      if not isReturnStructure( result ):
+        raise Exception( "prepareTasks does not return a return structure" )
+      if not result[ 'OK' ]:
+        self.log.warn( "Cannot prepare tasks", result[ 'Message' ] )
+    except Exception:
+      self.log.exception( "Exception while preparing tasks %s" % taskObjs.keys() )
+    for taskId, _taskStub in taskList:
+      if taskId in taskObjs:
+        taskResults[ taskId ] = self.__processTaskObj( taskId, taskObjs[ taskId ] )
+    return S_OK( [ ( taskId, taskResults[ taskId ] ) for taskId, _taskStub in taskList ] )
+
+  def __processTaskObj( self, taskId, taskObj ):
+    self.__freezeTime = 0
+    self.__fastTrackEnabled = True
     #Execute!
     result = self.processTask( taskId, taskObj )
     if not isReturnStructure( result ):
@@ -191,6 +222,16 @@ class ExecutorModule( object ):
   def fastTrackDispatch( self, taskId, taskObj ):
     return S_OK()
 
+  ###
+  #  Batches of tasks
+  ###
+
+  def prepareTasks( self, taskObjs ):
+    """ Called with the dict taskId -> taskObj of the tasks received together, before
+        processing them one by one. Failures are only logged
+    """
+    return S_OK()
+
   ####
   # Need to overwrite this functions
   ####
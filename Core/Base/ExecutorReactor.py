@@ -64,6 +64,7 @@ class ExecutorReactor( object ):
       self.__mindName = mindName
       self.__modules = {}
       self.__maxTasks = 1
+      self.__batchSizes = {}
       self.__reconnectSleep = 1
       self.__reconnectRetries = 10
       self.__extraArgs = {}
@@ -77,6 +78,7 @@ class ExecutorReactor( object ):
     def addModule( self, name, exeClass ):
       self.__modules[ name ] = exeClass
       self.__maxTasks = max( self.__maxTasks, exeClass.ex_getOption( "MaxTasks" ) )
+      self.__batchSizes[ name ] = max( 1, exeClass.ex_getOption( "BatchSize" ) )
       self.__reconnectSleep = max( self.__reconnectSleep, exeClass.ex_getOption( "ReconnectSleep" ) )
       self.__reconnectRetries = max( self.__reconnectRetries, exeClass.ex_getOption( "ReconnectRetries" ) )
       self.__extraArgs[ name ] = exeClass.ex_getExtraArguments()
@@ -84,9 +86,11 @@ class ExecutorReactor( object ):
     def connect( self ):
       self.__msgClient = MessageClient( self.__mindName )
       self.__msgClient.subscribeToMessage( 'ProcessTask', self.__processTask )
+      self.__msgClient.subscribeToMessage( 'ProcessTasks', self.__processTasks )
       self.__msgClient.subscribeToDisconnect( self.__disconnected )
       result = self.__msgClient.connect( executorTypes = list( self.__modules.keys() ),
                                          maxTasks = self.__maxTasks,
+                                         batchSizes = self.__batchSizes,
                                          extraArgs = self.__extraArgs )
       if result[ 'OK' ]:
         self.__aliveLock.alive()
@@ -99,6 +103,7 @@ class ExecutorReactor( object ):
         gLogger.notice( "Trying to reconnect to %s" % self.__mindName )
         result = self.__msgClient.connect( executorTypes = list( self.__modules.keys() ),
                                            maxTasks = self.__maxTasks,
+                                           batchSizes = self.__batchSizes,
                                            extraArgs = self.__extraArgs )
 
         if result[ 'OK' ]:
@@ -149,15 +154,40 @@ class ExecutorReactor( object ):
       return self.__msgClient.sendMessage( msgObj )
 
     def __processTask( self, msgObj ):
-      eType = msgObj.eType
-      taskId = msgObj.taskId
-      taskStub = msgObj.taskStub
+      return self.__processBatch( msgObj.eType, [ ( msgObj.taskId, msgObj.taskStub ) ] )
 
-      result = self.__moduleProcess( eType, taskId, taskStub )
-      if not result[ 'OK' ]:
-        return self.__sendExecutorError( eType, taskId, result[ 'Message' ] )
-      msgName, taskStub, extra = result[ 'Value' ]
+    def __processTasks( self, msgObj ):
+      return self.__processBatch( msgObj.eType, zip( msgObj.taskIds, msgObj.taskStubs ) )
 
+    def __processBatch( self, eType, taskList ):
+      if not taskList:
+        return S_OK()
+      start = time.time()
+      result = self.__moduleProcess( eType, taskList )
+      if not result[ 'OK' ]:
+        #Every task in the batch has to get an answer
+        taskReplies = [ ( taskId, ( 'ExecutorError', taskStub, result[ 'Message' ] ) )
+                        for taskId, taskStub in taskList ]
+      else:
+        taskReplies = result[ 'Value' ]
+      failed = []
+      for taskId, taskReply in taskReplies:
+        result = self.__sendTaskReply( eType, taskId, taskReply )
+        if not result[ 'OK' ]:
+          gLogger.error( "Could not send reply for task", "%s: %s" % ( taskId, result[ 'Message' ] ) )
+          failed.append( taskId )
+      if failed:
+        return S_ERROR( "Could not send the replies for tasks %s" % failed )
+      if len( taskList ) > 1:
+        elapsed = time.time() - start
+        gLogger.info( "Processed %s %s tasks in %.2f secs (%.1f tasks/sec)" % ( len( taskList ), eType, elapsed,
+                                                                             len( taskList ) / max( elapsed, 0.001 ) ) )
+      return S_OK()
+
+    def __sendTaskReply( self, eType, taskId, taskReply ):
+      msgName, taskStub, extra = taskReply
+      if msgName == "ExecutorError":
+        return self.__sendExecutorError( eType, taskId, extra )
       result = self.__msgClient.createMessage( msgName )
       if not result[ 'OK' ]:
         return self.__sendExecutorError( eType, taskId, "Can't generate %s message: %s" % ( msgName, result[ 'Message' ] ) )
@@ -172,33 +202,56 @@ class ExecutorReactor( object ):
         msgObj.freezeTime = extra
       return self.__msgClient.sendMessage( msgObj )
 
-
-    def __moduleProcess( self, eType, taskId, taskStub, fastTrackLevel = 0 ):
+    def __moduleProcess( self, eType, taskList, fastTrackLevel = 0 ):
+      """ Process the list of ( taskId, taskStub ) with the eType executor. Returns the list
+          of ( taskId, ( msgName, taskStub, extra ) ) with the message to send back for each task
+      """
       result = self.__getInstance( eType )
       if not result[ 'OK' ]:
         return result
       modInstance = result[ 'Value' ]
+      taskIds = [ taskId for taskId, _taskStub in taskList ]
       try:
-        result = modInstance._ex_processTask( taskId, taskStub )
+        result = modInstance._ex_processTasks( taskList )
       except Exception, excp:
-        gLogger.exception( "Error while processing task %s" % taskId )
-        return S_ERROR( "Error processing task %s: %s" % ( taskId, excp ) )
+        gLogger.exception( "Error while processing tasks %s" % taskIds )
+        return S_ERROR( "Error processing tasks %s: %s" % ( taskIds, excp ) )
 
       self.__storeInstance( eType, modInstance )
 
       if not result[ 'OK' ]:
-        return S_OK( ( 'TaskError', taskStub, "Error: %s" % result[ 'Message' ] ) )
-      taskStub, freezeTime, fastTrackType = result[ 'Value' ]
-      if freezeTime:
-        return S_OK( ( "TaskFreeze", taskStub, freezeTime ) )
-      if fastTrackType:
-        if fastTrackLevel < 10 and fastTrackType in self.__modules:
-          gLogger.notice( "Fast tracking task %s to %s" % ( taskId, fastTrackType ) )
-          return self.__moduleProcess( fastTrackType, taskId, taskStub, fastTrackLevel + 1 )
-        else:
+        return S_OK( [ ( taskId, ( 'TaskError', taskStub, "Error: %s" % result[ 'Message' ] ) )
+                       for taskId, taskStub in taskList ] )
+      taskStubs = dict( taskList )
+      taskReplies = {}
+      fastTracks = {}
+      for taskId, taskResult in result[ 'Value' ]:
+        if not taskResult[ 'OK' ]:
+          taskReplies[ taskId ] = ( 'TaskError', taskStubs[ taskId ], "Error: %s" % taskResult[ 'Message' ] )
+          continue
+        taskStub, freezeTime, fastTrackType = taskResult[ 'Value' ]
+        if freezeTime:
+          taskReplies[ taskId ] = ( "TaskFreeze", taskStub, freezeTime )
+          continue
+        if fastTrackType:
+          if fastTrackLevel < 10 and fastTrackType in self.__modules:
+            gLogger.notice( "Fast tracking task %s to %s" % ( taskId, fastTrackType ) )
+            fastTracks.setdefault( fastTrackType, [] ).append( ( taskId, taskStub ) )
+            continue
           gLogger.notice( "Stopping %s fast track. Sending back to the mind" % ( taskId ) )
-      
-      return S_OK( ( "TaskDone", taskStub, True ) )
+        taskReplies[ taskId ] = ( "TaskDone", taskStub, True )
+
+      #Tasks going to the same executor are fast tracked together
+      for fastTrackType in fastTracks:
+        result = self.__moduleProcess( fastTrackType, fastTracks[ fastTrackType ], fastTrackLevel + 1 )
+        if not result[ 'OK' ]:
+          #Only the tasks of this sub batch failed. Keep the replies of the rest
+          for taskId, taskStub in fastTracks[ fastTrackType ]:
+            taskReplies[ taskId ] = ( 'ExecutorError', taskStub, result[ 'Message' ] )
+          continue
+        taskReplies.update( dict( result[ 'Value' ] ) )
+
+      return S_OK( [ ( taskId, taskReplies[ taskId ] ) for taskId in taskIds ] )
 
 
   #####
@@ -20,6 +20,34 @@ class _MagicMethod( object ):
   def __str__( self ):
     return "<RPCClient method %s>" % self.__remoteFuncName
 
+class RPCBatch( object ):
+  """ Collect RPC calls to execute them all through one connection:
+
+        batch = rpcClient.getBatch()
+        batch.getReplicas( lfnList1 )
+        batch.getReplicas( lfnList2 )
+        result = batch.execute()
+  """
+
+  def __init__( self, rpcClient ):
+    self.__rpcClient = rpcClient
+    self.__calls = []
+
+  def __addCall( self, sFunctionName, args ):
+    self.__calls.append( ( sFunctionName, args ) )
+    return len( self.__calls ) - 1
+
+  def __getattr__( self, attrName ):
+    return _MagicMethod( self.__addCall, attrName )
+
+  def execute( self, maxInFlight = 20 ):
+    """
+    Execute the collected calls. Returns S_OK( list of results in the order the calls were added )
+    """
+    calls = self.__calls
+    self.__calls = []
+    return self.__rpcClient.executeBatch( calls, maxInFlight )
+
 class RPCClient( object ):
 
   def __init__( self, *args, **kwargs ):
@@ -35,6 +63,24 @@ class RPCClient( object ):
     retVal = self.__innerRPCClient.executeRPC( sFunctionName, args )
     return retVal
 
+  def executeBatch( self, calls, maxInFlight = 20 ):
+    """
+    Execute several RPC calls through one connection. The service executes them concurrently
+
+    :type calls: list
+    :param calls: ( function name, args tuple ) of each call
+    :type maxInFlight: int
+    :param maxInFlight: Max number of requests sent without having received their reply
+    :return: S_OK( list of the results of the calls in the same order )
+    """
+    return self.__innerRPCClient.executeBatchRPC( calls, maxInFlight )
+
+  def getBatch( self ):
+    """
+    Get an object to collect calls and execute them as a batch
+    """
+    return RPCBatch( self )
+
   def __getattr__( self, attrName ):
     """
     Function for emulating the existance of functions
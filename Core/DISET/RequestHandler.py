@@ -13,7 +13,7 @@ from DIRAC.Core.DISET.private.FileHelper import FileHelper
 from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR, isReturnStructure
 from DIRAC.FrameworkSystem.Client.Logger import gLogger
 from DIRAC.ConfigurationSystem.Client.Config import gConfig
-from DIRAC.Core.Utilities import Time
+from DIRAC.Core.Utilities import Time, DEncode
 
 def getServiceOption( serviceInfo, optionName, defaultValue ):
   """ Get service option resolving default values from the master service
@@ -132,12 +132,80 @@ class RequestHandler( object ):
       message = "Method %s for action %s does not return a S_OK/S_ERROR!" % ( actionTuple[1], actionTuple[0] )
       gLogger.error( message )
       retVal = S_ERROR( message )
+    if retVal[ 'OK' ] and isinstance( retVal.get( 'Value' ), types.GeneratorType ):
+      #RPC methods can return generators to stream big results
+      if self.__getClientOptions( proposalTuple ).get( 'streaming' ):
+        result = self.__sendStream( actionTuple[1], retVal[ 'Value' ] )
+        if not result[ 'OK' ]:
+          return result
+        self.__logRemoteQueryResponse( result[ 'Value' ], time.time() - startTime )
+        return S_OK()
+      try:
+        retVal = S_OK( list( retVal[ 'Value' ] ) )
+      except Exception as e:
+        gLogger.exception( "Uncaught exception when generating RPC result", "Function %s" % actionTuple[1] )
+        retVal = S_ERROR( "Server error while serving %s: %s" % ( actionTuple[1], str( e ) ) )
     self.__logRemoteQueryResponse( retVal, time.time() - startTime )
     result = self.__trPool.send( self.__trid, retVal ) #this will delete the value from the S_OK(value)
     del retVal
     retVal = None
     return result
     
+  @staticmethod
+  def __getClientOptions( proposalTuple ):
+    """ Options sent by the client on how to handle the connection
+    """
+    if len( proposalTuple ) > 3 and isinstance( proposalTuple[3], dict ):
+      return proposalTuple[3]
+    return {}
+
+  def __sendStream( self, method, generator ):
+    """
+    Send the items yielded by a generator in chunks of about StreamChunkSize bytes.
+    The stream is finished with an empty chunk and the final status of the call
+
+    :type method: string
+    :param method: Method that returned the generator
+    :return: S_OK( final status sent ) / S_ERROR if the stream could not be sent
+    """
+    result = S_OK()
+    result[ 'streamed' ] = True
+    retVal = self.__trPool.send( self.__trid, result )
+    if not retVal[ 'OK' ]:
+      return retVal
+    transport = self.__trPool.get( self.__trid )
+    chunkSize = self.srv_getCSOption( "StreamChunkSize", 1048576 )
+    chunk = []
+    chunkLen = 0
+    numItems = 0
+    try:
+      for item in generator:
+        encodedItem = DEncode.encode( item )
+        chunk.append( encodedItem )
+        chunkLen += len( encodedItem )
+        numItems += 1
+        if chunkLen >= chunkSize:
+          retVal = transport.sendEncodedData( "l%se" % "".join( chunk ) )
+          if not retVal[ 'OK' ]:
+            return retVal
+          chunk = []
+          chunkLen = 0
+      if chunk:
+        retVal = transport.sendEncodedData( "l%se" % "".join( chunk ) )
+        if not retVal[ 'OK' ]:
+          return retVal
+      result = S_OK( numItems )
+    except Exception as e:
+      gLogger.exception( "Uncaught exception when streaming RPC result", "Function %s" % method )
+      result = S_ERROR( "Server error while streaming %s: %s" % ( method, str( e ) ) )
+    retVal = transport.sendEncodedData( "le" )
+    if not retVal[ 'OK' ]:
+      return retVal
+    retVal = self.__trPool.send( self.__trid, result )
+    if not retVal[ 'OK' ]:
+      return retVal
+    return S_OK( result )
+
 #####
 #
 # File to/from Server Methods
@@ -157,11 +225,16 @@ class RequestHandler( object ):
       raise RequestHandler.ConnectionError( "Error while receiving file description %s %s" % ( self.srv_getFormattedRemoteCredentials(),
                                                                                 retVal[ 'Message' ] ) )
     fileInfo = retVal[ 'Value' ]
+    #Clients able to stream the data ask for it in the header
+    streamTransfer = retVal.get( 'StreamTransfer', False )
     sDirection = "%s%s" % ( sDirection[0].lower(), sDirection[1:] )
     if "transfer_%s" % sDirection not in dir( self ):
       self.__trPool.send( self.__trid, S_ERROR( "Service can't transfer files %s" % sDirection ) )
       return
-    retVal = self.__trPool.send( self.__trid, S_OK( "Accepted" ) )
+    acceptance = S_OK( "Accepted" )
+    if streamTransfer:
+      acceptance[ 'StreamTransfer' ] = True
+    retVal = self.__trPool.send( self.__trid, acceptance )
     if not retVal[ 'OK' ]:
       return retVal
     self.__logRemoteQuery( "FileTransfer/%s" % sDirection, fileInfo )
@@ -170,6 +243,8 @@ class RequestHandler( object ):
     try:
       try:
         fileHelper = FileHelper( self.__trPool.get( self.__trid ) )
+        if streamTransfer:
+          fileHelper.enableStreaming()
         if sDirection == "fromClient":
           fileHelper.setDirection( "fromClient" )
           uRetVal = self.transfer_fromClient( fileInfo[0], fileInfo[1], fileInfo[2], fileHelper )
@@ -237,7 +312,34 @@ class RequestHandler( object ):
     self.__logRemoteQuery( "RPC/%s" % method, args )
     return self.__RPCCallFunction( method, args )
 
-  def __RPCCallFunction( self, method, args ):
+  def _rh_executeMultiplexedRPC( self, method, args ):
+    """
+    Execute an RPC received through a multiplexed connection. The result is
+    returned instead of being sent, the service tags it with the request id
+
+    :type method: string
+    :param method: Method to execute
+    :return: S_OK/S_ERROR
+    """
+    self.serviceInfoDict[ 'actionTuple' ] = ( 'RPC', method )
+    startTime = time.time()
+    self.__logRemoteQuery( "RPC/%s" % method, args )
+    #The connection is being read by the service to get more requests
+    retVal = self.__RPCCallFunction( method, args, idleRead = False )
+    if not isReturnStructure( retVal ):
+      message = "Method %s for action RPC does not return a S_OK/S_ERROR!" % method
+      gLogger.error( message )
+      retVal = S_ERROR( message )
+    if retVal[ 'OK' ] and isinstance( retVal.get( 'Value' ), types.GeneratorType ):
+      try:
+        retVal = S_OK( list( retVal[ 'Value' ] ) )
+      except Exception as e:
+        gLogger.exception( "Uncaught exception when generating RPC result", "Function %s" % method )
+        retVal = S_ERROR( "Server error while serving %s: %s" % ( method, str( e ) ) )
+    self.__logRemoteQueryResponse( retVal, time.time() - startTime )
+    return retVal
+
+  def __RPCCallFunction( self, method, args, idleRead = True ):
     realMethod = "export_%s" % method
     gLogger.debug( "RPC to %s" % realMethod )
     try:
@@ -248,16 +350,18 @@ class RequestHandler( object ):
     if not dRetVal[ 'OK' ]:
       return dRetVal
     self.__lockManager.lock( "RPC/%s" % method )
-    self.__msgBroker.addTransportId( self.__trid,
-                                     self.serviceInfoDict[ 'serviceName' ],
-                                     idleRead = True )
+    if idleRead:
+      self.__msgBroker.addTransportId( self.__trid,
+                                       self.serviceInfoDict[ 'serviceName' ],
+                                       idleRead = True )
     try:
       try:
         uReturnValue = oMethod( *args )
         return uReturnValue
       finally:
         self.__lockManager.unlock( "RPC/%s" % method )
-        self.__msgBroker.removeTransport( self.__trid, closeTransport = False )
+        if idleRead:
+          self.__msgBroker.removeTransport( self.__trid, closeTransport = False )
     except Exception, v:
       gLogger.exception( "Uncaught exception when serving RPC", "Function %s" % method )
       return S_ERROR( "Server error while serving %s: %s" % ( method, str( v ) ) )
@@ -9,15 +9,25 @@
   - loads the required modules using the ServiceReactor.loadAgentModules method
   - starts the execution loop using the ServiceReactor.serve() method
 
+  Services with the WorkerProcesses option run in that number of forked worker
+  processes listening in the same port. The original process only supervises them:
+  sending it SIGHUP restarts the workers one by one (each old worker is stopped once
+  its replacement is ready) and SIGTERM stops them once the queries they are serving
+  finish. Modules are loaded before forking, so code changes need a full restart.
+
   Service modules must be placed under the Service directory of a DIRAC System.
   DIRAC Systems are called XXXSystem where XXX is the [DIRAC System Name], and
   must inherit from the base class RequestHandler
 
 """
 
+import os
+import sys
 import select
 import time
 import socket
+import signal
+import Queue
 
 try:
   import multiprocessing
@@ -28,9 +38,12 @@ from DIRAC import gLogger, S_OK, S_ERROR
 from DIRAC.Core.DISET.private.Service import Service
 from DIRAC.Core.DISET.private.GatewayService import GatewayService
 from DIRAC.Core.DISET.RequestHandler import RequestHandler
-from DIRAC.Core.Utilities import Time
+from DIRAC.Core.Utilities import Time, Network
+from DIRAC.Core.Utilities.LockRing import LockRing
+from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
 from DIRAC.Core.Base.private.ModuleLoader import ModuleLoader
 from DIRAC.Core.DISET.private.Protocols import gProtocolDict
+from DIRAC.Core.DISET.private import EventReactor
 from DIRAC.ConfigurationSystem.Client.Helpers import Registry
 from DIRAC.ConfigurationSystem.Client import PathFinder
 
@@ -39,6 +52,8 @@ class ServiceReactor( object ):
   __transportExtraKeywords = { 'SSLSessionTimeout' : False, 
                                'IgnoreCRLs': False, 
                                'PacketTimeout': 'timeout' }
+  __workerStartTimeout = 300
+  __workerStatsPeriod = 60
 
   def __init__( self ):
     self.__services = {}
@@ -50,6 +65,11 @@ class ServiceReactor( object ):
     self.__maxFD = 0
     self.__listeningConnections = {}
     self.__stats = ReactorStats()
+    self.__eventReactor = None
+    self.__numWorkers = 1
+    self.__workers = {}
+    self.__reusePort = False
+    self.__restartRequested = False
 
   def initialize( self, servicesList ):
     try:
@@ -67,6 +87,16 @@ class ServiceReactor( object ):
     for serviceName in self.__serviceModules:
       self.__services[ serviceName ] = Service( self.__serviceModules[ serviceName ] )
 
+    self.__numWorkers = max( [ self.__services[ serviceName ].getConfig().getWorkerProcesses()
+                               for serviceName in self.__services ] )
+    if self.__numWorkers > 1 and not multiprocessing:
+      gLogger.warn( "multiprocessing is not available. Running in one process" )
+      self.__numWorkers = 1
+    if self.__numWorkers > 1:
+      #Each worker process initializes its own services
+      gLogger.info( "Services will run in %s worker processes" % self.__numWorkers )
+      return S_OK()
+
     #Loop again to include the GW in case there is one (included in the __init__)
     for serviceName in self.__services:
       gLogger.info( "Initializing %s" % serviceName )
@@ -86,7 +116,7 @@ class ServiceReactor( object ):
         del( self.__listeningConnections[ svcName ][ 'transport' ] )
     gLogger.info( "Connections closed" )
 
-  def __createListeners( self ):
+  def __createListeners( self, reusePort = False ):
     for serviceName in self.__services:
       svcCfg = self.__services[ serviceName ].getConfig()
       protocol = svcCfg.getProtocol()
@@ -106,6 +136,8 @@ class ServiceReactor( object ):
           if kw == 'timeout':
             value = int( value )
           transportArgs[ kw ] = value
+      if reusePort:
+        transportArgs[ 'reusePort' ] = True
       gLogger.verbose( "Initializing %s transport" % protocol, svcCfg.getURL() )
       transport = gProtocolDict[ protocol ][ 'transport' ]( ( "", port ),
                                                             bServerMode = True, **transportArgs )
@@ -117,29 +149,281 @@ class ServiceReactor( object ):
     return S_OK()
 
   def serve( self ):
+    if self.__numWorkers > 1:
+      return self.__serveWithWorkers()
     result = self.__createListeners()
     if not result[ 'OK' ]:
       self.__closeListeningConnections()
       return result
     for svcName in self.__listeningConnections:
       gLogger.always( "Listening at %s" % self.__services[ svcName ].getConfig().getURL() )
-    #Multiple clones not yet working. Disabled by default
-    if False and multiprocessing:
-      for svcName in self.__listeningConnections:
-        clones = self.__services[ svcName ].getConfig().getCloneProcesses()
-        for i in range( 1, clones ):
-          p = multiprocessing.Process( target = self.__startCloneProcess, args = ( svcName, i ) )
-          p.start()
-          gLogger.always( "Started clone process %s for %s" % ( i, svcName ) )
+    #Stop serving on SIGTERM and SIGINT so the services are finalized ( and flush what they buffer )
+    try:
+      signal.signal( signal.SIGTERM, self.__stopSignalHandler )
+      signal.signal( signal.SIGINT, self.__stopSignalHandler )
+    except ValueError:
+      #Not in the main thread, nothing can be done about the signals
+      pass
+    try:
+      self.__serveConnections()
+    finally:
+      self.__finalizeServices()
+
+  def __finalizeServices( self ):
+    for svcName in self.__services:
+      result = self.__services[ svcName ].finalize()
+      if not result[ 'OK' ]:
+        gLogger.error( "Cannot finalize %s" % svcName, result[ 'Message' ] )
+
+  def __serveConnections( self ):
+    if self.__setupEventReactor():
+      while self.__alive:
+        result = self.__eventReactor.processEvents( 10 )
+        if not result[ 'OK' ]:
+          gLogger.error( "Error while processing events", result[ 'Message' ] )
+          time.sleep( 0.001 )
+      return
     while self.__alive:
       self.__acceptIncomingConnection()
 
-  #This function runs in a different process
-  def __startCloneProcess( self, svcName, i ):
-    self.__services[ svcName ].setCloneProcessId( i )
-    self.__alive = i
+  def __stopSignalHandler( self, signum, frame ):
+    self.__alive = False
+
+  def __restartSignalHandler( self, signum, frame ):
+    self.__restartRequested = True
+
+  def __serveWithWorkers( self ):
+    """ Start the worker processes and supervise them until stopped
+    """
+    #With SO_REUSEPORT each worker opens its own listening sockets and the kernel
+    #balances the connections. Otherwise they share the ones opened here: every idle
+    #worker waits in accept() on the inherited socket and the kernel hands each connection
+    #to one of them. Accepting in this process and passing the connections to the workers
+    #( multiprocessing.reduction.send_handle ) would balance them the same way, but with
+    #an extra hop per connection through the supervisor, that would then stop all the
+    #workers from getting connections whenever it's busy or restarting one of them
+    self.__reusePort = Network.isReusePortAvailable()
+    if not self.__reusePort:
+      gLogger.info( "SO_REUSEPORT is not available. Worker processes will share the listening sockets" )
+      result = self.__createListeners()
+      if not result[ 'OK' ]:
+        self.__closeListeningConnections()
+        return result
+    for svcName in self.__services:
+      self.__services[ svcName ].initWorkersMonitoring()
+    self.__workersStatsQueue = multiprocessing.Queue()
+    self.__workersStats = dict( [ ( svcName, {} ) for svcName in self.__services ] )
+    self.__lastWorkersStats = dict( [ ( svcName, {} ) for svcName in self.__services ] )
+    self.__lastWorkersStatsReport = time.time()
+    signal.signal( signal.SIGTERM, self.__stopSignalHandler )
+    signal.signal( signal.SIGINT, self.__stopSignalHandler )
+    signal.signal( signal.SIGHUP, self.__restartSignalHandler )
+    for workerId in range( self.__numWorkers ):
+      result = self.__startWorker( workerId )
+      if not result[ 'OK' ]:
+        self.__stopWorkers()
+        self.__closeListeningConnections()
+        return result
+    for svcName in self.__services:
+      svcCfg = self.__services[ svcName ].getConfig()
+      gLogger.always( "Listening at %s with %s workers" % ( svcCfg.getURL(), svcCfg.getWorkerProcesses() ) )
     while self.__alive:
-      self.__acceptIncomingConnection( svcName )
+      self.__processWorkersStats()
+      if self.__restartRequested:
+        self.__restartRequested = False
+        self.__restartWorkers()
+      self.__respawnDeadWorkers()
+    gLogger.always( "Stopping worker processes" )
+    self.__stopWorkers()
+    self.__closeListeningConnections()
+    return S_OK()
+
+  def __getWorkerServices( self, workerId ):
+    return [ svcName for svcName in self.__services
+             if self.__services[ svcName ].getConfig().getWorkerProcesses() > workerId ]
+
+  def __getWorkerStopTimeout( self ):
+    return max( [ self.__services[ svcName ].getConfig().getWorkerStopTimeout()
+                  for svcName in self.__services ] )
+
+  def __startWorker( self, workerId ):
+    """ Start a worker process and wait until it is ready to serve
+    """
+    readyEvent = multiprocessing.Event()
+    process = multiprocessing.Process( target = self.__runWorker, args = ( workerId, readyEvent ) )
+    process.start()
+    startTime = time.time()
+    while not readyEvent.is_set():
+      if not process.is_alive():
+        process.join()
+        return S_ERROR( "Worker %s exited while starting with code %s" % ( workerId, process.exitcode ) )
+      if time.time() - startTime > self.__workerStartTimeout:
+        self.__stopWorker( process )
+        return S_ERROR( "Worker %s did not start in %s seconds" % ( workerId, self.__workerStartTimeout ) )
+      readyEvent.wait( 1 )
+    self.__workers[ workerId ] = ( process, startTime )
+    gLogger.info( "Started worker %s with pid %s" % ( workerId, process.pid ) )
+    return S_OK( process )
+
+  def __stopWorker( self, process, timeout = 0 ):
+    """ Ask a worker to stop and kill it if it doesn't finish in time
+    """
+    if process.is_alive():
+      process.terminate()
+      process.join( timeout + 10 )
+    if process.is_alive():
+      gLogger.warn( "Worker with pid %s did not stop. Killing it" % process.pid )
+      os.kill( process.pid, signal.SIGKILL )
+      process.join()
+
+  def __stopWorkers( self ):
+    #Let all of them finish their queries at the same time
+    for workerId in self.__workers:
+      process = self.__workers[ workerId ][0]
+      if process.is_alive():
+        process.terminate()
+    timeout = self.__getWorkerStopTimeout()
+    for workerId in self.__workers:
+      self.__stopWorker( self.__workers[ workerId ][0], timeout )
+    self.__workers = {}
+
+  def __restartWorkers( self ):
+    """ Replace the workers one by one. The old one is only stopped once the new one is ready
+    """
+    gLogger.always( "Restarting worker processes" )
+    timeout = self.__getWorkerStopTimeout()
+    for workerId in sorted( self.__workers ):
+      oldProcess = self.__workers[ workerId ][0]
+      result = self.__startWorker( workerId )
+      if not result[ 'OK' ]:
+        gLogger.error( "Cannot restart worker. Keeping the running ones", result[ 'Message' ] )
+        return
+      self.__stopWorker( oldProcess, timeout )
+    gLogger.always( "Worker processes restarted" )
+
+  def __respawnDeadWorkers( self ):
+    now = time.time()
+    for workerId in sorted( self.__workers ):
+      process, startTime = self.__workers[ workerId ]
+      if process.is_alive():
+        continue
+      #Don't start them again in a tight loop if they keep dying
+      if now - startTime < 10:
+        continue
+      process.join()
+      gLogger.error( "Worker process died", "%s (pid %s) exited with code %s" % ( workerId, process.pid,
+                                                                                   process.exitcode ) )
+      for svcName in self.__workersStats:
+        self.__workersStats[ svcName ].pop( workerId, None )
+      result = self.__startWorker( workerId )
+      if not result[ 'OK' ]:
+        gLogger.error( "Cannot start worker again", result[ 'Message' ] )
+        self.__workers[ workerId ] = ( process, time.time() )
+
+  def __processWorkersStats( self, timeout = 1 ):
+    """ Collect the figures sent by the workers and report them aggregated
+    """
+    block = True
+    while True:
+      try:
+        workerId, svcName, stats = self.__workersStatsQueue.get( block, timeout )
+      except ( Queue.Empty, IOError ):
+        #IOError if interrupted by a signal
+        break
+      block = False
+      if svcName in self.__workersStats:
+        self.__workersStats[ svcName ][ workerId ] = stats
+    now = time.time()
+    if now - self.__lastWorkersStatsReport < self.__workerStatsPeriod:
+      return
+    self.__lastWorkersStatsReport = now
+    for svcName in self.__services:
+      self.__services[ svcName ].addWorkersMarks( self.__workersStats[ svcName ],
+                                                  self.__lastWorkersStats[ svcName ] )
+      self.__lastWorkersStats[ svcName ] = dict( self.__workersStats[ svcName ] )
+
+  def __sendWorkerStats( self, workerId ):
+    for svcName in self.__services:
+      self.__workersStatsQueue.put( ( workerId, svcName, self.__services[ svcName ].getWorkerStats() ) )
+
+  #This function runs in the worker processes
+  def __runWorker( self, workerId, readyEvent ):
+    #Locks held by the threads of the parent when forking would never be released here
+    LockRing()._openAll()
+    gThreadScheduler.restartAfterFork()
+    self.__alive = True
+    signal.signal( signal.SIGTERM, self.__stopSignalHandler )
+    signal.signal( signal.SIGINT, signal.SIG_IGN )
+    signal.signal( signal.SIGHUP, signal.SIG_IGN )
+    svcNames = self.__getWorkerServices( workerId )
+    self.__services = dict( [ ( svcName, self.__services[ svcName ] ) for svcName in svcNames ] )
+    for svcName in list( self.__listeningConnections ):
+      if svcName not in self.__services:
+        #Not closed, it would be shut down for the other processes too
+        del self.__listeningConnections[ svcName ]
+    for svcName in svcNames:
+      gLogger.info( "Initializing %s in worker %s" % ( svcName, workerId ) )
+      self.__services[ svcName ].setCloneProcessId( workerId )
+      result = self.__services[ svcName ].initialize()
+      if not result[ 'OK' ]:
+        gLogger.fatal( "Cannot initialize %s" % svcName, result[ 'Message' ] )
+        sys.exit( 1 )
+    if self.__reusePort:
+      result = self.__createListeners( reusePort = True )
+      if not result[ 'OK' ]:
+        gLogger.fatal( "Cannot create listening sockets", result[ 'Message' ] )
+        sys.exit( 1 )
+    result = gThreadScheduler.addPeriodicTask( self.__workerStatsPeriod, self.__sendWorkerStats, ( workerId, ) )
+    if not result[ 'OK' ]:
+      gLogger.error( "Cannot add stats task to thread scheduler", result[ 'Message' ] )
+    readyEvent.set()
+    self.__serveConnections()
+    #Stop accepting connections and let the queries in progress finish
+    if self.__reusePort:
+      self.__closeListeningConnections()
+    timeout = time.time() + self.__getWorkerStopTimeout()
+    while time.time() < timeout:
+      busy = 0
+      for svcName in self.__services:
+        stats = self.__services[ svcName ].getWorkerStats()
+        busy += stats[ 'activeQueries' ] + stats[ 'pendingQueries' ]
+      if not busy:
+        break
+      time.sleep( 0.1 )
+    self.__finalizeServices()
+    self.__sendWorkerStats( workerId )
+    gLogger.info( "Worker %s stopped" % workerId )
+
+  def __setupEventReactor( self ):
+    """ Use an epoll event loop if any service has the EventReactor option enabled.
+        Otherwise each connection is served in its own thread
+    """
+    svcNames = [ svcName for svcName in self.__services
+                 if self.__services[ svcName ].getConfig().getEventReactor() ]
+    if not svcNames:
+      return False
+    if not EventReactor.isAvailable():
+      gLogger.warn( "epoll is not available. Serving each connection in its own thread" )
+      return False
+    self.__eventReactor = EventReactor.EventReactor()
+    for svcName in svcNames:
+      gLogger.info( "Using event reactor for %s" % svcName )
+      self.__services[ svcName ].setEventReactor( self.__eventReactor )
+    for svcName in self.__listeningConnections:
+      self.__eventReactor.addListener( self.__listeningConnections[ svcName ][ 'socket' ],
+                                       self.__acceptFromReactor, ( svcName, ) )
+    return True
+
+  def __acceptFromReactor( self, svcName ):
+    try:
+      retVal = self.__listeningConnections[ svcName ][ 'transport' ].acceptConnection()
+    except socket.error as e:
+      gLogger.warn( "Error while accepting a connection: ", str( e ) )
+      return
+    if not retVal[ 'OK' ]:
+      gLogger.warn( "Error while accepting a connection: ", retVal[ 'Message' ] )
+      return
+    self.__handleAcceptedConnection( svcName, retVal[ 'Value' ] )
 
   def __getListeningSocketsList( self, svcName = False ):
     if svcName:
@@ -165,30 +449,35 @@ class ServiceReactor( object ):
                 gLogger.warn( "Error while accepting a connection: ", retVal[ 'Message' ] )
                 return
               clientTransport = retVal[ 'Value' ]
-      except socket.error:
+      except ( socket.error, select.error ):
         return
-      self.__maxFD = max( self.__maxFD, clientTransport.oSocket.fileno() )
-      #Is it banned?
-      clientIP = clientTransport.getRemoteAddress()[0]
-      if clientIP in Registry.getBannedIPs():
-        gLogger.warn( "Client connected from banned ip %s" % clientIP )
-        clientTransport.close()
-        continue
-      #Handle connection
-      self.__stats.connectionStablished()
-      self.__services[ svcName ].handleConnection( clientTransport )
-      #Renew context?
-      now = time.time()
-      renewed = False
-      for svcName in self.__listeningConnections:
-        tr = self.__listeningConnections[ svcName ][ 'transport' ]
-        if now - tr.latestServerRenewTime() > self.__services[ svcName ].getConfig().getContextLifeTime():
-          result = tr.renewServerContext()
-          if result[ 'OK' ]:
-            renewed = True
-      if renewed:
+      if self.__handleAcceptedConnection( svcName, clientTransport ):
         sockets = self.__getListeningSocketsList()
 
+  def __handleAcceptedConnection( self, svcName, clientTransport ):
+    """ Pass the new connection to its service. Returns True if the server contexts have been renewed
+    """
+    self.__maxFD = max( self.__maxFD, clientTransport.oSocket.fileno() )
+    #Is it banned?
+    clientIP = clientTransport.getRemoteAddress()[0]
+    if clientIP in Registry.getBannedIPs():
+      gLogger.warn( "Client connected from banned ip %s" % clientIP )
+      clientTransport.close()
+      return False
+    #Handle connection
+    self.__stats.connectionStablished()
+    self.__services[ svcName ].handleConnection( clientTransport )
+    #Renew context?
+    now = time.time()
+    renewed = False
+    for svcName in self.__listeningConnections:
+      tr = self.__listeningConnections[ svcName ][ 'transport' ]
+      if now - tr.latestServerRenewTime() > self.__services[ svcName ].getConfig().getContextLifeTime():
+        result = tr.renewServerContext()
+        if result[ 'OK' ]:
+          renewed = True
+    return renewed
+
 
   def __closeListeningConnections( self ):
     for svcName in self.__listeningConnections:
@@ -9,7 +9,7 @@ from DIRAC.Core.Utilities import File
 
 class TransferClient( BaseClient ):
 
-  def _sendTransferHeader( self, actionName, fileInfo ):
+  def _sendTransferHeader( self, actionName, fileInfo, streamTransfer = False ):
     """
     Send the header of the transfer
 
@@ -17,7 +17,9 @@ class TransferClient( BaseClient ):
     :param actionName: Action to execute
     :type fileInfo: tuple
     :param fileInfo: Information of the target file/bulk
-    :return: S_OK/S_ERROR
+    :type streamTransfer: boolean
+    :param streamTransfer: Ask the server to stream the data
+    :return: S_OK/S_ERROR. The 'StreamTransfer' key tells if the server accepted to stream
     """
     retVal = self._connect()
     if not retVal[ 'OK' ]:
@@ -28,13 +30,18 @@ class TransferClient( BaseClient ):
       retVal = self._proposeAction( transport, ( "FileTransfer", actionName ) )
       if not retVal[ 'OK' ]:
         return retVal
-      retVal = transport.sendData( S_OK( fileInfo ) )
+      header = S_OK( fileInfo )
+      if streamTransfer:
+        header[ 'StreamTransfer' ] = True
+      retVal = transport.sendData( header )
       if not retVal[ 'OK' ]:
         return retVal
       retVal = transport.receiveData()
       if not retVal[ 'OK' ]:
         return retVal
-      return S_OK( ( trid, transport ) )
+      result = S_OK( ( trid, transport ) )
+      result[ 'StreamTransfer' ] = streamTransfer and retVal.get( 'StreamTransfer', False )
+      return result
     except Exception as e:
       self._disconnect( trid )
       return S_ERROR( "Cound not request transfer: %s" % str( e ) )
@@ -58,10 +65,12 @@ class TransferClient( BaseClient ):
     if not retVal[ 'OK' ]:
       return retVal
     fd = retVal[ 'Value' ]
-    retVal = self._sendTransferHeader( "FromClient", ( fileId, token, File.getSize( filename ) ) )
+    retVal = self._sendTransferHeader( "FromClient", ( fileId, token, File.getSize( filename ) ), streamTransfer = True )
     if not retVal[ 'OK' ]:
       return retVal
     trid, transport = retVal[ 'Value' ]
+    if retVal[ 'StreamTransfer' ]:
+      fileHelper.enableStreaming()
     try:
       fileHelper.setTransport( transport )
       retVal = fileHelper.FDToNetwork( fd )
@@ -92,10 +101,12 @@ class TransferClient( BaseClient ):
       return retVal
     dS = retVal[ 'Value' ]
     closeAfterUse = retVal[ 'closeAfterUse' ]
-    retVal = self._sendTransferHeader( "ToClient", ( fileId, token ) )
+    retVal = self._sendTransferHeader( "ToClient", ( fileId, token ), streamTransfer = True )
     if not retVal[ 'OK' ]:
       return retVal
     trid, transport = retVal[ 'Value' ]
+    if retVal[ 'StreamTransfer' ]:
+      fileHelper.enableStreaming()
     try:
       fileHelper.setTransport( transport )
       retVal = fileHelper.networkToDataSink( dS )
@@ -138,16 +149,19 @@ class TransferClient( BaseClient ):
       bulkId = "%s.tar.bz2" % bulkId
     else:
       bulkId = "%s.tar" % bulkId
-    retVal = self._sendTransferHeader( "BulkFromClient", ( bulkId, token, bulkSize ) )
+    retVal = self._sendTransferHeader( "BulkFromClient", ( bulkId, token, bulkSize ), streamTransfer = True )
     if not retVal[ 'OK' ]:
       return retVal
     trid, transport = retVal[ 'Value' ]
     try:
       fileHelper = FileHelper( transport )
+      if retVal[ 'StreamTransfer' ]:
+        fileHelper.enableStreaming()
       retVal = fileHelper.bulkToNetwork( fileList, compress, onthefly )
       if not retVal[ 'OK' ]:
         return retVal
-      retVal = transport.receiveData()      return retVal
+      retVal = transport.receiveData()
+      return retVal
     finally:
       self._disconnect( trid )
 
@@ -171,12 +185,14 @@ class TransferClient( BaseClient ):
       bulkId = "%s.tar.bz2" % bulkId
     else:
       bulkId = "%s.tar" % bulkId
-    retVal = self._sendTransferHeader( "BulkToClient", ( bulkId, token ) )
+    retVal = self._sendTransferHeader( "BulkToClient", ( bulkId, token ), streamTransfer = True )
     if not retVal[ 'OK' ]:
       return retVal
     trid, transport = retVal[ 'Value' ]
     try:
       fileHelper = FileHelper( transport )
+      if retVal[ 'StreamTransfer' ]:
+        fileHelper.enableStreaming()
       retVal = fileHelper.networkToBulk( destDir, compress )
       if not retVal[ 'OK' ]:
         return retVal
@@ -3,6 +3,7 @@ __RCSID__ = "$Id$"
 import time
 import types
 import thread
+from hashlib import md5
 import DIRAC
 from DIRAC.Core.DISET.private.Protocols import gProtocolDict
 from DIRAC.FrameworkSystem.Client.Logger import gLogger
@@ -12,6 +13,8 @@ from DIRAC.ConfigurationSystem.Client.Config import gConfig
 from DIRAC.ConfigurationSystem.Client.PathFinder import getServiceURL
 from DIRAC.Core.Security import CS
 from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
+from DIRAC.Core.DISET.private.ConnectionPool import getGlobalConnectionPool
+from DIRAC.Core.DISET.private import Compression
 from DIRAC.Core.DISET.ThreadConfig import ThreadConfig
 
 class BaseClient:
@@ -31,6 +34,8 @@ class BaseClient:
   KW_PROXY_CHAIN = "proxyChain"
   KW_SKIP_CA_CHECK = "skipCACheck"
   KW_KEEP_ALIVE_LAPSE = "keepAliveLapse"
+  KW_REUSE_CONNECTIONS = "reuseConnections"
+  KW_COMPRESSION = "compression"
 
   __threadConfig = ThreadConfig()
 
@@ -51,10 +56,14 @@ class BaseClient:
     self.__nbOfRetry = 3 # by default we try try times
     self.__retryCounter = 1
     self.__bannedUrls = []
+    self.__reuseConnections = False
+    self.__compressionCodecs = []
+    self.__compressionThreshold = 4096
     for initFunc in ( self.__discoverSetup, self.__discoverVO, self.__discoverTimeout,
                       self.__discoverURL, self.__discoverCredentialsToUse,
                       self.__checkTransportSanity,
-                      self.__setKeepAliveLapse ):
+                      self.__setKeepAliveLapse, self.__discoverConnectionReuse,
+                      self.__discoverCompression ):
       result = initFunc()
       if not result[ 'OK' ] and self.__initStatus[ 'OK' ]:
         self.__initStatus = result
@@ -283,6 +292,49 @@ and this is thread %s
       #raise Exception( msgTxt )
 
 
+  def __discoverConnectionReuse( self ):
+    #Keep the connection open once the action is done to reuse it later?
+    if self.KW_REUSE_CONNECTIONS in self.kwargs:
+      reuse = self.kwargs[ self.KW_REUSE_CONNECTIONS ]
+      del( self.kwargs[ self.KW_REUSE_CONNECTIONS ] )
+    else:
+      reuse = gConfig.getValue( "/DIRAC/ConnectionPool/Enabled", False )
+    if type( reuse ) in types.StringTypes:
+      reuse = reuse.lower() in ( "y", "yes", "true", "1" )
+    self.__reuseConnections = bool( reuse )
+    return S_OK()
+
+  def reuseConnections( self ):
+    return self.__reuseConnections
+
+  def __discoverCompression( self ):
+    #Which codecs to propose to the service to compress the messages? It can be
+    #a boolean or the list of codecs in order of preference
+    if self.KW_COMPRESSION in self.kwargs:
+      compression = self.kwargs[ self.KW_COMPRESSION ]
+      del( self.kwargs[ self.KW_COMPRESSION ] )
+    else:
+      compression = gConfig.getValue( "/DIRAC/Compression/Enabled", False )
+    if type( compression ) in types.StringTypes:
+      compression = compression.lower() in ( "y", "yes", "true", "1" )
+    if type( compression ) in ( types.ListType, types.TupleType ):
+      self.__compressionCodecs = [ codec for codec in compression if codec in Compression.getAvailableCodecs() ]
+    elif compression:
+      self.__compressionCodecs = gConfig.getValue( "/DIRAC/Compression/Codecs", Compression.getAvailableCodecs() )
+    self.__compressionThreshold = gConfig.getValue( "/DIRAC/Compression/Threshold", 4096 )
+    return S_OK()
+
+  def __getConnectionKey( self ):
+    """ Idle connections can only be reused for the same service and credentials
+    """
+    credTuple = []
+    for kw in ( self.KW_USE_CERTIFICATES, self.KW_PROXY_LOCATION, self.KW_SKIP_CA_CHECK,
+                self.KW_DELEGATED_DN, self.KW_DELEGATED_GROUP ):
+      credTuple.append( str( self.kwargs.get( kw, "" ) ) )
+    if self.KW_PROXY_STRING in self.kwargs:
+      credTuple.append( md5( self.kwargs[ self.KW_PROXY_STRING ] ).hexdigest() )
+    return ( self.serviceURL, tuple( credTuple ), str( self.__extraCredentials ) )
+
   def _connect( self ):
 
     self.__discoverExtraCredentials()
@@ -290,6 +342,12 @@ and this is thread %s
       return self.__initStatus
     if self.__enableThreadCheck:
       self.__checkThreadID()
+    if self.__reuseConnections:
+      transport = getGlobalConnectionPool().get( self.__getConnectionKey() )
+      if transport:
+        gLogger.debug( "Reusing connection to: %s" % self.serviceURL )
+        trid = getGlobalTransportPool().add( transport )
+        return S_OK( ( trid, transport ) )
     gLogger.debug( "Connecting to: %s" % self.serviceURL )
     try:
       transport = gProtocolDict[ self.__URLTuple[0] ][ 'transport' ]( self.__URLTuple[1:3], **self.kwargs )
@@ -321,15 +379,33 @@ and this is thread %s
     trid = getGlobalTransportPool().add( transport )
     return S_OK( ( trid, transport ) )
 
-  def _disconnect( self, trid ):
+  def _disconnect( self, trid, keepConnection = False ):
+    if keepConnection and self.__reuseConnections:
+      transport = getGlobalTransportPool().get( trid )
+      if transport:
+        #The connection pool will close it if it can't be kept
+        getGlobalTransportPool().remove( trid )
+        getGlobalConnectionPool().put( self.__getConnectionKey(), transport )
+        return
     getGlobalTransportPool().close( trid )
 
-  def _proposeAction( self, transport, action ):
+  def _proposeAction( self, transport, action, connectionOptions = None ):
     if not self.__initStatus[ 'OK' ]:
       return self.__initStatus
     stConnectionInfo = ( ( self.__URLTuple[3], self.setup, self.vo ),
                          action,
                          self.__extraCredentials )
+    #Options for the service on how to handle the connection
+    if connectionOptions:
+      connectionOptions = dict( connectionOptions )
+    else:
+      connectionOptions = {}
+    if self.__reuseConnections and action[0] == "RPC":
+      connectionOptions[ 'keepConnection' ] = True
+    if self.__compressionCodecs:
+      connectionOptions[ 'compression' ] = self.__compressionCodecs
+    if connectionOptions:
+      stConnectionInfo += ( connectionOptions, )
     retVal = transport.sendData( S_OK( stConnectionInfo ) )
     if not retVal[ 'OK' ]:
       return retVal
@@ -341,6 +417,9 @@ and this is thread %s
       if 'delegate' in serverRequirements:
         gLogger.debug( "A delegation is requested" )
         serverReturn = self.__delegateCredentials( transport, serverRequirements[ 'delegate' ] )
+    #Compress the messages from now on if the service has accepted one of the codecs
+    if serverReturn[ 'OK' ]:
+      transport.setCompression( serverReturn.get( 'compression', False ), self.__compressionThreshold )
     return serverReturn
 
   def __delegateCredentials( self, transport, delegationRequest ):
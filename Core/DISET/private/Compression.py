@@ -0,0 +1,99 @@
+""" Codecs that can be negotiated to compress the messages sent through a DISET transport
+
+    zlib is always available. lz4 is faster but it's only used if the lz4 module is installed
+    in both ends. A compressed message is sent as <codec marker><length>:<compressed data>
+    so it can be told apart from a plain one, that only has the length as header.
+"""
+
+__RCSID__ = "$Id$"
+
+import zlib
+
+try:
+  import lz4.frame as lz4frame
+except ImportError:
+  lz4frame = None
+
+#Codec name -> marker prepended to the length of the compressed messages
+gCodecMarkers = { 'zlib' : 'Z' }
+#Preferred codecs first
+gCodecPreference = [ 'zlib' ]
+
+if lz4frame:
+  gCodecMarkers[ 'lz4' ] = 'L'
+  gCodecPreference.insert( 0, 'lz4' )
+
+gMarkerCodecs = dict( [ ( gCodecMarkers[ codec ], codec ) for codec in gCodecMarkers ] )
+
+def getAvailableCodecs():
+  """ Codecs that can be used in this installation, preferred first
+  """
+  return list( gCodecPreference )
+
+def negotiateCodec( proposedCodecs, allowedCodecs = None ):
+  """ Choose the first of the codecs proposed by the peer that can be used here.
+      Returns False if there's none
+  """
+  if not allowedCodecs:
+    allowedCodecs = gCodecPreference
+  if type( proposedCodecs ) not in ( list, tuple ):
+    return False
+  for codec in proposedCodecs:
+    if codec in gCodecMarkers and codec in allowedCodecs:
+      return codec
+  return False
+
+def getMarker( codec ):
+  return gCodecMarkers[ codec ]
+
+def getCodecForMarker( marker ):
+  """ Codec for a message header marker or False if it's not a compressed message header
+  """
+  return gMarkerCodecs.get( marker, False )
+
+def compress( codec, data ):
+  if codec == 'zlib':
+    #Level 1 gives most of the gain on DEncoded data for a fraction of the CPU
+    return zlib.compress( data, 1 )
+  if codec == 'lz4':
+    return lz4frame.compress( data )
+  raise ValueError( "Unknown compression codec %s" % codec )
+
+def decompress( codec, data, maxSize = 0 ):
+  """ Decompress data. If maxSize is not 0 a message that would give more than
+      maxSize bytes raises ValueError without decompressing the rest
+  """
+  return StreamDecompressor( codec, maxSize ).decompress( data, lastChunk = True )
+
+class StreamDecompressor( object ):
+  """ Decompress a message as its chunks arrive, with at most maxSize bytes
+      of output in total if it's not 0
+  """
+
+  def __init__( self, codec, maxSize = 0 ):
+    self.__codec = codec
+    self.__maxSize = max( 0, maxSize )
+    self.__size = 0
+    if codec == 'zlib':
+      self.__dObj = zlib.decompressobj()
+    elif codec == 'lz4' and lz4frame:
+      self.__dObj = lz4frame.LZ4FrameDecompressor()
+    else:
+      raise ValueError( "Unknown compression codec %s" % codec )
+
+  def decompress( self, data, lastChunk = False ):
+    #Asking for one byte more than what is left tells if the message goes over the limit
+    maxLength = 0
+    if self.__maxSize:
+      maxLength = self.__maxSize - self.__size + 1
+    if self.__codec == 'zlib':
+      result = self.__dObj.decompress( data, maxLength )
+      #Below the output limit all the input has been consumed, so flushing is bounded
+      if lastChunk and ( not maxLength or len( result ) < maxLength ):
+        result += self.__dObj.flush()
+    else:
+      result = self.__dObj.decompress( data, max_length = maxLength or -1 )
+    self.__size += len( result )
+    if self.__maxSize and self.__size > self.__maxSize:
+      raise ValueError( "Decompressed data exceeds %s bytes" % self.__maxSize )
+    return result
@@ -0,0 +1,234 @@
+""" Pools of idle DISET connections that can be reused for further RPC calls
+
+    ConnectionPool keeps in the client side the already authenticated transports
+    once the RPC has finished, keyed by service URL and credentials. Transports are
+    evicted when they have been idle or alive for too long, or when they fail the health check.
+
+    IdleConnectionListener is the server side counterpart. It watches the transports
+    the service has agreed to keep open and queues them for processing again when the
+    client sends a new proposal through them.
+"""
+
+__RCSID__ = "$Id$"
+
+import time
+import select
+import socket
+import threading
+
+from DIRAC import gLogger, gConfig, S_OK
+from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
+
+class ConnectionPool( object ):
+
+  def __init__( self, maxIdleTime = 30, maxAge = 600, maxIdlePerKey = 5 ):
+    self.__maxIdleTime = maxIdleTime
+    self.__maxAge = maxAge
+    self.__maxIdlePerKey = max( 1, maxIdlePerKey )
+    self.__lock = threading.Lock()
+    # key -> list of ( transport, creationTime, lastUsedTime )
+    self.__idle = {}
+    self.__stats = { 'hits' : 0, 'misses' : 0, 'evictions' : 0, 'returned' : 0 }
+    self.log = gLogger.getSubLogger( "ConnectionPool" )
+    result = gThreadScheduler.addPeriodicTask( max( 5, maxIdleTime / 2 ), self.purgeExpired )
+    if not result[ 'OK' ]:
+      self.log.error( "Cannot add purge task to thread scheduler", result[ 'Message' ] )
+
+  def __isHealthy( self, transport, creationTime, lastUsed, now ):
+    """ Check that the idle transport can still be used for a new request
+    """
+    if now - lastUsed > self.__maxIdleTime:
+      return False
+    if now - creationTime > self.__maxAge:
+      return False
+    # Data left unprocessed means the stream is not aligned to a message boundary
+    if transport.byteStream or transport.receivedMessages:
+      return False
+    # An idle connection must not have anything to be read. If it's readable the peer
+    # has either closed it or sent something we were not expecting
+    try:
+      inList, _outList, _exList = select.select( [ transport.getSocket() ], [], [], 0 )
+    except ( select.error, socket.error, ValueError ):
+      return False
+    return not inList
+
+  def __discard( self, transport ):
+    self.__stats[ 'evictions' ] += 1
+    try:
+      transport.close()
+    except Exception:
+      pass
+
+  def get( self, key ):
+    """ Get an idle transport for the given key. None if there's none available
+    """
+    now = time.time()
+    self.__lock.acquire()
+    try:
+      idleList = self.__idle.get( key, [] )
+      while idleList:
+        transport, creationTime, lastUsed = idleList.pop()
+        if self.__isHealthy( transport, creationTime, lastUsed, now ):
+          self.__stats[ 'hits' ] += 1
+          return transport
+        self.__discard( transport )
+      if key in self.__idle:
+        del self.__idle[ key ]
+      self.__stats[ 'misses' ] += 1
+      return None
+    finally:
+      self.__lock.release()
+
+  def put( self, key, transport ):
+    """ Return a transport to the pool once the action has finished. If the pool
+        does not want it, it will be closed.
+    """
+    now = time.time()
+    self.__lock.acquire()
+    try:
+      creationTime = transport.getCreationTimestamp()
+      if now - creationTime > self.__maxAge:
+        self.__discard( transport )
+        return False
+      idleList = self.__idle.setdefault( key, [] )
+      if len( idleList ) >= self.__maxIdlePerKey:
+        self.__discard( transport )
+        return False
+      idleList.append( ( transport, creationTime, now ) )
+      self.__stats[ 'returned' ] += 1
+      return True
+    finally:
+      self.__lock.release()
+
+  def purgeExpired( self ):
+    """ Close all the transports that can't be reused any more
+    """
+    now = time.time()
+    self.__lock.acquire()
+    try:
+      for key in list( self.__idle ):
+        keep = []
+        for idleTuple in self.__idle[ key ]:
+          if self.__isHealthy( idleTuple[0], idleTuple[1], idleTuple[2], now ):
+            keep.append( idleTuple )
+          else:
+            self.__discard( idleTuple[0] )
+        if keep:
+          self.__idle[ key ] = keep
+        else:
+          del self.__idle[ key ]
+    finally:
+      self.__lock.release()
+
+  def closeAll( self ):
+    self.__lock.acquire()
+    try:
+      for key in self.__idle:
+        for idleTuple in self.__idle[ key ]:
+          self.__discard( idleTuple[0] )
+      self.__idle = {}
+    finally:
+      self.__lock.release()
+
+  def getNumIdle( self ):
+    return sum( [ len( idleList ) for idleList in self.__idle.values() ] )
+
+  def getStats( self ):
+    """ Get the reuse counters of the pool
+    """
+    stats = dict( self.__stats )
+    stats[ 'idle' ] = self.getNumIdle()
+    requests = stats[ 'hits' ] + stats[ 'misses' ]
+    if requests:
+      stats[ 'hitRatio' ] = float( stats[ 'hits' ] ) / requests
+    else:
+      stats[ 'hitRatio' ] = 0.0
+    return S_OK( stats )
+
+
+class IdleConnectionListener( object ):
+  """ Watch the server side transports kept open after serving an action
+      and call back when a new proposal arrives through any of them
+  """
+
+  def __init__( self, transportPool, readyCallback, idleTimeout = 60 ):
+    self.__trPool = transportPool
+    self.__readyCallback = readyCallback
+    self.__idleTimeout = idleTimeout
+    self.__idleTransports = {}
+    self.__lock = threading.Lock()
+    self.__listening = False
+    self.__listenThread = None
+    self.__stats = { 'reused' : 0, 'expired' : 0 }
+
+  def getNumIdle( self ):
+    return len( self.__idleTransports )
+
+  def getStats( self ):
+    stats = dict( self.__stats )
+    stats[ 'idle' ] = self.getNumIdle()
+    return stats
+
+  def addTransport( self, trid ):
+    self.__lock.acquire()
+    try:
+      self.__idleTransports[ trid ] = time.time()
+      if not self.__listening or not self.__listenThread.isAlive():
+        self.__listening = True
+        self.__listenThread = threading.Thread( target = self.__listen )
+        self.__listenThread.setDaemon( True )
+        self.__listenThread.start()
+    finally:
+      self.__lock.release()
+
+  def __listen( self ):
+    while self.__listening:
+      now = time.time()
+      sockMap = {}
+      self.__lock.acquire()
+      try:
+        for trid in list( self.__idleTransports ):
+          transport = self.__trPool.get( trid )
+          if not transport:
+            del self.__idleTransports[ trid ]
+          elif now - self.__idleTransports[ trid ] > self.__idleTimeout:
+            del self.__idleTransports[ trid ]
+            self.__stats[ 'expired' ] += 1
+            self.__trPool.close( trid )
+          else:
+            sockMap[ transport.getSocket() ] = trid
+        if not sockMap:
+          self.__listening = False
+          return
+      finally:
+        self.__lock.release()
+      try:
+        inList, _outList, _exList = select.select( sockMap.keys(), [], [], 1 )
+      except ( select.error, socket.error ):
+        time.sleep( 0.001 )
+        continue
+      except Exception as e:
+        gLogger.exception( "Exception while selecting idle connections", lException = e )
+        continue
+      for sock in inList:
+        trid = sockMap[ sock ]
+        self.__lock.acquire()
+        try:
+          if trid not in self.__idleTransports:
+            continue
+          del self.__idleTransports[ trid ]
+        finally:
+          self.__lock.release()
+        self.__stats[ 'reused' ] += 1
+        self.__readyCallback( trid )
+
+
+gConnectionPool = None
+
+def getGlobalConnectionPool():
+  global gConnectionPool
+  if not gConnectionPool:
+    gConnectionPool = ConnectionPool( maxIdleTime = gConfig.getValue( "/DIRAC/ConnectionPool/MaxIdleTime", 30 ),
+                                      maxAge = gConfig.getValue( "/DIRAC/ConnectionPool/MaxAge", 600 ),
+                                      maxIdlePerKey = gConfig.getValue( "/DIRAC/ConnectionPool/MaxIdlePerKey", 5 ) )
+  return gConnectionPool
@@ -0,0 +1,230 @@
+""" epoll based event loop for DISET services
+
+    EventReactor watches from a single thread both the listening sockets of the
+    services and the client connections waiting for their next proposal. Data is
+    read from the connections as it arrives and they are only handed to a worker
+    thread once a complete message has been buffered, so idle or slow clients
+    do not hold any thread.
+
+    ReactorConnectionListener is the drop-in replacement of the IdleConnectionListener
+    used by the services running with the event reactor.
+"""
+
+__RCSID__ = "$Id$"
+
+import time
+import errno
+import select
+import threading
+
+from DIRAC import gLogger, S_OK, S_ERROR
+
+def isAvailable():
+  """ epoll is only available in linux
+  """
+  return hasattr( select, 'epoll' )
+
+class EventReactor( object ):
+
+  def __init__( self, maxBufferSize = 16384, expireCheckLapse = 1 ):
+    self.__epoll = select.epoll()
+    self.__lock = threading.Lock()
+    # fd -> ( callback, args )
+    self.__listeners = {}
+    # fd -> ( transport, deadline, readyCallback, errorCallback, args )
+    self.__watched = {}
+    self.__maxBufferSize = maxBufferSize
+    self.__expireCheckLapse = expireCheckLapse
+    self.__lastExpireCheck = time.time()
+    self.__stats = { 'dispatched' : 0, 'expired' : 0, 'failed' : 0 }
+    self.log = gLogger.getSubLogger( "EventReactor" )
+
+  def getNumWatched( self ):
+    return len( self.__watched )
+
+  def getStats( self ):
+    stats = dict( self.__stats )
+    stats[ 'watched' ] = self.getNumWatched()
+    stats[ 'listeners' ] = len( self.__listeners )
+    return stats
+
+  def addListener( self, sock, callback, args = () ):
+    """ Call callback( *args ) each time sock has a connection waiting to be accepted
+    """
+    fd = sock.fileno()
+    self.__lock.acquire()
+    try:
+      self.__listeners[ fd ] = ( callback, args )
+      self.__epoll.register( fd, select.EPOLLIN )
+    finally:
+      self.__lock.release()
+
+  def removeListener( self, sock ):
+    fd = sock.fileno()
+    self.__lock.acquire()
+    try:
+      if fd in self.__listeners:
+        del self.__listeners[ fd ]
+        self.__unregister( fd )
+    finally:
+      self.__lock.release()
+
+  def watchTransport( self, transport, timeout, readyCallback, errorCallback, args = () ):
+    """ Call readyCallback( *args ) once a complete message from transport is buffered.
+        errorCallback( errorMessage, *args ) is called instead if the connection fails,
+        exceeds the buffer limit or nothing arrives within timeout seconds.
+        Either callback is executed at most once and the transport is not watched any
+        more when it is called.
+    """
+    #Data can be already waiting in the transport buffers so check it now
+    result = transport.bufferAvailableData( self.__maxBufferSize )
+    if not result[ 'OK' ]:
+      self.__stats[ 'failed' ] += 1
+      self.__callBack( errorCallback, ( result[ 'Message' ], ) + tuple( args ) )
+      return
+    if result[ 'Value' ]:
+      self.__stats[ 'dispatched' ] += 1
+      self.__callBack( readyCallback, args )
+      return
+    fd = transport.getSocket().fileno()
+    self.__lock.acquire()
+    try:
+      self.__watched[ fd ] = ( transport, time.time() + timeout, readyCallback, errorCallback, args )
+      self.__epoll.register( fd, select.EPOLLIN | select.EPOLLPRI )
+    finally:
+      self.__lock.release()
+
+  def __unregister( self, fd ):
+    try:
+      self.__epoll.unregister( fd )
+    except ( IOError, OSError, ValueError ):
+      #Already closed
+      pass
+
+  def __unwatch( self, fd ):
+    self.__lock.acquire()
+    try:
+      watchTuple = self.__watched.pop( fd, None )
+      if watchTuple:
+        self.__unregister( fd )
+      return watchTuple
+    finally:
+      self.__lock.release()
+
+  def __callBack( self, callback, args ):
+    try:
+      callback( *args )
+    except Exception as e:
+      self.log.exception( "Exception in event reactor callback", lException = e )
+
+  def processEvents( self, timeout = 10 ):
+    """ Wait up to timeout seconds for events and process them.
+        Returns S_OK( number of events processed )
+    """
+    try:
+      events = self.__epoll.poll( timeout )
+    except IOError as e:
+      if e.errno == errno.EINTR:
+        return S_OK( 0 )
+      return S_ERROR( "Error while polling: %s" % str( e ) )
+    for fd, _eventMask in events:
+      if fd in self.__listeners:
+        callback, args = self.__listeners[ fd ]
+        self.__callBack( callback, args )
+      else:
+        self.__processTransportEvent( fd )
+    now = time.time()
+    if now - self.__lastExpireCheck >= self.__expireCheckLapse:
+      self.__lastExpireCheck = now
+      self.__expireTransports( now )
+    return S_OK( len( events ) )
+
+  def __processTransportEvent( self, fd ):
+    watchTuple = self.__watched.get( fd )
+    if not watchTuple:
+      return
+    transport, _deadline, readyCallback, errorCallback, args = watchTuple
+    #Closed connections are readable too, reading will tell
+    result = transport.bufferAvailableData( self.__maxBufferSize )
+    if result[ 'OK' ] and not result[ 'Value' ]:
+      return
+    if not self.__unwatch( fd ):
+      return
+    if result[ 'OK' ]:
+      self.__stats[ 'dispatched' ] += 1
+      self.__callBack( readyCallback, args )
+    else:
+      self.__stats[ 'failed' ] += 1
+      self.__callBack( errorCallback, ( result[ 'Message' ], ) + tuple( args ) )
+
+  def __expireTransports( self, now ):
+    expired = []
+    self.__lock.acquire()
+    try:
+      for fd in list( self.__watched ):
+        if now > self.__watched[ fd ][1]:
+          expired.append( self.__watched.pop( fd ) )
+          self.__unregister( fd )
+    finally:
+      self.__lock.release()
+    for watchTuple in expired:
+      self.__stats[ 'expired' ] += 1
+      self.__callBack( watchTuple[3], ( "Connection timeout", ) + tuple( watchTuple[4] ) )
+
+
+class ReactorConnectionListener( object ):
+  """ Wait through the event reactor for the next proposal of the service transports
+      and call back when it has been received
+  """
+
+  def __init__( self, eventReactor, transportPool, readyCallback, idleTimeout = 60 ):
+    self.__reactor = eventReactor
+    self.__trPool = transportPool
+    self.__readyCallback = readyCallback
+    self.__idleTimeout = idleTimeout
+    self.__numIdle = 0
+    self.__lock = threading.Lock()
+    self.__stats = { 'reused' : 0, 'expired' : 0 }
+
+  def getNumIdle( self ):
+    return self.__numIdle
+
+  def getStats( self ):
+    stats = dict( self.__stats )
+    stats[ 'idle' ] = self.getNumIdle()
+    return stats
+
+  def __updateNumIdle( self, delta ):
+    self.__lock.acquire()
+    try:
+      self.__numIdle += delta
+    finally:
+      self.__lock.release()
+
+  def addTransport( self, trid, readyCallback = None, timeout = None ):
+    """ Call readyCallback( trid ) once the next message from trid is buffered. By default
+        the listener callback is used and the transport is closed after idleTimeout seconds
+    """
+    transport = self.__trPool.get( trid )
+    if not transport:
+      return
+    if not readyCallback:
+      readyCallback = self.__readyCallback
+    if timeout is None:
+      timeout = self.__idleTimeout
+    self.__updateNumIdle( 1 )
+    self.__reactor.watchTransport( transport, timeout, self.__transportReady, self.__transportFailed,
+                                   ( trid, readyCallback ) )
+
+  def __transportReady( self, trid, readyCallback ):
+    self.__updateNumIdle( -1 )
+    if readyCallback == self.__readyCallback:
+      self.__stats[ 'reused' ] += 1
+    readyCallback( trid )
+
+  def __transportFailed( self, errMsg, trid, _readyCallback ):
+    self.__updateNumIdle( -1 )
+    if errMsg == "Connection timeout":
+      self.__stats[ 'expired' ] += 1
+    gLogger.debug( "Closing watched connection", "%s: %s" % ( trid, errMsg ) )
+    self.__trPool.close( trid )
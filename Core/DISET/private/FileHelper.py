@@ -1,7 +1,9 @@
 # $HeadURL$
 __RCSID__ = "$Id$"
 
+import io
 import os
+import stat
 try:
   import hashlib
   md5 = hashlib
@@ -18,6 +20,14 @@ from DIRAC.FrameworkSystem.Client.Logger import gLogger
 gLogger = gLogger.getSubLogger( "FileTransmissionHelper" )
 
 class FileHelper:
+  """ Send and receive files through a transport.
+
+      By default the data goes in DISET messages that are acknowledged one by one.
+      When streaming is negotiated with the peer, chunks are sent as raw bytes after
+      a small header, reusing a preallocated buffer ( or with sendfile from regular
+      files when no checksum is needed and the transport allows it ), and the
+      receiver only acknowledges them every streamAckBytes
+  """
 
   __validDirections = ( "toClient", "fromClient", 'receive', 'send' )
   __directionsMapping = { 'toClient' : 'send', 'fromClient' : 'receive' }
@@ -30,6 +40,12 @@ class FileHelper:
     self.bReceivedEOF = False
     self.direction = False
     self.packetSize = 1048576
+    self.streamBufferSize = 4194304
+    self.streamAckBytes = 67108864
+    self.__streaming = False
+    self.__streamBuffer = None
+    self.__streamedBytes = 0
+    self.__nextStreamAck = 0
     self.__fileBytes = 0
     self.__log = gLogger.getSubLogger( "FileHelper" )
 
@@ -39,6 +55,63 @@ class FileHelper:
   def enableCheckSum( self ):
     self.__checkMD5 = True
 
+  def enableStreaming( self ):
+    """ Both ends of the transfer have to enable it
+    """
+    self.__streaming = True
+
+  def disableStreaming( self ):
+    self.__streaming = False
+
+  def isStreaming( self ):
+    return self.__streaming
+
+  def __getStreamBuffer( self ):
+    if self.__streamBuffer is None or len( self.__streamBuffer ) != self.streamBufferSize:
+      self.__streamBuffer = bytearray( self.streamBufferSize )
+    return self.__streamBuffer
+
+  def __resetStream( self ):
+    self.__streamedBytes = 0
+    self.__nextStreamAck = 0
+
+  def __sendStreamChunk( self, chunkSize, sendFunction, *sendArgs ):
+    """ Send the header of a raw chunk and then the chunk with sendFunction( *sendArgs ).
+        The first chunk and then one every streamAckBytes ask for an acknowledgement
+    """
+    ackRequested = self.__streamedBytes >= self.__nextStreamAck
+    if ackRequested:
+      self.__nextStreamAck = self.__streamedBytes + self.streamAckBytes
+    retVal = self.oTransport.sendData( S_OK( ( True, chunkSize, ackRequested ) ) )
+    if not retVal[ 'OK' ]:
+      return retVal
+    retVal = sendFunction( *sendArgs )
+    if not retVal[ 'OK' ]:
+      return retVal
+    self.__streamedBytes += chunkSize
+    if not ackRequested:
+      return S_OK()
+    return self.oTransport.receiveData()
+
+  def __receiveStreamChunk( self, chunkSize, dataSink = None ):
+    """ Read a raw chunk through the stream buffer, writing it to dataSink if given
+    """
+    streamBuffer = self.__getStreamBuffer()
+    pendingBytes = chunkSize
+    while pendingBytes > 0:
+      readBytes = min( pendingBytes, len( streamBuffer ) )
+      retVal = self.oTransport.receiveRawData( streamBuffer, readBytes )
+      if not retVal[ 'OK' ]:
+        return retVal
+      pendingBytes -= readBytes
+      if dataSink is None:
+        continue
+      data = buffer( streamBuffer, 0, readBytes )
+      if self.__checkMD5:
+        self.__oMD5.update( data )
+      dataSink.write( data )
+    return S_OK()
+
   def setTransport( self, oTransport ):
     self.oTransport = oTransport
 
@@ -58,6 +131,8 @@ class FileHelper:
   def sendData( self, sBuffer ):
     if self.__checkMD5:
       self.__oMD5.update( sBuffer )
+    if self.__streaming:
+      return self.__sendStreamChunk( len( sBuffer ), self.oTransport.sendRawData, sBuffer )
     retVal = self.oTransport.sendData( S_OK( ( True, sBuffer ) ) )
     if not retVal[ 'OK' ]:
       return retVal
@@ -65,7 +140,11 @@ class FileHelper:
     return retVal
 
   def sendEOF( self ):
-    retVal = self.oTransport.sendData( S_OK( ( False, self.__oMD5.hexdigest() ) ) )
+    fileHash = self.__oMD5.hexdigest()
+    if self.__streaming and not self.__checkMD5:
+      #Tell the receiver there's nothing to check
+      fileHash = ""
+    retVal = self.oTransport.sendData( S_OK( ( False, fileHash ) ) )
     if not retVal[ 'OK' ]:
       return retVal
     self.__finishedTransmission()
@@ -88,6 +167,15 @@ class FileHelper:
     if not retVal[ 'OK' ]:
       return retVal
     stBuffer = retVal[ 'Value' ]
+    if stBuffer[0] and self.__streaming:
+      chunkSize, ackRequested = stBuffer[1:3]
+      chunkIO = cStringIO.StringIO()
+      retVal = self.__receiveStreamChunk( chunkSize, chunkIO )
+      if not retVal[ 'OK' ]:
+        return retVal
+      if ackRequested:
+        self.oTransport.sendData( S_OK() )
+      return S_OK( chunkIO.getvalue() )
     if stBuffer[0]:
       if self.__checkMD5:
         self.__oMD5.update( stBuffer[1] )
@@ -95,7 +183,9 @@ class FileHelper:
     else:
       self.bReceivedEOF = True
       if self.__checkMD5 and not self.__oMD5.hexdigest() == stBuffer[1]:
-        self.bErrorInMD5 = True
+        #Streaming senders without checksum send an empty one
+        if stBuffer[1] or not self.__streaming:
+          self.bErrorInMD5 = True
       self.__finishedTransmission()
       return S_OK( "" )
     return S_OK( stBuffer[1] )
@@ -106,7 +196,13 @@ class FileHelper:
   def markAsTransferred( self ):
     if not self.bFinishedTransmission:
       if self.direction == "receive":
-        self.oTransport.receiveData()
+        if self.__streaming:
+          result = self.__skipStream()
+          if not result[ 'OK' ] or not result[ 'Value' ]:
+            self.__finishedTransmission()
+            return
+        else:
+          self.oTransport.receiveData()
         abortTrans = S_OK()
         abortTrans[ 'AbortTransfer' ] = True
         self.oTransport.sendData( abortTrans )
@@ -119,6 +215,23 @@ class FileHelper:
         self.oTransport.receiveData()
     self.__finishedTransmission()
 
+  def __skipStream( self ):
+    """ Discard the streamed chunks until one needs an acknowledgement.
+        Returns S_OK( False ) if the sender finished before
+    """
+    while True:
+      retVal = self.oTransport.receiveData()
+      if not retVal[ 'OK' ]:
+        return retVal
+      stBuffer = retVal[ 'Value' ]
+      if not stBuffer[0]:
+        return S_OK( False )
+      retVal = self.__receiveStreamChunk( stBuffer[1] )
+      if not retVal[ 'OK' ]:
+        return retVal
+      if stBuffer[2]:
+        return S_OK( True )
+
   def __finishedTransmission( self ):
     self.bFinishedTransmission = True
 
@@ -154,6 +267,8 @@ class FileHelper:
     self.__oMD5 = md5.md5()
     self.bReceivedEOF = False
     self.bErrorInMD5 = False
+    if self.__streaming:
+      return self.__streamToDataSink( dataSink, maxFileSize )
     receivedBytes = 0
     try:
       result = self.receiveData( maxBufferSize = maxFileSize )
@@ -180,6 +295,49 @@ class FileHelper:
     self.__fileBytes = receivedBytes
     return S_OK()
 
+  def __streamToDataSink( self, dataSink, maxFileSize ):
+    receivedBytes = 0
+    try:
+      while True:
+        retVal = self.oTransport.receiveData()
+        if 'AbortTransfer' in retVal and retVal[ 'AbortTransfer' ]:
+          self.oTransport.sendData( S_OK() )
+          self.__finishedTransmission()
+          self.bReceivedEOF = True
+          break
+        if not retVal[ 'OK' ]:
+          return retVal
+        stBuffer = retVal[ 'Value' ]
+        if not stBuffer[0]:
+          self.bReceivedEOF = True
+          if self.__checkMD5 and stBuffer[1] and self.__oMD5.hexdigest() != stBuffer[1]:
+            self.bErrorInMD5 = True
+          self.__finishedTransmission()
+          break
+        chunkSize, ackRequested = stBuffer[1:3]
+        receivedBytes += chunkSize
+        if maxFileSize > 0 and receivedBytes > maxFileSize:
+          #The sender only listens when it asks for an acknowledgement
+          retVal = self.__receiveStreamChunk( chunkSize )
+          senderListening = ackRequested
+          if retVal[ 'OK' ] and not ackRequested:
+            retVal = self.__skipStream()
+            senderListening = retVal[ 'OK' ] and retVal[ 'Value' ]
+          if retVal[ 'OK' ] and senderListening:
+            self.sendError( "Exceeded maximum file size" )
+          return S_ERROR( "Received file exceeded maximum size of %s bytes" % ( maxFileSize ) )
+        retVal = self.__receiveStreamChunk( chunkSize, dataSink )
+        if not retVal[ 'OK' ]:
+          return retVal
+        if ackRequested:
+          self.oTransport.sendData( S_OK() )
+    except Exception as e:
+      return S_ERROR( "Error while receiving file, %s" % str( e ) )
+    if self.errorInTransmission():
+      return S_ERROR( "Error in the file CRC" )
+    self.__fileBytes = receivedBytes
+    return S_OK()
+
   def stringToNetwork( self, stringVal ):
     """ Send a given string to the DISET client over the network
     """
@@ -211,6 +369,8 @@ class FileHelper:
     return S_OK()
 
   def FDToNetwork( self, iFD ):
+    if self.__streaming:
+      return self.__FDToStream( iFD )
     self.__oMD5 = md5.md5()
     iPacketSize = self.packetSize
     self.__fileBytes = 0
@@ -233,6 +393,45 @@ class FileHelper:
     self.__fileBytes = sentBytes
     return S_OK()
 
+  def __FDToStream( self, iFD ):
+    self.__oMD5 = md5.md5()
+    self.__resetStream()
+    self.__fileBytes = 0
+    sentBytes = 0
+    try:
+      #sendfile only works from regular files and the data never gets to be hashed
+      useSendFile = not self.__checkMD5 and self.oTransport.canSendFile() and \
+                    stat.S_ISREG( os.fstat( iFD ).st_mode )
+      if not useSendFile:
+        streamBuffer = self.__getStreamBuffer()
+        fileIO = io.FileIO( iFD, "r", closefd = False )
+      while True:
+        if useSendFile:
+          chunkSize = min( self.streamAckBytes, os.fstat( iFD ).st_size - os.lseek( iFD, 0, os.SEEK_CUR ) )
+          if chunkSize <= 0:
+            break
+          dRetVal = self.__sendStreamChunk( chunkSize, self.oTransport.sendFileData, iFD, chunkSize )
+        else:
+          chunkSize = fileIO.readinto( streamBuffer )
+          if not chunkSize:
+            break
+          chunkData = buffer( streamBuffer, 0, chunkSize )
+          if self.__checkMD5:
+            self.__oMD5.update( chunkData )
+          dRetVal = self.__sendStreamChunk( chunkSize, self.oTransport.sendRawData, chunkData )
+        if not dRetVal[ 'OK' ]:
+          return dRetVal
+        if 'AbortTransfer' in dRetVal and dRetVal[ 'AbortTransfer' ]:
+          self.__log.verbose( "Transfer aborted" )
+          return S_OK()
+        sentBytes += chunkSize
+      self.sendEOF()
+    except Exception as e:
+      gLogger.exception( "Error while sending file" )
+      return S_ERROR( "Error while sending file: %s" % str( e ) )
+    self.__fileBytes = sentBytes
+    return S_OK()
+
   def BufferToNetwork( self, stringToSend ):
     sIO = cStringIO.StringIO( stringToSend )
     try:
@@ -79,6 +79,14 @@ class GatewayService( Service ):
       self._transportPool.close( trid )
     return result
 
+  def _keepConnection( self, proposalTuple ):
+    #Connections to the gateway are forwarded, so they are never kept
+    return False
+
+  def setEventReactor( self, eventReactor ):
+    #The gateway always serves each connection in its own thread
+    pass
+
   def _receiveAndCheckProposal( self, trid ):
     clientTransport = self._transportPool.get( trid )
     #Get the peer credentials
@@ -92,6 +100,9 @@ class GatewayService( Service ):
       return S_ERROR( "Invalid action proposal" )
     proposalTuple = retVal[ 'Value' ]
     gLogger.debug( "Received action from client", "/".join( list( proposalTuple[1] ) ) )
+    #Multiplexed calls are not forwarded, clients fall back to one call per connection
+    if proposalTuple[1][0] == 'Multiplex':
+      return S_ERROR( "%s is not a known action type" % proposalTuple[1][0] )
     #Check if there are extra credentials
     if proposalTuple[2]:
       clientTransport.setExtraCredentials( proposalTuple[2] )
@@ -3,6 +3,7 @@ __RCSID__ = "$Id$"
 
 import types
 from DIRAC.Core.DISET.private.BaseClient import BaseClient
+from DIRAC.Core.DISET.private.MultiplexedRPC import sendMultiplexedCalls
 from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
 
 
@@ -17,6 +18,7 @@ class InnerRPCClient( BaseClient ):
       retVal[ 'rpcStub' ] = stub
       return retVal
     trid, transport = retVal[ 'Value' ]
+    keepConnection = False
     try:
       retVal = self._proposeAction( transport, ( "RPC", functionName ) )
       if not retVal['OK']:
@@ -31,13 +33,113 @@ class InnerRPCClient( BaseClient ):
             retVal[ 'rpcStub' ] = stub
             return retVal
 
+      #The server agreed to keep the connection open for further requests
+      serverKeepsConnection = retVal.get( 'keepConnection', False )
       retVal = transport.sendData( S_OK( args ) )
       if not retVal[ 'OK' ]:
         return retVal
       receivedData = transport.receiveData()
       if type( receivedData ) == types.DictType:
         receivedData[ 'rpcStub' ] = stub
+        #Network errors are also S_ERROR, so only reuse after a successful reply
+        keepConnection = serverKeepsConnection and receivedData[ 'OK' ]
       return receivedData
     finally:
-      self._disconnect( trid )
+      self._disconnect( trid, keepConnection = keepConnection )
+
+
+  def executeStreamRPC( self, functionName, args ):
+    """ Execute an RPC that returns a sequence and get an iterator over its items
+        ( ( key, value ) pairs for dicts ). If the service streams the result, it is
+        received in chunks while it's being iterated. Errors while iterating are raised as IOError
+    """
+    stub = ( self._getBaseStub(), functionName, args )
+    retVal = self._connect()
+    if not retVal[ 'OK' ]:
+      retVal[ 'rpcStub' ] = stub
+      return retVal
+    trid, transport = retVal[ 'Value' ]
+    streamed = False
+    keepConnection = False
+    try:
+      retVal = self._proposeAction( transport, ( "RPC", functionName ), { 'streaming' : True } )
+      if not retVal[ 'OK' ]:
+        retVal[ 'rpcStub' ] = stub
+        return retVal
+      serverKeepsConnection = retVal.get( 'keepConnection', False )
+      retVal = transport.sendData( S_OK( args ) )
+      if not retVal[ 'OK' ]:
+        return retVal
+      receivedData = transport.receiveData()
+      if type( receivedData ) != types.DictType:
+        return S_ERROR( "Invalid reply received" )
+      if not receivedData[ 'OK' ]:
+        receivedData[ 'rpcStub' ] = stub
+        return receivedData
+      keepConnection = serverKeepsConnection
+      if receivedData.get( 'streamed' ):
+        streamed = True
+        return S_OK( self.__iterateStream( trid, transport, keepConnection ) )
+      #The service has sent the whole result in one go
+      value = receivedData[ 'Value' ]
+      if type( value ) == types.DictType:
+        return S_OK( value.iteritems() )
+      if type( value ) in ( types.ListType, types.TupleType ):
+        return S_OK( iter( value ) )
+      return S_OK( iter( [ value ] ) )
+    finally:
+      if not streamed:
+        self._disconnect( trid, keepConnection = keepConnection )
+
+  def __iterateStream( self, trid, transport, keepConnection ):
+    """ Receive the chunks of a streamed reply. The stream ends with an empty chunk
+        followed by the final status of the call
+    """
+    finished = False
+    try:
+      while True:
+        numItems = 0
+        for item in transport.receiveDataIterator():
+          numItems += 1
+          yield item
+        if not numItems:
+          break
+      result = transport.receiveData()
+      if not result[ 'OK' ]:
+        raise IOError( result[ 'Message' ] )
+      finished = True
+    finally:
+      self._disconnect( trid, keepConnection = keepConnection and finished )
 
+  def executeBatchRPC( self, calls, maxInFlight = 20 ):
+    """ Execute several RPCs through one connection. The service runs them concurrently
+        and sends back the results in turns with the requests. calls is a list of
+        ( functionName, args ) and the results are returned in the same order.
+        Services not supporting it get the calls one by one
+    """
+    if not calls:
+      return S_OK( [] )
+    retVal = self._connect()
+    if not retVal[ 'OK' ]:
+      return retVal
+    trid, transport = retVal[ 'Value' ]
+    try:
+      retVal = self._proposeAction( transport, ( "Multiplex", "RPC" ) )
+      if not retVal[ 'OK' ]:
+        if retVal[ 'Message' ].find( "not a known action type" ) == -1:
+          return retVal
+        multiplexed = False
+      else:
+        multiplexed = True
+        retVal = sendMultiplexedCalls( transport, calls, max( 1, maxInFlight ) )
+    finally:
+      self._disconnect( trid )
+    if not multiplexed:
+      return S_OK( [ self.executeRPC( functionName, args ) for functionName, args in calls ] )
+    if not retVal[ 'OK' ]:
+      return retVal
+    results = retVal[ 'Value' ]
+    for i in range( len( calls ) ):
+      if not results[i][ 'OK' ]:
+        results[i][ 'rpcStub' ] = ( self._getBaseStub(), calls[i][0], calls[i][1] )
+    return S_OK( results )
@@ -0,0 +1,169 @@
+""" RPC calls multiplexed through one connection
+
+    The client and the service take turns to use the connection, so only one end writes
+    at a time and they can never both block writing big messages into full buffers:
+
+    - The client sends requests, { 'request' : True, 'id', 'name', 'attrs' }, while it has less
+      than maxInFlight of them without response, and then { 'turn' : True }, or { 'end' : True }
+      once all the requests are sent.
+    - The service sends the responses, { 'request' : False, 'id', 'result' }, of all the calls
+      done by then, waiting for at least one, and then { 'turn' : True }. Once the client has
+      ended, it sends the remaining responses as soon as they are ready.
+
+    Each end only uses the transport from one thread. The service executes the calls in
+    worker threads of the connection.
+"""
+
+__RCSID__ = "$Id$"
+
+import types
+import Queue
+import threading
+
+from DIRAC import gLogger, S_OK, S_ERROR
+
+#Max number of threads executing the calls of a connection
+MAX_WORKERS = 8
+
+def sendMultiplexedCalls( transport, calls, maxInFlight ):
+  """ Send the ( functionName, args ) calls through the transport, with up to maxInFlight
+      of them waiting for their response. Returns S_OK( results in the order of the calls )
+  """
+  results = [ None ] * len( calls )
+  nextCall = 0
+  inFlight = 0
+  ended = False
+  while nextCall < len( calls ) or inFlight:
+    if not ended:
+      #Our turn
+      while nextCall < len( calls ) and inFlight < maxInFlight:
+        functionName, args = calls[ nextCall ]
+        retVal = transport.sendData( S_OK( { 'request' : True, 'id' : nextCall,
+                                             'name' : functionName, 'attrs' : args } ) )
+        if not retVal[ 'OK' ]:
+          return retVal
+        nextCall += 1
+        inFlight += 1
+      if nextCall == len( calls ):
+        ended = True
+        retVal = transport.sendData( S_OK( { 'end' : True } ) )
+      else:
+        retVal = transport.sendData( S_OK( { 'turn' : True } ) )
+      if not retVal[ 'OK' ]:
+        return retVal
+    #The service's turn, until it gives it back or, once ended, until all the responses are there
+    while inFlight or not ended:
+      retVal = transport.receiveData()
+      if type( retVal ) != types.DictType:
+        return S_ERROR( "Invalid reply received" )
+      if not retVal[ 'OK' ]:
+        return retVal
+      response = retVal[ 'Value' ]
+      try:
+        if response.get( 'turn' ) and not ended:
+          break
+        callId = response[ 'id' ]
+        if results[ callId ] is not None:
+          return S_ERROR( "Duplicated reply for request %s" % callId )
+        results[ callId ] = response[ 'result' ]
+      except ( AttributeError, KeyError, IndexError, TypeError ):
+        return S_ERROR( "Invalid reply received" )
+      inFlight -= 1
+  return S_OK( results )
+
+class MultiplexedRPCServer( object ):
+  """ Serve the multiplexed calls received through a transport. executeCall( name, args ) is
+      called in the worker threads for each of them and returns the result to send back
+  """
+
+  def __init__( self, transport, executeCall, maxWorkers = MAX_WORKERS ):
+    self.__transport = transport
+    self.__executeCall = executeCall
+    self.__maxWorkers = max( 1, maxWorkers )
+    self.__calls = Queue.Queue()
+    self.__results = Queue.Queue()
+    self.__workers = []
+    self.__stopped = False
+
+  def serve( self ):
+    """ Serve the calls until the client ends the batch. Returns S_OK( number of calls )
+    """
+    try:
+      return self.__serve()
+    finally:
+      self.__stopped = True
+      for _worker in self.__workers:
+        self.__calls.put( None )
+
+  def __serve( self ):
+    pending = 0
+    served = 0
+    ended = False
+    while not ended or pending:
+      if not ended:
+        #The client's turn
+        result = self.__receiveCalls()
+        if not result[ 'OK' ]:
+          return result
+        numCalls, ended = result[ 'Value' ]
+        pending += numCalls
+      #Our turn
+      responses = []
+      if pending:
+        responses.append( self.__results.get() )
+      while not ended:
+        try:
+          responses.append( self.__results.get_nowait() )
+        except Queue.Empty:
+          break
+      for callId, result in responses:
+        retVal = self.__transport.sendData( S_OK( { 'request' : False, 'id' : callId, 'result' : result } ) )
+        if not retVal[ 'OK' ]:
+          return S_ERROR( "Cannot send multiplexed response: %s" % retVal[ 'Message' ] )
+      pending -= len( responses )
+      served += len( responses )
+      if not ended:
+        retVal = self.__transport.sendData( S_OK( { 'turn' : True } ) )
+        if not retVal[ 'OK' ]:
+          return retVal
+    return S_OK( served )
+
+  def __receiveCalls( self ):
+    """ Receive the requests until the client gives the turn or ends.
+        Returns S_OK( ( number of calls, ended ) )
+    """
+    numCalls = 0
+    while True:
+      retVal = self.__transport.receiveData()
+      if type( retVal ) != types.DictType or not retVal[ 'OK' ]:
+        message = "Connection error"
+        if type( retVal ) == types.DictType:
+          message = retVal[ 'Message' ]
+        return S_ERROR( "Error while receiving multiplexed request: %s" % message )
+      msg = retVal[ 'Value' ]
+      if type( msg ) != types.DictType:
+        return S_ERROR( "Invalid multiplexed request" )
+      if msg.get( 'end' ) or msg.get( 'turn' ):
+        return S_OK( ( numCalls, bool( msg.get( 'end' ) ) ) )
+      if 'id' not in msg or 'name' not in msg or type( msg.get( 'attrs' ) ) not in ( types.ListType, types.TupleType ):
+        return S_ERROR( "Invalid multiplexed request" )
+      self.__calls.put( ( msg[ 'id' ], msg[ 'name' ], msg[ 'attrs' ] ) )
+      numCalls += 1
+      if len( self.__workers ) < self.__maxWorkers:
+        worker = threading.Thread( target = self.__work )
+        worker.setDaemon( True )
+        worker.start()
+        self.__workers.append( worker )
+
+  def __work( self ):
+    while True:
+      call = self.__calls.get()
+      if call is None or self.__stopped:
+        return
+      callId, name, args = call
+      try:
+        result = self.__executeCall( name, args )
+      except Exception as e:
+        gLogger.exception( "Exception while executing multiplexed RPC", lException = e )
+        result = S_ERROR( "Server error while serving %s: %s" % ( name, str( e ) ) )
+      self.__results.put( ( callId, result ) )
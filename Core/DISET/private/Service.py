@@ -11,10 +11,14 @@ from DIRAC.FrameworkSystem.Client.MonitoringClient import MonitoringClient
 from DIRAC.Core.DISET.private.ServiceConfiguration import ServiceConfiguration
 from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
 from DIRAC.Core.DISET.private.MessageBroker import MessageBroker, MessageSender
+from DIRAC.Core.DISET.private.ConnectionPool import IdleConnectionListener
+from DIRAC.Core.DISET.private.EventReactor import ReactorConnectionListener
+from DIRAC.Core.DISET.private import Compression
 from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
 from DIRAC.Core.Utilities.ThreadPool import ThreadPool
 from DIRAC.Core.Utilities.ReturnValues import isReturnStructure
 from DIRAC.Core.DISET.AuthManager import AuthManager
+from DIRAC.Core.DISET.private.MultiplexedRPC import MultiplexedRPCServer
 from DIRAC.FrameworkSystem.Client.SecurityLogClient import SecurityLogClient
 from DIRAC.ConfigurationSystem.Client import PathFinder
 
@@ -23,7 +27,8 @@ class Service( object ):
   SVC_VALID_ACTIONS = { 'RPC' : 'export',
                         'FileTransfer': 'transfer',
                         'Message' : 'msg',
-                        'Connection' : 'Message' }
+                        'Connection' : 'Message',
+                        'Multiplex' : 'RPC' }
   SVC_SECLOG_CLIENT = SecurityLogClient()
 
   def __init__( self, serviceData ):
@@ -42,12 +47,76 @@ class Service( object ):
     self._stats = { 'queries' : 0, 'connections' : 0 }
     self._authMgr = AuthManager( "%s/Authorization" % PathFinder.getServiceSection( serviceData[ 'loadName' ] ) )
     self._transportPool = getGlobalTransportPool()
-    self.__cloneId = 0
+    self.__cloneId = None
     self.__maxFD = 0
+    self._eventReactor = None
+    self._workersMonitor = None
 
   def setCloneProcessId( self, cloneId ):
     self.__cloneId = cloneId
     self._monitor.setComponentName( "%s-Clone:%s" % ( self._name, cloneId ) )
+    #The figures of all the clones are reported by the parent process
+    if self._workersMonitor:
+      self._workersMonitor.disable()
+
+  def getWorkerStats( self ):
+    """ Counters of this process to be aggregated with the ones of the other worker processes
+    """
+    return { 'queries' : self._stats[ 'queries' ],
+             'connections' : self._stats[ 'connections' ],
+             'activeQueries' : self._threadPool.numWorkingThreads(),
+             'pendingQueries' : self._threadPool.pendingJobs() }
+
+  def initWorkersMonitoring( self ):
+    """ Monitor the service as a whole when it runs in several worker processes.
+        Each worker reports its own figures as a clone of the service
+    """
+    self._workersMonitor = MonitoringClient()
+    self._workersMonitor.setComponentType( MonitoringClient.COMPONENT_SERVICE )
+    self._workersMonitor.setComponentName( self._name )
+    self._workersMonitor.setComponentLocation( self._cfg.getURL() )
+    self._workersMonitor.initialize()
+    self._workersMonitor.registerActivity( "Connections", "Connections received", "Framework", "connections", MonitoringClient.OP_RATE )
+    self._workersMonitor.registerActivity( "Queries", "Queries served", "Framework", "queries", MonitoringClient.OP_RATE )
+    self._workersMonitor.registerActivity( 'PendingQueries', "Pending queries", 'Framework', 'queries', MonitoringClient.OP_MEAN )
+    self._workersMonitor.registerActivity( 'ActiveQueries', "Active queries", 'Framework', 'threads', MonitoringClient.OP_MEAN )
+    self._workersMonitor.registerActivity( 'Workers', "Worker processes", 'Framework', 'processes', MonitoringClient.OP_MEAN )
+    self._workersMonitor.setComponentExtraParam( 'DIRACVersion', DIRAC.version )
+    self._workersMonitor.setComponentExtraParam( 'platform', DIRAC.platform )
+    self._workersMonitor.setComponentExtraParam( 'startTime', Time.dateTime() )
+
+  def addWorkersMarks( self, workersStats, lastWorkersStats ):
+    """ Report the aggregated figures of the workers. Both arguments are dicts
+        of worker id -> getWorkerStats() output, the current and the previous ones
+    """
+    totals = { 'queries' : 0, 'connections' : 0, 'activeQueries' : 0, 'pendingQueries' : 0 }
+    for workerId in workersStats:
+      stats = workersStats[ workerId ]
+      lastStats = lastWorkersStats.get( workerId, {} )
+      for key in totals:
+        if key in ( 'queries', 'connections' ):
+          delta = stats[ key ] - lastStats.get( key, 0 )
+          if delta < 0:
+            #The worker has been restarted
+            delta = stats[ key ]
+          totals[ key ] += delta
+        else:
+          totals[ key ] += stats[ key ]
+    self._workersMonitor.addMark( 'Queries', totals[ 'queries' ] )
+    self._workersMonitor.addMark( 'Connections', totals[ 'connections' ] )
+    self._workersMonitor.addMark( 'ActiveQueries', totals[ 'activeQueries' ] )
+    self._workersMonitor.addMark( 'PendingQueries', totals[ 'pendingQueries' ] )
+    self._workersMonitor.addMark( 'Workers', len( workersStats ) )
+    self._stats[ 'connections' ] += totals[ 'connections' ]
+    self._workersMonitor.setComponentExtraParam( 'queries', self._stats[ 'connections' ] )
+
+  def setEventReactor( self, eventReactor ):
+    """ Wait for the proposals through the event reactor instead of in a worker thread.
+        Has to be called after initialize
+    """
+    self._eventReactor = eventReactor
+    self._idleListener = ReactorConnectionListener( eventReactor, self._transportPool, self._queueReusedTransport,
+                                                    idleTimeout = self._cfg.getConnectionIdleTimeout() )
 
   def _isMetaAction( self, action ):
     referedAction = Service.SVC_VALID_ACTIONS[ action ]
@@ -74,6 +143,8 @@ class Service( object ):
                                    self._cfg.getMaxWaitingPetitions() )
     self._threadPool.daemonize()
     self._msgBroker = MessageBroker( "%sMSB" % self._name, threadPool = self._threadPool )
+    self._idleListener = IdleConnectionListener( self._transportPool, self._queueReusedTransport,
+                                                 idleTimeout = self._cfg.getConnectionIdleTimeout() )
     #Create static dict
     self._serviceInfoDict = { 'serviceName' : self._name,
                               'serviceSectionPath' : PathFinder.getServiceSection( self._name ),
@@ -148,9 +219,26 @@ class Service( object ):
     handlerInfo[ "module" ] = self._svcData[ 'moduleObj' ]
     handlerInfo[ "class" ] = handlerClass
     handlerInfo[ "init" ] = handlerInitMethods
+    handlerInfo[ "finalize" ] = getattr( self._svcData[ 'moduleObj' ], "finalize%s" % handlerName, None )
 
     return S_OK( handlerInfo )
 
+  def finalize( self ):
+    """ Call the global finalization function of the handler, if any, once the service stops serving
+    """
+    handler = getattr( self, "_handler", None )
+    if not handler or not handler[ 'finalize' ]:
+      return S_OK()
+    gLogger.verbose( "Executing finalization function" )
+    try:
+      result = handler[ 'finalize' ]()
+    except Exception, excp:
+      gLogger.exception( "Exception while calling finalization function" )
+      return S_ERROR( "Exception while calling finalization function: %s" % str( excp ) )
+    if not isReturnStructure( result ):
+      return S_ERROR( "Service finalization function %s must return S_OK/S_ERROR" % handler[ 'finalize' ] )
+    return result
+
   def _loadActions( self ):
 
     handlerClass = self._handler[ 'class' ]
@@ -211,7 +299,10 @@ class Service( object ):
   def _initMonitoring( self ):
     #Init extra bits of monitoring
     self._monitor.setComponentType( MonitoringClient.COMPONENT_SERVICE )
-    self._monitor.setComponentName( self._name )
+    if self.__cloneId is None:
+      self._monitor.setComponentName( self._name )
+    else:
+      self._monitor.setComponentName( "%s-Clone:%s" % ( self._name, self.__cloneId ) )
     self._monitor.setComponentLocation( self._cfg.getURL() )
     self._monitor.initialize()
     self._monitor.registerActivity( "Connections", "Connections received", "Framework", "connections", MonitoringClient.OP_RATE )
@@ -222,6 +313,14 @@ class Service( object ):
     self._monitor.registerActivity( 'ActiveQueries', "Active queries", 'Framework', 'threads', MonitoringClient.OP_MEAN )
     self._monitor.registerActivity( 'RunningThreads', "Running threads", 'Framework', 'threads', MonitoringClient.OP_MEAN )
     self._monitor.registerActivity( 'MaxFD', "Max File Descriptors", 'Framework', 'fd', MonitoringClient.OP_MEAN )
+    self._monitor.registerActivity( 'ReusedConnections', "Reused connections", 'Framework', 'connections', MonitoringClient.OP_RATE )
+    self._monitor.registerActivity( 'IdleConnections', "Idle kept connections", 'Framework', 'connections', MonitoringClient.OP_MEAN )
+    self._monitor.registerActivity( 'ResumedSessions', "Resumed SSL sessions", 'Framework', '%', MonitoringClient.OP_MEAN )
+    self._monitor.registerActivity( 'CachedCredentials', "Credentials cache hits", 'Framework', '%', MonitoringClient.OP_MEAN )
+    self._monitor.registerActivity( 'BytesSent', "Bytes sent", 'Framework', 'bytes', MonitoringClient.OP_SUM )
+    self._monitor.registerActivity( 'BytesReceived', "Bytes received", 'Framework', 'bytes', MonitoringClient.OP_SUM )
+    self._monitor.registerActivity( 'RawBytesSent', "Bytes sent before compression", 'Framework', 'bytes', MonitoringClient.OP_SUM )
+    self._monitor.registerActivity( 'RawBytesReceived', "Bytes received after decompression", 'Framework', 'bytes', MonitoringClient.OP_SUM )
 
     self._monitor.setComponentExtraParam( 'DIRACVersion', DIRAC.version )
     self._monitor.setComponentExtraParam( 'platform', DIRAC.platform )
@@ -244,8 +343,15 @@ class Service( object ):
     self._monitor.addMark( 'ActiveQueries', self._threadPool.numWorkingThreads() )
     self._monitor.addMark( 'RunningThreads', threading.activeCount() )
     self._monitor.addMark( 'MaxFD', self.__maxFD )
+    self._monitor.addMark( 'IdleConnections', self._idleListener.getNumIdle() )
     self.__maxFD = 0
 
+  def __reportHandshake( self, handshakeInfo ):
+    #Marks are 0 or 100 so the mean is the hit rate
+    if 'sessionResumed' in handshakeInfo:
+      self._monitor.addMark( 'ResumedSessions', 100 * int( bool( handshakeInfo[ 'sessionResumed' ] ) ) )
+    if 'cachedCredentials' in handshakeInfo:
+      self._monitor.addMark( 'CachedCredentials', 100 * int( bool( handshakeInfo[ 'cachedCredentials' ] ) ) )
 
   def getConfig( self ):
     return self._cfg
@@ -275,35 +381,89 @@ class Service( object ):
           return
       except:
         return
+      self.__reportHandshake( clientTransport.getHandshakeInfo() )
       #Add to the transport pool
       trid = self._transportPool.add( clientTransport )
       if not trid:
         return
-      #Receive and check proposal
-      result = self._receiveAndCheckProposal( trid )
-      if not result[ 'OK' ]:
-        self._transportPool.sendAndClose( trid, result )
-        return
-      proposalTuple = result[ 'Value' ]
-      #Instantiate handler
-      result = self._instantiateHandler( trid, proposalTuple )
-      if not result[ 'OK' ]:
-        self._transportPool.sendAndClose( trid, result )
+      if self._eventReactor:
+        #Don't hold this thread while the client sends the proposal
+        self._idleListener.addTransport( trid, readyCallback = self._queueNewTransport,
+                                         timeout = clientTransport.iReadTimeout )
         return
-      handlerObj = result[ 'Value' ]
-      #Execute the action
-      result = self._processProposal( trid, proposalTuple, handlerObj )
-      #Close the connection if required
-      if result[ 'closeTransport' ] or not result[ 'OK' ]:
-        if not result[ 'OK' ]:
-          gLogger.error( "Error processing proposal", result[ 'Message' ] )
-        self._transportPool.close( trid )
-      return result
+      return self.__serveTransport( trid )
     finally:
       self._lockManager.unlockGlobal()
       if monReport:
         self.__endReportToMonitoring( *monReport )
 
+  def _queueReusedTransport( self, trid ):
+    self._stats[ 'connections' ] += 1
+    self._monitor.addMark( 'ReusedConnections' )
+    self._threadPool.generateJobAndQueueIt( self._processReadyTransport,
+                                             args = ( trid, ) )
+
+  def _queueNewTransport( self, trid ):
+    self._threadPool.generateJobAndQueueIt( self._processReadyTransport,
+                                             args = ( trid, False ) )
+
+  #Threaded process function for connections whose proposal has already been received
+  def _processReadyTransport( self, trid, reused = True ):
+    self._lockManager.lockGlobal()
+    try:
+      monReport = self.__startReportToMonitoring()
+    except Exception:
+      monReport = False
+    try:
+      return self.__serveTransport( trid, reused = reused )
+    finally:
+      self._lockManager.unlockGlobal()
+      if monReport:
+        self.__endReportToMonitoring( *monReport )
+
+  def __serveTransport( self, trid, reused = False ):
+    transport = self._transportPool.get( trid )
+    try:
+      return self.__serveProposal( trid, reused )
+    finally:
+      if transport:
+        self.__reportTransferredBytes( transport )
+
+  def __reportTransferredBytes( self, transport ):
+    counters = transport.getByteCounters( reset = True )
+    for activity, key in ( ( 'BytesSent', 'sent' ), ( 'BytesReceived', 'received' ),
+                           ( 'RawBytesSent', 'rawSent' ), ( 'RawBytesReceived', 'rawReceived' ) ):
+      if counters[ key ]:
+        self._monitor.addMark( activity, counters[ key ] )
+
+  def __serveProposal( self, trid, reused ):
+    #Receive and check proposal
+    result = self._receiveAndCheckProposal( trid, reused )
+    if not result[ 'OK' ]:
+      if result.get( 'closeTransport' ):
+        self._transportPool.close( trid )
+      else:
+        self._transportPool.sendAndClose( trid, result )
+      return
+    proposalTuple = result[ 'Value' ]
+    #Instantiate handler
+    result = self._instantiateHandler( trid, proposalTuple )
+    if not result[ 'OK' ]:
+      self._transportPool.sendAndClose( trid, result )
+      return
+    handlerObj = result[ 'Value' ]
+    #Execute the action
+    result = self._processProposal( trid, proposalTuple, handlerObj )
+    #Close the connection if required
+    if result[ 'closeTransport' ] or not result[ 'OK' ]:
+      if not result[ 'OK' ]:
+        gLogger.error( "Error processing proposal", result[ 'Message' ] )
+      self._transportPool.close( trid )
+    elif result.get( 'keepConnection' ):
+      #Wait for the next proposal through the same connection
+      self._idleListener.addTransport( trid )
+    return result
+
 
   def _createIdentityString( self, credDict, clientTransport = None ):
     if 'username' in credDict:
@@ -321,12 +481,18 @@ class Service( object ):
       identity += "(%s)" % credDict[ 'DN' ]
     return identity
 
-  def _receiveAndCheckProposal( self, trid ):
+  def _receiveAndCheckProposal( self, trid, reused = False ):
     clientTransport = self._transportPool.get( trid )
     #Get the peer credentials
     credDict = clientTransport.getConnectingCredentials()
     #Receive the action proposal
     retVal = clientTransport.receiveData( 1024 )
+    if not retVal[ 'OK' ] and reused:
+      #The client has just closed the connection it had kept open
+      gLogger.debug( "Kept connection closed by client", retVal[ 'Message' ] )
+      result = S_ERROR( "Connection closed by peer" )
+      result[ 'closeTransport' ] = True
+      return result
     if not retVal[ 'OK' ]:
       gLogger.error( "Invalid action proposal", "%s %s" % ( self._createIdentityString( credDict,
                                                                                         clientTransport ),
@@ -429,11 +595,44 @@ class Service( object ):
       return S_ERROR( "Server error while loading handler" )
     return S_OK( handlerInstance )
 
+  def _keepConnection( self, proposalTuple ):
+    """ Check if the client wants the connection to be kept after the action and we allow it
+    """
+    if proposalTuple[1][0] != 'RPC' or len( proposalTuple ) < 4:
+      return False
+    if not isinstance( proposalTuple[3], dict ) or not proposalTuple[3].get( 'keepConnection' ):
+      return False
+    return self._cfg.getKeepConnections()
+
+  def _negotiateCompression( self, proposalTuple ):
+    """ Choose one of the compression codecs proposed by the client, if any
+    """
+    if len( proposalTuple ) < 4 or not isinstance( proposalTuple[3], dict ):
+      return False
+    proposedCodecs = proposalTuple[3].get( 'compression' )
+    if not proposedCodecs:
+      return False
+    allowedCodecs = self._cfg.getCompressionCodecs()
+    if not allowedCodecs:
+      return False
+    return Compression.negotiateCodec( proposedCodecs, allowedCodecs )
+
   def _processProposal( self, trid, proposalTuple, handlerObj ):
     #Notify the client we're ready to execute the action
-    retVal = self._transportPool.send( trid, S_OK() )
+    keepConnection = self._keepConnection( proposalTuple )
+    codec = self._negotiateCompression( proposalTuple )
+    readyMsg = S_OK()
+    if keepConnection:
+      readyMsg[ 'keepConnection' ] = True
+    if codec:
+      readyMsg[ 'compression' ] = codec
+    retVal = self._transportPool.send( trid, readyMsg )
     if not retVal[ 'OK' ]:
       return retVal
+    #Messages after the ready one are compressed if negotiated
+    transport = self._transportPool.get( trid )
+    if transport:
+      transport.setCompression( codec, self._cfg.getCompressionThreshold() )
 
     messageConnection = False
     if proposalTuple[1] == ( 'Connection', 'new' ):
@@ -459,6 +658,10 @@ class Service( object ):
       if not result[ 'OK' ]:
         self._msgBroker.removeTransport( trid )
 
+    if keepConnection and result[ 'OK' ]:
+      result[ 'closeTransport' ] = False
+      result[ 'keepConnection' ] = True
+      return result
     result[ 'closeTransport' ] = not messageConnection or not result[ 'OK' ]
     return result
 
@@ -472,11 +675,35 @@ class Service( object ):
 
   def _executeAction( self, trid, proposalTuple, handlerObj ):
     try:
+      if proposalTuple[1][0] == 'Multiplex':
+        return self._serveMultiplexedRPCs( trid, proposalTuple )
       return handlerObj._rh_executeAction( proposalTuple )
     except Exception as e:
       gLogger.exception( "Exception while executing handler action" )
       return S_ERROR( "Server error while executing action: %s" % str( e ) )
 
+  def _serveMultiplexedRPCs( self, trid, proposalTuple ):
+    """ Receive tagged RPC requests through the same connection until the client ends the batch.
+        Requests are executed concurrently by threads of the connection and each response is
+        sent with the id of its request. This thread does all the reads and writes
+    """
+    transport = self._transportPool.get( trid )
+    if not transport:
+      return S_ERROR( "Client disconnected" )
+    credDict = transport.getConnectingCredentials()
+    executeCall = lambda method, args: self.__executeMultiplexedCall( trid, proposalTuple, credDict, method, args )
+    return MultiplexedRPCServer( transport, executeCall ).serve()
+
+  def __executeMultiplexedCall( self, trid, proposalTuple, credDict, method, args ):
+    self._monitor.addMark( "Queries" )
+    result = self._authorizeProposal( ( 'RPC', method ), trid, credDict )
+    if not result[ 'OK' ]:
+      return result
+    result = self._instantiateHandler( trid, proposalTuple )
+    if not result[ 'OK' ]:
+      return result
+    return result[ 'Value' ]._rh_executeMultiplexedRPC( method, args )
+
   def _mbReceivedMsg( self, trid, msgObj ):
     result = self._authorizeProposal( ( 'Message', msgObj.getName() ),
                                       trid,
@@ -499,6 +726,7 @@ class Service( object ):
 
   def __startReportToMonitoring( self ):
     self._monitor.addMark( "Queries" )
+    self._stats[ 'queries' ] += 1
     now = time.time()
     stats = os.times()
     cpuTime = stats[0] + stats[2]
@@ -5,6 +5,7 @@ from DIRAC.Core.Utilities import Network, List
 from DIRAC.ConfigurationSystem.Client.ConfigurationData import gConfigurationData
 from DIRAC.ConfigurationSystem.Client import PathFinder
 from DIRAC.Core.DISET.private.Protocols import gDefaultProtocol
+from DIRAC.Core.DISET.private import Compression
 
 class ServiceConfiguration:
 
@@ -86,6 +87,52 @@ class ServiceConfiguration:
     except:
       return 1
 
+  def getWorkerProcesses( self ):
+    try:
+      return max( 1, int( self.getOption( "WorkerProcesses" ) ) )
+    except:
+      return 1
+
+  def getWorkerStopTimeout( self ):
+    try:
+      return int( self.getOption( "WorkerStopTimeout" ) )
+    except:
+      return 60
+
+  def getKeepConnections( self ):
+    optionValue = self.getOption( "KeepConnections" )
+    if optionValue:
+      return optionValue.lower() in ( "y", "yes", "true", "1" )
+    return False
+
+  def getEventReactor( self ):
+    optionValue = self.getOption( "EventReactor" )
+    if optionValue:
+      return optionValue.lower() in ( "y", "yes", "true", "1" )
+    return False
+
+  def getCompressionCodecs( self ):
+    """ Codecs the clients can ask for to compress the messages. None to disable compression
+    """
+    optionValue = self.getOption( "Compression" )
+    if optionValue:
+      if optionValue.lower() in ( "n", "no", "false", "0", "none" ):
+        return []
+      return List.fromChar( optionValue )
+    return Compression.getAvailableCodecs()
+
+  def getCompressionThreshold( self ):
+    try:
+      return int( self.getOption( "CompressionThreshold" ) )
+    except:
+      return 4096
+
+  def getConnectionIdleTimeout( self ):
+    try:
+      return int( self.getOption( "ConnectionIdleTimeout" ) )
+    except:
+      return 60
+
   def getPort( self ):
     try:
       return int( self.getOption( "Port" ) )
@@ -1,13 +1,16 @@
 __RCSID__ = "$Id$"
 
 import time
+import errno
+import socket
 import select
 import cStringIO
 from hashlib import md5
 
 from DIRAC.Core.Utilities.ReturnValues import S_ERROR, S_OK
 from DIRAC.FrameworkSystem.Client.Logger import gLogger
-from DIRAC.Core.Utilities import DEncode
+from DIRAC.Core.Utilities import DEncode, Network
+from DIRAC.Core.DISET.private import Compression
 
 class BaseTransport( object ):
 
@@ -39,6 +42,10 @@ class BaseTransport( object ):
         pass
     self.__lastActionTimestamp = time.time()
     self.__lastServerRenewTimestamp = self.__lastActionTimestamp
+    self.__creationTimestamp = self.__lastActionTimestamp
+    self.__compressionCodec = False
+    self.__compressionThreshold = 0
+    self.__byteCounters = { 'rawSent' : 0, 'sent' : 0, 'rawReceived' : 0, 'received' : 0 }
 
   def __updateLastActionTimestamp( self ):
     self.__lastActionTimestamp = time.time()
@@ -46,12 +53,39 @@ class BaseTransport( object ):
   def getLastActionTimestamp( self ):
     return self.__lastActionTimestamp
 
+  def getCreationTimestamp( self ):
+    return self.__creationTimestamp
+
   def getKeepAliveLapse( self ):
     return self.__keepAliveLapse
 
+  def setCompression( self, codec, threshold = 0 ):
+    """ Compress the messages sent from now on bigger than threshold bytes.
+        codec has to be negotiated with the peer beforehand. False disables compression
+    """
+    self.__compressionCodec = codec
+    self.__compressionThreshold = max( 0, threshold )
+
+  def getCompression( self ):
+    return self.__compressionCodec
+
+  def getByteCounters( self, reset = False ):
+    """ Bytes sent and received before ( raw ) and after compression
+    """
+    counters = dict( self.__byteCounters )
+    if reset:
+      for key in self.__byteCounters:
+        self.__byteCounters[ key ] = 0
+    return counters
+
   def handshake( self ):
     return S_OK()
 
+  def getHandshakeInfo( self ):
+    """ Details of the last handshake for the transports doing one
+    """
+    return {}
+
   def close( self ):
     self.oSocket.close()
 
@@ -110,13 +144,87 @@ class BaseTransport( object ):
   def _write( self, buffer ):
     return S_OK( self.oSocket.send( buffer ) )
 
+  def _readAvailable( self, bufSize = 16384 ):
+    """ Read without blocking. Returns S_OK( None ) if there's nothing to be read yet
+    """
+    try:
+      data = self.oSocket.recv( bufSize, socket.MSG_DONTWAIT )
+    except socket.timeout:
+      return S_OK( None )
+    except socket.error as e:
+      if e.args and e.args[0] in ( errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR ):
+        return S_OK( None )
+      return S_ERROR( "Exception while reading from peer: %s" % str( e ) )
+    if not data:
+      return S_ERROR( "Connection closed by peer" )
+    return S_OK( data )
+
+  def checkBufferedMessage( self ):
+    """ Check if a complete message ( and the keep alives before it ) is already
+        in the receive buffer, so receiveData won't block
+    """
+    keepAliveMagicLen = len( BaseTransport.keepAliveMagic )
+    position = 0
+    while True:
+      isKeepAlive = self.byteStream.startswith( BaseTransport.keepAliveMagic, position )
+      if isKeepAlive:
+        position += keepAliveMagicLen
+      iSeparatorPosition = self.byteStream.find( ":", position, position + 11 )
+      if iSeparatorPosition == -1:
+        if len( self.byteStream ) - position > 11:
+          return S_ERROR( "Invalid message header" )
+        return S_OK( False )
+      sizeStart = position
+      if Compression.getCodecForMarker( self.byteStream[ position:position + 1 ] ):
+        sizeStart += 1
+      try:
+        pkgSize = int( self.byteStream[ sizeStart:iSeparatorPosition ] )
+      except ValueError:
+        return S_ERROR( "Invalid message header" )
+      position = iSeparatorPosition + 1 + pkgSize
+      if len( self.byteStream ) < position:
+        return S_OK( False )
+      if not isKeepAlive:
+        return S_OK( True )
+
+  def bufferAvailableData( self, maxBufferSize = 0 ):
+    """ Buffer without blocking the data already sent by the peer.
+        Returns S_OK( True ) once a complete message has been buffered
+    """
+    while True:
+      result = self.checkBufferedMessage()
+      if not result[ 'OK' ] or result[ 'Value' ]:
+        return result
+      retVal = self._readAvailable()
+      if not retVal[ 'OK' ]:
+        return retVal
+      if retVal[ 'Value' ] is None:
+        return S_OK( False )
+      self.byteStream += retVal[ 'Value' ]
+      if maxBufferSize and len( self.byteStream ) > maxBufferSize:
+        return S_ERROR( "Read limit exceeded (%s chars)" % maxBufferSize )
+
   def sendData( self, uData, prefix = False ):
+    return self.sendEncodedData( DEncode.encode( uData ), prefix )
+
+  def sendEncodedData( self, sCodedData, prefix = False ):
+    """ Send data that has already been DEncoded
+    """
     self.__updateLastActionTimestamp()
-    sCodedData = DEncode.encode( uData )
+    self.__byteCounters[ 'rawSent' ] += len( sCodedData )
+    header = ""
+    codec = self.__compressionCodec
+    if codec and len( sCodedData ) >= self.__compressionThreshold:
+      compressedData = Compression.compress( codec, sCodedData )
+      #Not worth it if it doesn't shrink
+      if len( compressedData ) < len( sCodedData ):
+        header = Compression.getMarker( codec )
+        sCodedData = compressedData
+    self.__byteCounters[ 'sent' ] += len( sCodedData )
     if prefix:
-      dataToSend = "%s%s:%s" % ( prefix, len( sCodedData ), sCodedData )
+      dataToSend = "%s%s%s:%s" % ( prefix, header, len( sCodedData ), sCodedData )
     else:
-      dataToSend = "%s:%s" % ( len( sCodedData ), sCodedData )
+      dataToSend = "%s%s:%s" % ( header, len( sCodedData ), sCodedData )
     for index in range( 0, len( dataToSend ), self.packetSize ):
       bytesToSend = min( self.packetSize, len( dataToSend ) - index )
       packSentBytes = 0
@@ -135,6 +243,124 @@ class BaseTransport( object ):
     sCodedData=None
     return S_OK()
 
+  def canSendFile( self ):
+    """ Transports writing straight to the socket can send files with sendfile
+    """
+    return False
+
+  def sendRawData( self, rawData ):
+    """ Send the bytes of rawData ( any object with the buffer interface ) out of the
+        message framing. The peer has to know how many bytes to read with receiveRawData
+    """
+    self.__updateLastActionTimestamp()
+    size = len( rawData )
+    sentBytes = 0
+    while sentBytes < size:
+      try:
+        result = self._write( buffer( rawData, sentBytes, self.packetSize ) )
+        if not result[ 'OK' ]:
+          return result
+      except Exception as e:
+        return S_ERROR( "Exception while sending data: %s" % e )
+      if result[ 'Value' ] == 0:
+        return S_ERROR( "Connection closed by peer" )
+      sentBytes += result[ 'Value' ]
+    self.__byteCounters[ 'rawSent' ] += size
+    self.__byteCounters[ 'sent' ] += size
+    return S_OK()
+
+  def sendFileData( self, iFD, size ):
+    """ Send raw size bytes from the file descriptor iFD with sendfile
+    """
+    if not self.canSendFile():
+      return S_ERROR( "Transport can't send files with sendfile" )
+    self.__updateLastActionTimestamp()
+    result = Network.sendFile( self.oSocket, iFD, size, self.iReadTimeout )
+    if not result[ 'OK' ]:
+      return result
+    self.__byteCounters[ 'rawSent' ] += size
+    self.__byteCounters[ 'sent' ] += size
+    return S_OK()
+
+  def _readInto( self, view ):
+    """ Read into the view of a bytearray. Returns the number of bytes read
+    """
+    retVal = self._read( len( view ) )
+    if not retVal[ 'OK' ]:
+      return retVal
+    data = retVal[ 'Value' ]
+    if not data:
+      return S_ERROR( "Connection closed by peer" )
+    view[ :len( data ) ] = data
+    return S_OK( len( data ) )
+
+  def receiveRawData( self, rawBuffer, size ):
+    """ Fill the first size bytes of the rawBuffer bytearray with data sent by the
+        peer with sendRawData or sendFileData
+    """
+    self.__updateLastActionTimestamp()
+    #Part of the data can have been read together with the previous message
+    receivedBytes = min( size, len( self.byteStream ) )
+    if receivedBytes:
+      rawBuffer[ :receivedBytes ] = self.byteStream[ :receivedBytes ]
+      self.byteStream = self.byteStream[ receivedBytes: ]
+    view = memoryview( rawBuffer )
+    while receivedBytes < size:
+      retVal = self._readInto( view[ receivedBytes:size ] )
+      if not retVal[ 'OK' ]:
+        return retVal
+      receivedBytes += retVal[ 'Value' ]
+    self.__byteCounters[ 'rawReceived' ] += size
+    self.__byteCounters[ 'received' ] += size
+    return S_OK( size )
+
+
+  def __receiveHeader( self, maxBufferSize ):
+    """ Read until either a message length or a keep alive magic string is found
+        Returns the position of the message length separator or -1 if it's a keep alive
+    """
+    #Look either for message length of keep alive magic string
+    iSeparatorPosition = self.byteStream.find( ":", 0, 11 )
+    keepAliveMagicLen = len( BaseTransport.keepAliveMagic )
+    isKeepAlive = self.byteStream.find( BaseTransport.keepAliveMagic, 0, keepAliveMagicLen ) == 0
+    #While not found the message length or the ka, keep receiving
+    while iSeparatorPosition == -1 and not isKeepAlive:
+      retVal = self._read( 16384 )
+      #If error return
+      if not retVal[ 'OK' ]:
+        return retVal
+      #If closed return error
+      if not retVal[ 'Value' ]:
+        return S_ERROR( "Peer closed connection" )
+      #New data!
+      self.byteStream += retVal[ 'Value' ]
+      #Look again for either message length of ka magic string
+      iSeparatorPosition = self.byteStream.find( ":", 0, 11 )
+      isKeepAlive = self.byteStream.find( BaseTransport.keepAliveMagic, 0, keepAliveMagicLen ) == 0
+      #Over the limit?
+      if maxBufferSize and len( self.byteStream ) > maxBufferSize and iSeparatorPosition == -1 :
+        return S_ERROR( "Read limit exceeded (%s chars)" % maxBufferSize )
+    #Keep alive magic!
+    if isKeepAlive:
+      gLogger.debug( "Received keep alive header" )
+      #Remove the ka magic from the buffer
+      self.byteStream = self.byteStream[ keepAliveMagicLen: ]
+      return S_OK( -1 )
+    return S_OK( iSeparatorPosition )
+
+  def __getMessageHeader( self, iSeparatorPosition ):
+    """ Get the message size and the codec it's compressed with ( False if it's not ).
+        Only the codec negotiated for the connection is accepted
+    """
+    codec = Compression.getCodecForMarker( self.byteStream[ :1 ] )
+    if codec:
+      if codec != self.__compressionCodec:
+        return S_ERROR( "Received data compressed with %s, that was not negotiated" % codec )
+      pkgSize = int( self.byteStream[ 1:iSeparatorPosition ] )
+    else:
+      pkgSize = int( self.byteStream[ :iSeparatorPosition ] )
+    self.__byteCounters[ 'received' ] += pkgSize
+    return S_OK( ( pkgSize, codec ) )
 
   def receiveData( self, maxBufferSize = 0, blockAfterKeepAlive = True, idleReceive = False ):
     self.__updateLastActionTimestamp()
@@ -143,36 +369,19 @@ class BaseTransport( object ):
     #Buffer size can't be less than 0
     maxBufferSize = max( maxBufferSize, 0 )
     try:
-      #Look either for message length of keep alive magic string
-      iSeparatorPosition = self.byteStream.find( ":", 0, 10 )
-      keepAliveMagicLen = len( BaseTransport.keepAliveMagic )
-      isKeepAlive = self.byteStream.find( BaseTransport.keepAliveMagic, 0, keepAliveMagicLen ) == 0
-      #While not found the message length or the ka, keep receiving
-      while iSeparatorPosition == -1 and not isKeepAlive:
-        retVal = self._read( 16384 )
-        #If error return
-        if not retVal[ 'OK' ]:
-          return retVal
-        #If closed return error
-        if not retVal[ 'Value' ]:
-          return S_ERROR( "Peer closed connection" )
-        #New data!
-        self.byteStream += retVal[ 'Value' ]
-        #Look again for either message length of ka magic string
-        iSeparatorPosition = self.byteStream.find( ":", 0, 10 )
-        isKeepAlive = self.byteStream.find( BaseTransport.keepAliveMagic, 0, keepAliveMagicLen ) == 0
-        #Over the limit?
-        if maxBufferSize and len( self.byteStream ) > maxBufferSize and iSeparatorPosition == -1 :
-          return S_ERROR( "Read limit exceeded (%s chars)" % maxBufferSize )
+      retVal = self.__receiveHeader( maxBufferSize )
+      if not retVal[ 'OK' ]:
+        return retVal
+      iSeparatorPosition = retVal[ 'Value' ]
       #Keep alive magic!
-      if isKeepAlive:
-        gLogger.debug( "Received keep alive header" )
-        #Remove the ka magic from the buffer and process the keep alive
-        self.byteStream = self.byteStream[ keepAliveMagicLen: ]
+      if iSeparatorPosition == -1:
         return self.__processKeepAlive( maxBufferSize, blockAfterKeepAlive )
       #From here it must be a real message!
       #Process the size and remove the msg length from the bytestream
-      pkgSize = int( self.byteStream[ :iSeparatorPosition ] )
+      retVal = self.__getMessageHeader( iSeparatorPosition )
+      if not retVal[ 'OK' ]:
+        return retVal
+      pkgSize, codec = retVal[ 'Value' ]
       pkgData = self.byteStream[ iSeparatorPosition + 1: ]
       readSize = len( pkgData )
       if readSize >= pkgSize:
@@ -203,6 +412,12 @@ class BaseTransport( object ):
           pkgMem.seek( 0, 0 )
           data = pkgMem.read( pkgSize )
           self.byteStream = pkgMem.read()
+      if codec:
+        try:
+          data = Compression.decompress( codec, data, maxBufferSize )
+        except Exception as e:
+          return S_ERROR( "Could not decompress received data: %s" % str( e ) )
+      self.__byteCounters[ 'rawReceived' ] += len( data )
       try:
         data = DEncode.decode( data )[0]
       except Exception as e:
@@ -215,6 +430,61 @@ class BaseTransport( object ):
       gLogger.exception( "Network error while receiving data" )
       return S_ERROR( "Network error while receiving data: %s" % str( e ) )
 
+  def receiveDataIterator( self, maxBufferSize = 0 ):
+    """ Receive a message containing a list, tuple or dict and yield its items
+        ( ( key, value ) pairs for dicts ) as soon as they arrive instead of waiting
+        for the whole message to be received. Errors are raised as IOError
+    """
+    self.__updateLastActionTimestamp()
+    maxBufferSize = max( maxBufferSize, 0 )
+    while True:
+      retVal = self.__receiveHeader( maxBufferSize )
+      if not retVal[ 'OK' ]:
+        raise IOError( retVal[ 'Message' ] )
+      iSeparatorPosition = retVal[ 'Value' ]
+      if iSeparatorPosition > -1:
+        break
+      retVal = self.__processKeepAlive( maxBufferSize, blockAfterKeepAlive = False )
+      if not retVal[ 'OK' ]:
+        raise IOError( retVal[ 'Message' ] )
+    retVal = self.__getMessageHeader( iSeparatorPosition )
+    if not retVal[ 'OK' ]:
+      raise IOError( retVal[ 'Message' ] )
+    pkgSize, codec = retVal[ 'Value' ]
+    pkgData = self.byteStream[ iSeparatorPosition + 1: ]
+    decoder = DEncode.StreamDecoder()
+    decompressor = None
+    if codec:
+      decompressor = Compression.StreamDecompressor( codec, maxBufferSize )
+    self.byteStream = pkgData[ pkgSize: ]
+    rcvData = pkgData[ :pkgSize ]
+    readSize = len( pkgData )
+    del pkgData
+    while True:
+      if decompressor:
+        try:
+          rcvData = decompressor.decompress( rcvData, lastChunk = readSize >= pkgSize )
+        except Exception as e:
+          raise IOError( "Could not decompress received data: %s" % str( e ) )
+      self.__byteCounters[ 'rawReceived' ] += len( rcvData )
+      decoder.feed( rcvData )
+      if readSize >= pkgSize:
+        break
+      for item in decoder.getItems():
+        yield item
+      retVal = self._read( min( pkgSize - readSize, self.packetSize ), skipReadyCheck = True )
+      if not retVal[ 'OK' ]:
+        raise IOError( retVal[ 'Message' ] )
+      if not retVal[ 'Value' ]:
+        raise IOError( "Peer closed connection" )
+      rcvData = retVal[ 'Value' ]
+      readSize += len( rcvData )
+      if maxBufferSize and readSize > maxBufferSize:
+        raise IOError( "Read limit exceeded (%s chars)" % maxBufferSize )
+      self.__updateLastActionTimestamp()
+    for item in decoder.getItems( lastChunk = True ):
+      yield item
+
   def __processKeepAlive( self, maxBufferSize, blockAfterKeepAlive = True ):
     gLogger.debug( "Received Keep Alive" )
     #Next message down the stream will be the ka data
@@ -5,6 +5,7 @@ import select
 import time
 import os
 from DIRAC.Core.DISET.private.Transports.BaseTransport import BaseTransport
+from DIRAC.Core.Utilities import Network
 from DIRAC.FrameworkSystem.Client.Logger import gLogger
 from DIRAC.Core.Utilities.ReturnValues import S_ERROR, S_OK
 
@@ -36,6 +37,9 @@ class PlainTransport( BaseTransport ):
     self.oSocket = socket.socket( socket.AF_INET6, socket.SOCK_STREAM )
     if self.bAllowReuseAddress:
       self.oSocket.setsockopt( socket.SOL_SOCKET, socket.SO_REUSEADDR, 1 )
+    if self.extraArgsDict.get( 'reusePort' ) and not Network.setReusePort( self.oSocket ):
+      self.oSocket.close()
+      return S_ERROR( "SO_REUSEPORT is not supported" )
     self.oSocket.bind( self.stServerAddress )
     self.oSocket.listen( self.iListenQueueSize )
     return S_OK( self.oSocket )
@@ -83,6 +87,27 @@ class PlainTransport( BaseTransport ):
       except Exception as e:
         return S_ERROR( "Exception while reading from peer: %s" % str( e ) )
 
+  def canSendFile( self ):
+    return Network.isSendFileAvailable()
+
+  def _readInto( self, view ):
+    if not self._readReady():
+      return S_ERROR( "Connection seems stalled. Closing..." )
+    while True:
+      try:
+        readBytes = self.oSocket.recv_into( view )
+        break
+      except socket.error, e:
+        if e[0] == 11:
+          time.sleep( 0.001 )
+        else:
+          return S_ERROR( "Exception while reading from peer: %s" % str( e ) )
+      except Exception as e:
+        return S_ERROR( "Exception while reading from peer: %s" % str( e ) )
+    if not readBytes:
+      return S_ERROR( "Connection closed by peer" )
+    return S_OK( readBytes )
+
   def _write( self, buffer ):
     sentBytes = 0
     timeout = False
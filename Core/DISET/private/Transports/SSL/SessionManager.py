@@ -1,28 +1,73 @@
 # $HeadURL$
 __RCSID__ = "$Id$"
 
+import time
+import threading
 import GSI
 
 class SessionManager:
+  """ Client SSL sessions to resume, they are dropped after their lifetime
+  """
 
-  def __init__( self ):
+  def __init__( self, lifeTime = 900 ):
+    #sessionId -> ( session, expiration time )
     self.sessionsDict = {}
+    self.__lifeTime = lifeTime
+    self.__lock = threading.Lock()
+    self.__lastPurge = time.time()
 
   def __generateSession( self ):
     return GSI.SSL.Session()
 
   def get( self, sessionId ):
-    if sessionId not in self.sessionsDict:
-      self.sessionsDict[ sessionId ] = self.__generateSession()
-    return self.sessionsDict[ sessionId ]
+    self.__lock.acquire()
+    try:
+      if sessionId not in self.sessionsDict:
+        self.sessionsDict[ sessionId ] = ( self.__generateSession(), time.time() + self.__lifeTime )
+      return self.sessionsDict[ sessionId ][0]
+    finally:
+      self.__lock.release()
 
   def isValid( self, sessionId ):
-    return sessionId in self.sessionsDict and self.sessionsDict[ sessionId ].valid()
+    self.__lock.acquire()
+    try:
+      if sessionId not in self.sessionsDict:
+        return False
+      session, expiration = self.sessionsDict[ sessionId ]
+      if expiration < time.time():
+        del self.sessionsDict[ sessionId ]
+        return False
+      return session.valid()
+    finally:
+      self.__lock.release()
 
   def free( self, sessionId ):
-    self.sessionsDict[ sessionId ].free()
+    self.__lock.acquire()
+    try:
+      if sessionId in self.sessionsDict:
+        self.sessionsDict.pop( sessionId )[0].free()
+    finally:
+      self.__lock.release()
 
-  def set( self, sessionId, sessionObject ):
-    self.sessionsDict[ sessionId ] = sessionObject
+  def delete( self, sessionId ):
+    self.__lock.acquire()
+    try:
+      self.sessionsDict.pop( sessionId, None )
+    finally:
+      self.__lock.release()
 
-gSessionManager = SessionManager()
\ No newline at end of file
+  def set( self, sessionId, sessionObject, lifeTime = None ):
+    if lifeTime is None:
+      lifeTime = self.__lifeTime
+    now = time.time()
+    self.__lock.acquire()
+    try:
+      self.sessionsDict[ sessionId ] = ( sessionObject, now + lifeTime )
+      if now - self.__lastPurge > 300:
+        self.__lastPurge = now
+        for sId in [ sId for sId in self.sessionsDict if self.sessionsDict[ sId ][1] < now ]:
+          del self.sessionsDict[ sId ]
+    finally:
+      self.__lock.release()
+
+gSessionManager = SessionManager()
@@ -3,26 +3,34 @@ __RCSID__ = "$Id$"
 
 import time
 import copy
+import hashlib
 import os.path
 import GSI
 from DIRAC.Core.Utilities.ReturnValues import S_ERROR, S_OK
 from DIRAC.Core.Utilities.Network import checkHostsMatch
 from DIRAC.Core.Utilities.LockRing import LockRing
+from DIRAC.Core.Utilities.DictCache import LRUDictCache
 from DIRAC.Core.Security import Locations
 from DIRAC.Core.Security.X509Chain import X509Chain
 from DIRAC.FrameworkSystem.Client.Logger import gLogger
 
 DEFAULT_SSL_CIPHERS = "ECDH+AESGCM:DH+AESGCM:ECDH+AES256:DH+AES256:ECDH+AES128:DH+AES:ECDH+3DES:DH+3DES:RSA+AESGCM:RSA+AES:RSA+3DES:!aNULL:!MD5:!DSS"
+#Same lapse the CAs and CRLs are reloaded, resumed sessions skip those checks
+DEFAULT_SSL_SESSION_TIMEOUT = 900
 
 class SocketInfo:
 
   __cachedCAsCRLs = False
   __cachedCAsCRLsLastLoaded = 0
   __cachedCAsCRLsLoadLock = LockRing().getLock()
-
+  #Peer certificate fingerprint -> ( credentials dict, chain expiration time )
+  __credentialsCache = LRUDictCache( maxEntries = 10000 )
+  __credentialsCacheLastPurge = 0
 
   def __init__( self, infoDict, sslContext = None ):
     self.__retry = 0
+    self.__sessionResumed = False
+    self.__cachedCredentials = False
     self.infoDict = infoDict
     if sslContext:
       self.sslContext = sslContext
@@ -50,8 +58,55 @@ class SocketInfo:
   def getLocalCredentialsLocation( self ):
     return self.infoDict[ 'localCredentialsLocation' ]
 
+  def getSessionTimeout( self ):
+    return int( self.__getValue( 'SSLSessionTimeout', DEFAULT_SSL_SESSION_TIMEOUT ) )
+
+  def getHandshakeInfo( self ):
+    return { 'sessionResumed' : self.__sessionResumed,
+             'cachedCredentials' : self.__cachedCredentials }
+
+  def __getPeerFingerprint( self ):
+    #Chains of contexts not checking the CAs can't be trusted for other connections
+    if self.__getValue( 'skipCACheck', False ):
+      return False
+    peerCert = self.sslSocket.get_peer_certificate()
+    if not peerCert:
+      return False
+    return hashlib.sha1( GSI.crypto.dump_certificate( GSI.crypto.FILETYPE_PEM, peerCert ) ).hexdigest()
+
+  def __getCachedCredentials( self, fingerprint ):
+    now = time.time()
+    if now - SocketInfo.__credentialsCacheLastPurge > 300:
+      SocketInfo.__credentialsCacheLastPurge = now
+      SocketInfo.__credentialsCache.purgeExpired()
+    cached = SocketInfo.__credentialsCache.get( fingerprint )
+    if not cached:
+      return False
+    credDict, chainExpiration = cached
+    if not self.__sessionResumed:
+      #New sessions can be resumed for the whole session timeout from now on
+      self.__cacheCredentials( fingerprint, credDict, chainExpiration )
+    return dict( credDict )
+
+  def __cacheCredentials( self, fingerprint, credDict, chainExpiration ):
+    validSeconds = min( int( chainExpiration - time.time() ), self.getSessionTimeout() )
+    if validSeconds > 0:
+      SocketInfo.__credentialsCache.add( fingerprint, validSeconds, ( credDict, chainExpiration ) )
+
   def gatherPeerCredentials( self ):
+    """ Extract the credentials from the peer chain. The ones of already verified
+        peers are taken from the cache since resumed sessions don't send the chain
+    """
+    fingerprint = self.__getPeerFingerprint()
+    if fingerprint:
+      credDict = self.__getCachedCredentials( fingerprint )
+      if credDict:
+        self.__cachedCredentials = True
+        self.infoDict[ 'peerCredentials' ] = credDict
+        return S_OK( credDict )
     certList = self.sslSocket.get_peer_certificate_chain()
+    if certList is None:
+      return S_ERROR( "Peer certificate chain is not available" )
     #Servers don't receive the whole chain, the last cert comes alone
     if not self.infoDict[ 'clientMode' ]:
       certList.insert( 0, self.sslSocket.get_peer_certificate() )
@@ -73,8 +128,12 @@ class SocketInfo:
     diracGroup = peerChain.getDIRACGroup()
     if diracGroup[ 'OK' ] and diracGroup[ 'Value' ]:
       credDict[ 'group' ] = diracGroup[ 'Value' ]
+    if fingerprint:
+      result = peerChain.getRemainingSecs()
+      if result[ 'OK' ]:
+        self.__cacheCredentials( fingerprint, dict( credDict ), time.time() + result[ 'Value' ] )
     self.infoDict[ 'peerCredentials' ] = credDict
-    return credDict
+    return S_OK( credDict )
 
   def setSSLSocket( self, sslSocket ):
     self.sslSocket = sslSocket
@@ -287,10 +346,9 @@ class SocketInfo:
       return retVal
     self.sslContext.set_session_id( "DISETConnection%s" % str( time.time() ) )
     #self.sslContext.get_cert_store().set_flags( GSI.crypto.X509_CRL_CHECK )
-    if 'SSLSessionTimeout' in self.infoDict:
-      timeout = int( self.infoDict['SSLSessionTimeout'] )
-      gLogger.debug( "Setting session timeout to %s" % timeout )
-      self.sslContext.set_session_timeout( timeout )
+    timeout = self.getSessionTimeout()
+    gLogger.debug( "Setting session timeout to %s" % timeout )
+    self.sslContext.set_session_timeout( timeout )
     return S_OK()
 
   def doClientHandshake( self ):
@@ -334,7 +392,12 @@ class SocketInfo:
           gLogger.warn( "Error while handshaking", v )
           return S_ERROR( "Error while handshaking" )
         
-    credentialsDict = self.gatherPeerCredentials()
+    self.__sessionResumed = self.sslSocket.session_reused()
+    result = self.gatherPeerCredentials()
+    if not result[ 'OK' ]:
+      gLogger.warn( "Could not get the peer credentials", result[ 'Message' ] )
+      return result
+    credentialsDict = result[ 'Value' ]
     if self.infoDict[ 'clientMode' ]:
       hostnameCN = credentialsDict[ 'CN' ]
       #if hostnameCN.split("/")[-1] != self.infoDict[ 'hostname' ]:
@@ -114,6 +114,7 @@ class SocketInfoFactory:
       sessionHash.update( "|%s" % socketInfo.infoDict[ 'proxyChain' ].dumpAllToString()[ 'Value' ] )
     sessionId = sessionHash.hexdigest()
     socketInfo.sslContext.set_session_id( str( hash( sessionId ) ) )
+    socketInfo.infoDict[ 'sessionId' ] = sessionId
     socketInfo.setSSLSocket( sslSocket )
     if gSessionManager.isValid( sessionId ):
       sslSocket.set_session( gSessionManager.get( sessionId ) )
@@ -151,18 +152,23 @@ class SocketInfoFactory:
       if retVal[ 'OK' ]:
         #Everything went ok. Don't need to retry
         break
+    sessionId = socketInfo.infoDict[ 'sessionId' ]
     #Did the auth or the connection fail?
     if not retVal['OK']:
+      #Don't try to resume a session the server does not accept any more
+      gSessionManager.delete( sessionId )
       return retVal
-    if 'enableSessions' in kwargs and kwargs[ 'enableSessions' ]:
-      sessionId = hash( hostAddress )
-      gSessionManager.set( sessionId, sslSocket.get_session() )
+    if socketInfo.infoDict[ 'enableSessions' ] and not sslSocket.session_reused():
+      gSessionManager.set( sessionId, sslSocket.get_session(), socketInfo.getSessionTimeout() )
     return S_OK( socketInfo )
 
-  def getListeningSocket( self, hostAddress, listeningQueueSize = 5, reuseAddress = True, **kwargs ):
+  def getListeningSocket( self, hostAddress, listeningQueueSize = 5, reuseAddress = True, reusePort = False, **kwargs ):
     osSocket = socket.socket( socket.AF_INET6, socket.SOCK_STREAM )
     if reuseAddress:
       osSocket.setsockopt( socket.SOL_SOCKET, socket.SO_REUSEADDR, 1 )
+    if reusePort and not Network.setReusePort( osSocket ):
+      osSocket.close()
+      return S_ERROR( "SO_REUSEPORT is not supported" )
     retVal = self.generateServerInfo( kwargs )
     if not retVal[ 'OK' ]:
       return retVal
@@ -102,6 +102,9 @@ class SSLTransport( BaseTransport ):
       self.peerCredentials[ key ] = creds[ key ]
     return S_OK()
 
+  def getHandshakeInfo( self ):
+    return self.oSocketInfo.getHandshakeInfo()
+
   def setClientSocket( self, oSocket ):
     if self.serverMode():
       raise RuntimeError( "Must be initialized as client mode" )
@@ -144,6 +147,23 @@ class SSLTransport( BaseTransport ):
     finally:
       self.__unlock()
 
+  def _readAvailable( self, bufSize = 16384 ):
+    self.__lock()
+    try:
+      try:
+        data = self.oSocket.recv( bufSize )
+      except ( GSI.SSL.WantReadError, GSI.SSL.WantWriteError ):
+        return S_OK( None )
+      except GSI.SSL.ZeroReturnError:
+        return S_ERROR( "Connection closed by peer" )
+      except Exception as e:
+        return S_ERROR( "Exception while reading from peer: %s" % str( e ) )
+      if not data:
+        return S_ERROR( "Connection closed by peer" )
+      return S_OK( data )
+    finally:
+      self.__unlock()
+
   def isLocked( self ):
     return self.__locked
 
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+""" Throughput of the FileHelper transfers
+
+    Reproduces over a loopback TCP connection what the SandboxStore does in
+    transfer_fromClient ( the service writes what the client sends to a file ) and
+    transfer_toClient ( the service sends a file from disk ), comparing the DISET
+    messages with the streamed transfers, with and without checksum:
+
+      python Benchmark_FileHelper.py [fileSizeInMB] [tmpDir]
+"""
+
+__RCSID__ = "$Id$"
+
+import os
+import sys
+import time
+import socket
+import tempfile
+import threading
+
+from DIRAC.Core.DISET.private.FileHelper import FileHelper
+from DIRAC.Core.DISET.private.Transports.PlainTransport import PlainTransport
+
+MODES = ( ( "messages", False, True ),
+          ( "streamed", True, True ),
+          ( "streamed, no checksum", True, False ) )
+
+def getTransports():
+  """ Both ends of a loopback TCP connection """
+  listenSocket = socket.socket( socket.AF_INET, socket.SOCK_STREAM )
+  listenSocket.bind( ( "127.0.0.1", 0 ) )
+  listenSocket.listen( 1 )
+  clientSocket = socket.create_connection( listenSocket.getsockname() )
+  serverSocket = listenSocket.accept()[0]
+  listenSocket.close()
+  transports = []
+  for sock in ( clientSocket, serverSocket ):
+    transport = PlainTransport( ( "127.0.0.1", 0 ) )
+    transport.oSocket = sock
+    transports.append( transport )
+  return transports
+
+def generateFile( filePath, sizeMB ):
+  block = os.urandom( 1048576 )
+  fd = os.open( filePath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600 )
+  try:
+    for _i in xrange( sizeMB ):
+      os.write( fd, block )
+  finally:
+    os.close( fd )
+
+def sendFile( fileHelper, filePath, results ):
+  fd = os.open( filePath, os.O_RDONLY )
+  try:
+    results.append( fileHelper.FDToNetwork( fd ) )
+  finally:
+    os.close( fd )
+
+def receiveFile( fileHelper, filePath, results ):
+  fd = os.open( filePath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600 )
+  #networkToFD closes the descriptor
+  results.append( fileHelper.networkToFD( fd ) )
+
+def timeTransfer( srcPath, dstPath, fromClient, streaming, checkSum ):
+  """ Seconds to transfer srcPath into dstPath """
+  clientTransport, serviceTransport = getTransports()
+  helpers = []
+  for transport in ( clientTransport, serviceTransport ):
+    fileHelper = FileHelper( transport, checkSum = checkSum )
+    if streaming:
+      fileHelper.enableStreaming()
+    helpers.append( fileHelper )
+  if fromClient:
+    sender, receiver = helpers
+  else:
+    receiver, sender = helpers
+  results = []
+  start = time.time()
+  thread = threading.Thread( target = sendFile, args = ( sender, srcPath, results ) )
+  thread.start()
+  receiveFile( receiver, dstPath, results )
+  thread.join()
+  elapsed = time.time() - start
+  for transport in ( clientTransport, serviceTransport ):
+    transport.oSocket.close()
+  for result in results:
+    if not result[ 'OK' ]:
+      raise RuntimeError( result[ 'Message' ] )
+  return elapsed
+
+def runBenchmark( sizeMB, tmpDir ):
+  srcPath = tempfile.mktemp( dir = tmpDir )
+  dstPath = tempfile.mktemp( dir = tmpDir )
+  generateFile( srcPath, sizeMB )
+  try:
+    print "%-14s %-24s %10s %12s" % ( "Path", "Mode", "Time (s)", "MB/s" )
+    for pathName, fromClient in ( ( "fromClient", True ), ( "toClient", False ) ):
+      for modeName, streaming, checkSum in MODES:
+        elapsed = timeTransfer( srcPath, dstPath, fromClient, streaming, checkSum )
+        print "%-14s %-24s %10.2f %12.1f" % ( pathName, modeName, elapsed, sizeMB / elapsed )
+  finally:
+    for filePath in ( srcPath, dstPath ):
+      if os.path.exists( filePath ):
+        os.unlink( filePath )
+
+if __name__ == "__main__":
+  fileSize = 2048
+  if len( sys.argv ) > 1:
+    fileSize = int( sys.argv[1] )
+  tmpDir = None
+  if len( sys.argv ) > 2:
+    tmpDir = sys.argv[2]
+  runBenchmark( fileSize, tmpDir )
@@ -0,0 +1,102 @@
+""" Test cases for the compression of the messages sent through DISET transports
+"""
+
+__RCSID__ = "$Id$"
+
+import socket
+import unittest
+
+# sut
+from DIRAC.Core.DISET.private import Compression
+from DIRAC.Core.DISET.private.Transports.PlainTransport import PlainTransport
+
+class CompressionTestCase( unittest.TestCase ):
+
+  def setUp( self ):
+    self.sockets = socket.socketpair()
+    self.sender = PlainTransport( ( "localhost", 0 ) )
+    self.sender.oSocket = self.sockets[0]
+    self.receiver = PlainTransport( ( "localhost", 0 ) )
+    self.receiver.oSocket = self.sockets[1]
+    self.payload = [ "/lhcb/MC/2012/ALLSTREAMS.DST/00012345/0000/00012345_%08d_1.allstreams.dst" % i
+                     for i in range( 500 ) ]
+
+  def tearDown( self ):
+    for sock in self.sockets:
+      sock.close()
+
+  def testNegotiation( self ):
+    """ first proposed codec known in both ends """
+    self.assertEqual( Compression.negotiateCodec( [ 'unknown', 'zlib' ] ), 'zlib' )
+    self.assertEqual( Compression.negotiateCodec( [ 'zlib' ], [ 'lz4' ] ), False )
+    self.assertEqual( Compression.negotiateCodec( 'zlib' ), False )
+
+  def testCodecs( self ):
+    """ compress/decompress roundtrip for all the available codecs """
+    data = "".join( self.payload )
+    for codec in Compression.getAvailableCodecs():
+      self.assertEqual( Compression.decompress( codec, Compression.compress( codec, data ) ), data )
+      decompressor = Compression.StreamDecompressor( codec )
+      compressedData = Compression.compress( codec, data )
+      chunks = [ decompressor.decompress( compressedData[ i : i + 100 ],
+                                          lastChunk = i + 100 >= len( compressedData ) )
+                 for i in range( 0, len( compressedData ), 100 ) ]
+      self.assertEqual( "".join( chunks ), data )
+
+  def testOutputLimit( self ):
+    """ decompression stops as soon as the output goes over the limit """
+    data = "0" * 10000000
+    for codec in Compression.getAvailableCodecs():
+      compressedData = Compression.compress( codec, data )
+      self.assertEqual( Compression.decompress( codec, compressedData, len( data ) ), data )
+      self.assertRaises( ValueError, Compression.decompress, codec, compressedData, 1024 )
+      decompressor = Compression.StreamDecompressor( codec, 1024 )
+      self.assertRaises( ValueError, decompressor.decompress, compressedData[ :100 ] )
+
+  def testCompressedMessages( self ):
+    """ messages over the threshold are compressed """
+    self.sender.setCompression( 'zlib', 1024 )
+    self.receiver.setCompression( 'zlib' )
+    for message in ( "small", self.payload ):
+      self.assert_( self.sender.sendData( message )[ 'OK' ] )
+      self.assertEqual( self.receiver.receiveData(), message )
+    sentCounters = self.sender.getByteCounters()
+    receivedCounters = self.receiver.getByteCounters()
+    self.assert_( sentCounters[ 'sent' ] < sentCounters[ 'rawSent' ] / 5 )
+    self.assertEqual( sentCounters[ 'sent' ], receivedCounters[ 'received' ] )
+    self.assertEqual( sentCounters[ 'rawSent' ], receivedCounters[ 'rawReceived' ] )
+
+  def testUncompressed( self ):
+    """ without compression the payload goes as is """
+    self.assert_( self.sender.sendData( self.payload )[ 'OK' ] )
+    self.assertEqual( self.receiver.receiveData(), self.payload )
+    counters = self.sender.getByteCounters( reset = True )
+    self.assertEqual( counters[ 'sent' ], counters[ 'rawSent' ] )
+    self.assertEqual( self.sender.getByteCounters()[ 'sent' ], 0 )
+
+  def testNotNegotiated( self ):
+    """ compressed data is only accepted with the codec negotiated """
+    self.sender.setCompression( 'zlib' )
+    self.assert_( self.sender.sendData( self.payload )[ 'OK' ] )
+    self.assertFalse( self.receiver.receiveData()[ 'OK' ] )
+
+  def testReceiveLimit( self ):
+    """ the read limit applies to the decompressed data """
+    self.sender.setCompression( 'zlib' )
+    self.receiver.setCompression( 'zlib' )
+    self.assert_( self.sender.sendData( "0" * 100000 )[ 'OK' ] )
+    self.assertFalse( self.receiver.receiveData( 1024 )[ 'OK' ] )
+    self.assert_( self.sender.sendData( self.payload )[ 'OK' ] )
+    self.assertRaises( IOError, list, self.receiver.receiveDataIterator( 1024 ) )
+
+  def testCompressedIterator( self ):
+    """ compressed messages can be decoded while they arrive """
+    self.sender.setCompression( 'zlib' )
+    self.receiver.setCompression( 'zlib' )
+    self.receiver.packetSize = 512
+    self.assert_( self.sender.sendData( self.payload )[ 'OK' ] )
+    self.assertEqual( list( self.receiver.receiveDataIterator() ), self.payload )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( CompressionTestCase )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,98 @@
+""" Test cases for the epoll event reactor of the DISET services
+"""
+
+__RCSID__ = "$Id$"
+
+import socket
+import unittest
+
+from DIRAC.Core.Utilities import DEncode
+# sut
+from DIRAC.Core.DISET.private import EventReactor
+from DIRAC.Core.DISET.private.Transports.PlainTransport import PlainTransport
+
+class EventReactorTestCase( unittest.TestCase ):
+
+  def setUp( self ):
+    self.sockets = socket.socketpair()
+    self.sender = PlainTransport( ( "localhost", 0 ) )
+    self.sender.oSocket = self.sockets[0]
+    self.receiver = PlainTransport( ( "localhost", 0 ) )
+    self.receiver.oSocket = self.sockets[1]
+    self.ready = []
+    self.errors = []
+
+  def tearDown( self ):
+    for sock in self.sockets:
+      sock.close()
+
+  def __readyCallback( self, *args ):
+    self.ready.append( args )
+
+  def __errorCallback( self, errMsg, *args ):
+    self.errors.append( ( errMsg, ) + args )
+
+  def testBufferedMessage( self ):
+    """ a message is only complete once all its bytes are buffered """
+    data = DEncode.encode( [ "hello", "a" ] )
+    message = "%s:%s" % ( len( data ), data )
+    self.assertEqual( self.receiver.bufferAvailableData()[ 'Value' ], False )
+    for chunk in ( message[ :2 ], message[ 2:-1 ] ):
+      self.sockets[0].sendall( chunk )
+      self.assertEqual( self.receiver.bufferAvailableData()[ 'Value' ], False )
+    self.sockets[0].sendall( message[ -1: ] )
+    self.assertEqual( self.receiver.bufferAvailableData()[ 'Value' ], True )
+    self.assertEqual( self.receiver.receiveData(), [ "hello", "a" ] )
+
+  def testKeepAliveBeforeMessage( self ):
+    """ keep alives before the message are buffered with it """
+    self.assert_( self.sender.sendKeepAlive( responseId = "kaid" )[ 'OK' ] )
+    self.assertEqual( self.receiver.bufferAvailableData()[ 'Value' ], False )
+    self.assert_( self.sender.sendData( { 'hello' : 'world' } )[ 'OK' ] )
+    self.assertEqual( self.receiver.bufferAvailableData()[ 'Value' ], True )
+    self.assertEqual( self.receiver.receiveData(), { 'hello' : 'world' } )
+
+  def testBufferErrors( self ):
+    """ invalid headers, buffer limit and closed connections are errors """
+    self.sockets[0].sendall( "this is not a DISET message" )
+    self.assertFalse( self.receiver.bufferAvailableData()[ 'OK' ] )
+    self.receiver.byteStream = ""
+    self.assert_( self.sender.sendData( "x" * 1000 )[ 'OK' ] )
+    self.assertFalse( self.receiver.bufferAvailableData( 100 )[ 'OK' ] )
+    self.receiver.byteStream = ""
+    self.sockets[0].shutdown( socket.SHUT_WR )
+    self.assertFalse( self.receiver.bufferAvailableData()[ 'OK' ] )
+
+  def testDispatch( self ):
+    """ the callback is called once the message arrives """
+    if not EventReactor.isAvailable():
+      return
+    reactor = EventReactor.EventReactor()
+    reactor.watchTransport( self.receiver, 60, self.__readyCallback, self.__errorCallback, ( "trid", ) )
+    self.assertEqual( reactor.getNumWatched(), 1 )
+    reactor.processEvents( 0 )
+    self.assertEqual( self.ready, [] )
+    self.assert_( self.sender.sendData( "proposal" )[ 'OK' ] )
+    reactor.processEvents( 1 )
+    self.assertEqual( self.ready, [ ( "trid", ) ] )
+    self.assertEqual( reactor.getNumWatched(), 0 )
+    self.assertEqual( self.receiver.receiveData(), "proposal" )
+    #Already buffered messages are dispatched straight away
+    self.assert_( self.sender.sendData( "next" )[ 'OK' ] )
+    reactor.watchTransport( self.receiver, 60, self.__readyCallback, self.__errorCallback, ( "trid2", ) )
+    self.assertEqual( self.ready[-1], ( "trid2", ) )
+    self.assertEqual( self.errors, [] )
+
+  def testExpiration( self ):
+    """ connections without messages are expired """
+    if not EventReactor.isAvailable():
+      return
+    reactor = EventReactor.EventReactor( expireCheckLapse = 0 )
+    reactor.watchTransport( self.receiver, -1, self.__readyCallback, self.__errorCallback, ( "trid", ) )
+    reactor.processEvents( 0 )
+    self.assertEqual( self.errors, [ ( "Connection timeout", "trid" ) ] )
+    self.assertEqual( reactor.getStats()[ 'expired' ], 1 )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( EventReactorTestCase )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,125 @@
+""" Test cases for the file transfers of the FileHelper
+"""
+
+__RCSID__ = "$Id$"
+
+import os
+import socket
+import hashlib
+import tempfile
+import threading
+import cStringIO
+import unittest
+
+# sut
+from DIRAC.Core.DISET.private.FileHelper import FileHelper
+from DIRAC.Core.DISET.private.Transports.PlainTransport import PlainTransport
+
+class FileHelperTestCase( unittest.TestCase ):
+
+  def setUp( self ):
+    self.sockets = socket.socketpair()
+    self.transports = []
+    for sock in self.sockets:
+      transport = PlainTransport( ( "localhost", 0 ) )
+      transport.oSocket = sock
+      self.transports.append( transport )
+    self.data = os.urandom( 3 * 1048576 + 12345 )
+    fd, self.fileName = tempfile.mkstemp()
+    os.write( fd, self.data )
+    os.close( fd )
+
+  def tearDown( self ):
+    for sock in self.sockets:
+      sock.close()
+    os.unlink( self.fileName )
+
+  def __getHelpers( self, streaming = True, checkSum = True ):
+    sender = FileHelper( self.transports[0], checkSum = checkSum )
+    receiver = FileHelper( self.transports[1], checkSum = checkSum )
+    sender.setDirection( "send" )
+    receiver.setDirection( "receive" )
+    for fileHelper in ( sender, receiver ):
+      #Small chunks and acknowledgements to go through all the paths
+      fileHelper.streamBufferSize = 1048576
+      fileHelper.streamAckBytes = 2 * 1048576
+      if streaming:
+        fileHelper.enableStreaming()
+    return sender, receiver
+
+  def __sendFile( self, sender, results ):
+    fd = os.open( self.fileName, os.O_RDONLY )
+    try:
+      results.append( sender.FDToNetwork( fd ) )
+    finally:
+      os.close( fd )
+
+  def __transfer( self, sender, receiver, maxFileSize = 0 ):
+    results = []
+    thread = threading.Thread( target = self.__sendFile, args = ( sender, results ) )
+    thread.start()
+    dataSink = cStringIO.StringIO()
+    result = receiver.networkToDataSink( dataSink, maxFileSize = maxFileSize )
+    thread.join()
+    return results[0], result, dataSink.getvalue()
+
+  def testMessages( self ):
+    """ files are still sent in messages if streaming is not enabled """
+    sender, receiver = self.__getHelpers( streaming = False )
+    sent, received, data = self.__transfer( sender, receiver )
+    self.assert_( sent[ 'OK' ] )
+    self.assert_( received[ 'OK' ] )
+    self.assertEqual( data, self.data )
+
+  def testStreaming( self ):
+    """ streamed files arrive complete and with the same hash """
+    sender, receiver = self.__getHelpers()
+    sent, received, data = self.__transfer( sender, receiver )
+    self.assert_( sent[ 'OK' ] )
+    self.assert_( received[ 'OK' ] )
+    self.assertEqual( data, self.data )
+    self.assertEqual( receiver.getHash(), hashlib.md5( self.data ).hexdigest() )
+    self.assertEqual( sender.getHash(), receiver.getHash() )
+    self.assertEqual( sender.getTransferedBytes(), len( self.data ) )
+    self.assertEqual( receiver.getTransferedBytes(), len( self.data ) )
+
+  def testSendFile( self ):
+    """ without checksum files can be streamed with sendfile """
+    sender, receiver = self.__getHelpers( checkSum = False )
+    sent, received, data = self.__transfer( sender, receiver )
+    self.assert_( sent[ 'OK' ] )
+    self.assert_( received[ 'OK' ] )
+    self.assertEqual( data, self.data )
+
+  def testStreamedString( self ):
+    """ data sent with sendData is streamed too """
+    sender, receiver = self.__getHelpers()
+    thread = threading.Thread( target = sender.stringToNetwork, args = ( self.data, ) )
+    thread.start()
+    result = receiver.networkToString()
+    thread.join()
+    self.assert_( result[ 'OK' ] )
+    self.assertEqual( result[ 'Value' ], self.data )
+
+  def testMaxFileSize( self ):
+    """ the sender is told when the file is too big """
+    sender, receiver = self.__getHelpers()
+    sent, received, _data = self.__transfer( sender, receiver, maxFileSize = 1048576 )
+    self.assertFalse( sent[ 'OK' ] )
+    self.assertFalse( received[ 'OK' ] )
+
+  def testReceiverAbort( self ):
+    """ the receiver can abort a streamed transfer """
+    sender, receiver = self.__getHelpers()
+    results = []
+    thread = threading.Thread( target = self.__sendFile, args = ( sender, results ) )
+    thread.start()
+    receiver.markAsTransferred()
+    thread.join()
+    self.assert_( results[0][ 'OK' ] )
+    self.assert_( receiver.finishedTransmission() )
+    self.assertEqual( sender.getTransferedBytes(), 0 )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( FileHelperTestCase )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,91 @@
+""" Test cases for the RPC calls multiplexed through one connection
+"""
+
+__RCSID__ = "$Id$"
+
+import time
+import socket
+import threading
+import unittest
+
+from DIRAC import S_OK, S_ERROR
+
+# sut
+from DIRAC.Core.DISET.private.MultiplexedRPC import sendMultiplexedCalls, MultiplexedRPCServer
+from DIRAC.Core.DISET.private.Transports.PlainTransport import PlainTransport
+
+class MultiplexedRPCTestCase( unittest.TestCase ):
+
+  def setUp( self ):
+    self.sockets = socket.socketpair()
+    #A deadlock fails the test instead of hanging it
+    for sock in self.sockets:
+      sock.settimeout( 30 )
+    self.client = PlainTransport( ( "localhost", 0 ) )
+    self.client.oSocket = self.sockets[0]
+    self.server = PlainTransport( ( "localhost", 0 ) )
+    self.server.oSocket = self.sockets[1]
+    self.serverResult = None
+    self.threads = set()
+
+  def tearDown( self ):
+    for sock in self.sockets:
+      sock.close()
+
+  def __serve( self, executeCall, maxWorkers = 4 ):
+    def serve():
+      self.serverResult = MultiplexedRPCServer( self.server, executeCall, maxWorkers ).serve()
+    thread = threading.Thread( target = serve )
+    thread.setDaemon( True )
+    thread.start()
+    return thread
+
+  def __echo( self, name, args ):
+    self.threads.add( threading.currentThread().getName() )
+    if name == 'fail':
+      return S_ERROR( "Failed %s" % args[0] )
+    if name == 'raise':
+      raise Exception( "Boom" )
+    #The responses are ready in a different order than the requests
+    time.sleep( 0.001 * ( args[0] % 3 ) )
+    return S_OK( args )
+
+  def testResults( self ):
+    """ results come back in the order of the calls, whatever order they are done in """
+    thread = self.__serve( self.__echo )
+    calls = [ ( 'echo', ( i, ) ) for i in range( 50 ) ] + [ ( 'fail', ( 1, ) ), ( 'raise', () ) ]
+    result = sendMultiplexedCalls( self.client, calls, 5 )
+    thread.join( 30 )
+    self.assert_( result[ 'OK' ] )
+    self.assertEqual( [ r[ 'Value' ] for r in result[ 'Value' ][ :50 ] ], [ ( i, ) for i in range( 50 ) ] )
+    self.assertEqual( result[ 'Value' ][ 50 ][ 'Message' ], "Failed 1" )
+    self.failIf( result[ 'Value' ][ 51 ][ 'OK' ] )
+    self.assertEqual( self.serverResult, S_OK( 52 ) )
+    #The calls are executed by the workers of the connection
+    self.assert_( 1 < len( self.threads ) <= 4 )
+    self.failIf( thread.getName() in self.threads )
+
+  def testLargePayloads( self ):
+    """ requests and responses bigger than the socket buffers don't block the connection """
+    bufferSize = self.sockets[0].getsockopt( socket.SOL_SOCKET, socket.SO_SNDBUF ) + \
+                 self.sockets[1].getsockopt( socket.SOL_SOCKET, socket.SO_RCVBUF )
+    payload = "x" * ( 2 * bufferSize )
+    thread = self.__serve( lambda name, args : S_OK( args[0] + payload ) )
+    calls = [ ( 'echo', ( "%s:%s" % ( i, payload ), ) ) for i in range( 30 ) ]
+    result = sendMultiplexedCalls( self.client, calls, 20 )
+    thread.join( 30 )
+    self.assert_( result[ 'OK' ] )
+    for i in range( 30 ):
+      self.assertEqual( result[ 'Value' ][ i ][ 'Value' ], "%s:%s%s" % ( i, payload, payload ) )
+    self.assertEqual( self.serverResult, S_OK( 30 ) )
+
+  def testInvalidRequest( self ):
+    """ the service stops at the first invalid request """
+    thread = self.__serve( self.__echo )
+    self.client.sendData( S_OK( { 'request' : True, 'name' : 'echo' } ) )
+    thread.join( 30 )
+    self.failIf( self.serverResult[ 'OK' ] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( MultiplexedRPCTestCase )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -8,96 +8,108 @@
 
 __RCSID__ = "$Id$"
 
+import re
+
+from DIRAC.Core.Utilities.DictCache import LRUDictCache
+
+#One attribute up to its terminating ';', or up to the '[' of a sub JDL in its value.
+#Quoted strings may contain any character
+_attributeRE = re.compile( r'[\s;]*([^=;"\[\]]*)=([^;"\[\]]*(?:"[^"]*"[^;"\[\]]*)*)' )
+_valueRE = re.compile( r'[^;"\[\]]*(?:"[^"]*"[^;"\[\]]*)*' )
+_bracketRE = re.compile( r'"[^"]*"|[\[\]]' )
+
+#Parsed contents of the last JDLs, by JDL text
+MAX_CACHED_JDLS = 1000
+JDL_CACHE_LIFETIME = 3600
+_jdlCache = LRUDictCache( maxEntries = MAX_CACHED_JDLS )
+
+#Serialized ClassAds are their names and expressions separated by a character that is never in a JDL
+SERIALIZED_HEADER = "ClassAd1"
+SERIALIZED_SEPARATOR = "\0"
+
+def parseJDL( jdl ):
+  """ Parse one [] jdl enclosure into a dictionary of the attribute expressions
+  """
+  jdl = jdl.strip()
+  if not jdl or jdl[0] != '[' or jdl[-1] != ']':
+    print "Invalid JDL: it should start with [ and end with ]"
+    return {}
+
+  body = jdl[1:-1]
+  result = {}
+  index = 0
+  while index < len( body ):
+    match = _attributeRE.match( body, index )
+    if not match:
+      break
+    name = match.group( 1 ).strip()
+    value = match.group( 2 )
+    index = match.end()
+    while index < len( body ) and body[index] == '[':
+      end = _findSubJDLEnd( body, index )
+      if end == -1:
+        return {}
+      match = _valueRE.match( body, end )
+      value += body[index:end] + match.group()
+      index = match.end()
+    if index < len( body ):
+      if body[index] != ';':
+        return {}
+      index += 1
+    if not value:
+      return {}
+    result[name] = value.strip().replace( '\n', '' )
+  return result
+
+def _findSubJDLEnd( body, index ):
+  """ Position after the ] closing the [ at index, -1 if there is none
+  """
+  depth = 0
+  for match in _bracketRE.finditer( body, index ):
+    if match.group() == '[':
+      depth += 1
+    elif match.group() == ']':
+      depth -= 1
+      if depth == 0:
+        return match.end()
+  return -1
+
+def clearJDLCache():
+  _jdlCache.purgeAll()
+
 class ClassAd:
 
   def __init__( self, jdl ):
     """ClassAd constructor from a JDL string
     """
-    self.contents = {}
-    result = self.__analyse_jdl( jdl )
-    if result:
-      self.contents = result
-
-  def __analyse_jdl( self, jdl, index = 0 ):
-    """Analyse one [] jdl enclosure
+    if jdl == '[]':
+      self.contents = {}
+      return
+    contents = _jdlCache.get( jdl )
+    if contents is None:
+      contents = parseJDL( jdl )
+      _jdlCache.add( jdl, JDL_CACHE_LIFETIME, contents )
+    self.contents = dict( contents )
+
+  @staticmethod
+  def deserialize( data ):
+    """ Get a ClassAd from the string produced by serialize, without parsing any JDL
     """
-
-    jdl = jdl.strip()
-
-    # Strip all the blanks first
-    #temp = jdl.replace(' ','').replace('\n','')
-    temp = jdl
-
-    result = {}
-
-    if temp[0] != '[' or temp[-1] != ']':
-      print "Invalid JDL: it should start with [ and end with ]"
-      return result
-
-    # Parse the jdl string now
-    body = temp[1:-1]
-    index = 0
-    namemode = 1
-    valuemode = 0
-    while index < len( body ):
-      if namemode:
-        ind = body.find( "=", index )
-        if ind != -1:
-          name = body[index:ind]
-          index = ind + 1
-          valuemode = 1
-          namemode = 0
-        else:
-          break
-      elif valuemode:
-        ind1 = body.find( "[", index )
-        ind2 = body.find( ";", index )
-        if ind1 != -1 and ind1 < ind2:
-          value, newind = self.__find_subjdl( body, ind1 )
-        elif ind1 == -1 and ind2 == -1:
-          value = body[index:]
-          newind = len( body )
-        else:
-          if index == ind2:
-            return {}
-          else:
-            value = body[index:ind2]
-            newind = ind2 + 1
-
-        result[name.strip()] = value.strip().replace( '\n', '' )
-        index = newind
-        valuemode = 0
-        namemode = 1
-
-    return result
-
-  def __find_subjdl( self, body, index ):
-    """ Find a full [] enclosure starting from index
+    items = data.split( SERIALIZED_SEPARATOR )
+    if items[0] != SERIALIZED_HEADER or len( items ) % 2 != 1:
+      raise ValueError( "Not a serialized ClassAd" )
+    classAd = ClassAd( '[]' )
+    classAd.contents = dict( zip( items[1::2], items[2::2] ) )
+    return classAd
+
+  def serialize( self ):
+    """ Compact form of the ClassAd to be stored along with its JDL
     """
-    result = ''
-    if body[index] != '[':
-      return ( result, 0 )
-
-    depth = 0
-    ind = index
-    while ( depth < 10 ):
-      ind1 = body.find( ']', ind + 1 )
-      ind2 = body.find( '[', ind + 1 )
-      if ind2 != -1 and ind2 < ind1:
-        depth += 1
-        ind = ind2
-      else:
-        if depth > 0:
-          depth -= 1
-          ind = ind1
-        else:
-          result = body[index:ind1 + 1]
-          if body[ind1 + 1] == ";":
-            return ( result, ind1 + 2 )
-          else:
-            return result, 0
-
-    return result, 0
+    items = [ SERIALIZED_HEADER ]
+    for name, value in self.contents.items():
+      items.append( name )
+      items.append( str( value ) )
+    return SERIALIZED_SEPARATOR.join( items )
 
   def insertAttributeInt( self, name, attribute ):
     """Insert a named integer attribute
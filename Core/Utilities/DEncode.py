@@ -221,24 +221,273 @@ g_dEncodeFunctions[ types.DictType ] = encodeDict
 g_dDecodeFunctions[ "d" ] = decodeDict
 
 
+#Recursive, table driven, encoding and decoding. Kept as the reference implementation
+def recursiveEncode( uObject ):
+  eList = []
+  g_dEncodeFunctions[ type( uObject ) ]( uObject, eList )
+  return "".join( eList )
+
+def recursiveDecode( data ):
+  if not data:
+    return data
+  return g_dDecodeFunctions[ data[ 0 ] ]( data, 0 )
+
+#Fast encoding. Common types are inlined and lists of only ints or only strings are encoded in one go
+_StringType = types.StringType
+_IntType = types.IntType
+_ListType = types.ListType
+_TupleType = types.TupleType
+_DictType = types.DictType
+
+def _encodeFast( uObject, eList ):
+  oType = type( uObject )
+  if oType is _StringType:
+    eList.extend( ( "s", str( len( uObject ) ), ":", uObject ) )
+  elif oType is _IntType:
+    eList.extend( ( "i", str( uObject ), "e" ) )
+  elif oType is _DictType:
+    eList.append( "d" )
+    extend = eList.extend
+    for key in sorted( uObject ):
+      value = uObject[ key ]
+      if type( key ) is _StringType:
+        extend( ( "s", str( len( key ) ), ":", key ) )
+      else:
+        _encodeFast( key, eList )
+      vType = type( value )
+      if vType is _StringType:
+        extend( ( "s", str( len( value ) ), ":", value ) )
+      elif vType is _IntType:
+        extend( ( "i", str( value ), "e" ) )
+      else:
+        _encodeFast( value, eList )
+    eList.append( "e" )
+  elif oType is _ListType or oType is _TupleType:
+    if oType is _ListType:
+      eList.append( "l" )
+    else:
+      eList.append( "t" )
+    itemTypes = set( map( type, uObject ) )
+    if len( itemTypes ) == 1 and _IntType in itemTypes:
+      eList.extend( ( "i", "ei".join( map( str, uObject ) ), "e" ) )
+    elif len( itemTypes ) == 1 and _StringType in itemTypes:
+      extend = eList.extend
+      for sValue in uObject:
+        extend( ( "s", str( len( sValue ) ), ":", sValue ) )
+    else:
+      for item in uObject:
+        _encodeFast( item, eList )
+    eList.append( "e" )
+  else:
+    g_dEncodeFunctions[ oType ]( uObject, eList )
+
+#Fast decoding. Containers are kept in an explicit stack instead of recursing
+def _decodeIterative( data, i = 0 ):
+  index = data.index
+  dataLen = len( data )
+  #Parent containers as ( container, kind, key ) tuples
+  stack = []
+  #Kind of the container being decoded: 0 list, 1 tuple, 2 dict, 3 top level
+  cur = None
+  kind = 3
+  #Pending dict key. The stack itself is used as marker of no pending key
+  key = None
+  while True:
+    c = data[ i ]
+    if c == "s":
+      colon = index( ":", i + 1 )
+      i = colon + 1 + int( data[ i + 1 : colon ] )
+      value = data[ colon + 1 : i ]
+    elif c == "i":
+      end = index( "e", i + 1 )
+      value = int( data[ i + 1 : end ] )
+      i = end + 1
+    elif c == "e":
+      if kind == 3:
+        raise ValueError( "Unexpected end of container at %s" % i )
+      if kind == 2 and key is not stack:
+        raise ValueError( "Dictionary key without value at %s" % i )
+      value = cur
+      if kind == 1:
+        value = tuple( value )
+      cur, kind, key = stack.pop()
+      i += 1
+    elif c == "d":
+      stack.append( ( cur, kind, key ) )
+      cur = {}
+      kind = 2
+      i += 1
+      if data[ i ] == "s":
+        colon = index( ":", i + 1 )
+        i = colon + 1 + int( data[ i + 1 : colon ] )
+        key = data[ colon + 1 : i ]
+      else:
+        key = stack
+      continue
+    elif c == "l" or c == "t":
+      stack.append( ( cur, kind, key ) )
+      cur = []
+      kind = 0 if c == "l" else 1
+      i += 1
+      c = data[ i ]
+      if c == "s":
+        append = cur.append
+        while c == "s":
+          colon = index( ":", i + 1 )
+          end = colon + 1 + int( data[ i + 1 : colon ] )
+          append( data[ colon + 1 : end ] )
+          i = end
+          c = data[ i ]
+      elif c == "i":
+        append = cur.append
+        while c == "i":
+          end = index( "e", i + 1 )
+          append( int( data[ i + 1 : end ] ) )
+          i = end + 1
+          c = data[ i ]
+      continue
+    elif c == "n":
+      value = None
+      i += 1
+    elif c == "b":
+      value = data[ i + 1 ] != "0"
+      i += 2
+    elif c == "f":
+      end = index( "e", i + 1 )
+      if end + 1 < dataLen and data[ end + 1 ] in ( "+", "-" ):
+        end = index( "e", end + 1 )
+      value = float( data[ i + 1 : end ] )
+      i = end + 1
+    elif c == "I":
+      end = index( "e", i + 1 )
+      value = long( data[ i + 1 : end ] )
+      i = end + 1
+    elif c == "u":
+      colon = index( ":", i + 1 )
+      end = colon + 1 + int( data[ i + 1 : colon ] )
+      value = unicode( data[ colon + 1 : end ], 'utf-8' )
+      i = end
+    elif c == "z":
+      value, i = decodeDateTime( data, i )
+    else:
+      raise ValueError( "Unknown DEncode type %s at position %s" % ( c, i ) )
+    #Add the value to the container being decoded
+    if kind == 2:
+      if key is stack:
+        key = value
+      else:
+        cur[ key ] = value
+        #Keys are almost always strings, read the next one straight away
+        if data[ i ] == "s":
+          colon = index( ":", i + 1 )
+          i = colon + 1 + int( data[ i + 1 : colon ] )
+          key = data[ colon + 1 : i ]
+        else:
+          key = stack
+    elif kind < 2:
+      cur.append( value )
+    else:
+      #Strings are not bound checked when sliced, check the whole object is there
+      if i > dataLen:
+        raise ValueError( "Truncated data: expected %s bytes and got %s" % ( i, dataLen ) )
+      return ( value, i )
+
 #Encode function
 def encode( uObject ):
-  try:
-    eList = []
-    #print "ENCODE FUNCTION : %s" % g_dEncodeFunctions[ type( uObject ) ]
-    g_dEncodeFunctions[ type( uObject ) ]( uObject, eList )
-    return "".join( eList )
-  except Exception:
-    raise
+  eList = []
+  _encodeFast( uObject, eList )
+  return "".join( eList )
 
+#Decode function. Returns a tuple with the decoded object and the position where it ends
 def decode( data ):
   if not data:
     return data
-  try:
-    #print "DECODE FUNCTION : %s" % g_dDecodeFunctions[ sStream [ iIndex ] ]
-    return g_dDecodeFunctions[ data[ 0 ] ]( data, 0 )
-  except Exception:
-    raise
+  return _decodeIterative( data )
+
+class StreamDecoder( object ):
+  """ Decode a list, tuple or dict while its encoded data arrives in chunks.
+
+      Complete items ( ( key, value ) pairs for dicts ) can be retrieved as soon as
+      their data has been fed, so the already decoded part doesn't need to be kept.
+  """
+
+  def __init__( self ):
+    self.__chunks = []
+    self.__buffer = ""
+    self.__retryLength = 0
+    self.__kind = None
+    self.__key = None
+    self.__hasKey = False
+    self.__finished = False
+
+  def feed( self, data ):
+    if self.__finished:
+      raise ValueError( "Data fed after the end of the encoded container" )
+    self.__chunks.append( data )
+
+  def isFinished( self ):
+    return self.__finished
+
+  def getRemainder( self ):
+    """ Data fed after the end of the container
+    """
+    if not self.__finished:
+      return ""
+    return self.__buffer
+
+  def getItems( self, lastChunk = False ):
+    """ Get the items that have been completely received since the last call
+
+        :param lastChunk: no more data will be fed, the container has to be finished
+    """
+    if self.__chunks:
+      self.__buffer = "".join( [ self.__buffer ] + self.__chunks )
+      self.__chunks = []
+    data = self.__buffer
+    items = []
+    if self.__finished or ( not lastChunk and len( data ) < self.__retryLength ):
+      return items
+    pos = 0
+    if self.__kind is None:
+      if not data:
+        return items
+      self.__kind = data[0]
+      if self.__kind not in ( "l", "t", "d" ):
+        raise ValueError( "Only lists, tuples and dicts can be stream decoded, not %s" % self.__kind )
+      pos = 1
+    dataLen = len( data )
+    while pos < dataLen:
+      if data[ pos ] == "e":
+        if self.__hasKey:
+          raise ValueError( "Dictionary key without value at %s" % pos )
+        self.__finished = True
+        pos += 1
+        break
+      try:
+        value, end = _decodeIterative( data, pos )
+      except ( IndexError, ValueError ):
+        if lastChunk:
+          raise
+        break
+      #Numbers are only complete if something comes after them
+      if end >= dataLen:
+        break
+      pos = end
+      if self.__kind != "d":
+        items.append( value )
+      elif self.__hasKey:
+        items.append( ( self.__key, value ) )
+        self.__key = None
+        self.__hasKey = False
+      else:
+        self.__key = value
+        self.__hasKey = True
+    self.__buffer = data[ pos: ]
+    #Don't retry decoding a big incomplete item until enough new data has arrived
+    self.__retryLength = 2 * len( self.__buffer )
+    if lastChunk and not self.__finished:
+      raise ValueError( "Encoded container is not complete" )
+    return items
 
 
 if __name__ == "__main__":
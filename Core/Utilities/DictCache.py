@@ -1,9 +1,14 @@
 """
-  DictCache.
+  DictCache and its size bounded version LRUDictCache.
 """
 __RCSID__ = "$Id$"
 
+import sys
+import math
+import time
 import datetime
+import threading
+import collections
 # DIRAC
 from DIRAC.Core.Utilities.LockRing import LockRing
 
@@ -186,3 +191,252 @@ class DictCache( object ):
     del self.__lock
     del self.__cache
 
+
+
+class LRUDictCache( object ):
+  """
+  .. class:: LRUDictCache
+
+  DictCache with a bounded size. Entries are split in shards, each one with its own
+  lock, and the least recently used entries of a shard are evicted when it goes over
+  its share of maxEntries or maxBytes. Expired entries are dropped when they are
+  found, so purgeExpired is only needed to release them early.
+  """
+
+  def __init__( self, deleteFunction = False, maxEntries = 0, maxBytes = 0, shards = 16, sizeFunction = None ):
+    """
+    Initialize the cache.
+      If a delete function is specified it will be invoked when deleting, expiring
+      or evicting a cached object
+
+    :param maxEntries: maximum number of entries, 0 for no limit
+    :param maxBytes: maximum size of the values, 0 for no limit
+    :param shards: number of independently locked parts of the cache
+    :param sizeFunction: size of a value for maxBytes, sys.getsizeof by default
+    """
+    self.__deleteFunction = deleteFunction
+    self.__numShards = max( 1, shards )
+    #Limits are enforced per shard
+    self.__maxEntries = 0
+    if maxEntries > 0:
+      self.__maxEntries = max( 1, int( math.ceil( float( maxEntries ) / self.__numShards ) ) )
+    self.__maxBytes = 0
+    if maxBytes > 0:
+      self.__maxBytes = max( 1, int( math.ceil( float( maxBytes ) / self.__numShards ) ) )
+    self.__sizeFunction = sizeFunction or sys.getsizeof
+    self.__shards = []
+    for _i in range( self.__numShards ):
+      # cKey -> ( expirationTime, value, size ) in least recently used order
+      self.__shards.append( { 'lock' : threading.Lock(),
+                              'entries' : collections.OrderedDict(),
+                              'bytes' : 0,
+                              'stats' : dict.fromkeys( ( 'hits', 'misses', 'evictions', 'expirations' ), 0 ) } )
+
+  def __getShard( self, cKey ):
+    return self.__shards[ hash( cKey ) % self.__numShards ]
+
+  def __popEntry( self, shard, cKey, deleted ):
+    """ Remove the entry from the shard with its lock held. The value is appended to
+        deleted to call the delete function once the lock is released
+    """
+    _expTime, value, size = shard[ 'entries' ].pop( cKey )
+    shard[ 'bytes' ] -= size
+    deleted.append( value )
+
+  def __callDeleteFunction( self, deleted ):
+    if self.__deleteFunction:
+      for value in deleted:
+        self.__deleteFunction( value )
+
+  def __lookUp( self, cKey, validSeconds ):
+    """ Returns ( found, value ) and refreshes the entry position in the LRU order
+    """
+    shard = self.__getShard( cKey )
+    deleted = []
+    shard[ 'lock' ].acquire()
+    try:
+      entries = shard[ 'entries' ]
+      if cKey in entries:
+        entry = entries[ cKey ]
+        now = time.time()
+        if entry[0] > now + validSeconds:
+          #Move it to the most recently used end
+          del entries[ cKey ]
+          entries[ cKey ] = entry
+          shard[ 'stats' ][ 'hits' ] += 1
+          return True, entry[1]
+        # Not valid for long enough, delete it as DictCache does
+        expTime = entry[0]
+        self.__popEntry( shard, cKey, deleted )
+        if expTime <= now:
+          shard[ 'stats' ][ 'expirations' ] += 1
+      shard[ 'stats' ][ 'misses' ] += 1
+      return False, None
+    finally:
+      shard[ 'lock' ].release()
+      self.__callDeleteFunction( deleted )
+
+  def exists( self, cKey, validSeconds = 0 ):
+    """
+      Returns True/False if the key exists for the given number of seconds
+
+    :param cKey: identification key of the record
+    :param validSeconds: The amount of seconds the key has to be valid for
+    """
+    return self.__lookUp( cKey, validSeconds )[0]
+
+  def get( self, cKey, validSeconds = 0 ):
+    """
+    Get a record from the cache
+
+    :param cKey: identification key of the record
+    :param validSeconds: The amount of seconds the key has to be valid for
+    """
+    return self.__lookUp( cKey, validSeconds )[1]
+
+  def delete( self, cKey ):
+    """
+    Delete a key from the cache
+
+    :param cKey: identification key of the record
+    """
+    shard = self.__getShard( cKey )
+    deleted = []
+    shard[ 'lock' ].acquire()
+    try:
+      if cKey in shard[ 'entries' ]:
+        self.__popEntry( shard, cKey, deleted )
+    finally:
+      shard[ 'lock' ].release()
+      self.__callDeleteFunction( deleted )
+
+  def add( self, cKey, validSeconds, value = None ):
+    """
+    Add a record to the cache
+
+    :param cKey: identification key of the record
+    :param validSeconds: valid seconds of this record
+    :param value: value of the record
+    """
+    if max( 0, validSeconds ) == 0:
+      return
+    shard = self.__getShard( cKey )
+    now = time.time()
+    size = 0
+    if self.__maxBytes:
+      size = self.__sizeFunction( value )
+    deleted = []
+    shard[ 'lock' ].acquire()
+    try:
+      entries = shard[ 'entries' ]
+      if cKey in entries:
+        #Replaced values are not deleted, as in DictCache
+        shard[ 'bytes' ] -= entries.pop( cKey )[2]
+      entries[ cKey ] = ( now + validSeconds, value, size )
+      shard[ 'bytes' ] += size
+      #Drop the expired entries at the LRU end first
+      while True:
+        oldKey = next( iter( entries ) )
+        if oldKey == cKey or entries[ oldKey ][0] > now:
+          break
+        self.__popEntry( shard, oldKey, deleted )
+        shard[ 'stats' ][ 'expirations' ] += 1
+      while len( entries ) > 1 and ( ( self.__maxEntries and len( entries ) > self.__maxEntries ) or
+                                     ( self.__maxBytes and shard[ 'bytes' ] > self.__maxBytes ) ):
+        self.__popEntry( shard, next( iter( entries ) ), deleted )
+        shard[ 'stats' ][ 'evictions' ] += 1
+    finally:
+      shard[ 'lock' ].release()
+      self.__callDeleteFunction( deleted )
+
+  def showContentsInString( self ):
+    """
+    Return a human readable string to represent the contents
+    """
+    data = []
+    for shard in self.__shards:
+      shard[ 'lock' ].acquire()
+      try:
+        for cKey, ( expTime, value, _size ) in shard[ 'entries' ].items():
+          data.append( "%s:" % str( cKey ) )
+          data.append( "\tExp: %s" % datetime.datetime.fromtimestamp( expTime ) )
+          if value:
+            data.append( "\tVal: %s" % value )
+      finally:
+        shard[ 'lock' ].release()
+    return "\n".join( data )
+
+  def getKeys( self, validSeconds = 0 ):
+    """
+    Get keys for all contents
+    """
+    keys = []
+    limitTime = time.time() + validSeconds
+    for shard in self.__shards:
+      shard[ 'lock' ].acquire()
+      try:
+        for cKey, entry in shard[ 'entries' ].items():
+          if entry[0] > limitTime:
+            keys.append( cKey )
+      finally:
+        shard[ 'lock' ].release()
+    return keys
+
+  def purgeExpired( self, expiredInSeconds = 0 ):
+    """
+    Purge all entries that are expired or will be expired in <expiredInSeconds>
+    """
+    limitTime = time.time() + expiredInSeconds
+    for shard in self.__shards:
+      deleted = []
+      shard[ 'lock' ].acquire()
+      try:
+        entries = shard[ 'entries' ]
+        for cKey in [ cKey for cKey in entries if entries[ cKey ][0] < limitTime ]:
+          self.__popEntry( shard, cKey, deleted )
+          shard[ 'stats' ][ 'expirations' ] += 1
+      finally:
+        shard[ 'lock' ].release()
+        self.__callDeleteFunction( deleted )
+
+  def purgeAll( self, useLock = True ):
+    """
+    Purge all entries
+    CAUTION: useLock parameter should ALWAYS be True except when called from __del__
+    """
+    for shard in self.__shards:
+      deleted = []
+      if useLock:
+        shard[ 'lock' ].acquire()
+      try:
+        for cKey in shard[ 'entries' ].keys():
+          self.__popEntry( shard, cKey, deleted )
+      finally:
+        if useLock:
+          shard[ 'lock' ].release()
+        self.__callDeleteFunction( deleted )
+
+  def getStats( self ):
+    """
+    Hits, misses, evictions and expirations since the cache was created,
+    and the number of entries and bytes it holds
+    """
+    stats = dict.fromkeys( ( 'hits', 'misses', 'evictions', 'expirations', 'entries', 'bytes' ), 0 )
+    for shard in self.__shards:
+      shard[ 'lock' ].acquire()
+      try:
+        for key in shard[ 'stats' ]:
+          stats[ key ] += shard[ 'stats' ][ key ]
+        stats[ 'entries' ] += len( shard[ 'entries' ] )
+        stats[ 'bytes' ] += shard[ 'bytes' ]
+      finally:
+        shard[ 'lock' ].release()
+    return stats
+
+  def __len__( self ):
+    return sum( [ len( shard[ 'entries' ] ) for shard in self.__shards ] )
+
+  def __del__( self ):
+    """ Purge the entries, as DictCache does, so managed files are removed
+    """
+    self.purgeAll( useLock = False )
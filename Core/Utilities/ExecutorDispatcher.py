@@ -16,20 +16,23 @@ class ExecutorState( object ):
     self.__lock = threading.Lock()
     self.__typeToId = {}
     self.__maxTasks = {}
+    self.__batchSizes = {}
     self.__execTasks = {}
     self.__taskInExec = {}
 
   def _internals( self ):
     return { 'type2id' : dict( self.__typeToId ),
              'maxTasks' : dict( self.__maxTasks ),
+             'batchSizes' : dict( self.__batchSizes ),
              'execTasks' : dict( self.__execTasks ),
              'tasksInExec' : dict( self.__taskInExec ),
              'locked' : self.__lock.locked() }
 
-  def addExecutor( self, eId, eTypes, maxTasks = 1 ):
+  def addExecutor( self, eId, eTypes, maxTasks = 1, batchSizes = None ):
     self.__lock.acquire()
     try:
       self.__maxTasks[ eId ] = max( 1, maxTasks )
+      self.__batchSizes[ eId ] = dict( batchSizes or {} )
       if eId not in self.__execTasks:
         self.__execTasks[ eId ] = set()
       if type( eTypes ) not in ( types.ListType, types.TupleType ):
@@ -53,6 +56,7 @@ class ExecutorState( object ):
         tasks.append( taskId )
       self.__execTasks.pop( eId )
       self.__maxTasks.pop( eId )
+      self.__batchSizes.pop( eId, None )
       return tasks
     finally:
       self.__lock.release()
@@ -75,6 +79,14 @@ class ExecutorState( object ):
     except KeyError:
       return 0
 
+  def batchSize( self, eId, eType ):
+    """ Number of tasks of eType the executor takes at once, never more than its max tasks
+    """
+    try:
+      return max( 1, min( self.__batchSizes[ eId ].get( eType, 1 ), self.__maxTasks[ eId ] ) )
+    except KeyError:
+      return 1
+
   def getFreeExecutors( self, eType ):
     execs = {}
     try:
@@ -201,6 +213,26 @@ class ExecutorQueues:
     #Not found. release and return None
     return None
 
+  def popTasks( self, eType, numTasks ):
+    """ Pop up to numTasks tasks waiting for eType
+    """
+    self.__lock.acquire()
+    try:
+      try:
+        queue = self.__queues[ eType ]
+      except KeyError:
+        return []
+      taskIds = queue[ :numTasks ]
+      del queue[ :numTasks ]
+      for taskId in taskIds:
+        del( self.__taskInQueue[ taskId ] )
+      if taskIds:
+        self.__lastUse[ eType ] = time.time()
+        self.__log.verbose( "Popped tasks %s from executor %s waiting queue" % ( taskIds, eType ) )
+      return taskIds
+    finally:
+      self.__lock.release()
+
   def getState( self ):
     self.__lock.acquire()
     try:
@@ -248,6 +280,15 @@ class ExecutorDispatcherCallbacks:
   def cbSendTask( self, taskId, taskObj, eId, eType ):
     return S_ERROR( "No send task callback defined" )
 
+  def cbSendTasks( self, taskList, eId, eType ):
+    """ Send a batch of ( taskId, taskObj ) of the same type. By default they are sent one by one
+    """
+    for taskId, taskObj in taskList:
+      result = self.cbSendTask( taskId, taskObj, eId, eType )
+      if not result[ 'OK' ]:
+        return result
+    return S_OK()
+
   def cbDisconectExecutor( self, eId ):
     return S_ERROR( "No disconnect callback defined" )
 
@@ -354,9 +395,13 @@ class ExecutorDispatcher:
         self.__monitor.addMark( "executors-%s" % eType, self.__execTypes[ eType ] )
       except KeyError:
         pass
+      self.__monitor.addMark( "queued-%s" % eType, self.__queues.waitingTasks( eType ) )
     self.__monitor.addMark( "executors", len( self.__idMap ) )
 
-  def addExecutor( self, eId, eTypes, maxTasks = 1 ):
+  def addExecutor( self, eId, eTypes, maxTasks = 1, batchSizes = None ):
+    """ maxTasks is the number of tasks the executor processes at the same time, batchSizes
+        the number of tasks of each type it wants to get at once
+    """
     self.__log.verbose( "Adding new %s executor to the pool %s" % ( eId, ", ".join ( eTypes ) ) )
     self.__executorsLock.acquire()
     try:
@@ -365,7 +410,7 @@ class ExecutorDispatcher:
       if type( eTypes ) not in ( types.ListType, types.TupleType ):
         eTypes = [ eTypes ]
       self.__idMap[ eId ] = list( eTypes )
-      self.__states.addExecutor( eId, eTypes, maxTasks )
+      self.__states.addExecutor( eId, eTypes, maxTasks, batchSizes )
       for eType in eTypes:
         if eType not in self.__execTypes:
           self.__execTypes[ eType ] = 0
@@ -376,6 +421,10 @@ class ExecutorDispatcher:
                                              "Executors", "tasks", self.__monitor.OP_RATE, 300 )
             self.__monitor.registerActivity( "taskTime-%s" % eType, "Task processing time for %s" % eType,
                                              "Executors", "seconds", self.__monitor.OP_MEAN, 300 )
+            self.__monitor.registerActivity( "queued-%s" % eType, "Tasks waiting for %s" % eType,
+                                             "Executors", "tasks", self.__monitor.OP_MEAN, 300 )
+            self.__monitor.registerActivity( "batchSize-%s" % eType, "Tasks sent at once to %s" % eType,
+                                             "Executors", "tasks", self.__monitor.OP_MEAN, 300 )
         self.__execTypes[ eType ] += 1
     finally:
       self.__executorsLock.release()
@@ -778,15 +827,71 @@ class ExecutorDispatcher:
       self.__log.verbose( "No more tasks for %s" % eTypes )
       return S_OK()
     taskId, eType = pData
+    batchSize = self.__states.batchSize( eId, eType )
+    if batchSize > 1:
+      return self.__sendBatchToExecutor( eId, eType, taskId, batchSize )
     self.__log.verbose( "Sending task %s to %s=%s" % ( taskId, eType, eId ) )
     self.__states.addTask( eId, taskId )
     result = self.__msgTaskToExecutor( taskId, eId, eType )
     if not result[ 'OK' ]:
-      self.__queues.pushTask( eType, taskId, ahead = True )
       self.__states.removeTask( taskId )
+      #Don't bring back tasks that have been removed in the meantime
+      if taskId in self.__tasks:
+        self.__queues.pushTask( eType, taskId, ahead = True )
       return result
     return S_OK( taskId )
 
+  def __sendBatchToExecutor( self, eId, eType, taskId, batchSize ):
+    """ Send taskId and the next tasks waiting for eType at once. While the executor
+        is busy, wait until there is room for a full batch
+    """
+    freeSlots = self.__states.freeSlots( eId )
+    numTasks = min( batchSize, freeSlots, self.__queues.waitingTasks( eType ) + 1 )
+    if numTasks < min( batchSize, self.__queues.waitingTasks( eType ) + 1 ) and \
+       self.__states.getTasksForExecutor( eId ):
+      self.__queues.pushTask( eType, taskId, ahead = True )
+      return S_OK()
+    taskIds = [ taskId ] + self.__queues.popTasks( eType, numTasks - 1 )
+    #Tasks may have been removed while they were popped from the queue
+    taskIds = [ taskId for taskId in taskIds if taskId in self.__tasks ]
+    if not taskIds:
+      return self.__sendTaskToExecutor( eId, eType )
+    self.__log.verbose( "Sending tasks %s to %s=%s" % ( taskIds, eType, eId ) )
+    for taskId in taskIds:
+      self.__states.addTask( eId, taskId )
+    result = self.__msgTasksToExecutor( taskIds, eId, eType )
+    if not result[ 'OK' ]:
+      for taskId in reversed( taskIds ):
+        self.__states.removeTask( taskId )
+        #Don't bring back tasks that have been removed in the meantime
+        if taskId in self.__tasks:
+          self.__queues.pushTask( eType, taskId, ahead = True )
+      return result
+    if self.__monitor:
+      self.__monitor.addMark( "batchSize-%s" % eType, len( taskIds ) )
+    return S_OK( tuple( taskIds ) )
+
+  def __msgTasksToExecutor( self, taskIds, eId, eType ):
+    taskList = []
+    now = time.time()
+    for taskId in taskIds:
+      try:
+        eTask = self.__tasks[ taskId ]
+      except KeyError:
+        return S_ERROR( "Task %s has been deleted" % taskId )
+      eTask.sendTime = now
+      taskList.append( ( taskId, eTask.taskObj ) )
+    try:
+      result = self.__cbHolder.cbSendTasks( taskList, eId, eType )
+    except:
+      self.__log.exception( "Exception while sending tasks to executor" )
+      return S_ERROR( "Exception while sending tasks to executor" )
+    if isReturnStructure( result ):
+      return result
+    errMsg = "Send tasks callback did not send back an S_OK/S_ERROR structure"
+    self.__log.fatal( errMsg )
+    return S_ERROR( errMsg )
+
   def __msgTaskToExecutor( self, taskId, eId, eType ):
     try:
       self.__tasks[ taskId ].sendTime = time.time()
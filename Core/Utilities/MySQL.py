@@ -54,6 +54,13 @@
     Create a new Table in the DB
 
 
+    _getRangePartitions( table ), _partitionByRange( table, field, boundaries ),
+    _addRangePartitions( table, boundaries ), _dropPartitions( table, partitionNames )
+
+    Manage tables partitioned by ranges of an integer field, so that old
+    records can be removed dropping whole partitions
+
+
     _getConnection()
 
     Gets a connection from the Queue (or open a new one if none is available)
@@ -808,6 +815,9 @@ class MySQL( object ):
           unique.
         "Engine": use the given DB engine, InnoDB is the default if not present.
         "Charset": use the given character set. Default is latin1
+        "RangePartitions": { 'Field' : field, 'Boundaries' : [ upper bounds ] } to
+          partition the table by ranges of an integer field. The field must be
+          in the primary key and the table can't have foreign keys.
       force:
         if True, requested tables are DROP if they exist.
         if False, returned with S_ERROR if table exist.
@@ -830,6 +840,8 @@ class MySQL( object ):
                         % ( type( thisTable ), thisTable ) )
       if not 'Fields' in thisTable:
         return S_ERROR( DErrno.EMYSQL, 'Missing `Fields` key in `%s` table dictionary' % table )
+      if 'RangePartitions' in thisTable and 'ForeignKeys' in thisTable:
+        return S_ERROR( DErrno.EMYSQL, 'Partitioned table `%s` can not have foreign keys' % table )
 
     tableCreationList = [[]]
 
@@ -927,6 +939,9 @@ class MySQL( object ):
 
         cmd = 'CREATE TABLE `%s` (\n%s\n) ENGINE=%s DEFAULT CHARSET=%s' % (
                table, ',\n'.join( cmdList ), engine, charset )
+        if 'RangePartitions' in thisTable:
+          partDict = thisTable['RangePartitions']
+          cmd += '\n' + self.__rangePartitionsDefinition( partDict['Field'], partDict['Boundaries'] )
         retDict = self._update( cmd, debug = True )
         if not retDict['OK']:
           return retDict
@@ -934,6 +949,86 @@ class MySQL( object ):
 
     return S_OK()
 
+  def __rangePartitionsList( self, boundaries ):
+    """ A partition p<bound> for each upper bound plus pmax for the rest
+    """
+    partList = [ 'PARTITION `p%d` VALUES LESS THAN ( %d )' % ( bound, bound )
+                 for bound in sorted( set( [ int( bound ) for bound in boundaries ] ) ) ]
+    partList.append( 'PARTITION `pmax` VALUES LESS THAN MAXVALUE' )
+    return ',\n'.join( partList )
+
+  def __rangePartitionsDefinition( self, field, boundaries ):
+    return 'PARTITION BY RANGE ( `%s` ) (\n%s\n)' % ( field, self.__rangePartitionsList( boundaries ) )
+
+  def _getRangePartitions( self, table ):
+    """ Partitions of a table partitioned by range, as an ordered list of ( name, upper bound )
+        tuples. The bound of the last one is None if it holds up to MAXVALUE. Empty list
+        if the table is not partitioned
+    """
+    cmd = "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS"
+    cmd += " WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = '%s' AND PARTITION_NAME IS NOT NULL" % table
+    cmd += " ORDER BY PARTITION_ORDINAL_POSITION"
+    retDict = self._query( cmd, debug = True )
+    if not retDict['OK']:
+      return retDict
+    partitions = []
+    for name, description in retDict['Value']:
+      if description == 'MAXVALUE':
+        partitions.append( ( name, None ) )
+      else:
+        partitions.append( ( name, int( description ) ) )
+    return S_OK( partitions )
+
+  def _partitionByRange( self, table, field, boundaries ):
+    """ Partition an existing table by ranges of field. Foreign keys of the table are dropped
+        since MySQL doesn't support them in partitioned tables. It rebuilds the whole table
+    """
+    cmd = "SELECT CONSTRAINT_NAME FROM information_schema.TABLE_CONSTRAINTS WHERE"
+    cmd += " TABLE_SCHEMA = DATABASE() AND TABLE_NAME = '%s' AND CONSTRAINT_TYPE = 'FOREIGN KEY'" % table
+    retDict = self._query( cmd, debug = True )
+    if not retDict['OK']:
+      return retDict
+    for row in retDict['Value']:
+      retDict = self._update( 'ALTER TABLE `%s` DROP FOREIGN KEY `%s`' % ( table, row[0] ), debug = True )
+      if not retDict['OK']:
+        return retDict
+    cmd = 'ALTER TABLE `%s` %s' % ( table, self.__rangePartitionsDefinition( field, boundaries ) )
+    return self._update( cmd, debug = True )
+
+  def _addRangePartitions( self, table, boundaries ):
+    """ Add partitions for the given upper bounds, splitting the last pmax partition
+    """
+    retDict = self._getRangePartitions( table )
+    if not retDict['OK']:
+      return retDict
+    partitions = retDict['Value']
+    if not partitions or partitions[-1][1] is not None:
+      return S_ERROR( DErrno.EMYSQL, 'Table `%s` is not partitioned up to MAXVALUE' % table )
+    lastBound = 0
+    if len( partitions ) > 1:
+      lastBound = partitions[-2][1]
+    boundaries = [ bound for bound in boundaries if bound > lastBound ]
+    if not boundaries:
+      return S_OK( 0 )
+    #Only the rows of pmax are moved
+    cmd = 'ALTER TABLE `%s` REORGANIZE PARTITION `%s` INTO (\n%s\n)' % ( table, partitions[-1][0],
+                                                                       self.__rangePartitionsList( boundaries ) )
+    retDict = self._update( cmd, debug = True )
+    if not retDict['OK']:
+      return retDict
+    return S_OK( len( set( boundaries ) ) )
+
+  def _dropPartitions( self, table, partitionNames ):
+    """ Drop partitions and all their rows at once
+    """
+    if not partitionNames:
+      return S_OK( 0 )
+    cmd = 'ALTER TABLE `%s` DROP PARTITION %s' % ( table, ', '.join( [ '`%s`' % name for name in partitionNames ] ) )
+    retDict = self._update( cmd, debug = True )
+    if not retDict['OK']:
+      return retDict
+    return S_OK( len( partitionNames ) )
+
   def _getFields( self, tableName, outFields = None,
                   inFields = None, inValues = None,
                   limit = False, conn = None,
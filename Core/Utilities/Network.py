@@ -13,9 +13,23 @@ import struct
 import array
 import os
 import fcntl
+import errno
+import select
 import platform
 from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
 
+#sendfile is not exposed by python 2, the linux one is called through ctypes
+_libcSendFile = None
+if platform.system() == 'Linux':
+  try:
+    import ctypes
+    import ctypes.util
+    _libcSendFile = ctypes.CDLL( ctypes.util.find_library( "c" ), use_errno = True ).sendfile
+    _libcSendFile.argtypes = [ ctypes.c_int, ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t ]
+    _libcSendFile.restype = ctypes.c_ssize_t
+  except Exception:
+    _libcSendFile = None
+
 def discoverInterfaces():
   max_possible = 128
   maxBytes = max_possible * 32
@@ -75,6 +89,57 @@ def getMACFromInterface( ifname ):
   info = fcntl.ioctl( mySocket.fileno(), 0x8927, struct.pack( '256s', ifname[:15] ) )
   return ''.join( ['%02x:' % ord( char ) for char in info[18:24]] )[:-1]
 
+def setReusePort( sock ):
+  """ Allow several processes to listen in the same port, the kernel balances the
+      connections between them. Returns False if it is not supported
+  """
+  reusePort = getattr( socket, 'SO_REUSEPORT', None )
+  if reusePort is None and platform.system() == 'Linux':
+    #Not defined in python 2 but available since linux 3.9
+    reusePort = 15
+  if reusePort is None:
+    return False
+  try:
+    sock.setsockopt( socket.SOL_SOCKET, reusePort, 1 )
+  except socket.error:
+    return False
+  return True
+
+def isReusePortAvailable():
+  mySocket = socket.socket( socket.AF_INET, socket.SOCK_STREAM )
+  try:
+    return setReusePort( mySocket )
+  finally:
+    mySocket.close()
+
+def isSendFileAvailable():
+  return _libcSendFile is not None
+
+def sendFile( sock, iFD, size, timeout = 600 ):
+  """ Send size bytes from the current position of the file descriptor iFD through
+      sock with the sendfile system call, so the data is not copied into python
+  """
+  if _libcSendFile is None:
+    return S_ERROR( "sendfile is not available" )
+  sockFD = sock.fileno()
+  sentBytes = 0
+  while sentBytes < size:
+    sent = _libcSendFile( sockFD, iFD, None, size - sentBytes )
+    if sent < 0:
+      err = ctypes.get_errno()
+      if err == errno.EINTR:
+        continue
+      if err == errno.EAGAIN:
+        #Sockets with a timeout are non blocking
+        if not select.select( [], [ sock ], [], timeout )[1]:
+          return S_ERROR( "Timeout while sending file" )
+        continue
+      return S_ERROR( "Error while sending file: %s" % os.strerror( err ) )
+    if sent == 0:
+      return S_ERROR( "File ended %s bytes before expected" % ( size - sentBytes ) )
+    sentBytes += sent
+  return S_OK( sentBytes )
+
 def getFQDN():
   sFQDN = socket.getfqdn()
   if sFQDN.find( 'localhost' ) > -1:
@@ -6,23 +6,79 @@
 """ The Process Monitor utility allows to calculate cumulative CPU time and memory 
     for a given PID and it's process group.  This is only implemented for linux /proc 
     file systems but could feasibly be extended in the future.
+
+    The values are read from /proc/<pid>/stat and /proc/<pid>/io of the processes, or
+    from the cgroup accounting files when the process runs in a cgroup of its own.
+    The last samples are kept to report their min/max/average and percentiles.
 """
 
 from DIRAC import gLogger, S_OK, S_ERROR
-from DIRAC.Core.Utilities.Subprocess import shellCall
+from DIRAC.Core.Utilities.Statistics import getMean, getPercentile
 
 __RCSID__ = "$Id$"
 
-import os, re, platform
+import os, re, time, platform
+import collections
 
 class ProcessMonitor( object ):
 
   #############################################################################
-  def __init__( self ):
-    """ Standard constructor
+  def __init__( self, maxSamples = 100, useCgroups = True ):
+    """ Standard constructor, maxSamples is the number of samples kept
     """
     self.log = gLogger.getSubLogger( 'ProcessMonitor' )
     self.osType = platform.uname()
+    self.useCgroups = useCgroups
+    self.samples = collections.deque( maxlen = max( 1, maxSamples ) )
+    self.__cgroupMounts = None
+
+  #############################################################################
+  def setMaxSamples( self, maxSamples ):
+    """ Change the number of samples kept, keeping the most recent ones
+    """
+    self.samples = collections.deque( self.samples, maxlen = max( 1, maxSamples ) )
+
+  def sampleResources( self, pid ):
+    """ Take a sample of the resources used by the process and its children and keep it.
+        Returns the sample: CPU (s), Vsize and RSS (bytes), ReadBytes and WriteBytes,
+        Time, and CPUUsage (cores used since the previous sample)
+    """
+    currentOS = self.__checkCurrentOS()
+    if currentOS.lower() != 'linux':
+      return S_ERROR( 'Unsupported platform' )
+    result = self.getResourceConsumedLinux( pid )
+    if not result['OK']:
+      return result
+    sample = dict( result['Value'] )
+    sample['Source'] = 'proc'
+    if self.useCgroups:
+      result = self.getCgroupResourceConsumed( pid )
+      if result['OK']:
+        sample.update( result['Value'] )
+        sample['Source'] = 'cgroup'
+    sample['Time'] = time.time()
+    if self.samples:
+      previous = self.samples[-1]
+      elapsed = sample['Time'] - previous['Time']
+      if elapsed > 0 and previous['Source'] == sample['Source']:
+        sample['CPUUsage'] = max( 0.0, sample['CPU'] - previous['CPU'] ) / elapsed
+    self.samples.append( sample )
+    return S_OK( sample )
+
+  def getSamplesSummary( self, names, percentiles = ( 50, 90 ) ):
+    """ Min, Max, Avg and percentiles ( P50, P90... ) of the named values over the kept samples
+    """
+    summary = {}
+    for name in names:
+      values = [ sample[ name ] for sample in self.samples if name in sample ]
+      if not values:
+        continue
+      summary[ name ] = { 'Min' : min( values ),
+                          'Max' : max( values ),
+                          'Avg' : getMean( values ) }
+      for percentile in percentiles:
+        summary[ name ][ 'P%s' % percentile ] = getPercentile( values, percentile )
+    return summary
 
   #############################################################################
   def getCPUConsumed( self, pid ):
@@ -61,6 +117,130 @@ class ProcessMonitor( object ):
     pidList = pidListResult['Value']
     return self.__getChildResourceConsumedLinux( pid, pidList )
 
+  #############################################################################
+  def getCgroupResourceConsumed( self, pid ):
+    """ Returns the CPU (s), RSS and IO (bytes) accounted to the cgroup of the PID.
+        Fails if the process shares the cgroup of the current process, the values
+        would then include other processes
+    """
+    payloadGroups = self.__getCgroupsLinux( pid )
+    ownGroups = self.__getCgroupsLinux( os.getpid() )
+    mounts = self.__getCgroupMountsLinux()
+    resources = {}
+
+    #cgroup v2, all the controllers in the same hierarchy
+    cgDir = self.__getCgroupDir( '', payloadGroups, ownGroups, mounts )
+    if cgDir:
+      for line in self.__readLines( os.path.join( cgDir, 'cpu.stat' ) ):
+        fields = line.split()
+        if len( fields ) == 2 and fields[0] == 'usage_usec':
+          resources['CPU'] = float( fields[1] ) / 1000000
+      for line in self.__readLines( os.path.join( cgDir, 'memory.stat' ) ):
+        fields = line.split()
+        if len( fields ) == 2 and fields[0] == 'anon':
+          resources['RSS'] = float( fields[1] )
+      ioLines = self.__readLines( os.path.join( cgDir, 'io.stat' ) )
+      if ioLines:
+        resources['ReadBytes'] = 0
+        resources['WriteBytes'] = 0
+        for line in ioLines:
+          for field in line.split()[1:]:
+            name, _sep, value = field.partition( '=' )
+            if name == 'rbytes':
+              resources['ReadBytes'] += int( value )
+            elif name == 'wbytes':
+              resources['WriteBytes'] += int( value )
+      if resources:
+        return S_OK( resources )
+
+    #cgroup v1, one hierarchy per controller
+    cgDir = self.__getCgroupDir( 'cpuacct', payloadGroups, ownGroups, mounts )
+    if cgDir:
+      lines = self.__readLines( os.path.join( cgDir, 'cpuacct.usage' ) )
+      if lines:
+        resources['CPU'] = float( lines[0] ) / 1000000000
+    cgDir = self.__getCgroupDir( 'memory', payloadGroups, ownGroups, mounts )
+    if cgDir:
+      for line in self.__readLines( os.path.join( cgDir, 'memory.stat' ) ):
+        fields = line.split()
+        if len( fields ) == 2 and fields[0] == 'total_rss':
+          resources['RSS'] = float( fields[1] )
+    cgDir = self.__getCgroupDir( 'blkio', payloadGroups, ownGroups, mounts )
+    if cgDir:
+      ioLines = self.__readLines( os.path.join( cgDir, 'blkio.throttle.io_service_bytes' ) )
+      if ioLines:
+        resources['ReadBytes'] = 0
+        resources['WriteBytes'] = 0
+        for line in ioLines:
+          fields = line.split()
+          if len( fields ) == 3 and fields[1] == 'Read':
+            resources['ReadBytes'] += int( fields[2] )
+          elif len( fields ) == 3 and fields[1] == 'Write':
+            resources['WriteBytes'] += int( fields[2] )
+    if not resources:
+      return S_ERROR( 'Process %s does not run in a cgroup of its own' % pid )
+    return S_OK( resources )
+
+  #############################################################################
+  @staticmethod
+  def __readLines( path ):
+    """ Lines of the file, an empty list if it can't be read
+    """
+    try:
+      with open( path, 'r' ) as fopen:
+        return fopen.readlines()
+    except ( IOError, OSError ):
+      return []
+
+  def __getCgroupsLinux( self, pid ):
+    """ Path of the cgroup of the PID for each controller, '' being the cgroup v2 hierarchy
+    """
+    cgroups = {}
+    for line in self.__readLines( '/proc/%s/cgroup' % pid ):
+      fields = line.strip().split( ':', 2 )
+      if len( fields ) != 3:
+        continue
+      for controller in fields[1].split( ',' ):
+        cgroups[ controller ] = fields[2]
+    return cgroups
+
+  def __getCgroupMountsLinux( self ):
+    """ Mount point and root of the cgroup hierarchies, by controller
+    """
+    if self.__cgroupMounts is not None:
+      return self.__cgroupMounts
+    mounts = {}
+    for line in self.__readLines( '/proc/self/mountinfo' ):
+      fields = line.split()
+      try:
+        sep = fields.index( '-' )
+        fsType = fields[ sep + 1 ]
+        if fsType == 'cgroup2':
+          mounts[''] = ( fields[4], fields[3] )
+        elif fsType == 'cgroup':
+          for option in fields[ sep + 3 ].split( ',' ):
+            mounts[ option ] = ( fields[4], fields[3] )
+      except ( ValueError, IndexError ):
+        continue
+    self.__cgroupMounts = mounts
+    return mounts
+
+  @staticmethod
+  def __getCgroupDir( controller, payloadGroups, ownGroups, mounts ):
+    """ Directory of the accounting files of the payload cgroup, None if it has none of its own
+    """
+    path = payloadGroups.get( controller )
+    if not path or path == '/' or path == ownGroups.get( controller ) or controller not in mounts:
+      return None
+    mountPoint, root = mounts[ controller ]
+    #Inside a container the hierarchy is mounted from the container cgroup
+    if root != '/' and path.startswith( root ):
+      path = path[ len( root ): ]
+    cgDir = os.path.join( mountPoint, path.lstrip( '/' ) )
+    if not os.path.isdir( cgDir ):
+      return None
+    return cgDir
+
   #############################################################################
   def getCPUConsumedLinux( self, pid ):
     """Returns the CPU consumed given a PID assuming a proc file system exists.
@@ -90,23 +270,38 @@ class ProcessMonitor( object ):
   def __getProcListLinux( self ):
     """Gets list of process IDs from /proc/*.
     """
-    result = shellCall( 10, 'ls -d /proc/[0-9]*' )
-
-    if not result['OK']:
-      if not 'Value' in result:
-        return result
-    procList = result['Value'][1].replace( '/proc/', '' ).split( '\n' )
+    try:
+      procList = [ entry for entry in os.listdir( '/proc' ) if entry.isdigit() ]
+    except OSError as excp:
+      return S_ERROR( 'Cannot list processes: %s' % excp )
 
     return S_OK( procList )
 
+  #############################################################################
+  def __getProcIOLinux( self, pid ):
+    """Returns the bytes read and written by the process, ( 0, 0 ) if it can't be known.
+    """
+    readBytes = 0
+    writeBytes = 0
+    for line in self.__readLines( '/proc/%s/io' % pid ):
+      if line.startswith( 'read_bytes:' ):
+        readBytes = int( line.split()[1] )
+      elif line.startswith( 'write_bytes:' ):
+        writeBytes = int( line.split()[1] )
+    return readBytes, writeBytes
+
   #############################################################################
   def __getChildResourceConsumedLinux( self, pid, pidList, infoDict = None ):
-    """Adds contributions to CPU total from child processes recursively.
+    """Adds the contributions of the process, its descendants and the orphan processes
+       of their process groups.
     """
     childCPU = 0
     vsize = 0
     rss = 0
-    pageSize = os.sysconf('SC_PAGESIZE')
+    readBytes = 0
+    writeBytes = 0
+    pageSize = os.sysconf( 'SC_PAGESIZE' )
+    clockTicks = float( os.sysconf( 'SC_CLK_TCK' ) )
     if not infoDict:
       infoDict = {}
       for pidCheck in pidList:
@@ -114,60 +309,51 @@ class ProcessMonitor( object ):
         if info['OK']:
           infoDict[pidCheck] = info['Value']
 
-    procGroup = self.__getProcGroupLinux( pid )
-    if not procGroup['OK']:
-      return procGroup
-
-    procGroup = procGroup['Value'].strip()
+    if pid not in infoDict:
+      return S_ERROR( 'Process %s does not exist' % ( pid ) )
 
+    children = {}
     for pidCheck, info in infoDict.items():
-      if pidCheck in infoDict and info[3] == pid:
-        contribution = float( info[13] ) / 100 + float( info[14] ) / 100 + float( info[15] ) / 100 + float( info[16] ) / 100
-        childCPU += contribution
-        vsize += float( info[22] )
-        rss += float( info[23] ) * pageSize
-        self.log.debug( 'Added %s to CPU total (now %s) from child PID %s %s' % ( contribution, childCPU, info[0], info[1] ) )
-        del infoDict[pidCheck]
-        result = self.__getChildResourceConsumedLinux( pidCheck, pidList, infoDict )
-        if result['OK']:
-          childCPU += result['Value']['CPU']
-          vsize += result['Value']['Vsize']
-          rss += result['Value']['RSS'] 
-
-
-    #Next add any contributions from orphan processes in same process group
-    for pidCheck, info in infoDict.items():
-      if pidCheck in infoDict and info[3] == 1 and info[4] == procGroup:
-        contribution = float( info[13] ) / 100 + float( info[14] ) / 100 + float( info[15] ) / 100 + float( info[16] ) / 100
-        childCPU += contribution
-        vsize += float( info[22] )
-        rss += float( info[23] ) * pageSize
-        self.log.debug( 'Added %s to CPU total (now %s) from orphan PID %s %s' % ( contribution, childCPU, info[0], info[1] ) )
-        del infoDict[pidCheck]
-
-    #Finally add the parent itself
-    if pid in infoDict:
-      info = infoDict[pid]
-      contribution = float( info[13] ) / 100 + float( info[14] ) / 100 + float( info[15] ) / 100 + float( info[16] ) / 100
+      children.setdefault( info[3], [] ).append( pidCheck )
+
+    procTree = set()
+    procGroups = set()
+    toCheck = [ pid ]
+    while toCheck:
+      pidCheck = toCheck.pop()
+      if pidCheck in procTree:
+        continue
+      procTree.add( pidCheck )
+      procGroups.add( infoDict[pidCheck][4] )
+      toCheck.extend( children.get( pidCheck, [] ) )
+    #Orphan processes in the same process groups
+    for pidCheck in children.get( '1', [] ):
+      if infoDict[pidCheck][4] in procGroups:
+        procTree.add( pidCheck )
+
+    for pidCheck in procTree:
+      info = infoDict[pidCheck]
+      contribution = ( float( info[13] ) + float( info[14] ) + float( info[15] ) + float( info[16] ) ) / clockTicks
       childCPU += contribution
       vsize += float( info[22] )
       rss += float( info[23] ) * pageSize
+      procRead, procWrite = self.__getProcIOLinux( pidCheck )
+      readBytes += procRead
+      writeBytes += procWrite
       self.log.debug( 'Added %s to CPU total (now %s) from PID %s %s' % ( contribution, childCPU, info[0], info[1] ) )
-      del infoDict[pid]
-
-      # Some debug printout if 0 CPU is determined
-      if childCPU == 0:
-        self.log.error( 'Consumed CPU is found to be 0' )
-        self.log.info( 'Contributing processes:' )
-        for pidCheck in pidList:
-          if pidCheck not in infoDict:
-            info = self.__getProcInfoLinux( pidCheck )
-            if info['OK']:
-              self.log.info( '  PID:', info['Value'] )
+
+    # Some debug printout if 0 CPU is determined
+    if childCPU == 0:
+      self.log.error( 'Consumed CPU is found to be 0' )
+      self.log.info( 'Contributing processes:' )
+      for pidCheck in procTree:
+        self.log.info( '  PID:', infoDict[pidCheck] )
 
     return S_OK( { "CPU": childCPU,
                    "Vsize": vsize,
-                   "RSS": rss } )
+                   "RSS": rss,
+                   "ReadBytes": readBytes,
+                   "WriteBytes": writeBytes } )
 
 
   #############################################################################
@@ -389,18 +575,12 @@ class ProcessMonitor( object ):
         procStat = fopen.readline()
     except Exception:
       return S_ERROR( 'Not able to check %s' % pid )
-    return S_OK( procStat.split( ' ' ) )
-
-  #############################################################################
-  def __getProcGroupLinux( self, pid ):
-    """Returns UID for given PID.
-    """
-    result = shellCall( 10, 'ps --no-headers -o pgrp -p %s' % ( pid ) )
-    if not result['OK']:
-      if  not 'Value' in result:
-        return result
-
-    return S_OK( result['Value'][1] )
+    #The executable name may contain spaces
+    commStart = procStat.find( '(' )
+    commEnd = procStat.rfind( ')' )
+    if commStart < 0 or commEnd < commStart:
+      return S_ERROR( 'Not able to check %s' % pid )
+    return S_OK( [ procStat[:commStart].strip(), procStat[commStart:commEnd + 1] ] + procStat[commEnd + 1:].split() )
 
   #############################################################################
   def __checkCurrentOS( self ):
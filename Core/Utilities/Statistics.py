@@ -38,6 +38,23 @@ def getMedian( numbers ):
   else:
     return 0.5*(copy[nbNum//2 - 1] + copy[nbNum//2])
 
+def getPercentile( numbers, percentile ):
+  """ Return the percentile of the list of numbers, interpolating between
+  the closest ranks.
+
+  :param list numbers: data sample
+  :param float percentile: percentile between 0 and 100
+  """
+  nbNum = len(numbers)
+  if not nbNum:
+    return
+  copy = sorted( [float(x) for x in numbers] )
+  rank = ( nbNum - 1 ) * min( max( float( percentile ), 0.0 ), 100.0 ) / 100.0
+  low = int( rank )
+  if low == nbNum - 1:
+    return copy[low]
+  return copy[low] + ( copy[low + 1] - copy[low] ) * ( rank - low )
+
 def getVariance( numbers, posMean='Empty' ):
   """Determine the measure of the spread of the data set about the mean.
   Sample variance is determined by default; population variance can be
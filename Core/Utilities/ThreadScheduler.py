@@ -27,6 +27,13 @@ class ThreadScheduler:
   def setMinValidPeriod( self, period ):
     self.__minPeriod = period
 
+  def restartAfterFork( self ):
+    """ Threads are not inherited by forked processes. Call it in the child to run the tasks there
+    """
+    self.__thId = False
+    if self.__hood:
+      self.__createExecutorIfNeeded()
+
   def disableCreateReactorThread( self ):
     self.__createReactorThread = False
 
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+""" Micro-benchmark of the ClassAdLight JDL parsing
+
+    Times the parsing of JDLs, the ClassAds built from the JDL cache and the ones
+    loaded from their serialized form. The corpus is either made of JDLs shaped like
+    the user, production and parametric jobs or read from JDL files:
+
+      python Benchmark_ClassAd.py [numberOfJDLs | jdlFile ...]
+"""
+
+__RCSID__ = "$Id$"
+
+import gc
+import sys
+import time
+
+from DIRAC.Core.Utilities.ClassAd.ClassAdLight import ClassAd, parseJDL, clearJDLCache
+
+def getUserJDL( i ):
+  """ Job submitted with the Dirac API """
+  return """[
+    Origin = "DIRAC";
+    Executable = "$DIRACROOT/scripts/dirac-jobexec";
+    StdError = "std.err";
+    LogLevel = "info";
+    JobName = "analysis_%(i)s";
+    Priority = "1";
+    Arguments = "jobDescription.xml -o LogLevel=info";
+    JobGroup = "vo.user";
+    OutputSandbox = { "std.err", "std.out", "histos_%(i)s.root" };
+    StdOutput = "std.out";
+    InputSandbox = { "jobDescription.xml", "SB:ProductionSandboxSE|/SandBox/u/user/%(i)s.tar.bz2" };
+    JobType = "User";
+    CPUTime = "86400";
+    Site = { "LCG.CERN.ch", "LCG.CNAF.it", "LCG.GRIDKA.de", "LCG.RAL.uk" }
+]""" % { 'i' : i }
+
+def getProductionJDL( i ):
+  """ Job of a data processing transformation, with its input data """
+  inputData = ",\n".join( [ '"/lhcb/LHCb/Collision15/RAW/00012345/0000/00012345_%08d_1.raw"' % ( i * 10 + j )
+                            for j in range( 10 ) ] )
+  return """[
+    Origin = "DIRAC";
+    Executable = "$DIRACROOT/scripts/dirac-jobexec";
+    JobName = "00012345_%(i)08d";
+    Priority = "5";
+    Arguments = "jobDescription.xml -o LogLevel=verbose";
+    JobGroup = "00012345";
+    JobType = "DataReconstruction";
+    OutputSandbox = { "std.err", "std.out" };
+    InputSandbox = { "jobDescription.xml" };
+    InputData = { %(inputData)s };
+    InputDataPolicy = "DIRAC.WorkloadManagementSystem.Client.InputDataByProtocol";
+    Platform = "x86_64-slc6-gcc49-opt";
+    CPUTime = "1000000";
+    Parameters = [ ProductionID = "00012345"; JobNumber = "%(i)s"; SoftwarePackages = "DaVinci.v38r1" ];
+    JobRequirements = [ OwnerDN = "/DC=ch/DC=cern/CN=prod"; OwnerGroup = "lhcb_prod"; CPUTime = 1000000 ]
+]""" % { 'i' : i, 'inputData' : inputData }
+
+def getParametricJDL( i ):
+  """ Job of a parametric bulk """
+  return """[
+    Executable = "simulate.sh";
+    Arguments = "--seed %(i)s --events 500";
+    JobName = "mc_%(i)05d";
+    Parameter = "%(i)s";
+    ParameterNumber = %(i)s;
+    OutputData = { "LFN:/vo/user/u/user/mc/%(i)05d/out.root" };
+    OutputSE = "CERN-USER";
+    CPUTime = 43200
+]""" % { 'i' : i }
+
+def getCorpus( nJDLs ):
+  corpus = []
+  for i in xrange( nJDLs ):
+    corpus.append( ( getUserJDL, getProductionJDL, getParametricJDL )[ i % 3 ]( i ) )
+  return corpus
+
+def timeIt( func, arg, repeat = 5 ):
+  """ Best wall time of several runs, with the garbage collector disabled while timing
+  """
+  best = None
+  gcEnabled = gc.isenabled()
+  gc.disable()
+  try:
+    for _i in range( repeat ):
+      start = time.time()
+      func( arg )
+      elapsed = time.time() - start
+      if best is None or elapsed < best:
+        best = elapsed
+  finally:
+    if gcEnabled:
+      gc.enable()
+  return best
+
+def parseAll( corpus ):
+  for jdl in corpus:
+    parseJDL( jdl )
+
+def buildAll( corpus ):
+  for jdl in corpus:
+    ClassAd( jdl )
+
+def deserializeAll( serialized ):
+  for data in serialized:
+    ClassAd.deserialize( data )
+
+def runBenchmark( corpus ):
+  serialized = [ ClassAd( jdl ).serialize() for jdl in corpus ]
+  print "%d JDLs, %.2f MB of JDL, %.2f MB serialized" % ( len( corpus ), sum( [ len( jdl ) for jdl in corpus ] ) / 1048576.,
+                                                          sum( [ len( data ) for data in serialized ] ) / 1048576. )
+  print "%-28s %10s %14s" % ( "", "Total", "Per JDL" )
+  clearJDLCache()
+  for name, func, arg in ( ( "parse", parseAll, corpus ),
+                           ( "ClassAd from cache", buildAll, corpus ),
+                           ( "ClassAd from serialized", deserializeAll, serialized ) ):
+    elapsed = timeIt( func, arg )
+    print "%-28s %9.3fs %12.1fus" % ( name, elapsed, elapsed * 1000000 / max( 1, len( corpus ) ) )
+
+if __name__ == "__main__":
+  args = sys.argv[1:]
+  if args and not args[0].isdigit():
+    jdls = []
+    for fileName in args:
+      with open( fileName ) as jdlFile:
+        jdls.append( jdlFile.read() )
+  else:
+    jdls = getCorpus( args and int( args[0] ) or 1000 )
+  runBenchmark( jdls )
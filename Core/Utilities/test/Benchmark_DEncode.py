@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+""" Micro-benchmark of DEncode
+
+    Compares the fast encode/decode with the recursive implementation on payloads
+    shaped like the replies of some of the heaviest RPC calls:
+
+      python Benchmark_DEncode.py [numberOfEntries]
+"""
+
+__RCSID__ = "$Id$"
+
+import gc
+import sys
+import time
+import datetime
+
+from DIRAC.Core.Utilities import DEncode
+
+def getReplicasPayload( nEntries ):
+  """ FileCatalog getReplicas reply """
+  successful = {}
+  for i in xrange( nEntries ):
+    lfn = "/lhcb/MC/2012/ALLSTREAMS.DST/00012345/0000/00012345_%08d_1.allstreams.dst" % i
+    successful[ lfn ] = { 'CERN-DST' : 'srm://srm-lhcb.cern.ch/castor/cern.ch/grid%s' % lfn,
+                          'CNAF-DST' : 'srm://storm-fe-lhcb.cr.cnaf.infn.it/t0d1%s' % lfn }
+  return { 'OK' : True, 'Value' : { 'Successful' : successful, 'Failed' : {} } }
+
+def getTransformationFilesPayload( nEntries ):
+  """ TransformationManager getTransformationFiles reply """
+  now = datetime.datetime.utcnow()
+  files = []
+  for i in xrange( nEntries ):
+    files.append( { 'TransformationID' : 12345,
+                    'FileID' : 100000 + i,
+                    'LFN' : "/lhcb/LHCb/Collision15/RAW/00012345/0000/00012345_%08d_1.raw" % i,
+                    'Status' : 'Processed',
+                    'TaskID' : i / 10,
+                    'TargetSE' : 'Unknown',
+                    'UsedSE' : 'Unknown',
+                    'ErrorCount' : 0,
+                    'LastUpdate' : now,
+                    'InsertedTime' : now } )
+  return { 'OK' : True, 'Value' : files }
+
+def getJobParametersPayload( nEntries ):
+  """ JobMonitoring getJobParameters reply for a bunch of jobs """
+  jobs = {}
+  for i in xrange( nEntries / 10 ):
+    jobs[ 1000000 + i ] = { 'CPUNormalizationFactor' : '11.2',
+                            'HostName' : 'wn%05d.cern.ch' % i,
+                            'LocalAccount' : 'lhcb%03d' % ( i % 100 ),
+                            'MemoryUsed' : 1536.4,
+                            'TotalCPUTime(s)' : 37215.2,
+                            'Pilot_Reference' : 'https://lcgce01.gridpp.rl.ac.uk:8443/CREAM%09d' % i,
+                            'OutputSandboxMissingFiles' : [ 'std.err', 'std.out' ],
+                            'JobIDs' : range( i, i + 10 ) }
+  return { 'OK' : True, 'Value' : jobs }
+
+def timeIt( func, arg, repeat = 5 ):
+  """ Best wall time of several runs. As timeit does, the garbage collector is
+      disabled while timing so it doesn't add noise to the comparison
+  """
+  best = None
+  gcEnabled = gc.isenabled()
+  gc.disable()
+  try:
+    for _i in range( repeat ):
+      start = time.time()
+      func( arg )
+      elapsed = time.time() - start
+      if best is None or elapsed < best:
+        best = elapsed
+  finally:
+    if gcEnabled:
+      gc.enable()
+  return best
+
+def runBenchmark( nEntries ):
+  print "%-24s %10s %12s %12s %12s %12s" % ( "Payload", "Size (MB)", "enc recur.", "enc fast",
+                                             "dec recur.", "dec fast" )
+  for name, payloadFunc in ( ( "getReplicas", getReplicasPayload ),
+                             ( "getTransformationFiles", getTransformationFilesPayload ),
+                             ( "getJobParameters", getJobParametersPayload ) ):
+    payload = payloadFunc( nEntries )
+    data = DEncode.encode( payload )
+    if data != DEncode.recursiveEncode( payload ) or DEncode.decode( data )[0] != payload:
+      print "ERROR: %s is not encoded/decoded consistently" % name
+      continue
+    times = ( timeIt( DEncode.recursiveEncode, payload ), timeIt( DEncode.encode, payload ),
+              timeIt( DEncode.recursiveDecode, data ), timeIt( DEncode.decode, data ) )
+    print "%-24s %10.2f %11.3fs %11.3fs %11.3fs %11.3fs" % ( ( name, len( data ) / 1048576. ) + times )
+
+if __name__ == "__main__":
+  entries = 100000
+  if len( sys.argv ) > 1:
+    entries = int( sys.argv[1] )
+  runBenchmark( entries )
@@ -0,0 +1,69 @@
+""" Test cases for the JDL parsing of ClassAdLight
+"""
+
+__RCSID__ = "$Id$"
+
+import unittest
+
+# sut
+from DIRAC.Core.Utilities.ClassAd.ClassAdLight import ClassAd, parseJDL, clearJDLCache
+
+JOB_JDL = """[
+    Executable = "dirac-jobexec";
+    Arguments = "jobDescription.xml -o LogLevel=INFO";
+    JobName = "Step1; Step2";
+    InputData =
+        {
+            "/lhcb/MC/2012/00012345_00000001_1.dst",
+            "/lhcb/MC/2012/00012345_00000002_1.dst"
+        };
+    Parameters = [ NumberOfEvents = 100; Seed = "123" ];
+    Site = { "LCG.CERN.ch", "LCG.CNAF.it" };
+    Priority = 1
+]"""
+
+class ClassAdLightTestCase( unittest.TestCase ):
+
+  def setUp( self ):
+    clearJDLCache()
+
+  def testParse( self ):
+    """ attributes, lists, sub JDLs and quoted separators """
+    classAd = ClassAd( JOB_JDL )
+    self.assert_( classAd.isOK() )
+    self.assertEqual( classAd.getAttributeString( 'JobName' ), 'Step1; Step2' )
+    self.assertEqual( classAd.getAttributeString( 'Arguments' ), 'jobDescription.xml -o LogLevel=INFO' )
+    self.assertEqual( classAd.getListFromExpression( 'Site' ), [ 'LCG.CERN.ch', 'LCG.CNAF.it' ] )
+    self.assertEqual( len( classAd.getListFromExpression( 'InputData' ) ), 2 )
+    self.assertEqual( classAd.getDictionaryFromSubJDL( 'Parameters' ), { 'NumberOfEvents' : '100', 'Seed' : '123' } )
+    self.assertEqual( classAd.getAttributeInt( 'Priority' ), 1 )
+    #What asJDL writes is parsed back
+    newClassAd = ClassAd( classAd.asJDL() )
+    self.assertEqual( newClassAd.getListFromExpression( 'Site' ), [ 'LCG.CERN.ch', 'LCG.CNAF.it' ] )
+    self.assertEqual( newClassAd.getAttributeString( 'JobName' ), 'Step1; Step2' )
+
+  def testSubJDL( self ):
+    """ nested sub JDLs, also as last attribute """
+    contents = parseJDL( '[ A = [ b = [ c = 1 ]; d = "]" ]; E = 2; F = [ g = 3 ] ]' )
+    self.assertEqual( contents, { 'A' : '[ b = [ c = 1 ]; d = "]" ]', 'E' : '2', 'F' : '[ g = 3 ]' } )
+
+  def testInvalid( self ):
+    """ JDLs without brackets or with empty values are not OK """
+    self.assertEqual( parseJDL( 'Executable = "x";' ), {} )
+    self.assertEqual( parseJDL( '[ Executable =; ]' ), {} )
+    self.assertFalse( ClassAd( '[]' ).isOK() )
+
+  def testCache( self ):
+    """ ClassAds of the same JDL don't share their contents """
+    classAd = ClassAd( JOB_JDL )
+    classAd.insertAttributeInt( 'JobID', 1 )
+    self.assertFalse( ClassAd( JOB_JDL ).lookupAttribute( 'JobID' ) )
+
+  def testSerialize( self ):
+    """ the serialized form gives back the same ClassAd """
+    classAd = ClassAd( JOB_JDL )
+    self.assertEqual( ClassAd.deserialize( classAd.serialize() ).contents, classAd.contents )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( ClassAdLightTestCase )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,109 @@
+""" Test cases for DIRAC.Core.Utilities.DEncode module
+
+    The fast encode/decode functions have to be wire compatible with the recursive ones
+"""
+
+__RCSID__ = "$Id$"
+
+import unittest
+import datetime
+
+# sut
+from DIRAC.Core.Utilities import DEncode
+
+class DEncodeTestCase( unittest.TestCase ):
+
+  def setUp( self ):
+    now = datetime.datetime( 2016, 3, 4, 12, 30, 15, 1234 )
+    self.samples = [ 1, -25, 2L ** 70, 3.5, 2.0 * 10 ** 20, 2.0 * 10 ** -10, True, False, None,
+                     "", "someString", u"unicode\xe9", now, now.date(), now.time(),
+                     [], (), {},
+                     [ "/lhcb/MC/2012/file_%d.dst" % i for i in range( 50 ) ],
+                     [ i * 1000 for i in range( 50 ) ],
+                     tuple( [ "a%s" % i for i in range( 20 ) ] ),
+                     [ 1, "a", 2, "b", None, [ 3, 4 ], { 'k' : ( 5, ) } ] * 3,
+                     { 'OK' : True,
+                       'Value' : { 'Successful' : { '/lhcb/file1' : { 'CERN-DST' : 'srm://some/pfn1',
+                                                                      'CNAF-DST' : 'srm://some/pfn2' } },
+                                   'Failed' : { '/lhcb/file2' : 'No such file or directory' } } },
+                     { 1 : "one", 2.5 : [ now ], ( 1, 2 ) : { 'nested' : [ [ [] ] ] }, None : False },
+                     { 'dates' : [ now ] * 10, 'ints' : range( 10 ), 'longs' : [ 1L, 2L ] } ]
+
+  def testRoundTrip( self ):
+    """ decode( encode( x ) ) == x """
+    for sample in self.samples:
+      data = DEncode.encode( sample )
+      value, length = DEncode.decode( data )
+      self.assertEqual( value, sample )
+      self.assertEqual( type( value ), type( sample ) )
+      self.assertEqual( length, len( data ) )
+
+  def testWireCompatibility( self ):
+    """ same wire format as the recursive implementation """
+    for sample in self.samples:
+      data = DEncode.encode( sample )
+      self.assertEqual( data, DEncode.recursiveEncode( sample ) )
+      self.assertEqual( DEncode.decode( data ), DEncode.recursiveDecode( data ) )
+
+  def testTrailingData( self ):
+    """ decode stops at the end of the first object """
+    data = DEncode.encode( [ 1, 2 ] ) + "garbage"
+    self.assertEqual( DEncode.decode( data ), ( [ 1, 2 ], len( data ) - len( "garbage" ) ) )
+
+  def testEmpty( self ):
+    """ empty data is returned as is """
+    self.assertEqual( DEncode.decode( "" ), "" )
+
+  def testMalformed( self ):
+    """ malformed data raises """
+    for data in ( "x", "l1e", "s10:abc", "dsa:be", "e" ):
+      self.assertRaises( Exception, DEncode.decode, data )
+
+class StreamDecoderTestCase( unittest.TestCase ):
+
+  def __decodeInChunks( self, data, chunkSize ):
+    decoder = DEncode.StreamDecoder()
+    items = []
+    for pos in range( 0, len( data ), chunkSize ):
+      decoder.feed( data[ pos : pos + chunkSize ] )
+      items.extend( decoder.getItems() )
+    items.extend( decoder.getItems( lastChunk = True ) )
+    self.assert_( decoder.isFinished() )
+    return items
+
+  def testList( self ):
+    """ list items are decoded whatever the chunk boundaries """
+    value = [ 1, 2.0 * 10 ** 20, "abc", { 'a' : [ 1, 2 ] }, None, 123456789, 2.5 ] * 5
+    data = DEncode.encode( value )
+    for chunkSize in ( 1, 2, 3, 7, 100, len( data ) ):
+      self.assertEqual( self.__decodeInChunks( data, chunkSize ), value )
+
+  def testDict( self ):
+    """ dicts are decoded as ( key, value ) pairs """
+    value = dict( [ ( "/lhcb/file%d" % i, { 'Size' : i, 'GUID' : "guid%s" % i } ) for i in range( 20 ) ] )
+    data = DEncode.encode( value )
+    for chunkSize in ( 1, 5, 64, len( data ) ):
+      self.assertEqual( dict( self.__decodeInChunks( data, chunkSize ) ), value )
+
+  def testIncremental( self ):
+    """ items are available as soon as they are complete """
+    decoder = DEncode.StreamDecoder()
+    decoder.feed( "li1ei2" )
+    self.assertEqual( decoder.getItems(), [ 1 ] )
+    decoder.feed( "es3:ab" )
+    self.assertEqual( decoder.getItems(), [ 2 ] )
+    decoder.feed( "cetrailing" )
+    self.assertEqual( decoder.getItems(), [ "abc" ] )
+    self.assert_( decoder.isFinished() )
+    self.assertEqual( decoder.getRemainder(), "trailing" )
+
+  def testIncomplete( self ):
+    """ incomplete data raises at the end """
+    decoder = DEncode.StreamDecoder()
+    decoder.feed( "li1ei2" )
+    self.assertRaises( ValueError, decoder.getItems, True )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( DEncodeTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( StreamDecoderTestCase ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
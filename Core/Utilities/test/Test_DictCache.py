@@ -0,0 +1,99 @@
+""" Test cases for the LRUDictCache
+"""
+
+__RCSID__ = "$Id$"
+
+import time
+import threading
+import unittest
+
+# sut
+from DIRAC.Core.Utilities.DictCache import LRUDictCache
+
+class LRUDictCacheTestCase( unittest.TestCase ):
+
+  def setUp( self ):
+    self.deleted = []
+
+  def testDictCacheAPI( self ):
+    """ it behaves as DictCache """
+    cache = LRUDictCache( deleteFunction = self.deleted.append )
+    cache.add( "a", 10, 1 )
+    cache.add( "b", 0, 2 )
+    self.assert_( cache.exists( "a" ) )
+    self.assertFalse( cache.exists( "b" ) )
+    self.assertEqual( cache.get( "a" ), 1 )
+    self.assertEqual( cache.getKeys(), [ "a" ] )
+    #Not valid for long enough is deleted
+    self.assertEqual( cache.get( "a", 20 ), None )
+    self.assertEqual( self.deleted, [ 1 ] )
+    cache.add( "c", 10, 3 )
+    cache.delete( "c" )
+    self.assertEqual( len( cache ), 0 )
+    self.assertEqual( self.deleted, [ 1, 3 ] )
+
+  def testExpiration( self ):
+    """ expired entries are dropped when found """
+    cache = LRUDictCache( deleteFunction = self.deleted.append, shards = 1 )
+    cache.add( "a", 0.01, 1 )
+    cache.add( "b", 0.01, 2 )
+    time.sleep( 0.02 )
+    self.assertEqual( cache.get( "a" ), None )
+    cache.add( "c", 10, 3 )
+    self.assertEqual( len( cache ), 1 )
+    self.assertEqual( sorted( self.deleted ), [ 1, 2 ] )
+    self.assertEqual( cache.getStats()[ 'expirations' ], 2 )
+
+  def testMaxEntries( self ):
+    """ the least recently used entries are evicted """
+    cache = LRUDictCache( deleteFunction = self.deleted.append, maxEntries = 3, shards = 1 )
+    for key in ( "a", "b", "c" ):
+      cache.add( key, 10, key )
+    cache.get( "a" )
+    cache.add( "d", 10, "d" )
+    self.assertEqual( sorted( cache.getKeys() ), [ "a", "c", "d" ] )
+    self.assertEqual( self.deleted, [ "b" ] )
+    stats = cache.getStats()
+    self.assertEqual( stats[ 'evictions' ], 1 )
+    self.assertEqual( stats[ 'hits' ], 1 )
+    self.assertEqual( stats[ 'entries' ], 3 )
+
+  def testMaxBytes( self ):
+    """ entries are evicted to keep the size of the values """
+    cache = LRUDictCache( maxBytes = 10, shards = 1, sizeFunction = len )
+    cache.add( "a", 10, "x" * 6 )
+    cache.add( "b", 10, "x" * 6 )
+    self.assertEqual( cache.getKeys(), [ "b" ] )
+    self.assertEqual( cache.getStats()[ 'bytes' ], 6 )
+    #A single entry bigger than the limit is kept
+    cache.add( "c", 10, "x" * 20 )
+    self.assertEqual( cache.getKeys(), [ "c" ] )
+
+  def testShards( self ):
+    """ the limits are split between the shards """
+    cache = LRUDictCache( maxEntries = 64, shards = 4 )
+    for i in range( 1000 ):
+      cache.add( i, 10, i )
+    self.assert_( len( cache ) <= 64 )
+    cache.purgeAll()
+    self.assertEqual( len( cache ), 0 )
+
+  def testThreads( self ):
+    """ concurrent access keeps the cache consistent """
+    cache = LRUDictCache( maxEntries = 100, shards = 8 )
+    def work( offset ):
+      for i in range( 1000 ):
+        cache.add( offset + i % 150, 10, i )
+        cache.get( offset + ( i * 7 ) % 150 )
+    threads = [ threading.Thread( target = work, args = ( t * 1000, ) ) for t in range( 4 ) ]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    stats = cache.getStats()
+    self.assertEqual( stats[ 'hits' ] + stats[ 'misses' ], 4000 )
+    self.assert_( stats[ 'entries' ] <= 104 )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( LRUDictCacheTestCase )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
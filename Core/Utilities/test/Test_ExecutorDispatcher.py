@@ -0,0 +1,108 @@
+""" Test cases for the dispatching of tasks in batches
+"""
+
+__RCSID__ = "$Id$"
+
+import unittest
+
+from DIRAC import S_OK, S_ERROR
+
+# sut
+from DIRAC.Core.Utilities.ExecutorDispatcher import ExecutorDispatcher, ExecutorDispatcherCallbacks, \
+                                                    ExecutorQueues, ExecutorState
+
+class FakeCallbacks( ExecutorDispatcherCallbacks ):
+  """ Tasks go once through type1 """
+
+  def __init__( self ):
+    self.sent = []
+
+  def cbDispatch( self, taskId, taskObj, pathExecuted ):
+    if pathExecuted:
+      return S_OK()
+    return S_OK( "type1" )
+
+  def cbSendTask( self, taskId, taskObj, eId, eType ):
+    self.sent.append( [ taskId ] )
+    return S_OK()
+
+  def cbSendTasks( self, taskList, eId, eType ):
+    self.sent.append( [ taskId for taskId, _taskObj in taskList ] )
+    return S_OK()
+
+class RemovingCallbacks( FakeCallbacks ):
+  """ The first batch fails after one of its tasks has been removed """
+
+  def __init__( self, dispatcher, taskId ):
+    FakeCallbacks.__init__( self )
+    self.dispatcher = dispatcher
+    self.taskId = taskId
+
+  def cbSendTasks( self, taskList, eId, eType ):
+    if self.taskId is None or len( taskList ) < 2:
+      return FakeCallbacks.cbSendTasks( self, taskList, eId, eType )
+    self.dispatcher.removeTask( self.taskId )
+    self.taskId = None
+    return S_ERROR( "Connection lost" )
+
+class ExecutorDispatcherTestCase( unittest.TestCase ):
+
+  def testPopTasks( self ):
+    """ several tasks of a type are popped in order """
+    queues = ExecutorQueues()
+    for taskId in range( 5 ):
+      queues.pushTask( "type1", taskId )
+    self.assertEqual( queues.popTasks( "type1", 3 ), [ 0, 1, 2 ] )
+    self.assertEqual( queues.popTasks( "type1", 3 ), [ 3, 4 ] )
+    self.assertEqual( queues.popTasks( "type1", 3 ), [] )
+    self.assertEqual( queues.popTasks( "type2", 3 ), [] )
+    self.assertEqual( queues.waitingTasks( "type1" ), 0 )
+
+  def testBatchSize( self ):
+    """ batches are never bigger than the tasks an executor can hold """
+    states = ExecutorState()
+    states.addExecutor( 1, "type1", 2, { "type1" : 10 } )
+    states.addExecutor( 2, "type1", 4 )
+    self.assertEqual( states.batchSize( 1, "type1" ), 2 )
+    self.assertEqual( states.batchSize( 2, "type1" ), 1 )
+    self.assertEqual( states.batchSize( 3, "type1" ), 1 )
+
+  def testBatchDispatch( self ):
+    """ tasks are sent one by one while the executor has room, and in batches once they queue """
+    callbacks = FakeCallbacks()
+    dispatcher = ExecutorDispatcher()
+    dispatcher.setCallbacks( callbacks )
+    dispatcher.addExecutor( "e1", [ "type1" ], 4, { "type1" : 2 } )
+    for taskId in range( 1, 7 ):
+      self.assert_( dispatcher.addTask( taskId, "task%s" % taskId )[ 'OK' ] )
+    self.assertEqual( callbacks.sent, [ [ 1 ], [ 2 ], [ 3 ], [ 4 ] ] )
+    #One free slot is not enough for a batch while there are tasks in flight
+    dispatcher.taskProcessed( "e1", 1 )
+    self.assertEqual( len( callbacks.sent ), 4 )
+    dispatcher.taskProcessed( "e1", 2 )
+    self.assertEqual( callbacks.sent[ 4: ], [ [ 5, 6 ] ] )
+    for taskId in ( 3, 4, 5, 6 ):
+      self.assert_( dispatcher.taskProcessed( "e1", taskId )[ 'OK' ] )
+    self.assertEqual( dispatcher.getTaskIds(), [] )
+
+  def testRemovedTaskNotQueued( self ):
+    """ a failed batch only puts back in the queue the tasks that still exist """
+    dispatcher = ExecutorDispatcher()
+    callbacks = RemovingCallbacks( dispatcher, 6 )
+    dispatcher.setCallbacks( callbacks )
+    dispatcher.addExecutor( "e1", [ "type1" ], 4, { "type1" : 2 } )
+    for taskId in range( 1, 7 ):
+      self.assert_( dispatcher.addTask( taskId, "task%s" % taskId )[ 'OK' ] )
+    dispatcher.taskProcessed( "e1", 1 )
+    dispatcher.taskProcessed( "e1", 2 )
+    internals = dispatcher._internals()
+    self.assertEqual( internals[ 'tasks' ], [ 3, 4, 5 ] )
+    self.assertEqual( internals[ 'queues' ][ 'queues' ], { "type1" : [ 5 ] } )
+    #Task 5 is sent on its own once the executor has room
+    dispatcher.taskProcessed( "e1", 3 )
+    self.assertEqual( callbacks.sent[ -1 ], [ 5 ] )
+    self.assertEqual( dispatcher._internals()[ 'queues' ][ 'queues' ], { "type1" : [] } )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( ExecutorDispatcherTestCase )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,47 @@
+""" Test cases for the sampling of the resources used by a process tree
+"""
+
+__RCSID__ = "$Id$"
+
+import os
+import time
+import subprocess
+import unittest
+
+# sut
+from DIRAC.Core.Utilities.ProcessMonitor import ProcessMonitor
+
+class ProcessMonitorTestCase( unittest.TestCase ):
+
+  def setUp( self ):
+    self.monitor = ProcessMonitor( maxSamples = 3, useCgroups = False )
+
+  def testChildren( self ):
+    """ the CPU of the children is accounted to the parent """
+    before = self.monitor.getCPUConsumed( os.getpid() )[ 'Value' ]
+    child = subprocess.Popen( [ 'sh', '-c', 'i=0; while [ $i -lt 200000 ]; do i=$((i+1)); done' ] )
+    result = self.monitor.getResourceConsumedLinux( os.getpid() )
+    child.wait()
+    self.assert_( result[ 'OK' ] )
+    self.assert_( result[ 'Value' ][ 'RSS' ] > 0 )
+    self.assert_( result[ 'Value' ][ 'Vsize' ] >= result[ 'Value' ][ 'RSS' ] )
+    self.assert_( self.monitor.getCPUConsumed( os.getpid() )[ 'Value' ] > before )
+    self.assertFalse( self.monitor.getResourceConsumedLinux( 999999999 )[ 'OK' ] )
+
+  def testSamples( self ):
+    """ only the last samples are kept and summarized """
+    for _i in range( 4 ):
+      self.assert_( self.monitor.sampleResources( os.getpid() )[ 'OK' ] )
+      time.sleep( 0.01 )
+    self.assertEqual( len( self.monitor.samples ), 3 )
+    self.assert_( 'CPUUsage' in self.monitor.samples[-1] )
+    summary = self.monitor.getSamplesSummary( [ 'RSS', 'Unknown' ], percentiles = ( 50, 90 ) )
+    self.assertEqual( summary.keys(), [ 'RSS' ] )
+    self.assertEqual( sorted( summary[ 'RSS' ] ), [ 'Avg', 'Max', 'Min', 'P50', 'P90' ] )
+    self.assert_( summary[ 'RSS' ][ 'Min' ] <= summary[ 'RSS' ][ 'P50' ] <= summary[ 'RSS' ][ 'Max' ] )
+    self.monitor.setMaxSamples( 1 )
+    self.assertEqual( len( self.monitor.samples ), 1 )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( ProcessMonitorTestCase )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -68,6 +68,22 @@ class StatisticsTestCase(unittest.TestCase):
     aList = [ 1, 2 ]
     self.assertEqual( getMedian(aList), 1.5 )
 
+  def testGetPercentile( self ):
+    """ getPercentile tests
+    """
+    # empty list
+    self.assertEqual( getPercentile( [], 50 ), None )
+    # one element
+    self.assertEqual( getPercentile( [ 3 ], 90 ), 3.0 )
+    # median and bounds
+    aList = [ 4, 1, 3, 2 ]
+    self.assertEqual( getPercentile( aList, 50 ), getMedian( aList ) )
+    self.assertEqual( getPercentile( aList, 0 ), 1.0 )
+    self.assertEqual( getPercentile( aList, 100 ), 4.0 )
+    # interpolated
+    self.assertEqual( getPercentile( range( 11 ), 90 ), 9.0 )
+    self.assertAlmostEqual( getPercentile( aList, 90 ), 3.7 )
+
   def testGetVariance(self):
     """ getVariance tests
     """
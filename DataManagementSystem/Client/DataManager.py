@@ -103,6 +103,7 @@ class DataManager( object ):
     self.resourceStatus = ResourceStatus()
     self.ignoreMissingInFC = Operations( self.vo ).getValue( 'DataManagement/IgnoreMissingInFC', False )
     self.useCatalogPFN = Operations( self.vo ).getValue( 'DataManagement/UseCatalogPFN', True )
+    self.listPageSize = Operations( self.vo ).getValue( 'DataManagement/ListDirectoryPageSize', 1000 )
     self.dmsHelper = DMSHelpers()
 
   def setAccountingClient( self, client ):
@@ -285,12 +286,14 @@ class DataManager( object ):
     allFiles = []
     while len( activeDirs ) > 0:
       currentDir = activeDirs[0]
-      # We only need the metadata (verbose) if a limit date is given
-      res = returnSingleResult( self.fc.listDirectory( currentDir, verbose = ( days != 0 ) ) )
       activeDirs.remove( currentDir )
-      if not res['OK']:
-        log.debug( "Error retrieving directory contents", "%s %s" % ( currentDir, res['Message'] ) )
-      else:
+      cursor = 0
+      while True:
+        # We only need the metadata (verbose) if a limit date is given
+        res = self.__listDirectoryPage( currentDir, cursor, verbose = ( days != 0 ) )
+        if not res['OK']:
+          log.debug( "Error retrieving directory contents", "%s %s" % ( currentDir, res['Message'] ) )
+          break
         dirContents = res['Value']
         subdirs = dirContents['SubDirs']
         files = dirContents['Files']
@@ -307,8 +310,21 @@ class DataManager( object ):
             if wildcard == '*' or fnmatch.fnmatch( fileName, wildcard ):
               fileName = fileInfo.get( 'LFN', fileName )
               allFiles.append( fileName )
+        cursor = dirContents.get( 'Cursor', 0 )
+        if not cursor:
+          break
     return S_OK( allFiles )
 
+  def __listDirectoryPage( self, directory, cursor, verbose = False ):
+    """ Get the contents of the directory by pages of files when the catalogs can,
+        the Cursor of the page is 0 after the last page
+    """
+    if 'listDirectoryPage' in self.fc.ro_methods:
+      res = self.fc.listDirectoryPage( directory, cursor, self.listPageSize, verbose )
+      if res['OK'] or cursor:
+        return res
+    return returnSingleResult( self.fc.listDirectory( directory, verbose = verbose ) )
+
   ##########################################################################
   #
   # These are the data transfer methods
@@ -15,6 +15,7 @@ from DIRAC.Core.Security.ProxyInfo import getProxyInfo
 from DIRAC.Interfaces.API.Dirac import Dirac
 from DIRAC.Core.Utilities.PrettyPrint import int_with_commas, printTable
 from DIRAC.DataManagementSystem.Client.DirectoryListing import DirectoryListing
+from DIRAC.Resources.Catalog.FileCatalogClient import FileCatalogClient
 from DIRAC.DataManagementSystem.Client.MetaQuery import MetaQuery, FILE_STANDARD_METAKEYS
 from DIRAC.DataManagementSystem.Client.CmdDirCompletion.AbstractFileSystem import DFCFileSystem, UnixLikeFileSystem
 from DIRAC.DataManagementSystem.Client.CmdDirCompletion.DirectoryCompletion import DirectoryCompletion
@@ -1075,6 +1076,9 @@ File Catalog Client $Revision: 1.17 $Date:
      -S  --sizeorder           : List ordering by file size.
      -H  --human-readable      : Print sizes in human readable format (e.g., 1Ki, 20Mi);
                                  powers of 2 are used (1Mi = 2^20 B).
+
+     Without ordering options, big directories are printed page by page as they are
+     received, each page in name order.
     """
     
     argss = args.split()
@@ -1152,54 +1156,66 @@ File Catalog Client $Revision: 1.17 $Date:
     
     # Get directory contents now
     try:
+      printContents = lambda pathDict: self.__printDirectoryContents( pathDict, _long, numericid,
+                                                                      reverse, timeorder, sizeorder, humanread )
+      if isinstance( self.fc, FileCatalogClient ) and not ( reverse or timeorder or sizeorder ):
+        # Only one page of the directory is in memory at a time
+        printedPages = [ 0 ]
+        def printPage( pathDict ):
+          printedPages[0] += 1
+          printContents( pathDict )
+        result = self.fc.streamDirectory( path, printPage, verbose = _long )
+        # Services not streaming the listings get the full listing request
+        if result['OK'] or printedPages[0]:
+          if not result['OK']:
+            print "Error:",result['Message']
+          return
       result =  self.fc.listDirectory(path,_long)                   
-      dList = DirectoryListing()
       if result['OK']:
         if result['Value']['Successful']:
-          for entry in result['Value']['Successful'][path]['Files']:
-            fname = entry.split('/')[-1]
-            # print entry, fname
-            # fname = entry.replace(self.cwd,'').replace('/','')
-            if _long:
-              fileDict = result['Value']['Successful'][path]['Files'][entry]['MetaData']
-              repDict = result['Value']['Successful'][path]['Files'][entry].get( "Replicas", {} )
-              if fileDict:
-                dList.addFile(fname,fileDict,repDict,numericid)
-            else:  
-              dList.addSimpleFile(fname)
-          for entry in result['Value']['Successful'][path]['SubDirs']:
-            dname = entry.split('/')[-1]
-            # print entry, dname
-            # dname = entry.replace(self.cwd,'').replace('/','')  
-            if _long:
-              dirDict = result['Value']['Successful'][path]['SubDirs'][entry]
-              if dirDict:
-                dList.addDirectory(dname,dirDict,numericid)
-            else:    
-              dList.addSimpleFile(dname)
-          
-          for entry in result['Value']['Successful'][path]['Links']:
-            pass
-          
-          if 'Datasets' in result['Value']['Successful'][path]:
-            for entry in result['Value']['Successful'][path]['Datasets']:
-              dname = os.path.basename( entry )    
-              if _long:
-                dsDict = result['Value']['Successful'][path]['Datasets'][entry]['Metadata']  
-                if dsDict:
-                  dList.addDataset(dname,dsDict,numericid)
-              else:    
-                dList.addSimpleFile(dname)
-              
-          if _long:
-            dList.printListing(reverse,timeorder,sizeorder,humanread)
-          else:
-            dList.printOrdered()
+          printContents( result['Value']['Successful'][path] )
       else:
         print "Error:",result['Message']
     except Exception as x:
       print "Error:", str(x)
 
+  def __printDirectoryContents( self, pathDict, _long, numericid, reverse, timeorder, sizeorder, humanread ):
+    """ Print the contents of a directory, or of a page of it
+    """
+    dList = DirectoryListing()
+    for entry in pathDict['Files']:
+      fname = entry.split('/')[-1]
+      if _long:
+        fileDict = pathDict['Files'][entry]['MetaData']
+        repDict = pathDict['Files'][entry].get( "Replicas", {} )
+        if fileDict:
+          dList.addFile(fname,fileDict,repDict,numericid)
+      else:  
+        dList.addSimpleFile(fname)
+    for entry in pathDict['SubDirs']:
+      dname = entry.split('/')[-1]
+      if _long:
+        dirDict = pathDict['SubDirs'][entry]
+        if dirDict:
+          dList.addDirectory(dname,dirDict,numericid)
+      else:    
+        dList.addSimpleFile(dname)
+
+    if 'Datasets' in pathDict:
+      for entry in pathDict['Datasets']:
+        dname = os.path.basename( entry )    
+        if _long:
+          dsDict = pathDict['Datasets'][entry]['Metadata']  
+          if dsDict:
+            dList.addDataset(dname,dsDict,numericid)
+        else:    
+          dList.addSimpleFile(dname)
+
+    if _long:
+      dList.printListing(reverse,timeorder,sizeorder,humanread)
+    else:
+      dList.printOrdered()
+
   def complete_ls(self, text, line, begidx, endidx):
     result = []
     args = line.split()
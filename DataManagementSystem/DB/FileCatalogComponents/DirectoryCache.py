@@ -0,0 +1,192 @@
+########################################################################
+# $HeadURL$
+########################################################################
+
+""" DIRAC FileCatalog directory cache
+
+    Bounded in memory cache of the directory paths resolved by the directory
+    trees. Each entry keeps the DirID of the path and, once they are read, the
+    UID, GID and Mode of the directory. Only existing directories are cached.
+
+    The effective permissions of the paths, resolved through their nearest existing
+    directory, are kept as well per UID and GID of the credentials.
+"""
+
+__RCSID__ = "$Id$"
+
+import os
+import time
+import threading
+from collections import deque
+
+from DIRAC.Core.Utilities.DictCache import LRUDictCache
+
+class DirectoryCache( object ):
+
+  def __init__( self, maxEntries = 100000, lifetime = 60, maxPermissions = 100000 ):
+    """ At most maxEntries paths and maxPermissions resolved permissions are kept for
+        lifetime seconds. Other catalog servers can change the directories, so the lifetime
+        bounds how long an entry can be stale. A null size or lifetime disables the cache
+    """
+    self.__lifetime = 0
+    if maxEntries > 0:
+      self.__lifetime = max( 0, lifetime )
+    self.__cache = LRUDictCache( maxEntries = max( 0, maxEntries ) )
+    self.__permLifetime = 0
+    if maxPermissions > 0:
+      self.__permLifetime = max( 0, lifetime )
+    # ( path, UID, GID ) -> ( generation, { Read, Write, Execute } )
+    self.__permissions = LRUDictCache( maxEntries = max( 0, maxPermissions ) )
+    #Invalidations while a path is being resolved must not be undone by its result
+    self.__generation = 0
+    #Generation of the last invalidation of each path. The permissions cached before it
+    #for the path or a path below it are stale. Kept while such permissions can be alive
+    self.__invalidations = {}
+    self.__invalidationsExpiry = deque()
+    self.__lock = threading.Lock()
+
+  def isEnabled( self ):
+    return self.__lifetime > 0
+
+  def __key( self, path ):
+    return os.path.normpath( path )
+
+  def getGeneration( self ):
+    """ Token to take before reading the DB and give back to add or update the entries
+    """
+    return self.__generation
+
+  def getDirID( self, path ):
+    """ Cached DirID of the path or None
+    """
+    entry = self.__cache.get( self.__key( path ) )
+    if entry is None:
+      return None
+    return entry[0]
+
+  def getParameters( self, path ):
+    """ Cached { DirID, UID, GID, Mode } of the path or None if they are not known
+    """
+    entry = self.__cache.get( self.__key( path ) )
+    if entry is None or entry[1] is None:
+      return None
+    parameters = dict( entry[1] )
+    parameters[ 'DirID' ] = entry[0]
+    return parameters
+
+  def add( self, path, dirID, parameters = None, generation = None ):
+    """ Cache the DirID of the path, and optionally its UID, GID and Mode parameters
+    """
+    if not self.__lifetime or not dirID:
+      return
+    if parameters is not None:
+      parameters = { 'UID' : parameters[ 'UID' ],
+                     'GID' : parameters[ 'GID' ],
+                     'Mode' : parameters[ 'Mode' ] }
+    self.__lock.acquire()
+    try:
+      if generation is not None and generation != self.__generation:
+        return
+      self.__cache.add( self.__key( path ), self.__lifetime, ( dirID, parameters ) )
+    finally:
+      self.__lock.release()
+
+  def getPermissions( self, path, uid, gid ):
+    """ Cached { Read, Write, Execute } permissions of the path for the UID and GID or None
+    """
+    key = self.__key( path )
+    entry = self.__permissions.get( ( key, uid, gid ) )
+    if entry is None:
+      return None
+    generation, permissions = entry
+    if self.__invalidations and self.__isInvalidated( key, generation ):
+      self.__permissions.delete( ( key, uid, gid ) )
+      return None
+    return dict( permissions )
+
+  def __isInvalidated( self, key, generation ):
+    """ Whether the path or one of its parents was invalidated after the generation
+    """
+    while True:
+      if self.__invalidations.get( key, 0 ) > generation:
+        return True
+      parent = os.path.dirname( key )
+      if parent == key:
+        return False
+      key = parent
+
+  def addPermissions( self, path, uid, gid, permissions, generation = None ):
+    """ Cache the permissions of the path for the UID and GID
+    """
+    if not self.__permLifetime:
+      return
+    self.__lock.acquire()
+    try:
+      if generation is not None and generation != self.__generation:
+        return
+      self.__permissions.add( ( self.__key( path ), uid, gid ), self.__permLifetime,
+                              ( self.__generation, dict( permissions ) ) )
+    finally:
+      self.__lock.release()
+
+  def __invalidatePermissions( self, key ):
+    """ Invalidate the permissions of the path and of all the paths below it: the paths that
+        don't exist have the permissions of their nearest existing parent. The stale entries
+        are dropped when they are looked up, rather than searched for
+    """
+    now = time.time()
+    #Forget the invalidations older than any cached permissions
+    while self.__invalidationsExpiry and self.__invalidationsExpiry[0][0] < now:
+      _expiry, eKey, generation = self.__invalidationsExpiry.popleft()
+      if self.__invalidations.get( eKey ) == generation:
+        del self.__invalidations[ eKey ]
+    if key == '/':
+      self.__permissions.purgeAll()
+      self.__invalidations.clear()
+      self.__invalidationsExpiry.clear()
+      return
+    self.__invalidations[ key ] = self.__generation
+    self.__invalidationsExpiry.append( ( now + self.__permLifetime, key, self.__generation ) )
+
+  def invalidate( self, path, recursive = False ):
+    """ Drop the path, and all the paths below it if recursive
+    """
+    key = self.__key( path )
+    self.__lock.acquire()
+    try:
+      self.__generation += 1
+      if self.__permLifetime:
+        self.__invalidatePermissions( key )
+      if not recursive:
+        self.__cache.delete( key )
+        return
+      if key == '/':
+        self.__cache.purgeAll()
+        return
+      prefix = key + '/'
+      for cKey in self.__cache.getKeys():
+        if cKey == key or cKey.startswith( prefix ):
+          self.__cache.delete( cKey )
+    finally:
+      self.__lock.release()
+
+  def clear( self ):
+    self.invalidate( '/', recursive = True )
+
+  @staticmethod
+  def __addHitRatio( stats ):
+    lookUps = stats[ 'hits' ] + stats[ 'misses' ]
+    stats[ 'hitRatio' ] = 0.
+    if lookUps:
+      stats[ 'hitRatio' ] = float( stats[ 'hits' ] ) / lookUps
+    return stats
+
+  def getStats( self ):
+    """ Cache counters with the hit ratio
+    """
+    return self.__addHitRatio( self.__cache.getStats() )
+
+  def getPermissionStats( self ):
+    """ Permission cache counters with the hit ratio
+    """
+    return self.__addHitRatio( self.__permissions.getStats() )
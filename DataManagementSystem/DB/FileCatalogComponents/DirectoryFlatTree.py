@@ -59,8 +59,8 @@ class DirectoryFlatTree(DirectoryTreeBase):
       dirs[dirID] = dict(zip(metadata,tuple[1:]))
     return S_OK(dirs)
 
-  def getPathPermissions(self,paths,credDict):
-    """ Get the permissions for the supplied paths """
+  def getPathPermissions(self,paths,credDict,useCache=True):
+    """ Get the permissions for the supplied paths, always from the DB """
     res = self.db.ugManager.getUserAndGroupID(credDict)
     if not res['OK']:
       return res
@@ -88,7 +88,7 @@ class DirectoryFlatTree(DirectoryTreeBase):
         successful[dirName]['Execute'] = mode & stat.S_IXOTH
     return S_OK({'Successful':successful,'Failed':res['Value']['Failed']})
 
-  def findDir(self,path):
+  def _findDir(self,path,connection=False):
     res = self.__findDirs([path])
     if not res['OK']:
       return res
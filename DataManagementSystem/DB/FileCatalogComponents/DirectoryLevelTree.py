@@ -29,7 +29,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
     
     return 'Directory'
 
-  def findDir(self,path,connection=False):
+  def _findDir(self,path,connection=False):
     """  Find directory ID for the given path
     """
     
@@ -46,7 +46,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
     res['Level'] = result['Value'][0][1]
     return res
   
-  def findDirs( self, paths, connection=False ):
+  def _findDirs( self, paths, connection=False ):
     """ Find DirIDs for the given path list
     """
     dpaths = ','.join( [ "'"+os.path.normpath( path )+"'" for path in paths ] )
@@ -64,7 +64,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
     """ Remove directory
     """
 
-    result = self.findDir(path)
+    result = self.findDir( path, useCache = False )
     if not result['OK']:
       return result   
     if not result['Value']:
@@ -102,7 +102,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
   def makeDir(self,path):
     """ Create a new directory entry
     """      
-    result = self.findDir(path)
+    result = self.findDir( path, useCache = False )
     if not result['OK']:
       return result
     dirID = result['Value']
@@ -123,7 +123,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
       level = len(elements)
       if level > MAX_LEVELS:
         return S_ERROR('Too many directory levels: %d' % level)
-      result = self.getParent(path)
+      result = self.findDir( os.path.dirname( path ), useCache = False )
       if not result['OK']:
         return result
       parentDirID = result['Value']
@@ -150,7 +150,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
       #resUnlock = self.db._query("UNLOCK TABLES;",conn)      
       if result['Message'].find('Duplicate') != -1:
         #The directory is already added
-        resFind = self.findDir(path)
+        resFind = self.findDir( path, useCache = False )
         if not resFind['OK']:
           return resFind
         dirID = resFind['Value']
@@ -358,6 +358,21 @@ class DirectoryLevelTree(DirectoryTreeBase):
     
     return S_OK([ x[0] for x in result['Value'] ])
   
+  def _getChildrenByIDs( self, dirIDs ):
+    """ Get the child directory IDs of several directories in one go
+    """
+    childDict = dict( [ ( dirID, [] ) for dirID in dirIDs ] )
+    if not dirIDs:
+      return S_OK( childDict )
+    req = "SELECT Parent,DirID FROM FC_DirectoryLevelTree WHERE Parent IN (%s)" % ','.join( [ str( dirID ) for dirID in dirIDs ] )
+    result = self.db._query( req )
+    if not result['OK']:
+      return result
+    for parentID, dirID in result['Value']:
+      if dirID != parentID:
+        childDict[parentID].append( dirID )
+    return S_OK( childDict )
+
   def getSubdirectoriesByID(self,dirID,requestString=False,includeParent=False):
     """ Get all the subdirectories of the given directory at a given level
     """
@@ -530,7 +545,10 @@ class DirectoryLevelTree(DirectoryTreeBase):
         return result
       result = self.__rebuildLevelIndexes( parentID, connection)
       resUnlock = self.db._query("UNLOCK TABLES", connection )       
-      
+
+    # The IDs of the recovered directories may have changed
+    if parentDict:
+      self.db.directoryCache.clear()
     return S_OK()
 
   def _getConnection( self, connection=False ):
@@ -20,7 +20,7 @@ class DirectoryNodeTree( DirectoryTreeBase ):
     DirectoryTreeBase.__init__( self, database )
     self.treeTable = 'FC_DirectoryTreeM'
 
-  def findDir( self, path ):
+  def _findDir( self, path, connection = False ):
     """ Find the identifier of a directory specified by its path
     """
     dpath = path
@@ -48,7 +48,7 @@ class DirectoryNodeTree( DirectoryTreeBase ):
   def makeDir( self, path ):
     """ Create a single directory
     """
-    result = self.findDir( path )
+    result = self.findDir( path, useCache = False )
     if not result['OK']:
       return result
     dirID = result['Value']
@@ -62,7 +62,7 @@ class DirectoryNodeTree( DirectoryTreeBase ):
     level = len( elements )
     dirName = elements[-1]
 
-    result = self.getParent( path )
+    result = self.getParent( path, useCache = False )
     if not result['OK']:
       return result
     parentDirID = result['Value']
@@ -85,7 +85,7 @@ class DirectoryNodeTree( DirectoryTreeBase ):
     else:
       return S_OK( {"Exists":True, "DirID":result['Value']} )
 
-  def getParent( self, path ):
+  def getParent( self, path, useCache = True ):
     """ Get the parent ID of the given directory
     """
     dpath = path
@@ -94,7 +94,7 @@ class DirectoryNodeTree( DirectoryTreeBase ):
     elements = dpath.split( '/' )
     if len( elements ) > 1:
       parentDir = os.path.dirname( path )
-      result = self.findDir( parentDir )
+      result = self.findDir( parentDir, useCache = useCache )
       if not result['OK']:
         return result
       parentDirID = result['Value']
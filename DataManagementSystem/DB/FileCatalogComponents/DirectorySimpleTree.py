@@ -18,7 +18,7 @@ class DirectorySimpleTree( DirectoryTreeBase ):
     DirectoryTreeBase.__init__(self,database)
     self.treeTable = 'FC_DirectoryTree'
 
-  def findDir( self, path ):
+  def _findDir( self, path, connection = False ):
     
     req = "SELECT DirID from FC_DirectoryTree WHERE DirName='%s'" % path
     result = self.db._query(req)
@@ -34,7 +34,7 @@ class DirectorySimpleTree( DirectoryTreeBase ):
     """ Remove directory
     """
 
-    result = self.findDir(path)
+    result = self.findDir( path, useCache = False )
     if not result['OK']:
       return result   
     if not result['Value']:
@@ -47,7 +47,7 @@ class DirectorySimpleTree( DirectoryTreeBase ):
 
   def makeDir( self, path ):
         
-    result = self.findDir(path)
+    result = self.findDir( path, useCache = False )
     if not result['OK']:
       return result
     dirID = result['Value']
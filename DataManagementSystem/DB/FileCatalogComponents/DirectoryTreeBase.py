@@ -12,6 +12,10 @@ from types import StringTypes, ListType
 import stat
 
 DEBUG = 0
+#Number of directories reconciled at once when rebuilding the directory usage
+USAGE_RECONCILE_BATCH = 1000
+#Seconds to wait when rebuilding the directory usage for a reconciliation of another server
+USAGE_RECONCILE_LOCK_TIMEOUT = 600
 
 #############################################################################
 class DirectoryTreeBase:
@@ -27,13 +31,8 @@ class DirectoryTreeBase:
 #
 ############################################################################
 
-  def findDir( self, path, connection = False ):
-    """  Find directory ID for the given path
-    """
-    return S_ERROR( "To be implemented on derived class" )
-
-  def findDirs( self, paths, connection = False ):
-    """ Find DirIDs for the given path list
+  def _findDir( self, path, connection = False ):
+    """  Find directory ID for the given path in the DB
     """
     return S_ERROR( "To be implemented on derived class" )
 
@@ -48,6 +47,19 @@ class DirectoryTreeBase:
   def getChildren( self, path, connection = False ):
     return S_ERROR( "To be implemented on derived class" )
 
+  def _getChildrenByIDs( self, dirIDs ):
+    """ Get the child directory IDs of several directories, derived classes can do it in one go
+
+        :returns: S_OK( { dirID : [ child dirIDs ] } )
+    """
+    childDict = {}
+    for dirID in dirIDs:
+      result = self.getChildren( dirID )
+      if not result['OK']:
+        return result
+      childDict[dirID] = result['Value']
+    return S_OK( childDict )
+
   def getDirectoryPath( self, dirID ):
     """ Get directory name by directory ID
     """
@@ -63,6 +75,56 @@ class DirectoryTreeBase:
 
 ##########################################################################
 
+  def _findDirs( self, paths, connection = False ):
+    """ Find DirIDs for the given path list in the DB, derived classes can do it in one go
+    """
+    dirDict = {}
+    for path in paths:
+      result = self._findDir( path, connection )
+      if not result['OK']:
+        return result
+      if result['Value']:
+        dirDict[os.path.normpath( path )] = result['Value']
+    return S_OK( dirDict )
+
+  def findDir( self, path, connection = False, useCache = True ):
+    """  Find directory ID for the given path. Other servers can remove the cached directories,
+         so the write operations don't use the cache but refresh it
+    """
+    dirCache = self.db.directoryCache
+    if useCache:
+      dirID = dirCache.getDirID( path )
+      if dirID:
+        return S_OK( dirID )
+    generation = dirCache.getGeneration()
+    result = self._findDir( path, connection )
+    if result['OK'] and result['Value']:
+      dirCache.add( path, result['Value'], generation = generation )
+    return result
+
+  def findDirs( self, paths, connection = False, useCache = True ):
+    """ Find DirIDs for the given path list, without using the cache for the write operations
+    """
+    dirCache = self.db.directoryCache
+    dirDict = {}
+    missing = []
+    for path in paths:
+      dirID = None
+      if useCache:
+        dirID = dirCache.getDirID( path )
+      if dirID:
+        dirDict[os.path.normpath( path )] = dirID
+      else:
+        missing.append( path )
+    if missing:
+      generation = dirCache.getGeneration()
+      result = self._findDirs( missing, connection )
+      if not result['OK']:
+        return result
+      for dirName, dirID in result['Value'].items():
+        dirCache.add( dirName, dirID, generation = generation )
+        dirDict[dirName] = dirID
+    return S_OK( dirDict )
 
   def _getConnection( self, connection ):
     if connection:
@@ -119,7 +181,10 @@ class DirectoryTreeBase:
 
     if not dirDict:
       self.removeDir( path )
+      self.db.directoryCache.invalidate( path )
       return S_ERROR( 'Failed to create directory %s' % path )
+    # Permissions resolved through the parent meanwhile are out of date as well
+    self.db.directoryCache.invalidate( path )
     return S_OK( dirID )
 
 #####################################################################
@@ -132,23 +197,22 @@ class DirectoryTreeBase:
     if not path or path[0] != '/':
       return S_ERROR( 'Not an absolute path' )
 
-    result = self.existsDir( path )
+    #The files are registered with the returned DirID, which must not come from the cache
+    result = self.findDir( path, useCache = False )
     if not result['OK']:
       return result
-    result = result['Value']
-    if result['Exists']:
-      return S_OK( result['DirID'] )
+    if result['Value']:
+      return S_OK( result['Value'] )
 
     if path == '/':
       result = self.makeDirectory( path, credDict )
       return result
 
     parentDir = os.path.dirname( path )
-    result = self.existsDir( parentDir )
+    result = self.findDir( parentDir, useCache = False )
     if not result['OK']:
       return result
-    result = result['Value']
-    if result['Exists']:
+    if result['Value']:
       result = self.makeDirectory( path, credDict )
     else:
       result = self.makeDirectories( parentDir, credDict )
@@ -254,7 +318,7 @@ class DirectoryTreeBase:
     failed = {}
     
     # Check if requested directories exist in the catalog
-    result = self.findDirs( dirs )
+    result = self.findDirs( dirs, useCache = False )
     if not result['OK']:
       return result
     dirDict = result['Value']
@@ -271,6 +335,7 @@ class DirectoryTreeBase:
         failed[dir] = 'Failed to remove non-empty directory'
         continue
       result = self.removeDir( dir )
+      self.db.directoryCache.invalidate( dir, recursive = True )
       if not result['OK']:
         failed[dir] = result['Message']
       else:
@@ -398,10 +463,13 @@ class DirectoryTreeBase:
 
         :param dictionary paths : dictionary < lfn : owner >
     """
-    return self._changeDirectoryParameter( paths,
-                                           self._setDirectoryOwner,
-                                           self.db.fileManager.setFileOwner,
-                                           recursive = recursive )
+    result = self._changeDirectoryParameter( paths,
+                                             self._setDirectoryOwner,
+                                             self.db.fileManager.setFileOwner,
+                                             recursive = recursive )
+    for path in paths:
+      self.db.directoryCache.invalidate( path, recursive = recursive )
+    return result
 
 #####################################################################
   def changeDirectoryGroup( self, paths, recursive = False ):
@@ -409,10 +477,13 @@ class DirectoryTreeBase:
 
         :param dictionary paths : dictionary < lfn : group >
     """
-    return self._changeDirectoryParameter( paths,
-                                           self._setDirectoryGroup,
-                                           self.db.fileManager.setFileGroup,
-                                           recursive = recursive )
+    result = self._changeDirectoryParameter( paths,
+                                             self._setDirectoryGroup,
+                                             self.db.fileManager.setFileGroup,
+                                             recursive = recursive )
+    for path in paths:
+      self.db.directoryCache.invalidate( path, recursive = recursive )
+    return result
 
 #####################################################################
   def _setDirectoryMode( self, path, mode ):
@@ -429,10 +500,13 @@ class DirectoryTreeBase:
 
         :param dictionary paths : dictionary < lfn : mode >
     """
-    return self._changeDirectoryParameter( paths,
-                                           self._setDirectoryMode,
-                                           self.db.fileManager.setFileMode,
-                                           recursive = recursive )
+    result = self._changeDirectoryParameter( paths,
+                                             self._setDirectoryMode,
+                                             self.db.fileManager.setFileMode,
+                                             recursive = recursive )
+    for path in paths:
+      self.db.directoryCache.invalidate( path, recursive = recursive )
+    return result
 
 #####################################################################
   def _changeDirectoryParameter( self, paths,
@@ -492,53 +566,61 @@ class DirectoryTreeBase:
     """
     return self._setDirectoryParameter( path, 'Status', status )
 
-  def getPathPermissions( self, lfns, credDict ):
-    """ Get permissions for the given user/group to manipulate the given lfns 
+  def getPathPermissions( self, lfns, credDict, useCache = True ):
+    """ Get permissions for the given user/group to manipulate the given lfns.
+        The paths that don't exist get the permissions of their nearest existing parent.
+        Another server can have changed the cached permissions, so the Write checks don't
+        use the cache: they resolve all the paths from the DB at once and refresh it
     """
+    result = self.db.ugManager.getUserAndGroupID( credDict )
+    if not result['OK']:
+      return result
+    uid, gid = result['Value']
+
+    dirCache = self.db.directoryCache
     successful = {}
-    failed = {}
+    toResolve = []
     for path in lfns:
-      result = self.getDirectoryPermissions( path, credDict )
-      if not result['OK']:
-        failed[path] = result['Message']
+      permissions = None
+      if useCache:
+        permissions = dirCache.getPermissions( path, uid, gid )
+      if permissions is None:
+        toResolve.append( path )
       else:
-        successful[path] = result['Value']
+        successful[path] = permissions
+    if not toResolve:
+      return S_OK( {'Successful':successful, 'Failed':{}} )
 
-    return S_OK( {'Successful':successful, 'Failed':failed} )
+    generation = dirCache.getGeneration()
+    result = self.resolveDirectories( toResolve, useCache = useCache )
+    if not result['OK']:
+      return result
+    for path, resolved in result['Value'].items():
+      if resolved is None:
+        # Nothing yet exists, starting from the scratch
+        permissions = {'Read':True, 'Write':True, 'Execute':True}
+      else:
+        permissions = self.__getModePermissions( uid, gid, resolved[1] )
+      dirCache.addPermissions( path, uid, gid, permissions, generation = generation )
+      successful[path] = permissions
+
+    return S_OK( {'Successful':successful, 'Failed':{}} )
 
   #####################################################################
   def getDirectoryPermissions( self, path, credDict ):
     """ Get permissions for the given user/group to manipulate the given directory 
     """
-    result = self.db.ugManager.getUserAndGroupID( credDict )
+    result = self.getPathPermissions( [path], credDict )
     if not result['OK']:
       return result
-    uid, gid = result['Value']
-
-    result = self.getDirectoryParameters( path )
-    if not result['OK']:
-      if "not found" in result['Message'] or "not exist" in result['Message']:
-        # If the directory does not exist, check the nearest parent for the permissions
-        if path == '/':
-          # Nothing yet exists, starting from the scratch
-          resultDict = {}  
-          resultDict['Write'] = True
-          resultDict['Read'] = True 
-          resultDict['Execute'] = True
-          return S_OK( resultDict )
-        else:
-          pDir = os.path.dirname( path )
-          result = self.getDirectoryPermissions( pDir, credDict )
-          return result
-      else:
-        return result
-
-    dUid = result['Value']['UID']
-    dGid = result['Value']['GID']
-    mode = result['Value']['Mode']
+    return S_OK( result['Value']['Successful'][path] )
 
-    owner = uid == dUid
-    group = gid == dGid
+  def __getModePermissions( self, uid, gid, parameters ):
+    """ Permissions of the user and group given by the UID, GID and Mode of a directory
+    """
+    owner = uid == parameters['UID']
+    group = gid == parameters['GID']
+    mode = parameters['Mode']
 
     resultDict = {}
     if self.db.globalReadAccess:
@@ -556,7 +638,78 @@ class DirectoryTreeBase:
                             or ( group and mode & stat.S_IXGRP > 0 )\
                             or mode & stat.S_IXOTH > 0
 
-    return S_OK( resultDict )
+    return resultDict
+
+  def resolveDirectories( self, paths, useCache = True ):
+    """ Find the nearest existing directory of each path, the path itself if it is a directory.
+        The parents missing in the directory cache, or all of them if useCache is False, are
+        read with a single query
+
+        :returns: S_OK( { path : ( directory, { DirID, UID, GID, Mode } ) } ), with None
+                  instead of the tuple if not even the root directory exists
+    """
+    dirCache = self.db.directoryCache
+    parameters = {}
+    toGet = set()
+    levels = {}
+    for path in paths:
+      dpath = os.path.normpath( path )
+      levels[path] = []
+      while True:
+        levels[path].append( dpath )
+        if dpath not in parameters and dpath not in toGet:
+          cached = None
+          if useCache:
+            cached = dirCache.getParameters( dpath )
+          if cached:
+            parameters[dpath] = cached
+          else:
+            toGet.add( dpath )
+        parent = os.path.dirname( dpath )
+        if dpath in parameters or parent == dpath:
+          break
+        dpath = parent
+
+    if toGet:
+      generation = dirCache.getGeneration()
+      result = self._getDirectoriesParameters( list( toGet ), useCache = useCache )
+      if not result['OK']:
+        return result
+      for dirName, dirParameters in result['Value'].items():
+        dirCache.add( dirName, dirParameters['DirID'], dirParameters, generation = generation )
+        parameters[dirName] = dirParameters
+
+    resolved = {}
+    for path, pathLevels in levels.items():
+      resolved[path] = None
+      for dpath in pathLevels:
+        if dpath in parameters:
+          resolved[path] = ( dpath, parameters[dpath] )
+          break
+    return S_OK( resolved )
+
+  def _getDirectoriesParameters( self, paths, useCache = True ):
+    """ Get the DirID, UID, GID and Mode of the existing directories among the paths
+
+        :returns: S_OK( { path : { DirID, UID, GID, Mode } } )
+    """
+    result = self.findDirs( paths, useCache = useCache )
+    if not result['OK']:
+      return result
+    dirNames = dict( [ ( dirID, dirName ) for dirName, dirID in result['Value'].items() ] )
+    if not dirNames:
+      return S_OK( {} )
+
+    req = "SELECT DirID,UID,GID,Mode FROM FC_DirectoryInfo WHERE DirID IN (%s)" % \
+          ','.join( [ str( dirID ) for dirID in dirNames ] )
+    result = self.db._query( req )
+    if not result['OK']:
+      return result
+    dirDict = {}
+    for dirID, uid, gid, mode in result['Value']:
+      dirDict[dirNames[dirID]] = { 'DirID' : int( dirID ), 'UID' : int( uid ),
+                                   'GID' : int( gid ), 'Mode' : int( mode ) }
+    return S_OK( dirDict )
 
   def getFileIDsInDirectoryWithLimits( self, dirID, credDict, startItem = 1, maxItems = 25 ):
     """ Get file IDs for the given directory
@@ -640,14 +793,30 @@ class DirectoryTreeBase:
     if not result['OK']:
       return result
     directoryID = result['Value']
-    directories = {}
-    files = {}
     links = {}
-    result = self.getChildren( path )
+    result = self.__getSubDirectories( path, details )
+    if not result['OK']:
+      return result
+    directories = result['Value']
+    result = self.db.fileManager.getFilesInDirectory( directoryID, verbose = details )
     if not result['OK']:
       return result
+    files = result['Value']
+    result = self.db.datasetManager.getDatasetsInDirectory( directoryID, verbose = details )
+    if not result['OK']:
+      return result
+    datasets = result['Value']
+    pathDict = {'Files': files, 'SubDirs':directories, 'Links':links, 'Datasets':datasets }
+
+    return S_OK( pathDict )
 
-    # Get subdirectories
+  def __getSubDirectories( self, path, details = False ):
+    """ Get the subdirectories of a given directory, with their parameters if details
+    """
+    directories = {}
+    result = self.getChildren( path )
+    if not result['OK']:
+      return result
     dirIDList = result['Value']
     for dirID in dirIDList:
       result = self.getDirectoryPath( dirID )
@@ -662,16 +831,35 @@ class DirectoryTreeBase:
           directories[dirName] = result['Value']
       else:
         directories[dirName] = True
-    result = self.db.fileManager.getFilesInDirectory( directoryID, verbose = details )
+    return S_OK( directories )
+
+  def getDirectoryContentsPage( self, path, cursor = 0, maxFiles = 1000, details = False ):
+    """ Get the contents of a given directory by pages of at most maxFiles files.
+        The subdirectories and datasets come with the first page, cursor 0, and the
+        Cursor of each page gives the next one, 0 after the last page
+    """
+    result = self.findDir( path )
     if not result['OK']:
       return result
-    files = result['Value']
-    result = self.db.datasetManager.getDatasetsInDirectory( directoryID, verbose = details )
+    directoryID = result['Value']
+    if not directoryID:
+      return S_ERROR( 'Directory %s not found' % path )
+    directories = {}
+    datasets = {}
+    if not cursor:
+      result = self.__getSubDirectories( path, details )
+      if not result['OK']:
+        return result
+      directories = result['Value']
+      result = self.db.datasetManager.getDatasetsInDirectory( directoryID, verbose = details )
+      if not result['OK']:
+        return result
+      datasets = result['Value']
+    result = self.db.fileManager.getFilesInDirectoryPage( directoryID, cursor, maxFiles, verbose = details )
     if not result['OK']:
       return result
-    datasets = result['Value']
-    pathDict = {'Files': files, 'SubDirs':directories, 'Links':links, 'Datasets':datasets }
-
+    pathDict = {'Files': result['Value'], 'SubDirs':directories, 'Links':{}, 'Datasets':datasets,
+                'Cursor': result['Cursor'] }
     return S_OK( pathDict )
 
   def listDirectory( self, lfns, verbose = False ):
@@ -721,6 +909,25 @@ class DirectoryTreeBase:
       
     return result
 
+  def getDirectoryReplicasPage( self, path, cursor = 0, maxFiles = 1000, allStatus = False ):
+    """ Get the replicas of the files of a given directory by pages of at most maxFiles files,
+        the Cursor of each page gives the next one, 0 after the last page
+    """
+    result = self.findDir( path )
+    if not result['OK']:
+      return result
+    directoryID = result['Value']
+    if not directoryID:
+      return S_ERROR( 'Directory %s not found' % path )
+    result = self.db.fileManager.getDirectoryReplicasPage( directoryID, cursor, maxFiles, allStatus )
+    if not result['OK']:
+      return result
+    pageDict = {'Replicas': result['Value'], 'Cursor': result['Cursor']}
+    if self.db.lfnPfnConvention:
+      resSE = self.db.seManager.getSEPrefixes()
+      pageDict['SEPrefixes'] = resSE['Value'] if resSE['OK'] else {}
+    return S_OK( pageDict )
+
   def getDirectorySize( self, lfns, longOutput = False, rawFileTables = False ):
     """ Get the total size of the requested directories. If long flag
         is True, get also physical size per Storage Element
@@ -765,40 +972,60 @@ class DirectoryTreeBase:
 
     return S_OK( resultDict )
 
+  def __getDirectoryUsage( self, paths, req, connection ):
+    """ Read the usage of the directories at once, req selecting DirID and the usage columns
+        for the DirIDs replacing its %s
+
+        :returns: S_OK( ( { path : dirID }, { dirID : [ usage rows ] } ) ), the
+                  paths that are not directories are left out
+    """
+    result = self.findDirs( paths )
+    if not result['OK']:
+      return result
+    dirIDs = {}
+    for path in paths:
+      dirID = result['Value'].get( os.path.normpath( path ) )
+      if dirID:
+        dirIDs[path] = dirID
+    usageDict = {}
+    if not dirIDs:
+      return S_OK( ( dirIDs, usageDict ) )
+
+    req = req % ','.join( [ str( dirID ) for dirID in set( dirIDs.values() ) ] )
+    result = self.db._query( req, connection )
+    if not result['OK']:
+      return result
+    for row in result['Value']:
+      usageDict.setdefault( row[0], [] ).append( row[1:] )
+    return S_OK( ( dirIDs, usageDict ) )
+
   def _getDirectoryLogicalSizeFromUsage( self, lfns, connection ):
     """ Get the total "logical" size of the requested directories
     """
     paths = lfns.keys()
     successful = {}
     failed = {}
+    req = "SELECT DirID, SESize, SEFiles FROM FC_DirectoryUsage WHERE SEID=0 AND DirID IN (%s)"
+    result = self.__getDirectoryUsage( paths, req, connection )
+    if not result['OK']:
+      return result
+    dirIDs, usageDict = result['Value']
     for path in paths:
-      result = self.findDir( path )
-      if not result['OK']:
+      if path not in dirIDs:
         failed[path] = "Directory not found"
         continue
-      if not result['Value']:
-        failed[path] = "Directory not found"
-        continue
-      dirID = result['Value']
-      req = "SELECT SESize, SEFiles FROM FC_DirectoryUsage WHERE SEID=0 AND DirID=%d" % dirID
-
-      result = self.db._query( req, connection )
-      if not result['OK']:
-        failed[path] = result['Message']
-      elif not result['Value']:
+      dirID = dirIDs[path]
+      usage = usageDict.get( dirID )
+      if not usage or not usage[0][0]:
         successful[path] = {"LogicalSize":0, "LogicalFiles":0, 'LogicalDirectories':0}
-      elif result['Value'][0][0]:
-        successful[path] = {"LogicalSize":int( result['Value'][0][0] ),
-                            "LogicalFiles":int( result['Value'][0][1] )}
-        result = self.countSubdirectories( dirID, includeParent = False )
-        if result['OK']:
-          successful[path]['LogicalDirectories'] = result['Value']
-        else:
-          successful[path]['LogicalDirectories'] = -1
-
-
+        continue
+      successful[path] = {"LogicalSize":int( usage[0][0] ),
+                          "LogicalFiles":int( usage[0][1] )}
+      result = self.countSubdirectories( dirID, includeParent = False )
+      if result['OK']:
+        successful[path]['LogicalDirectories'] = result['Value']
       else:
-        successful[path] = {"LogicalSize":0, "LogicalFiles":0, 'LogicalDirectories':0}
+        successful[path]['LogicalDirectories'] = -1
 
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
@@ -859,42 +1086,33 @@ class DirectoryTreeBase:
     paths = lfns.keys()
     successful = {}
     failed = {}
+    req = "SELECT D.DirID, S.SEName, D.SESize, D.SEFiles FROM FC_DirectoryUsage as D, FC_StorageElements as S"
+    req += " WHERE S.SEID=D.SEID AND D.DirID IN (%s)"
+    result = self.__getDirectoryUsage( paths, req, connection )
+    if not result['OK']:
+      return result
+    dirIDs, usageDict = result['Value']
     for path in paths:
-      result = self.findDir( path )
-      if not result['OK']:
+      if path not in dirIDs:
         failed[path] = "Directory not found"
         continue
-      if not result['Value']:
-        failed[path] = "Directory not found"
-        continue
-      dirID = result['Value']
-
-      req = "SELECT S.SEID, S.SEName, D.SESize, D.SEFiles FROM FC_DirectoryUsage as D, FC_StorageElements as S"
-      req += "  WHERE S.SEID=D.SEID AND D.DirID=%d" % dirID
-      result = self.db._query( req, connection )
-      if not result['OK']:
-        failed[path] = result['Message']
-      elif not result['Value']:
-        successful[path] = {}
-      elif result['Value'][0][0]:
-        seDict = {}
-        totalSize = 0
-        totalFiles = 0
-        for seID, seName, seSize, seFiles in result['Value']:
-          if seSize or seFiles:
-            seDict[seName] = {'Size':seSize, 'Files':seFiles}
-            totalSize += seSize
-            totalFiles += seFiles
-          else:
-            req = 'DELETE FROM FC_DirectoryUsage WHERE SEID=%d AND DirID=%d' % ( seID, dirID )
-            result = self.db._update( req )
-            if not result['OK']:
-              gLogger.error( 'Failed to delete entry from FC_DirectoryUsage', result['Message'] )
-        seDict['TotalSize'] = int( totalSize )
-        seDict['TotalFiles'] = int( totalFiles )
-        successful[path] = seDict
-      else:
+      usage = usageDict.get( dirIDs[path] )
+      if not usage:
         successful[path] = {}
+        continue
+      seDict = {}
+      totalSize = 0
+      totalFiles = 0
+      for seName, seSize, seFiles in usage:
+        # The empty rows are dropped by the usage reconciliation
+        if not ( seSize or seFiles ):
+          continue
+        seDict[seName] = {'Size':seSize, 'Files':seFiles}
+        totalSize += seSize
+        totalFiles += seFiles
+      seDict['TotalSize'] = int( totalSize )
+      seDict['TotalFiles'] = int( totalFiles )
+      successful[path] = seDict
 
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
@@ -1003,145 +1221,156 @@ class DirectoryTreeBase:
 
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
-  def _rebuildDirectoryUsage( self ):
-    """ Recreate and replenish the Storage Usage tables
-    """
+  def reconcileDirectoryUsage( self, afterDirID = 0, maxDirectories = 1000, lockTimeout = 0 ):
+    """ Check the usage of at most maxDirectories directories following afterDirID against
+        their files, replicas and sub directories. The drift of a directory is added to it and
+        to all its parents, which leaves their own usage untouched, so the directories can be
+        reconciled in any order. The empty rows of the directories are dropped as well as the
+        ones of the removed directories.
 
-    req = "DROP TABLE IF EXISTS FC_DirectoryUsage_backup"
-    result = self.db._update( req )
-    req = "RENAME TABLE FC_DirectoryUsage TO FC_DirectoryUsage_backup"
-    result = self.db._update( req )
-    req = "CREATE TABLE `FC_DirectoryUsage` LIKE `FC_DirectoryUsage_backup`"
-    result = self.db._update( req )
-    if not result['OK']:
-      return result
+        Only one reconciliation runs at a time for all the catalog servers of the DB. If another
+        one is running, the call waits for up to lockTimeout seconds for it, and then fails, or
+        checks nothing without a timeout.
 
-    result = self.__rebuildDirectoryUsageLeaves()
+        :returns: S_OK( { 'Checked' : n, 'Corrected' : m, 'Cursor' : dirID } ), the DirID to
+                  start the next call from, 0 once all the directories were checked
+    """
+    # Two reconciliations at the same time would both add the same drift
+    lockName = "CONCAT( DATABASE(), '.DirectoryUsage' )"
+    result = self.db._query( "SELECT GET_LOCK( %s, %d )" % ( lockName, lockTimeout ) )
     if not result['OK']:
       return result
+    if not result['Value'][0][0]:
+      if lockTimeout:
+        return S_ERROR( "The directory usage is being reconciled by another server" )
+      gLogger.verbose( "The directory usage is being reconciled by another server" )
+      return S_OK( { 'Checked' : 0, 'Corrected' : 0, 'Cursor' : afterDirID } )
+    try:
+      result = self.__reconcileDirectoryUsage( afterDirID, maxDirectories )
+    finally:
+      self.db._query( "SELECT RELEASE_LOCK( %s )" % lockName )
+    return result
 
-    result = self.db.dtree.findDir( '/' )
+  def __reconcileDirectoryUsage( self, afterDirID, maxDirectories ):
+    """ Reconcile the usage of the directories holding the reconciliation lock
+    """
+    # Everything is read from the same snapshot, the corrections are then added to the
+    # usage as it is, with the changes done meanwhile
+    result = self.db.transactionStart()
     if not result['OK']:
       return result
-    if not result['Value']:
-      return S_ERROR( 'Directory / not found' )
-    dirID = result['Value']
-    result = self.__rebuildDirectoryUsage( dirID )
-    gLogger.verbose( 'Finished rebuilding Directory Usage' )
-    return result
 
-  def __rebuildDirectoryUsageLeaves( self ):
-    """ Rebuild DirectoryUsage entries for directories having files
-    """
-    req = 'SELECT DISTINCT(DirID) FROM FC_Files'
+    req = "SELECT DirID FROM FC_DirectoryInfo WHERE DirID>%d ORDER BY DirID LIMIT %d" % ( afterDirID, maxDirectories )
     result = self.db._query( req )
     if not result['OK']:
+      self.db.transactionRollback()
       return result
-
-    dirIDs = [ x[0] for x in result['Value'] ]
-    gLogger.verbose( 'Starting rebuilding Directory Usage, number of visible directories %d' % len( dirIDs ) )
-
-    insertFields = ['DirID', 'SEID', 'SESize', 'SEFiles', 'LastUpdate']
-    insertCount = 0
-    insertValues = []
-
-    count = 0
-    empty = 0
-
-    for dirID in dirIDs:
-
-      count += 1
-
-      # Get the physical size
-      req = "SELECT SUM(F.Size),COUNT(F.Size),R.SEID from FC_Files as F, FC_Replicas as R "
-      req += "WHERE F.FileID=R.FileID AND F.DirID=%d GROUP BY R.SEID" % int( dirID )
+    dirIDs = [ row[0] for row in result['Value'] ]
+    resultDict = { 'Checked' : len( dirIDs ), 'Corrected' : 0, 'Cursor' : 0 }
+    if len( dirIDs ) == maxDirectories:
+      resultDict['Cursor'] = dirIDs[-1]
+    if not dirIDs:
+      return self.__deleteDirectoryUsage( afterDirID, 0, dirIDs, resultDict )
+
+    result = self._getChildrenByIDs( dirIDs )
+    if not result['OK']:
+      self.db.transactionRollback()
+      return result
+    parentIDs = {}
+    for dirID, childIDs in result['Value'].items():
+      for childID in childIDs:
+        parentIDs[childID] = dirID
+    dirString = ','.join( [ str( dirID ) for dirID in dirIDs ] )
+
+    # The drift of a directory is what its files and replicas account for, minus its usage
+    # without the one of its sub directories: ( dirID, seID ) -> [ size, files ]
+    drift = {}
+    # ( query, sign, rows of the sub directories )
+    queries = [ ( "SELECT DirID, 0, SUM(Size), COUNT(*) FROM FC_Files WHERE DirID IN (%s) GROUP BY DirID" % dirString, 1, False ),
+                ( "SELECT F.DirID, R.SEID, SUM(F.Size), COUNT(*) FROM FC_Files as F, FC_Replicas as R "
+                  "WHERE F.FileID=R.FileID AND F.DirID IN (%s) GROUP BY F.DirID, R.SEID" % dirString, 1, False ),
+                ( "SELECT DirID, SEID, SESize, SEFiles FROM FC_DirectoryUsage WHERE DirID IN (%s)" % dirString, -1, False ) ]
+    if parentIDs:
+      req = "SELECT DirID, SEID, SESize, SEFiles FROM FC_DirectoryUsage WHERE DirID IN (%s)" % \
+            ','.join( [ str( childID ) for childID in parentIDs ] )
+      queries.append( ( req, 1, True ) )
+    for req, sign, children in queries:
       result = self.db._query( req )
       if not result['OK']:
+        self.db.transactionRollback()
         return result
-      if not result['Value']:
-        empty += 1
-
-      for seSize, seFiles, seID in result['Value']:
-        insertValues = [dirID, seID, seSize, seFiles, 'UTC_TIMESTAMP()']
-        result = self.db.insertFields( 'FC_DirectoryUsage', insertFields, insertValues )
-        if not result['OK']:
-          if "Duplicate" in result['Message']:
-            req = "UPDATE FC_DirectoryUsage SET SESize=%d, SEFiles=%d, LastUpdate=UTC_TIMESTAMP()" % ( seSize, seFiles )
-            req += " WHERE DirID=%s AND SEID=%s" % ( dirID, seID )
-            result = self.db._update( req )
-            if not result['OK']:
-              return result
-          return result
-
-      # Get the logical size
-      req = "SELECT SUM(Size),COUNT(Size) from FC_Files WHERE DirID=%d " % int( dirID )
-      result = self.db._query( req )
+      for dirID, seID, size, files in result['Value']:
+        if children:
+          dirID = parentIDs[dirID]
+        delta = drift.setdefault( ( dirID, seID ), [0, 0] )
+        delta[0] += sign * int( size or 0 )
+        delta[1] += sign * int( files or 0 )
+
+    directorySEDict = {}
+    for ( dirID, seID ), ( size, files ) in drift.items():
+      if size or files:
+        directorySEDict.setdefault( dirID, {} )[seID] = { 'Size' : size, 'Files' : files }
+    if directorySEDict:
+      gLogger.info( "Correcting the usage of %d directories" % len( directorySEDict ) )
+      result = self.db.fileManager._updateDirectoryUsage( directorySEDict, '+' )
       if not result['OK']:
+        self.db.transactionRollback()
         return result
-      if not result['Value']:
-        return S_ERROR( 'Empty directory' )
-      seSize, seFiles = result['Value'][0]
-      insertValues = [dirID, 0, seSize, seFiles, 'UTC_TIMESTAMP()']
-      result = self.db.insertFields( 'FC_DirectoryUsage', insertFields, insertValues )
-      if not result['OK']:
-        if "Duplicate" in result['Message']:
-          req = "UPDATE FC_DirectoryUsage SET SESize=%d, SEFiles=%d, LastUpdate=UTC_TIMESTAMP()" % ( seSize, seFiles )
-          req += " WHERE DirID=%s AND SEID=0" % dirID
-          result = self.db._update( req )
-          if not result['OK']:
-            return result
-        else:
-          return result
-
-    gLogger.verbose( "Processed %d directories, %d empty " % ( count, empty ) )
+    resultDict['Corrected'] = len( directorySEDict )
 
-    return S_OK()
+    return self.__deleteDirectoryUsage( afterDirID, resultDict['Cursor'], dirIDs, resultDict )
 
-  def __rebuildDirectoryUsage( self, directoryID ):
-    """ Rebuild DirectoryUsage entries recursively for the given path
+  def __deleteDirectoryUsage( self, afterDirID, lastDirID, dirIDs, resultDict ):
+    """ Drop the empty usage rows of the checked directories and commit the reconciliation.
+        Then drop the rows of the removed directories following afterDirID, up to lastDirID
+        or all of them if it is null
     """
-    result = self.getChildren( directoryID )
-    if not result['OK']:
-      return result
-    dirIDs = result['Value']
-    resultDict = {}
-    for dirID in dirIDs:
-      result = self.__rebuildDirectoryUsage( dirID )
-      if not result['OK']:
-        return result
-      dirDict = result['Value']
-      for seID in dirDict:
-        resultDict.setdefault( seID, {'Size':0, 'Files':0} )
-        resultDict[seID]['Size'] += dirDict[seID]['Size']
-        resultDict[seID]['Files'] += dirDict[seID]['Files']
-
-    insertFields = ['DirID', 'SEID', 'SESize', 'SEFiles', 'LastUpdate']
-    insertValues = []
-    for seID in resultDict:
-      size = resultDict[seID]['Size']
-      files = resultDict[seID]['Files']
-      req = "UPDATE FC_DirectoryUsage SET SESize=SESize+%d, SEFiles=SEFiles+%d WHERE DirID=%d AND SEID=%d"
-      req = req % ( size, files, directoryID, seID )
+    if dirIDs:
+      req = "DELETE FROM FC_DirectoryUsage WHERE DirID IN (%s) AND SESize=0 AND SEFiles=0" % \
+            ','.join( [ str( dirID ) for dirID in dirIDs ] )
       result = self.db._update( req )
       if not result['OK']:
+        self.db.transactionRollback()
         return result
-      if not result['Value']:
-        insertValues = [directoryID, seID, size, files, 'UTC_TIMESTAMP()']
-        result = self.db.insertFields( 'FC_DirectoryUsage', insertFields, insertValues )
-        if not result['OK']:
-          return result
+    result = self.db.transactionCommit()
+    if not result['OK']:
+      return result
 
-    req = "SELECT SEID,SESize,SEFiles from FC_DirectoryUsage WHERE DirID=%d" % directoryID
+    # The directories missing from the snapshot may have been created since, so the removed
+    # ones are looked for in the current directories. Their DirIDs are never used again
+    req = "SELECT DISTINCT U.DirID FROM FC_DirectoryUsage AS U LEFT JOIN FC_DirectoryInfo AS D ON U.DirID=D.DirID"
+    req += " WHERE U.DirID>%d AND D.DirID IS NULL" % afterDirID
+    if lastDirID:
+      req += " AND U.DirID<=%d" % lastDirID
     result = self.db._query( req )
     if not result['OK']:
       return result
-
-    resultDict = {}
-    for seid, size, files in result['Value']:
-      resultDict[seid] = {'Size':size, 'Files':files}
-
+    if result['Value']:
+      req = "DELETE FROM FC_DirectoryUsage WHERE DirID IN (%s)" % ','.join( [ str( row[0] ) for row in result['Value'] ] )
+      result = self.db._update( req )
+      if not result['OK']:
+        return result
     return S_OK( resultDict )
 
+  def _rebuildDirectoryUsage( self ):
+    """ Bring the usage of all the directories in line with their files and replicas, going
+        over the whole tree with the usage reconciliation
+    """
+    checked = 0
+    corrected = 0
+    cursor = 0
+    while True:
+      result = self.reconcileDirectoryUsage( cursor, USAGE_RECONCILE_BATCH, USAGE_RECONCILE_LOCK_TIMEOUT )
+      if not result['OK']:
+        return result
+      checked += result['Value']['Checked']
+      corrected += result['Value']['Corrected']
+      cursor = result['Value']['Cursor']
+      if not cursor:
+        break
+    gLogger.verbose( 'Finished rebuilding Directory Usage, %d directories corrected out of %d' % ( corrected, checked ) )
+    return S_OK()
+
   def getDirectoryCounters( self, connection = False ):
     """ Get the total number of directories
     """
@@ -11,6 +11,8 @@ from DIRAC.Core.Utilities.List                                            import
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.Utilities        import getIDSelectString
 
 DEBUG = 0
+#Maximum number of ( DirID, FileName ) pairs looked up by a single join
+LOOKUP_CHUNK_SIZE = 10000
 
 import os
 from types import ListType, TupleType, StringTypes
@@ -41,6 +43,24 @@ class FileManager( FileManagerBase ):
           failed[fname] = 'No such file or directory'
 
     successful = {}
+    #Files spread over several directories are looked up together
+    if len( directoryIDs ) > 1:
+      directoryPaths = dict( [ ( dirID, dirPath ) for dirPath, dirID in directoryIDs.items() ] )
+      dirFiles = dict( [ ( dirID, dirDict[dirPath] ) for dirPath, dirID in directoryIDs.items() ] )
+      res = self.__getFilesInDirectories( dirFiles, metadata, allStatus = allStatus, connection = connection )
+      if res['OK']:
+        for ( dirID, fileName ), fileDict in res['Value'].items():
+          fname = '%s/%s' % ( directoryPaths[dirID], fileName )
+          fname = fname.replace( '//', '/' )
+          successful[fname] = fileDict
+      for dirPath in directoryIDs:
+        for fileName in dirDict[dirPath]:
+          fname = '%s/%s' % ( dirPath, fileName )
+          fname = fname.replace( '//', '/' )
+          if not fname in successful:
+            failed[fname] = res.get( 'Message', 'No such file or directory' )
+      return S_OK( {"Successful":successful, "Failed":failed} )
+
     for dirPath in directoryIDs:
       fileNames = dirDict[dirPath]
       res = self._getDirectoryFiles( directoryIDs[dirPath], fileNames, metadata, allStatus = allStatus, connection = connection )
@@ -83,23 +103,14 @@ class FileManager( FileManagerBase ):
           failed[fname] = 'No such directory'
       else:
         directoryPaths[directoryIDs[dirPath]] = dirPath
-    directoryIDList = directoryIDs.keys()
-    for dirIDs in breakListIntoChunks( directoryIDList, 1000 ):
-
-      wheres = []
-      for dirPath in dirIDs:
-        fileNames = dirDict[dirPath]
-        dirID = directoryIDs[dirPath]
-        wheres.append( "( DirID=%d AND FileName IN (%s) )" % (dirID, stringListToString(fileNames) ) )
-
-      req = "SELECT FileName,DirID,FileID FROM FC_Files WHERE %s" % " OR ".join( wheres )
-      result = self.db._query(req,connection)
-      if not result['OK']:
-        return result
-      for fileName, dirID, fileID in result['Value']:
-        fname = '%s/%s' % (directoryPaths[dirID],fileName)
-        fname = fname.replace('//','/')
-        successful[fname] = fileID
+    dirFiles = dict( [ ( dirID, dirDict[dirPath] ) for dirPath, dirID in directoryIDs.items() ] )
+    result = self.__findFilesInDirectories( dirFiles, allStatus = True, connection = connection )
+    if not result['OK']:
+      return result
+    for fileName, dirID, fileID, _size, _uid, _gid, _status in result['Value']:
+      fname = '%s/%s' % (directoryPaths[dirID],fileName)
+      fname = fname.replace('//','/')
+      successful[fname] = fileID
 
     for lfn in lfns:
       if not lfn in successful:
@@ -129,28 +140,97 @@ class FileManager( FileManagerBase ):
     res = self.db._query(req,connection)
     if not res['OK']:
       return res
-    fileNameIDs = res['Value']
-    if not fileNameIDs:
-      return S_OK({})
-    filesDict = {}
+    res = self.__getFilesMetadata( res['Value'], metadata, connection = connection )
+    if not res['OK']:
+      return res
+    files = {}
+    for ( _dirID, fileName ), fileDict in res['Value'].items():
+      files[fileName] = fileDict
+    return S_OK(files)
+
+  def __findFilesInDirectories( self, dirFiles, allStatus = False, connection = False ):
+    """ Get the FC_Files rows of the files given as { dirID : [ fileNames ] }. The
+        ( DirID, FileName ) pairs are loaded by chunks into a temporary table of the
+        connection and joined with FC_Files, instead of one query per directory
+    """
+    pairs = []
+    for dirID, fileNames in dirFiles.items():
+      pairs += [ "(%d,'%s')" % ( dirID, fileName ) for fileName in fileNames ]
+    if not pairs:
+      return S_OK( [] )
+
+    connection = self._getConnection( connection )
+    req = "CREATE TEMPORARY TABLE IF NOT EXISTS FC_FileLookUp ( DirID INT NOT NULL, "
+    req += "FileName VARCHAR(128) CHARACTER SET latin1 COLLATE latin1_bin NOT NULL, "
+    req += "PRIMARY KEY (DirID,FileName) ) ENGINE = MEMORY"
+    res = self.db._update( req, connection )
+    if not res['OK']:
+      return res
+    statusCondition = ''
+    if not allStatus:
+      statusIDs = []
+      for status in self.db.visibleFileStatus:
+        res = self._getStatusInt( status, connection = connection )
+        if res['OK']:
+          statusIDs.append( res['Value'] )
+      if statusIDs:
+        statusCondition = " WHERE F.Status IN (%s)" % intListToString( statusIDs )
+
+    rows = []
+    for pairChunk in breakListIntoChunks( pairs, LOOKUP_CHUNK_SIZE ):
+      res = self.db._update( "DELETE FROM FC_FileLookUp", connection )
+      if not res['OK']:
+        return res
+      res = self.db._update( "INSERT IGNORE INTO FC_FileLookUp (DirID,FileName) VALUES %s" % ','.join( pairChunk ),
+                             connection )
+      if not res['OK']:
+        return res
+      req = "SELECT F.FileName,F.DirID,F.FileID,F.Size,F.UID,F.GID,F.Status FROM FC_FileLookUp L "
+      req += "JOIN FC_Files F ON F.DirID=L.DirID AND F.FileName=L.FileName%s" % statusCondition
+      res = self.db._query( req, connection )
+      if not res['OK']:
+        return res
+      rows += list( res['Value'] )
+    return S_OK( rows )
+
+  def __getFilesInDirectories( self, dirFiles, metadata, allStatus = False, connection = False ):
+    """ Get the metadata of the files given as { dirID : [ fileNames ] }
+
+        :return: S_OK( { ( dirID, fileName ) : metadataDict } )
+    """
+    res = self.__findFilesInDirectories( dirFiles, allStatus = allStatus, connection = connection )
+    if not res['OK']:
+      return res
+    return self.__getFilesMetadata( res['Value'], metadata, connection = connection )
+
+  def __getFilesMetadata( self, fileRows, metadata_input, connection = False ):
+    """ Build the metadata of the FC_Files rows (FileName,DirID,FileID,Size,UID,GID,Status)
+
+        :return: S_OK( { ( dirID, fileName ) : metadataDict } )
+    """
+    metadata = list(metadata_input)
+    files = {}
+    if not fileRows:
+      return S_OK(files)
     # If we only requested the FileIDs then there is no need to do anything else
     if metadata == ['FileID']:
-      for fileName,dirID,fileID,size,uid,gid,status in fileNameIDs:
-        filesDict[fileName] = {'FileID':fileID}
-      return S_OK(filesDict)
+      for fileName,dirID,fileID,size,uid,gid,status in fileRows:
+        files[( dirID, fileName )] = {'FileID':fileID}
+      return S_OK(files)
     # Otherwise get the additionally requested metadata from the FC_FileInfo table
-    files = {}
+    filesDict = {}
     userDict = {}
     groupDict = {}
-    for fileName,dirID,fileID,size,uid,gid,status in fileNameIDs:
-      filesDict[fileID] = fileName
-      files[fileName] = {}
+    for fileName,dirID,fileID,size,uid,gid,status in fileRows:
+      fileKey = ( dirID, fileName )
+      filesDict[fileID] = fileKey
+      files[fileKey] = {}
       if 'Size' in metadata:
-        files[fileName]['Size'] = size
+        files[fileKey]['Size'] = size
       if 'DirID' in metadata:
-        files[fileName]['DirID'] = dirID
+        files[fileKey]['DirID'] = dirID
       if 'UID' in metadata:
-        files[fileName]['UID'] = uid
+        files[fileKey]['UID'] = uid
         if uid in userDict:
           owner = userDict[uid]
         else:  
@@ -159,9 +239,9 @@ class FileManager( FileManagerBase ):
           if result['OK']:
             owner = result['Value']
           userDict[uid] = owner  
-        files[fileName]['Owner'] = owner   
+        files[fileKey]['Owner'] = owner   
       if 'GID' in metadata:
-        files[fileName]['GID'] = gid
+        files[fileKey]['GID'] = gid
         if gid in groupDict:
           group = groupDict[gid]
         else:    
@@ -170,22 +250,23 @@ class FileManager( FileManagerBase ):
           if result['OK']:
             group = result['Value']
           groupDict[gid] = group  
-        files[fileName]['OwnerGroup'] = group    
+        files[fileKey]['OwnerGroup'] = group    
       if 'Status' in metadata:
-        files[fileName]['Status'] = self._getIntStatus( status ).get( "Value", status )
+        files[fileKey]['Status'] = self._getIntStatus( status ).get( "Value", status )
     for element in ['FileID','Size','DirID','UID','GID','Status']:
       if element in metadata:
         metadata.remove(element)    
     metadata.append('FileID')
     metadata.reverse()
-    req = "SELECT %s FROM FC_FileInfo WHERE FileID IN (%s)" % (intListToString(metadata),intListToString(filesDict.keys()))  
-    res = self.db._query(req,connection)
-    if not res['OK']:
-      return res
-    for tuple_ in res['Value']:
-      fileID = tuple_[0]
-      rowDict = dict(zip(metadata,tuple_))
-      files[filesDict[fileID]].update(rowDict)
+    for fileIDs in breakListIntoChunks( filesDict.keys(), LOOKUP_CHUNK_SIZE ):
+      req = "SELECT %s FROM FC_FileInfo WHERE FileID IN (%s)" % (intListToString(metadata),intListToString(fileIDs))
+      res = self.db._query(req,connection)
+      if not res['OK']:
+        return res
+      for tuple_ in res['Value']:
+        fileID = tuple_[0]
+        rowDict = dict(zip(metadata,tuple_))
+        files[filesDict[fileID]].update(rowDict)
     return S_OK(files)
 
   def _getDirectoryFileIDs( self, dirID, requestString = False ):
@@ -241,13 +322,12 @@ class FileManager( FileManagerBase ):
     connection = self._getConnection(connection)
     # Add the files
     failed = {}
-    insertTuples = []
+    insertTuples = {}
     res = self._getStatusInt('AprioriGood',connection=connection)
     statusID = 0
     if res['OK']:
       statusID = res['Value']
       
-    directorySESizeDict = {}  
     for lfn in lfns.keys():
       dirID = lfns[lfn]['DirID']
       fileName = os.path.basename(lfn)
@@ -259,55 +339,80 @@ class FileManager( FileManagerBase ):
         result = self.db.ugManager.getUserAndGroupID( ownerDict )
         if result['OK']:
           s_uid, s_gid = result['Value']
-      insertTuples.append("(%d,%d,%d,%d,%d,'%s')" % (dirID,size,s_uid,s_gid,statusID,fileName))
-      directorySESizeDict.setdefault( dirID, {} )
-      directorySESizeDict[dirID].setdefault( 0, {'Files':0,'Size':0} )
-      directorySESizeDict[dirID][0]['Size'] += lfns[lfn]['Size']
-      directorySESizeDict[dirID][0]['Files'] += 1
+      insertTuples[lfn] = "(%d,%d,%d,%d,%d,'%s')" % (dirID,size,s_uid,s_gid,statusID,fileName)
+
+    # The files, their info and the directory usage are added in one transaction, so that
+    # the usage reconciliation never sees files without their usage
+    directorySESizeDict = {}
+    res = self._updateWithDirectoryUsage( lambda: self.__insertFiles( lfns, insertTuples, failed, directorySESizeDict, connection ),
+                                          directorySESizeDict, '+', connection = connection )
+    if not res['OK']:
+      for lfn in lfns.keys():
+        failed[lfn] = res['Message']
+        lfns.pop(lfn)
+
+    return S_OK({'Successful':lfns,'Failed':failed})
 
-    req = "INSERT INTO FC_Files (DirID,Size,UID,GID,Status,FileName) VALUES %s" % (','.join(insertTuples))
+  def __insertFiles( self, lfns, fileTuples, failed, directorySESizeDict, connection ):
+    """ Insert the files and their info, filling the usage change of their directories.
+        fileTuples are the FC_Files values of each LFN
+    """
+    if not lfns:
+      return S_OK()
+    # The directories can have been removed by another server since they were looked up:
+    # lock them until the files are there
+    dirIDs = set( [ lfns[lfn]['DirID'] for lfn in lfns ] )
+    treeTable = self.db.dtree.getTreeTable()
+    req = "SELECT DirID FROM %s WHERE DirID IN (%s) LOCK IN SHARE MODE" % ( treeTable, intListToString( dirIDs ) )
+    res = self.db._query( req, connection )
+    if not res['OK']:
+      return res
+    removedDirIDs = dirIDs - set( [ row[0] for row in res['Value'] ] )
+    for lfn in lfns.keys():
+      if lfns[lfn]['DirID'] in removedDirIDs:
+        self.db.directoryCache.invalidate( os.path.dirname( lfn ) )
+        failed[lfn] = 'No such directory'
+        lfns.pop( lfn )
+    if not lfns:
+      return S_OK()
+    req = "INSERT INTO FC_Files (DirID,Size,UID,GID,Status,FileName) VALUES %s" % \
+          ( ','.join( [ fileTuples[lfn] for lfn in lfns ] ) )
     res = self.db._update(req,connection)
     if not res['OK']:
       return res
-    # Get the fileIDs for the inserted files
-    res = self._findFiles(lfns.keys(),['FileID'],connection=connection)
+    # Get the fileIDs for the inserted files, in the directories they were inserted in
+    dirFiles = {}
+    for lfn in lfns:
+      dirFiles.setdefault( lfns[lfn]['DirID'], [] ).append( os.path.basename( lfn ) )
+    res = self.__findFilesInDirectories( dirFiles, allStatus = True, connection = connection )
     if not res['OK']:
-      for lfn in lfns.keys():
-        failed[lfn] = 'Failed post insert check'
-        lfns.pop(lfn)
-    else:
-      failed.update(res['Value']['Failed'])
-      for lfn in res['Value']['Failed'].keys():
-        lfns.pop(lfn)
-      for lfn,fileDict in res['Value']['Successful'].items():
-        lfns[lfn]['FileID'] = fileDict['FileID']
+      return S_ERROR( 'Failed post insert check' )
+    fileIDs = dict( [ ( ( dirID, fileName ), fileID ) for fileName, dirID, fileID, _size, _uid, _gid, _status in res['Value'] ] )
+    for lfn in lfns.keys():
+      fileID = fileIDs.get( ( lfns[lfn]['DirID'], os.path.basename( lfn ) ) )
+      if fileID:
+        lfns[lfn]['FileID'] = fileID
+      else:
+        failed[lfn] = 'No such file or directory'
+        lfns.pop( lfn )
     insertTuples = []
-    toDelete = []
     for lfn in lfns.keys():
       fileInfo = lfns[lfn]     
       fileID = fileInfo['FileID']
       dirID = fileInfo['DirID']
+      directorySESizeDict.setdefault( dirID, {} )
+      directorySESizeDict[dirID].setdefault( 0, {'Files':0,'Size':0} )
+      directorySESizeDict[dirID][0]['Size'] += fileInfo['Size']
+      directorySESizeDict[dirID][0]['Files'] += 1
       checksum = fileInfo['Checksum']
       checksumtype = fileInfo.get('ChecksumType','Adler32')
       guid = fileInfo.get('GUID','')
       mode = fileInfo.get('Mode',self.db.umask)
-      toDelete.append(fileID)
       insertTuples.append("(%d,'%s','%s','%s',UTC_TIMESTAMP(),UTC_TIMESTAMP(),%d)" % (fileID,guid,checksum,checksumtype,mode))
-    if insertTuples:
-      req = "INSERT INTO FC_FileInfo (FileID,GUID,Checksum,ChecksumType,CreationDate,ModificationDate,Mode) VALUES %s" % ','.join( insertTuples )
-      res = self.db._update(req)
-      if not res['OK']:
-        self._deleteFiles(toDelete,connection=connection)
-        for lfn in lfns.keys():
-          failed[lfn] = res['Message']
-          lfns.pop(lfn)
-      else:
-        # Update the directory usage
-        result = self._updateDirectoryUsage(directorySESizeDict,'+',connection=connection)
-        if not result['OK']:
-          gLogger.warn( "Failed to insert FC_DirectoryUsage", result['Message'] )
-          
-    return S_OK({'Successful':lfns,'Failed':failed})
+    if not insertTuples:
+      return S_OK()
+    req = "INSERT INTO FC_FileInfo (FileID,GUID,Checksum,ChecksumType,CreationDate,ModificationDate,Mode) VALUES %s" % ','.join( insertTuples )
+    return self.db._update( req, connection )
 
   def _getFileIDFromGUID(self,guid,connection=False):
     connection = self._getConnection(connection)
@@ -375,6 +480,53 @@ class FileManager( FileManagerBase ):
       return filePurge
     return S_OK()
 
+  def _deleteFilesWithDirectoryUsage( self, lfns, connection = False ):
+    """ Delete the files and all their replicas, and decrease the usage of their directories in
+        the same transaction. The decrease is computed from the rows locked for the deletion, so
+        that concurrent removals of the same files, or replicas added meanwhile, count exactly once
+    """
+    connection = self._getConnection( connection )
+    fileIDs = [ lfnDict['FileID'] for lfnDict in lfns.values() ]
+    directorySESizeDict = {}
+    return self._updateWithDirectoryUsage( lambda: self.__deleteLockedFiles( fileIDs, directorySESizeDict, connection ),
+                                           directorySESizeDict, '-', connection = connection )
+
+  def __deleteLockedFiles( self, fileIDs, directorySESizeDict, connection ):
+    """ Lock the files and their replicas, fill the usage change of their directories with the
+        rows still there and delete them
+    """
+    if not fileIDs:
+      return S_OK()
+    req = "SELECT FileID,DirID,Size FROM FC_Files WHERE FileID IN (%s) FOR UPDATE" % intListToString( fileIDs )
+    res = self.db._query( req, connection )
+    if not res['OK']:
+      return res
+    files = {}
+    for fileID, dirID, size in res['Value']:
+      files[fileID] = ( dirID, size )
+      directorySESizeDict.setdefault( dirID, {} )
+      directorySESizeDict[dirID].setdefault( 0, {'Files':0,'Size':0} )
+      directorySESizeDict[dirID][0]['Size'] += size
+      directorySESizeDict[dirID][0]['Files'] += 1
+    # Already removed by someone else
+    if not files:
+      return S_OK()
+    req = "SELECT RepID,FileID,SEID FROM FC_Replicas WHERE FileID IN (%s) FOR UPDATE" % intListToString( files.keys() )
+    res = self.db._query( req, connection )
+    if not res['OK']:
+      return res
+    repIDs = []
+    for repID, fileID, seID in res['Value']:
+      repIDs.append( repID )
+      dirID, size = files[fileID]
+      directorySESizeDict[dirID].setdefault( seID, {'Files':0,'Size':0} )
+      directorySESizeDict[dirID][seID]['Size'] += size
+      directorySESizeDict[dirID][seID]['Files'] += 1
+    res = self.__deleteReplicas( repIDs, connection = connection )
+    if not res['OK']:
+      return res
+    return self.__deleteFiles( files.keys(), connection = connection )
+
   def __deleteFileReplicas( self, fileIDs, connection = False ):
     connection = self._getConnection(connection)
     res = self.__getFileIDReplicas(fileIDs,connection=connection)
@@ -447,16 +599,50 @@ class FileManager( FileManagerBase ):
     if not insertTuples:
       return S_OK({'Successful':successful,'Failed':failed})
 
+    # The replicas, their info and the directory usage are added in one transaction, so that
+    # the usage reconciliation never sees replicas without their usage
+    directorySESizeDict = {}
+    res = self._updateWithDirectoryUsage( lambda: self.__insertReplicas( lfns, insertTuples, statusID, fileIDLFNs, master,
+                                                                         failed, directorySESizeDict, connection ),
+                                          directorySESizeDict, '+', connection = connection )
+    if not res['OK']:
+      for lfn in lfns.keys():
+        failed[lfn] = res['Message']
+    else:
+      for lfn in lfns.keys():
+        successful[lfn] = True
+    return S_OK({'Successful':successful,'Failed':failed})
+
+  def __insertReplicas( self, lfns, replicaTuples, statusID, fileIDLFNs, master, failed, directorySESizeDict, connection ):
+    """ Insert the replicas and their info, filling the usage change of their directories
+    """
+    # The files can have been removed since they were looked up: lock them until the replicas
+    # are there, and take their directories from the DB rather than from the directory cache
+    fileIDs = set( [ fileID for fileID, _seID in replicaTuples ] )
+    req = "SELECT FileID,DirID FROM FC_Files WHERE FileID IN (%s) LOCK IN SHARE MODE" % intListToString( fileIDs )
+    res = self.db._query( req, connection )
+    if not res['OK']:
+      return res
+    fileDirIDs = dict( res['Value'] )
+    for fileID in fileIDs:
+      lfn = fileIDLFNs[fileID]
+      if fileID in fileDirIDs:
+        lfns[lfn]['DirID'] = fileDirIDs[fileID]
+      elif lfn in lfns:
+        failed[lfn] = 'No such file or directory'
+        lfns.pop( lfn )
+    replicaTuples = [ tuple_ for tuple_ in replicaTuples if tuple_[0] in fileDirIDs ]
+    if not replicaTuples:
+      return S_OK()
     req = "INSERT INTO FC_Replicas (FileID,SEID,Status) VALUES %s" % \
-          (','.join(["(%d,%d,%d)" % (tuple_[0],tuple_[1],statusID) for tuple_ in insertTuples]))
+          (','.join(["(%d,%d,%d)" % (tuple_[0],tuple_[1],statusID) for tuple_ in replicaTuples]))
     res = self.db._update(req,connection)
     if not res['OK']:
       return res
-    res = self._getRepIDsForReplica(insertTuples, connection=connection)
+    res = self._getRepIDsForReplica(replicaTuples, connection=connection)
     if not res['OK']:
       return res
     replicaDict = res['Value']
-    directorySESizeDict = {}
     for fileID,repDict in replicaDict.items():
       lfn = fileIDLFNs[fileID]
       dirID = lfns[lfn]['DirID']
@@ -471,27 +657,16 @@ class FileManager( FileManagerBase ):
     if master:
       replicaType = 'Master'
     insertReplicas = []
-    toDelete = []
     for lfn in lfns.keys():
       fileDict = lfns[lfn]
       repID = fileDict.get( 'RepID', 0 )
       if repID:
         pfn = fileDict['PFN']
-        toDelete.append(repID)
         insertReplicas.append("(%d,'%s',UTC_TIMESTAMP(),UTC_TIMESTAMP(),'%s')" % (repID,replicaType,pfn))    
-    if insertReplicas:
-      req = "INSERT INTO FC_ReplicaInfo (RepID,RepType,CreationDate,ModificationDate,PFN) VALUES %s" % (','.join(insertReplicas))
-      res = self.db._update(req,connection)
-      if not res['OK']:
-        for lfn in lfns.keys():
-          failed[lfn] = res['Message']
-        self.__deleteReplicas(toDelete,connection=connection)
-      else:
-        # Update the directory usage
-        self._updateDirectoryUsage(directorySESizeDict,'+',connection=connection)
-        for lfn in lfns.keys():
-          successful[lfn] = True
-    return S_OK({'Successful':successful,'Failed':failed})
+    if not insertReplicas:
+      return S_OK()
+    req = "INSERT INTO FC_ReplicaInfo (RepID,RepType,CreationDate,ModificationDate,PFN) VALUES %s" % (','.join(insertReplicas))
+    return self.db._update( req, connection )
 
   def _getRepIDsForReplica(self,replicaTuples,connection=False):
     connection = self._getConnection(connection)
@@ -529,7 +704,6 @@ class FileManager( FileManagerBase ):
 
     lfnFileIDDict = res['Value']['Successful']
     toRemove = []
-    directorySESizeDict = {}
     for lfn,fileDict in lfnFileIDDict.items():
       fileID = fileDict['FileID']
       se = lfns[lfn]['SE']
@@ -539,32 +713,39 @@ class FileManager( FileManagerBase ):
           return res
       seID = res['Value']
       toRemove.append( ( fileID, seID ) )
-      # Now prepare the storage usage update
-      dirID = fileDict['DirID']
-      directorySESizeDict.setdefault( dirID, {} )
-      directorySESizeDict[dirID].setdefault( seID, {'Files':0,'Size':0} )
-      directorySESizeDict[dirID][seID]['Size'] += fileDict['Size']
-      directorySESizeDict[dirID][seID]['Files'] += 1
-    res = self._getRepIDsForReplica( toRemove, connection )
+    # The storage usage update is computed from the replicas locked for the deletion
+    directorySESizeDict = {}
+    res = self._updateWithDirectoryUsage( lambda: self.__deleteLockedReplicas( toRemove, directorySESizeDict, connection ),
+                                          directorySESizeDict, '-', connection = connection )
     if not res['OK']:
       for lfn in lfnFileIDDict.keys():
         failed[lfn] = res['Message']
     else:
-      repIDs = []
-      for fileID,seDict in res['Value'].items():
-        for seID,repID in seDict.items():
-          repIDs.append(repID)    
-      res = self.__deleteReplicas( repIDs, connection = connection )
-      if not res['OK']:
-        for lfn in lfnFileIDDict.keys():
-          failed[lfn] = res['Message']
-      else:
-        # Update the directory usage
-        self._updateDirectoryUsage( directorySESizeDict, '-', connection = connection )
-        for lfn in lfnFileIDDict.keys():
-          successful[lfn] = True
+      for lfn in lfnFileIDDict.keys():
+        successful[lfn] = True
     return S_OK( {"Successful":successful, "Failed":failed} )
 
+  def __deleteLockedReplicas( self, replicaTuples, directorySESizeDict, connection ):
+    """ Lock the ( fileID, seID ) replicas and their files, fill the usage change of their
+        directories with the replicas still there and delete them
+    """
+    if not replicaTuples:
+      return S_OK()
+    queryTuples = [ "(%d,%d)" % ( fileID, seID ) for fileID, seID in replicaTuples ]
+    req = "SELECT R.RepID,R.SEID,F.DirID,F.Size FROM FC_Files F JOIN FC_Replicas R ON R.FileID=F.FileID "
+    req += "WHERE (R.FileID,R.SEID) IN (%s) FOR UPDATE" % intListToString( queryTuples )
+    res = self.db._query( req, connection )
+    if not res['OK']:
+      return res
+    repIDs = []
+    for repID, seID, dirID, size in res['Value']:
+      repIDs.append( repID )
+      directorySESizeDict.setdefault( dirID, {} )
+      directorySESizeDict[dirID].setdefault( seID, {'Files':0,'Size':0} )
+      directorySESizeDict[dirID][seID]['Size'] += size
+      directorySESizeDict[dirID][seID]['Files'] += 1
+    return self.__deleteReplicas( repIDs, connection = connection )
+
   def __deleteReplicas( self, repIDs, connection = False ):
     connection = self._getConnection(connection)
     if type(repIDs) not in [ ListType, TupleType]:
@@ -377,30 +377,66 @@ class FileManagerBase( object ):
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
   def _updateDirectoryUsage( self, directorySEDict, change, connection = False ):
+    """ Apply the usage change of the directories to them and to all their parents.
+        The changes are summed per directory and SE and written with a single statement
+
+        :param dict directorySEDict: { dirID : { seID : { 'Files' : files, 'Size' : size } } },
+                                     SEID 0 being the logical usage
+        :param str change: '+' or '-'
+    """
     connection = self._getConnection( connection )
-    for directoryID in directorySEDict.keys():
+    sign = 1
+    if change == '-':
+      sign = -1
+    usageDelta = {}
+    for directoryID, dirDict in directorySEDict.items():
       result = self.db.dtree.getPathIDsByID( directoryID )
       if not result['OK']:
         return result
-      parentIDs = result['Value']
-      dirDict = directorySEDict[directoryID]
-      for seID in dirDict.keys() :
-        seDict = dirDict[seID]
-        files = seDict['Files']
-        size = seDict['Size']
-        insertTuples = []
-        for dirID in parentIDs:
-          insertTuples.append( '(%d,%d,%d,%d,UTC_TIMESTAMP())' % ( dirID, seID, size, files ) )
-    
-        req = "INSERT INTO FC_DirectoryUsage (DirID,SEID,SESize,SEFiles,LastUpdate) "
-        req += "VALUES %s" % ','.join( insertTuples )
-        req += " ON DUPLICATE KEY UPDATE SESize=SESize%s%d, SEFiles=SEFiles%s%d, LastUpdate=UTC_TIMESTAMP() " \
-                                                           % ( change, size, change, files )
-        res = self.db._update( req )
-        if not res['OK']:
-          gLogger.warn( "Failed to update FC_DirectoryUsage", res['Message'] )
-    return S_OK()
-    
+      for dirID in result['Value']:
+        for seID, seDict in dirDict.items():
+          delta = usageDelta.setdefault( ( dirID, seID ), [0, 0] )
+          delta[0] += sign * seDict['Size']
+          delta[1] += sign * seDict['Files']
+
+    # The rows are always locked in the same order, the parents being shared by all the updates
+    insertTuples = []
+    for ( dirID, seID ), ( size, files ) in sorted( usageDelta.items() ):
+      if size or files:
+        insertTuples.append( '(%d,%d,%d,%d,UTC_TIMESTAMP())' % ( dirID, seID, size, files ) )
+    if not insertTuples:
+      return S_OK()
+
+    req = "INSERT INTO FC_DirectoryUsage (DirID,SEID,SESize,SEFiles,LastUpdate) "
+    req += "VALUES %s" % ','.join( insertTuples )
+    req += " ON DUPLICATE KEY UPDATE SESize=SESize+VALUES(SESize), SEFiles=SEFiles+VALUES(SEFiles), "
+    req += "LastUpdate=UTC_TIMESTAMP()"
+    res = self.db._update( req, connection )
+    if not res['OK']:
+      gLogger.warn( "Failed to update FC_DirectoryUsage", res['Message'] )
+    return res
+
+  def _updateWithDirectoryUsage( self, updateFunction, directorySEDict, change, connection = False ):
+    """ Run updateFunction, which adds or removes files or replicas, and the matching directory
+        usage change in one transaction, so that the usage follows the files and replicas exactly
+    """
+    connection = self._getConnection( connection )
+    res = self.db.transactionStart()
+    if not res['OK']:
+      return res
+    result = updateFunction()
+    if result['OK']:
+      res = self._updateDirectoryUsage( directorySEDict, change, connection = connection )
+      if not res['OK']:
+        result = res
+    if not result['OK']:
+      self.db.transactionRollback()
+      return result
+    res = self.db.transactionCommit()
+    if not res['OK']:
+      return res
+    return result
+
   def _populateFileAncestors( self, lfns, connection = False ):
     connection = self._getConnection( connection )
     successful = {}
@@ -642,28 +678,31 @@ class FileManagerBase( object ):
         successful[lfn] = True
       else:
         failed[lfn] = error
-    fileIDLfns = {}
     lfns = res['Value']['Successful']
-    for lfn, lfnDict in lfns.items():
-      fileIDLfns[lfnDict['FileID']] = lfn
 
-    res = self._computeStorageUsageOnRemoveFile( lfns, connection = connection )
+    # Now do removal, with the update of the directory usage
+    res = self._deleteFilesWithDirectoryUsage( lfns, connection = connection )
     if not res['OK']:
-      return res
-    directorySESizeDict = res['Value']
-
-    # Now do removal
-    res = self._deleteFiles( fileIDLfns.keys(), connection = connection )
-    if not res['OK']:
-      for lfn in fileIDLfns.values():
+      for lfn in lfns:
         failed[lfn] = res['Message']
     else:
-      # Update the directory usage
-      self._updateDirectoryUsage( directorySESizeDict, '-', connection = connection )
-      for lfn in fileIDLfns.values():
+      for lfn in lfns:
         successful[lfn] = True
     return S_OK( {"Successful":successful, "Failed":failed} )
 
+  def _deleteFilesWithDirectoryUsage( self, lfns, connection = False ):
+    """ Delete the files found by _findFiles, with their DirID, FileID and Size, and decrease
+        the usage of their directories in the same transaction
+    """
+    connection = self._getConnection( connection )
+    res = self._computeStorageUsageOnRemoveFile( lfns, connection = connection )
+    if not res['OK']:
+      return res
+    directorySESizeDict = res['Value']
+    fileIDs = [ lfnDict['FileID'] for lfnDict in lfns.values() ]
+    return self._updateWithDirectoryUsage( lambda: self._deleteFiles( fileIDs, connection = connection ),
+                                           directorySESizeDict, '-', connection = connection )
+
 
   def _computeStorageUsageOnRemoveFile( self, lfns, connection = False ):
     # Resolve the replicas to calculate reduction in storage usage
@@ -1123,9 +1162,55 @@ class FileManagerBase( object ):
     return self._getDirectoryFileIDs( dirID, requestString = requestString )
 
   def getFilesInDirectory( self, dirID, verbose = False, connection = False ):
+    return self.__getFilesInDirectory( dirID, [], verbose = verbose, connection = connection )
+
+  def _getDirectoryFilesPage( self, dirID, afterFileID, maxFiles, allStatus = False, connection = False ):
+    """ Get the next maxFiles ( FileID, FileName ) of the directory, in FileID order from afterFileID
+    """
+    connection = self._getConnection( connection )
+    req = "SELECT FileID,FileName FROM FC_Files WHERE DirID=%d AND FileID>%d" % ( dirID, afterFileID )
+    if not allStatus:
+      statusIDs = []
+      for status in self.db.visibleFileStatus:
+        res = self._getStatusInt( status, connection = connection )
+        if res['OK']:
+          statusIDs.append( res['Value'] )
+      if statusIDs:
+        req += " AND Status IN (%s)" % intListToString( statusIDs )
+    req += " ORDER BY FileID LIMIT %d" % maxFiles
+    res = self.db._query( req, connection )
+    if not res['OK']:
+      return res
+    result = S_OK( list( res['Value'] ) )
+    # The cursor to the next page, 0 once the directory is exhausted
+    result['Cursor'] = 0
+    if len( res['Value'] ) == maxFiles:
+      result['Cursor'] = res['Value'][-1][0]
+    return result
+
+  def getFilesInDirectoryPage( self, dirID, afterFileID, maxFiles, verbose = False, connection = False ):
+    """ Get the files of the directory by pages of maxFiles, following the cursor returned with each page
+    """
+    connection = self._getConnection( connection )
+    res = self._getDirectoryFilesPage( dirID, afterFileID, maxFiles, connection = connection )
+    if not res['OK']:
+      return res
+    cursor = res['Cursor']
+    files = {}
+    if res['Value']:
+      res = self.__getFilesInDirectory( dirID, [ fileName for _fileID, fileName in res['Value'] ],
+                                        verbose = verbose, connection = connection )
+      if not res['OK']:
+        return res
+      files = res['Value']
+    result = S_OK( files )
+    result['Cursor'] = cursor
+    return result
+
+  def __getFilesInDirectory( self, dirID, fileNames, verbose = False, connection = False ):
     connection = self._getConnection( connection )
     files = {}
-    res = self._getDirectoryFiles( dirID, [], ['FileID', 'Size', 'GUID',
+    res = self._getDirectoryFiles( dirID, fileNames, ['FileID', 'Size', 'GUID',
                                                'Checksum', 'ChecksumType',
                                                'Type', 'UID',
                                                'GID', 'CreationDate',
@@ -1178,6 +1263,31 @@ class FileManagerBase( object ):
 
     return S_OK( resultDict )
 
+  def getDirectoryReplicasPage( self, dirID, afterFileID, maxFiles, allStatus = False, connection = False ):
+    """ Get the replicas of the files of the directory by pages of maxFiles, following the
+        cursor returned with each page
+    """
+    connection = self._getConnection( connection )
+    res = self._getDirectoryFilesPage( dirID, afterFileID, maxFiles, allStatus = allStatus, connection = connection )
+    if not res['OK']:
+      return res
+    cursor = res['Cursor']
+    fileIDNames = dict( res['Value'] )
+    resultDict = {}
+    if fileIDNames:
+      fields = []
+      if not self.db.lfnPfnConvention or self.db.lfnPfnConvention == "Weak":
+        fields = ['PFN']
+      res = self._getFileReplicas( fileIDNames.keys(), fields, allStatus = allStatus, connection = connection )
+      if not res['OK']:
+        return res
+      for fileID, seDict in res['Value'].items():
+        if seDict:
+          resultDict[fileIDNames[fileID]] = dict( [ ( se, seDict[se].get( 'PFN', '' ) ) for se in seDict ] )
+    result = S_OK( resultDict )
+    result['Cursor'] = cursor
+    return result
+
   def _getFileDirectories( self, lfns ):
     """ For a list of lfn, returns a dictionary with key the directory, and value
         the files in that directory. It does not make any query, just splits the names
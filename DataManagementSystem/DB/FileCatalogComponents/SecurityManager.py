@@ -27,8 +27,9 @@ class SecurityManagerBase( object ):
   def setDatabase( self, database ):
     self.db = database
 
-  def getPathPermissions( self, paths, credDict ):
-    """ Get path permissions according to the policy
+  def getPathPermissions( self, paths, credDict, useCache = True ):
+    """ Get path permissions according to the policy. The cached permissions can be out of
+        date, useCache must be False for anything else than Read checks
     """
     return S_ERROR( 'The getPathPermissions method must be implemented in the inheriting class' )
 
@@ -60,7 +61,7 @@ class SecurityManagerBase( object ):
       resDict = {'Successful':successful, 'Failed':{}}
       return S_OK( resDict )
 
-    result = self.getPathPermissions( paths, credDict )
+    result = self.getPathPermissions( paths, credDict, useCache = ( opType.lower() == 'read' ) )
     if not result['OK']:
       return result
 
@@ -83,7 +84,7 @@ class SecurityManagerBase( object ):
 
 class NoSecurityManager( SecurityManagerBase ):
 
-  def getPathPermissions( self, paths, credDict ):
+  def getPathPermissions( self, paths, credDict, useCache = True ):
     """ Get path permissions according to the policy
     """
 
@@ -105,15 +106,17 @@ class NoSecurityManager( SecurityManagerBase ):
 
 class DirectorySecurityManager( SecurityManagerBase ):
 
-  def getPathPermissions( self, paths, credDict ):
+  def getPathPermissions( self, paths, credDict, useCache = True ):
     """ Get path permissions according to the policy
     """
 
     toGet = dict( zip( paths, [ [path] for path in paths ] ) )
     permissions = {}
     failed = {}
+    # The directory trees resolve the missing paths through their parents all at once,
+    # only the ones reporting them as missing need the walk up the hierarchy
     while toGet:
-      res = self.db.dtree.getPathPermissions( toGet.keys(), credDict )
+      res = self.db.dtree.getPathPermissions( toGet.keys(), credDict, useCache = useCache )
       if not res['OK']:
         return res
       for path, mode in res['Value']['Successful'].items():
@@ -142,7 +145,7 @@ class DirectorySecurityManager( SecurityManagerBase ):
 
 class FullSecurityManager( SecurityManagerBase ):
 
-  def getPathPermissions( self, paths, credDict ):
+  def getPathPermissions( self, paths, credDict, useCache = True ):
     """ Get path permissions according to the policy
     """
 
@@ -166,7 +169,7 @@ class FullSecurityManager( SecurityManagerBase ):
       toGet.pop( path )
     while toGet:
       paths = toGet.keys()
-      res = self.db.dtree.getPathPermissions( paths, credDict )
+      res = self.db.dtree.getPathPermissions( paths, credDict, useCache = useCache )
       if not res['OK']:
         return res
       for path, mode in res['Value']['Successful'].items():
@@ -221,13 +224,13 @@ class DirectorySecurityManagerWithDelete( DirectorySecurityManager ):
 
     return res
 
-  def getPathPermissions( self, paths, credDict ):
+  def getPathPermissions( self, paths, credDict, useCache = True ):
     """ Get path permissions according to the policy
     """
 
     # If we are testing in anything else than a Delete, just return the parent methods
     if hasattr( self, 'opType' ) and self.opType.lower() != 'delete':
-      return super( DirectorySecurityManagerWithDelete, self ).getPathPermissions( paths, credDict )
+      return super( DirectorySecurityManagerWithDelete, self ).getPathPermissions( paths, credDict, useCache = useCache )
 
     # If the object (file or dir) does not exist, we grant the permission
     res = self.db.dtree.exists( paths )
@@ -263,7 +266,7 @@ class DirectorySecurityManagerWithDelete( DirectorySecurityManager ):
     # For all the paths that exist, check the write permission
     if paths:
 
-      res = super( DirectorySecurityManagerWithDelete, self ).getPathPermissions( paths, credDict )
+      res = super( DirectorySecurityManagerWithDelete, self ).getPathPermissions( paths, credDict, useCache = useCache )
       if not res['OK']:
         return res
 
@@ -347,8 +350,8 @@ class PolicyBasedSecurityManager( SecurityManagerBase ):
   def hasAccess( self, opType, paths, credDict ):
     return self.policyObj.hasAccess( opType, paths, credDict )
 
-  def getPathPermissions( self, paths, credDict ):
-    return self.policyObj.getPathPermissions( paths, credDict )
+  def getPathPermissions( self, paths, credDict, useCache = True ):
+    return self.policyObj.getPathPermissions( paths, credDict, useCache = useCache )
   
   
   
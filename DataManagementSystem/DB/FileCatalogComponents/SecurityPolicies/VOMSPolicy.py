@@ -170,12 +170,13 @@ class VOMSPolicy( SecurityManagerBase ):
 
 
 
-  def __getDirectoryPermission( self, path, credDict, recursive = True, noExistStrategy = None ):
-    """ Checks POSIX permission for a directory using the VOMS roles.
-        That is, if the owner group of the directory share the same vomsRole as the requesting user,
+  def __getDirectoryPermissions( self, paths, credDict, recursive = True, noExistStrategy = None, useCache = True ):
+    """ Checks POSIX permission for a list of directories using the VOMS roles.
+        That is, if the owner group of a directory shares the same vomsRole as the requesting user,
         we check the permission as if the request was done with the real owner group.
+        The directories are resolved all together, and their permissions cached, by the directory tree.
 
-        :param path : directory path (string)
+        :param paths : list/dict of directory paths
         :param credDict : credential of the user
         :param recursive : if that directory does not exist, checks the parent one
         :param noExistStrategy : If the directory does not exist, we can
@@ -184,49 +185,89 @@ class VOMSPolicy( SecurityManagerBase ):
                                  * None : return the error as is
 
                noExistStrategy makes sense only if recursive is False
+        :param useCache : whether the cached permissions can be used, only for the Read checks
 
-        :returns S_OK structure with a dictionary ( Read/Write/Execute : True/False)
+        :returns: Successful dictionary with the ( Read/Write/Execute : True/False) dictionaries, and Failed.
     """
 
-    if not path:
-      return S_ERROR( 'Empty path' )
+    successful = {}
+    failed = {}
 
-    # We check what is the group stored in the DB for the given path
-    res = self.db.dtree.getDirectoryParameters( path )
-    if not res['OK']:
-      # If the error is not due to the directory not existing, we return
+    toResolve = []
+    for path in paths:
+      if not path:
+        failed[path] = 'Empty path'
+      else:
+        toResolve.append( path )
+    if not toResolve:
+      return S_OK( { 'Successful' : successful, 'Failed' : failed } )
 
-      if not self.__isNotExistError( res['Message'] ):
-        return res
+    res = self.db.dtree.resolveDirectories( toResolve, useCache = useCache )
+    if not res['OK']:
+      return res
 
+    # ( username, group ) : ( credDict, { directory : [paths] } )
+    toCheck = {}
+    for path, resolved in res['Value'].items():
       # Very special case to allow creation of very first entry
-      if path == '/':
-        return S_OK( {'Read':True, 'Write':True, 'Execute':True} )
+      if resolved is None:
+        successful[path] = {'Read':True, 'Write':True, 'Execute':True}
+        continue
+
+      dirName, dirParameters = resolved
+      # The directory does not exist, and we don't check its parents
+      if dirName != os.path.normpath( path ) and not recursive:
+        # If we have no strategy regarding non existing directories, then just return the error
+        if noExistStrategy is None:
+          failed[path] = 'Directory not found'
+        else:
+          successful[path] = dict.fromkeys( ['Read', 'Write', 'Execute'], noExistStrategy )
+        continue
+
+      origGrp = 'unknown'
+      res = self.db.ugManager.getGroupName( dirParameters['GID'] )
+      if res['OK']:
+        origGrp = res['Value']
+
+      # If the two group share the same voms role, we do the query like if we were
+      # the group stored in the DB
+      checkCredDict = credDict
+      if self.__shareVomsRole( credDict.get( 'group', 'anon' ), origGrp ):
+        checkCredDict = { 'username' : credDict.get( 'username', 'anon' ), 'group' : origGrp}
+
+      credKey = ( checkCredDict.get( 'username', 'anon' ), checkCredDict.get( 'group', 'anon' ) )
+      toCheck.setdefault( credKey, ( checkCredDict, {} ) )[1].setdefault( dirName, [] ).append( path )
+
+    for checkCredDict, dirPaths in toCheck.values():
+      res = self.db.dtree.getPathPermissions( dirPaths.keys(), checkCredDict, useCache = useCache )
+      if not res['OK']:
+        return res
+      for dirName, resolvedPaths in dirPaths.items():
+        for path in resolvedPaths:
+          if dirName in res['Value']['Successful']:
+            successful[path] = dict( res['Value']['Successful'][dirName] )
+          else:
+            failed[path] = res['Value']['Failed'].get( dirName, 'Directory not found' )
 
-      # From now on, we know that the error is due to the directory not existing
+    return S_OK( { 'Successful' : successful, 'Failed' : failed } )
 
-      # If recursive, we try the parent directory
-      if recursive:
-        return self.__getDirectoryPermission( os.path.dirname( path ), credDict,
-                                             recursive = recursive, noExistStrategy = noExistStrategy )
-      # From now on, we know we don't run recursive
 
-      # If we have no strategy regarding non existing directories, then just return the error
-      if noExistStrategy is None:
-        return res
 
-      # Finally, follow the strategy
-      return S_OK( dict.fromkeys( ['Read', 'Write', 'Execute'], noExistStrategy ) )
+  def __getDirectoryPermission( self, path, credDict, recursive = True, noExistStrategy = None, useCache = True ):
+    """ Checks POSIX permission for a directory using the VOMS roles, see __getDirectoryPermissions
 
-    # The directory exists.
-    origGrp = res['Value']['OwnerGroup']
+        :param path : directory path (string)
 
-    # If the two group share the same voms role, we do the query like if we were
-    # the group stored in the DB
-    if self.__shareVomsRole( credDict.get( 'group', 'anon' ), origGrp ):
-      credDict = { 'username' : credDict.get( 'username', 'anon' ), 'group' : origGrp}
+        :returns S_OK structure with a dictionary ( Read/Write/Execute : True/False)
+    """
 
-    return  self.db.dtree.getDirectoryPermissions( path, credDict )
+    res = self.__getDirectoryPermissions( [path], credDict, recursive = recursive, noExistStrategy = noExistStrategy,
+                                          useCache = useCache )
+    if not res['OK']:
+      return res
+    if path in res['Value']['Failed']:
+      return S_ERROR( res['Value']['Failed'][path] )
+    return S_OK( res['Value']['Successful'][path] )
 
 
 
@@ -247,18 +288,16 @@ class VOMSPolicy( SecurityManagerBase ):
         :returns: Successful dictionary with True of False, and Failed.
     """
 
-    successful = {}
-    failed = {}
-
+    res = self.__getDirectoryPermissions( paths, credDict, recursive = recursive, noExistStrategy = noExistStrategy,
+                                          useCache = ( permission == 'Read' ) )
+    if not res['OK']:
+      return res
 
-    for dirName in paths:
-      res = self.__getDirectoryPermission( dirName, credDict, recursive = recursive, noExistStrategy = noExistStrategy )
-      if not res['OK']:
-        failed[dirName] = res['Message']
-      else:
-        successful[dirName] = res['Value'].get( permission, False )
+    successful = {}
+    for dirName, permissions in res['Value']['Successful'].items():
+      successful[dirName] = permissions.get( permission, False )
         
-    return S_OK( { 'Successful' : successful, 'Failed' : failed } )
+    return S_OK( { 'Successful' : successful, 'Failed' : res['Value']['Failed'] } )
 
 
   def __testPermissionOnParentDirectory( self, paths, permission, credDict, recursive = True, noExistStrategy = None ):
@@ -302,7 +341,7 @@ class VOMSPolicy( SecurityManagerBase ):
 
 
 
-  def __getFileOrDirectoryPermission( self, path, credDict, recursive = False, noExistStrategy = None ):
+  def __getFileOrDirectoryPermission( self, path, credDict, recursive = False, noExistStrategy = None, useCache = True ):
     """ Checks POSIX permission for a directory or file using the VOMS roles.
         That is, if the owner group of the directory or file shares the same vomsRole as the requesting user,
         we check the permission as if the request was done with the real owner group.
@@ -332,7 +371,8 @@ class VOMSPolicy( SecurityManagerBase ):
       # From now on, we know that the error is due to the File not existing
       # We Try then the directory method, since path can be a directory
       # The noExistStrategy will be applied by __getDirectoryPermission, so we don't need to do it ourselves
-      res = self.__getDirectoryPermission( path, credDict, recursive = recursive, noExistStrategy = noExistStrategy )
+      res = self.__getDirectoryPermission( path, credDict, recursive = recursive, noExistStrategy = noExistStrategy,
+                                           useCache = useCache )
 
     return res
 
@@ -358,7 +398,8 @@ class VOMSPolicy( SecurityManagerBase ):
     failed = {}
 
     for path in paths:
-      res = self.__getFileOrDirectoryPermission( path, credDict, recursive = recursive, noExistStrategy = noExistStrategy )
+      res = self.__getFileOrDirectoryPermission( path, credDict, recursive = recursive, noExistStrategy = noExistStrategy,
+                                                 useCache = ( permission == 'Read' ) )
       if not res['OK']:
         failed[path] = res['Message']
       else:
@@ -613,7 +654,7 @@ class VOMSPolicy( SecurityManagerBase ):
     return res
 
 
-  def getPathPermissions( self, paths, credDict ):
+  def getPathPermissions( self, paths, credDict, useCache = True ):
     """ This method is meant to disappear, hopefully soon,
         but as long as we have clients from versions < v6r14,
         we need a getPathPermissions method. Since it does not make
@@ -623,6 +664,6 @@ class VOMSPolicy( SecurityManagerBase ):
 
     oldSEM = getattr( self, 'oldSecurityManager', None )
     if oldSEM:
-      return oldSEM.getPathPermissions( paths, credDict )
+      return oldSEM.getPathPermissions( paths, credDict, useCache = useCache )
     else:
-      return super( VOMSPolicy, self ).getPathPermissions( paths, credDict )
+      return super( VOMSPolicy, self ).getPathPermissions( paths, credDict, useCache = useCache )
@@ -2,6 +2,7 @@
 import mock
 import unittest
 import stat
+import os
 
 from types import ListType
 from DIRAC import S_OK, S_ERROR
@@ -106,6 +107,30 @@ class mock_DirectoryManager(object):
   def getDirectoryParameters(self, path):
     return S_OK( directoryTree[path] ) if path in directoryTree else S_ERROR( 'Directory not found' )
 
+  def resolveDirectories( self, paths, useCache = True ):
+    """ The owner and group names are used as UID and GID """
+    resolved = {}
+    for path in paths:
+      dirName = os.path.normpath( path )
+      while dirName not in directoryTree and dirName != '/':
+        dirName = os.path.dirname( dirName )
+      resolved[path] = None
+      if dirName in directoryTree:
+        node = directoryTree[dirName]
+        resolved[path] = ( dirName, {'DirID' : 0, 'UID' : node['owner'], 'GID' : node['OwnerGroup'], 'Mode' : node['mode']} )
+    return S_OK( resolved )
+
+  def getPathPermissions( self, lfns, credDict, useCache = True ):
+    successful = {}
+    failed = {}
+    for path in lfns:
+      res = self.getDirectoryPermissions( path, credDict )
+      if res['OK']:
+        successful[path] = res['Value']
+      else:
+        failed[path] = res['Message']
+    return S_OK( {'Successful' : successful, 'Failed' : failed} )
+
   def getDirectoryPermissions(self, path, credDict):
     if path not in directoryTree:
       return S_ERROR( 'Directory not found' )
@@ -203,6 +228,14 @@ class mock_FileManager( object ):
     return S_OK( {'Successful': successful, 'Failed':failed} )
 
 
+class mock_UserAndGroupManager( object ):
+  """ This class is a mock of the user and group manager using the names as ids
+  """
+
+  def getGroupName( self, gid ):
+    return S_OK( gid )
+
+
 class mock_db(object):
   """ This class is a mock of a FileCatalogDB.
       It just contains dtree and fileManager references
@@ -212,6 +245,7 @@ class mock_db(object):
     self.globalReadAccess = False
     self.dtree = mock_DirectoryManager()
     self.fileManager = mock_FileManager()
+    self.ugManager = mock_UserAndGroupManager()
 
 
 class mock_SecurityManagerBase( object ):
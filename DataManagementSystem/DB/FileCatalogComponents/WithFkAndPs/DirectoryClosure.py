@@ -35,7 +35,7 @@ class DirectoryClosure( DirectoryTreeBase ):
     self.closureTable = 'FC_DirectoryClosure'
 
 
-  def findDir( self, path, connection = False ):
+  def _findDir( self, path, connection = False ):
     """  Find directory ID for the given path
 
       :param path : path of the directory
@@ -56,7 +56,7 @@ class DirectoryClosure( DirectoryTreeBase ):
     return res
 
 
-  def findDirs( self, paths, connection = False ):
+  def _findDirs( self, paths, connection = False ):
     """ Find DirIDs for the given path list
 
         :param paths: list of path
@@ -76,6 +76,28 @@ class DirectoryClosure( DirectoryTreeBase ):
 
     return S_OK( dirDict )
 
+  def _getDirectoriesParameters( self, paths, useCache = True ):
+    """ Get the DirID, UID, GID and Mode of the existing directories among the paths,
+        always from the DB
+
+        :param paths: list of path
+
+        :returns: S_OK( { path : { DirID, UID, GID, Mode } } )
+    """
+
+    dirDict = {}
+    if not paths:
+      return S_OK( dirDict )
+    dpaths = stringListToString( [os.path.normpath( path ) for path in paths ] )
+    req = "SELECT Name, DirID, UID, GID, Mode FROM %s WHERE Name IN (%s)" % ( self.directoryTable, dpaths )
+    result = self.db._query( req )
+    if not result['OK']:
+      return result
+    for dirName, dirID, uid, gid, mode in result['Value']:
+      dirDict[dirName] = { 'DirID' : int( dirID ), 'UID' : int( uid ), 'GID' : int( gid ), 'Mode' : int( mode ) }
+
+    return S_OK( dirDict )
+
   def removeDir( self, path ):
     """ Remove directory
 
@@ -87,7 +109,7 @@ class DirectoryClosure( DirectoryTreeBase ):
     """
 
     # Find the directory ID
-    result = self.findDir( path )
+    result = self.findDir( path, useCache = False )
     if not result['OK']:
       return result
 
@@ -355,8 +377,8 @@ class DirectoryClosure( DirectoryTreeBase ):
     dpath = os.path.normpath( path )
     parentDir = os.path.dirname( dpath )
 
-    # Try to see if the dir exists
-    result = self.findDir( path )
+    # Try to see if the dir exists, not trusting the cache when creating it
+    result = self.findDir( path, useCache = False )
     if not result['OK']:
       return result
 
@@ -379,7 +401,7 @@ class DirectoryClosure( DirectoryTreeBase ):
       ( l_uid, l_gid ) = result['Value']
 
     # Find the ID of the parent
-    res = self.findDir( parentDir )
+    res = self.findDir( parentDir, useCache = False )
     if not res['OK']:
       return res
 
@@ -395,6 +417,8 @@ class DirectoryClosure( DirectoryTreeBase ):
         return result
 
       dirId = result['Value'][0][0]
+      # Permissions resolved through the parent meanwhile are out of date
+      self.db.directoryCache.invalidate( dpath )
 
       result = S_OK( dirId )
       result['NewDirectory'] = True
@@ -668,6 +692,11 @@ class DirectoryClosure( DirectoryTreeBase ):
     """
     return self.__getPhysicalSize( lfns, 'ps_calculate_dir_physical_size', connection )
   
+  def reconcileDirectoryUsage( self, afterDirID = 0, maxDirectories = 1000, lockTimeout = 0 ):
+    """ The directory usage is maintained by the triggers of the DB, nothing to reconcile
+    """
+    return S_OK( { 'Checked' : 0, 'Corrected' : 0, 'Cursor' : 0 } )
+
   def _changeDirectoryParameter( self, paths,
                                  directoryFunction,
                                  _fileFunction,
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+""" Bulk file look up time of the FileManager
+
+    Fills the configured FileCatalogDB (DirectoryLevelTree and FileManager) with a
+    synthetic catalog of numDirs directories of filesPerDir files, 10M files by default:
+
+      python Benchmark_FindFiles.py fill [numDirs] [filesPerDir]
+
+    and times the look up of numLFNs random LFNs spread over numLFNDirs directories,
+    one query per directory or OR chain against the join of the lookup table:
+
+      python Benchmark_FindFiles.py [numLFNs] [numLFNDirs]
+
+    Use a dedicated DB, the fill writes directly into FC_Files
+"""
+
+__RCSID__ = "$Id$"
+
+import sys
+import time
+import random
+
+from DIRAC.Core.Base import Script
+Script.parseCommandLine()
+
+from DIRAC.Core.Utilities.List import stringListToString, breakListIntoChunks
+from DIRAC.DataManagementSystem.DB.FileCatalogDB import FileCatalogDB
+
+BASE_PATH = '/benchmark'
+CRED_DICT = { 'username' : 'benchmark', 'group' : 'benchmark', 'properties' : [ 'FileCatalogManagement' ] }
+DB_CONFIG = { 'UserGroupManager' : 'UserAndGroupManagerDB',
+              'SEManager' : 'SEManagerDB',
+              'SecurityManager' : 'NoSecurityManager',
+              'DirectoryManager' : 'DirectoryLevelTree',
+              'FileManager' : 'FileManager',
+              'DatasetManager' : 'DatasetManager',
+              'DirectoryMetadata' : 'DirectoryMetadata',
+              'FileMetadata' : 'FileMetadata',
+              'UniqueGUID' : False,
+              'GlobalReadAccess' : True,
+              'LFNPFNConvention' : 'Strong',
+              'ResolvePFN' : True,
+              'DefaultUmask' : 0775,
+              'ValidFileStatus' : [ 'AprioriGood' ],
+              'ValidReplicaStatus' : [ 'AprioriGood' ],
+              'VisibleFileStatus' : [ 'AprioriGood' ],
+              'VisibleReplicaStatus' : [ 'AprioriGood' ] }
+
+def getDB():
+  fcDB = FileCatalogDB()
+  result = fcDB.setConfig( DB_CONFIG )
+  if not result[ 'OK' ]:
+    raise RuntimeError( result[ 'Message' ] )
+  return fcDB
+
+def check( result ):
+  if not result[ 'OK' ]:
+    raise RuntimeError( result[ 'Message' ] )
+  return result[ 'Value' ]
+
+def dirPath( dirNumber ):
+  return "%s/dir%05d" % ( BASE_PATH, dirNumber )
+
+def fill( fcDB, numDirs, filesPerDir ):
+  statusID = check( fcDB.fileManager._getStatusInt( 'AprioriGood' ) )
+  start = time.time()
+  for dirNumber in range( numDirs ):
+    dirID = check( fcDB.dtree.makeDirectories( dirPath( dirNumber ), CRED_DICT ) )
+    rows = [ "(%d,1024,1,1,%d,'file%06d')" % ( dirID, statusID, fileNumber ) for fileNumber in range( filesPerDir ) ]
+    for rowChunk in breakListIntoChunks( rows, 10000 ):
+      check( fcDB._update( "INSERT INTO FC_Files (DirID,Size,UID,GID,Status,FileName) VALUES %s" % ','.join( rowChunk ) ) )
+    if dirNumber and not dirNumber % 100:
+      print "%d directories, %d files in %.1f secs" % ( dirNumber, dirNumber * filesPerDir, time.time() - start )
+  print "Filled %d files in %.1f secs" % ( numDirs * filesPerDir, time.time() - start )
+
+def getLFNs( fcDB, numLFNs, numLFNDirs ):
+  """ numLFNs existing LFNs spread over numLFNDirs random directories """
+  req = "SELECT COUNT(*) FROM FC_DirectoryLevelTree WHERE DirName LIKE '%s/dir%%'" % BASE_PATH
+  numDirs = check( fcDB._query( req ) )[0][0]
+  if not numDirs:
+    raise RuntimeError( "No synthetic catalog, run the fill first" )
+  dirs = [ dirPath( dirNumber ) for dirNumber in random.sample( range( numDirs ), min( numDirs, numLFNDirs ) ) ]
+  dirIDs = check( fcDB.dtree.findDirs( dirs ) )
+  fileNames = {}
+  for dirPathName, dirID in dirIDs.items():
+    req = "SELECT FileName FROM FC_Files WHERE DirID=%d" % dirID
+    fileNames[dirPathName] = [ row[0] for row in check( fcDB._query( req ) ) ]
+  lfns = []
+  for lfnNumber in range( numLFNs ):
+    dirPathName = dirs[ lfnNumber % len( dirs ) ]
+    lfns.append( "%s/%s" % ( dirPathName, random.choice( fileNames[dirPathName] ) ) )
+  return list( set( lfns ) ), dirIDs
+
+def perDirectory( fcDB, lfns, dirIDs ):
+  """ Former look up, one query per directory """
+  dirDict = fcDB.fileManager._getFileDirectories( lfns )
+  found = 0
+  for dirPathName, fileNames in dirDict.items():
+    found += len( check( fcDB.fileManager._getDirectoryFiles( dirIDs[dirPathName], fileNames, [ 'FileID' ] ) ) )
+  return found
+
+def orChain( fcDB, lfns, dirIDs ):
+  """ Former FileID look up, an OR of the directories """
+  dirDict = fcDB.fileManager._getFileDirectories( lfns )
+  found = 0
+  for dirPaths in breakListIntoChunks( dirDict.keys(), 1000 ):
+    wheres = [ "( DirID=%d AND FileName IN (%s) )" % ( dirIDs[dirPathName], stringListToString( dirDict[dirPathName] ) )
+               for dirPathName in dirPaths ]
+    found += len( check( fcDB._query( "SELECT FileName,DirID,FileID FROM FC_Files WHERE %s" % " OR ".join( wheres ) ) ) )
+  return found
+
+def timeLookUp( name, lookUp ):
+  start = time.time()
+  found = lookUp()
+  print "%-24s %10.3f secs %8d found" % ( name, time.time() - start, found )
+
+def runBenchmark( fcDB, numLFNs, numLFNDirs ):
+  lfns, dirIDs = getLFNs( fcDB, numLFNs, numLFNDirs )
+  print "Looking up %d LFNs in %d directories" % ( len( lfns ), len( dirIDs ) )
+  timeLookUp( "query per directory", lambda: perDirectory( fcDB, lfns, dirIDs ) )
+  timeLookUp( "_findFiles", lambda: len( check( fcDB.fileManager._findFiles( lfns ) )[ 'Successful' ] ) )
+  timeLookUp( "OR chain", lambda: orChain( fcDB, lfns, dirIDs ) )
+  timeLookUp( "_findFileIDs", lambda: len( check( fcDB.fileManager._findFileIDs( lfns ) )[ 'Successful' ] ) )
+
+if __name__ == "__main__":
+  args = Script.getPositionalArgs()
+  if args and args[0] == "fill":
+    dirs = 10000
+    filesPerDirectory = 1000
+    if len( args ) > 1:
+      dirs = int( args[1] )
+    if len( args ) > 2:
+      filesPerDirectory = int( args[2] )
+    fill( getDB(), dirs, filesPerDirectory )
+  else:
+    lfnsToFind = 100000
+    lfnDirs = 5000
+    if len( args ) > 0:
+      lfnsToFind = int( args[0] )
+    if len( args ) > 1:
+      lfnDirs = int( args[1] )
+    runBenchmark( getDB(), lfnsToFind, lfnDirs )
@@ -0,0 +1,110 @@
+""" Test cases for the FileCatalog directory cache
+"""
+
+__RCSID__ = "$Id$"
+
+import time
+import unittest
+from mock import patch, Mock
+
+from DIRAC import S_OK
+
+# sut
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryCache import DirectoryCache
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryTreeBase import DirectoryTreeBase
+
+class DirectoryCacheTestCase( unittest.TestCase ):
+
+  def setUp( self ):
+    self.cache = DirectoryCache( maxEntries = 10, lifetime = 60 )
+
+  def testLookUp( self ):
+    """ paths are normalized and the parameters are only returned once known """
+    self.cache.add( '/vo/user/', 3 )
+    self.assertEqual( self.cache.getDirID( '/vo/user' ), 3 )
+    self.assertEqual( self.cache.getParameters( '/vo/user' ), None )
+    self.cache.add( '/vo/user', 3, { 'UID' : 1, 'GID' : 2, 'Mode' : 0755, 'Status' : 0 } )
+    self.assertEqual( self.cache.getParameters( '/vo//user' ), { 'DirID' : 3, 'UID' : 1, 'GID' : 2, 'Mode' : 0755 } )
+    self.assertEqual( self.cache.getDirID( '/vo/data' ), None )
+    stats = self.cache.getStats()
+    self.assertEqual( ( stats[ 'hits' ], stats[ 'misses' ] ), ( 3, 1 ) )
+    self.assertEqual( stats[ 'hitRatio' ], 0.75 )
+
+  def testInvalidate( self ):
+    """ recursive invalidation drops the sub directories but not the paths sharing the prefix """
+    for dirID, path in enumerate( [ '/', '/vo', '/vo/user', '/vo/user/a', '/vo/users' ] ):
+      self.cache.add( path, dirID + 1 )
+    self.cache.invalidate( '/vo/user', recursive = True )
+    self.assertEqual( [ self.cache.getDirID( path ) for path in [ '/vo', '/vo/user', '/vo/user/a', '/vo/users' ] ],
+                      [ 2, None, None, 5 ] )
+    self.cache.invalidate( '/vo' )
+    self.assertEqual( self.cache.getDirID( '/vo' ), None )
+    self.assertEqual( self.cache.getDirID( '/vo/users' ), 5 )
+    self.cache.clear()
+    self.assertEqual( self.cache.getStats()[ 'entries' ], 0 )
+
+  def testGeneration( self ):
+    """ a lookup started before an invalidation is not cached """
+    generation = self.cache.getGeneration()
+    self.cache.invalidate( '/vo' )
+    self.cache.add( '/vo', 2, generation = generation )
+    self.assertEqual( self.cache.getDirID( '/vo' ), None )
+    self.cache.add( '/vo', 2, generation = self.cache.getGeneration() )
+    self.assertEqual( self.cache.getDirID( '/vo' ), 2 )
+
+  def testPermissions( self ):
+    """ permissions are kept per UID and GID, and dropped below any invalidated path """
+    self.cache.addPermissions( '/vo/user/a/file', 1, 2, { 'Read' : True, 'Write' : False, 'Execute' : True } )
+    self.cache.addPermissions( '/vo/users/file', 1, 2, { 'Read' : True, 'Write' : True, 'Execute' : True } )
+    self.assertEqual( self.cache.getPermissions( '/vo/user/a/file', 1, 2 )[ 'Write' ], False )
+    self.assertEqual( self.cache.getPermissions( '/vo/user/a/file', 1, 3 ), None )
+    #The creation of a directory changes the permissions of the paths below it
+    self.cache.invalidate( '/vo/user' )
+    self.assertEqual( self.cache.getPermissions( '/vo/user/a/file', 1, 2 ), None )
+    self.assertEqual( self.cache.getPermissions( '/vo/users/file', 1, 2 )[ 'Write' ], True )
+    generation = self.cache.getGeneration()
+    self.cache.invalidate( '/vo/data' )
+    self.cache.addPermissions( '/vo/data/file', 1, 2, { 'Read' : True, 'Write' : True, 'Execute' : True }, generation )
+    self.assertEqual( self.cache.getPermissions( '/vo/data/file', 1, 2 ), None )
+
+  def testPermissionInvalidations( self ):
+    """ permissions cached after an invalidation are kept, and old invalidations are forgotten """
+    allowed = { 'Read' : True, 'Write' : True, 'Execute' : True }
+    self.cache.addPermissions( '/vo', 1, 2, allowed )
+    self.cache.invalidate( '/vo/user/a' )
+    self.cache.addPermissions( '/vo/user/a/file', 1, 2, allowed )
+    self.assertEqual( self.cache.getPermissions( '/vo/user/a/file', 1, 2 ), allowed )
+    self.assertEqual( self.cache.getPermissions( '/vo', 1, 2 ), allowed )
+    self.cache.invalidate( '/vo' )
+    self.assertEqual( self.cache.getPermissions( '/vo/user/a/file', 1, 2 ), None )
+    self.assertEqual( self.cache.getPermissions( '/vo', 1, 2 ), None )
+    invalidations = self.cache._DirectoryCache__invalidations
+    self.assertEqual( sorted( invalidations ), [ '/vo', '/vo/user/a' ] )
+    with patch( 'DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryCache.time.time',
+                return_value = time.time() + 61 ):
+      self.cache.invalidate( '/data' )
+    self.assertEqual( invalidations.keys(), [ '/data' ] )
+
+  def testDisabled( self ):
+    """ nothing is kept with a null size """
+    cache = DirectoryCache( maxEntries = 0 )
+    self.assertFalse( cache.isEnabled() )
+    cache.add( '/vo', 2 )
+    self.assertEqual( cache.getDirID( '/vo' ), None )
+
+  def testWriteLookUp( self ):
+    """ the lookups of the write operations go to the DB and refresh the cache """
+    tree = DirectoryTreeBase( Mock( directoryCache = self.cache ) )
+    tree._findDir = Mock( return_value = S_OK( 7 ) )
+    self.cache.add( '/vo/user', 3 )
+    self.assertEqual( tree.findDir( '/vo/user' )['Value'], 3 )
+    self.assertFalse( tree._findDir.called )
+    self.assertEqual( tree.findDir( '/vo/user', useCache = False )['Value'], 7 )
+    self.assertEqual( tree.findDirs( [ '/vo/user' ] )['Value'], { '/vo/user' : 7 } )
+    tree._findDir.return_value = S_OK( 8 )
+    self.assertEqual( tree.findDirs( [ '/vo/user' ], useCache = False )['Value'], { '/vo/user' : 8 } )
+    self.assertEqual( self.cache.getDirID( '/vo/user' ), 8 )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( DirectoryCacheTestCase )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
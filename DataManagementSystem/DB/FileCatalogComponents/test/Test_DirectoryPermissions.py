@@ -0,0 +1,96 @@
+""" Test cases for the resolution of the path permissions by the directory trees
+"""
+
+__RCSID__ = "$Id$"
+
+import re
+import unittest
+
+from DIRAC import S_OK
+
+# sut
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryCache import DirectoryCache
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryLevelTree import DirectoryLevelTree
+
+class FakeUserAndGroupManager( object ):
+
+  def getUserAndGroupID( self, credDict ):
+    return S_OK( ( credDict['username'], credDict['group'] ) )
+
+class FakeDB( object ):
+  """ Answers the queries of the level tree from a dictionary path : ( DirID, UID, GID, Mode ) """
+
+  def __init__( self, directories ):
+    self.directories = directories
+    self.queries = []
+    self.globalReadAccess = False
+    self.directoryCache = DirectoryCache( maxEntries = 100, lifetime = 60 )
+    self.ugManager = FakeUserAndGroupManager()
+
+  def _query( self, req, connection = False ):
+    self.queries.append( req )
+    if req.startswith( "SELECT DirName,DirID from FC_DirectoryLevelTree" ):
+      names = re.findall( "'([^']*)'", req )
+      return S_OK( [ ( name, self.directories[name][0] ) for name in names if name in self.directories ] )
+    if req.startswith( "SELECT DirID,UID,GID,Mode FROM FC_DirectoryInfo" ):
+      dirIDs = [ int( dirID ) for dirID in req.split( '(' )[1].rstrip( ')' ).split( ',' ) ]
+      return S_OK( [ params for params in self.directories.values() if params[0] in dirIDs ] )
+    raise AssertionError( "Unexpected query %s" % req )
+
+class DirectoryPermissionsTestCase( unittest.TestCase ):
+
+  def setUp( self ):
+    self.db = FakeDB( { '/' : ( 1, 0, 0, 0755 ),
+                        '/vo' : ( 2, 0, 0, 0755 ),
+                        '/vo/user' : ( 3, 1, 2, 0750 ) } )
+    self.dtree = DirectoryLevelTree( self.db )
+    self.owner = { 'username' : 1, 'group' : 2 }
+    self.other = { 'username' : 5, 'group' : 6 }
+
+  def testResolveBatch( self ):
+    """ the paths and all their parents are read with one query of each table """
+    paths = [ '/vo/user/a/file1', '/vo/user/a/file2', '/vo/user', '/vo/new/file' ]
+    result = self.dtree.getPathPermissions( paths, self.owner )
+    self.assert_( result['OK'] )
+    self.assertEqual( len( self.db.queries ), 2 )
+    permissions = result['Value']['Successful']
+    self.assertEqual( [ permissions[path]['Write'] for path in paths ], [ True, True, True, False ] )
+    result = self.dtree.getPathPermissions( paths, self.other )
+    self.assertEqual( [ result['Value']['Successful'][path]['Read'] for path in paths ], [ False, False, False, True ] )
+    #The parameters of the directories were cached, only the paths that don't exist are looked for
+    self.assertEqual( len( self.db.queries ), 3 )
+    self.dtree.getPathPermissions( paths, self.owner )
+    self.assertEqual( len( self.db.queries ), 3 )
+    self.dtree.getPathPermissions( [ '/vo/user/b/file3' ], self.owner )
+    self.assertEqual( len( self.db.queries ), 4 )
+
+  def testInvalidation( self ):
+    """ a mode change of a directory is seen by the paths below it """
+    self.assertEqual( self.dtree.getDirectoryPermissions( '/vo/user/a/file1', self.other )['Value']['Read'], False )
+    self.db.directories['/vo/user'] = ( 3, 1, 2, 0755 )
+    self.assertEqual( self.dtree.getDirectoryPermissions( '/vo/user/a/file1', self.other )['Value']['Read'], False )
+    self.db.directoryCache.invalidate( '/vo/user' )
+    self.assertEqual( self.dtree.getDirectoryPermissions( '/vo/user/a/file1', self.other )['Value']['Read'], True )
+
+  def testWriteCheck( self ):
+    """ without the cache, a mode change made by another server is seen at once, in one go """
+    paths = [ '/vo/user/a/file1', '/vo/user/a/file2' ]
+    self.assertEqual( self.dtree.getPathPermissions( paths, self.owner )['Value']['Successful'][paths[0]]['Write'], True )
+    self.db.directories['/vo/user'] = ( 3, 1, 2, 0550 )
+    self.assertEqual( self.dtree.getPathPermissions( paths, self.owner )['Value']['Successful'][paths[0]]['Write'], True )
+    queries = len( self.db.queries )
+    result = self.dtree.getPathPermissions( paths, self.owner, useCache = False )
+    self.assertEqual( [ result['Value']['Successful'][path]['Write'] for path in paths ], [ False, False ] )
+    self.assertEqual( len( self.db.queries ), queries + 2 )
+    #The cache is refreshed as well
+    self.assertEqual( self.dtree.getPathPermissions( paths, self.owner )['Value']['Successful'][paths[0]]['Write'], False )
+
+  def testEmptyCatalog( self ):
+    """ everything is allowed before the root directory is created """
+    self.db.directories.clear()
+    result = self.dtree.getPathPermissions( [ '/', '/vo' ], self.other )
+    self.assertEqual( result['Value']['Successful']['/vo'], { 'Read' : True, 'Write' : True, 'Execute' : True } )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( DirectoryPermissionsTestCase )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,309 @@
+""" Test cases for the reconciliation of the directory usage
+"""
+
+__RCSID__ = "$Id$"
+
+import re
+import unittest
+import mock
+
+from DIRAC import S_OK
+
+# sut
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryLevelTree import DirectoryLevelTree
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.FileManager import FileManager
+
+class FakeFileManager( object ):
+  """ Applies the usage changes to the directories and their parents as the FileManager does """
+
+  def __init__( self, db ):
+    self.db = db
+
+  def _updateDirectoryUsage( self, directorySEDict, change, connection = False ):
+    for dirID, seDict in directorySEDict.items():
+      while dirID:
+        for seID, usage in seDict.items():
+          row = self.db.usage.setdefault( ( dirID, seID ), [0, 0] )
+          row[0] += usage['Size']
+          row[1] += usage['Files']
+        dirID = self.db.parents[dirID]
+    return S_OK()
+
+class FakeDB( object ):
+  """ Directories 1:/ 2:/vo 3:/vo/a 4:/vo/b with the files of /vo/a and /vo/b on SE 1 """
+
+  def __init__( self ):
+    self.parents = { 1 : 0, 2 : 1, 3 : 2, 4 : 2 }
+    # FileID : ( DirID, Size, SEIDs )
+    self.files = { 1 : ( 3, 10, [ 1 ] ), 2 : ( 3, 20, [ 1 ] ), 3 : ( 4, 5, [ 1 ] ) }
+    # ( DirID, SEID ) : [ size, files ]
+    self.usage = {}
+    # Directories created after the snapshot of the reconciliation
+    self.newDirIDs = set()
+    self.locked = False
+    self.fileManager = FakeFileManager( self )
+    self.transactions = []
+
+  def transactionStart( self ):
+    self.transactions.append( 'start' )
+    return S_OK()
+
+  def transactionCommit( self ):
+    self.transactions.append( 'commit' )
+    return S_OK()
+
+  def transactionRollback( self ):
+    self.transactions.append( 'rollback' )
+    return S_OK()
+
+  def __dirIDs( self, req ):
+    return [ int( dirID ) for dirID in re.search( r"DirID (?:NOT )?IN \(([0-9,]*)\)", req ).group( 1 ).split( ',' ) ]
+
+  def _query( self, req, connection = False ):
+    if req.startswith( "SELECT GET_LOCK" ):
+      return S_OK( ( ( int( not self.locked ), ), ) )
+    if req.startswith( "SELECT RELEASE_LOCK" ):
+      self.transactions.append( 'release' )
+      return S_OK( ( ( 1, ), ) )
+    if req.startswith( "SELECT DirID FROM FC_DirectoryInfo" ):
+      afterDirID, limit = [ int( x ) for x in re.findall( r"DirID>(\d+) ORDER BY DirID LIMIT (\d+)", req )[0] ]
+      return S_OK( [ ( dirID, ) for dirID in sorted( self.parents )
+                     if dirID > afterDirID and dirID not in self.newDirIDs ][:limit] )
+    if req.startswith( "SELECT DISTINCT U.DirID FROM FC_DirectoryUsage" ):
+      lowID = int( re.search( r"U.DirID>(\d+)", req ).group( 1 ) )
+      highID = re.search( r"U.DirID<=(\d+)", req )
+      dirIDs = set( [ key[0] for key in self.usage if key[0] > lowID and key[0] not in self.parents ] )
+      if highID:
+        dirIDs = [ dirID for dirID in dirIDs if dirID <= int( highID.group( 1 ) ) ]
+      return S_OK( [ ( dirID, ) for dirID in dirIDs ] )
+    if req.startswith( "SELECT Parent,DirID FROM FC_DirectoryLevelTree" ):
+      parentIDs = [ int( x ) for x in re.search( r"Parent IN \(([0-9,]*)\)", req ).group( 1 ).split( ',' ) ]
+      return S_OK( [ ( parentID, dirID ) for dirID, parentID in self.parents.items()
+                     if parentID in parentIDs and dirID not in self.newDirIDs ] )
+    dirIDs = self.__dirIDs( req )
+    rows = {}
+    if req.startswith( "SELECT DirID, 0, SUM(Size)" ):
+      for dirID, size, _seIDs in self.files.values():
+        if dirID in dirIDs:
+          row = rows.setdefault( ( dirID, 0 ), [0, 0] )
+          row[0] += size
+          row[1] += 1
+    elif req.startswith( "SELECT F.DirID, R.SEID" ):
+      for dirID, size, seIDs in self.files.values():
+        for seID in seIDs:
+          if dirID in dirIDs:
+            row = rows.setdefault( ( dirID, seID ), [0, 0] )
+            row[0] += size
+            row[1] += 1
+    elif req.startswith( "SELECT DirID, SEID, SESize, SEFiles FROM FC_DirectoryUsage" ):
+      rows = dict( [ ( key, value ) for key, value in self.usage.items() if key[0] in dirIDs ] )
+    else:
+      raise AssertionError( "Unexpected query %s" % req )
+    return S_OK( [ key + tuple( value ) for key, value in rows.items() ] )
+
+  def _update( self, req, connection = False ):
+    dirIDs = self.__dirIDs( req )
+    for key, value in self.usage.items():
+      if key[0] in dirIDs and ( "SESize=0" not in req or value == [0, 0] ):
+        del self.usage[key]
+    return S_OK()
+
+class DirectoryUsageTestCase( unittest.TestCase ):
+
+  def setUp( self ):
+    self.db = FakeDB()
+    self.dtree = DirectoryLevelTree( self.db )
+
+  def __expectedUsage( self ):
+    return { ( 3, 0 ) : [ 30, 2 ], ( 3, 1 ) : [ 30, 2 ], ( 4, 0 ) : [ 5, 1 ], ( 4, 1 ) : [ 5, 1 ],
+             ( 2, 0 ) : [ 35, 3 ], ( 2, 1 ) : [ 35, 3 ], ( 1, 0 ) : [ 35, 3 ], ( 1, 1 ) : [ 35, 3 ] }
+
+  def testRebuild( self ):
+    """ going over the tree in small batches, in any order, gives the usage of the files """
+    self.db.usage[ ( 2, 2 ) ] = [ 7, 1 ]
+    self.db.usage[ ( 9, 0 ) ] = [ 1, 1 ]
+    result = self.dtree.reconcileDirectoryUsage( 2, 2 )
+    self.assertEqual( result['Value'], { 'Checked' : 2, 'Corrected' : 2, 'Cursor' : 4 } )
+    self.assert_( self.dtree._rebuildDirectoryUsage()['OK'] )
+    self.assertEqual( self.db.usage, self.__expectedUsage() )
+    self.assertEqual( self.db.transactions.count( 'start' ), self.db.transactions.count( 'commit' ) )
+    self.assertEqual( self.db.transactions.count( 'start' ), self.db.transactions.count( 'release' ) )
+
+  def testDrift( self ):
+    """ only the drifting directory is corrected, in it and its parents """
+    self.dtree._rebuildDirectoryUsage()
+    self.db.files[ 4 ] = ( 4, 100, [ 1, 2 ] )
+    result = self.dtree.reconcileDirectoryUsage( 0, 10 )
+    self.assertEqual( result['Value'], { 'Checked' : 4, 'Corrected' : 1, 'Cursor' : 0 } )
+    expected = self.__expectedUsage()
+    for dirID in ( 1, 2, 4 ):
+      expected[ ( dirID, 0 ) ] = [ expected[ ( dirID, 0 ) ][0] + 100, expected[ ( dirID, 0 ) ][1] + 1 ]
+      expected[ ( dirID, 1 ) ] = [ expected[ ( dirID, 1 ) ][0] + 100, expected[ ( dirID, 1 ) ][1] + 1 ]
+      expected[ ( dirID, 2 ) ] = [ 100, 1 ]
+    self.assertEqual( self.db.usage, expected )
+    #Nothing left to correct
+    self.assertEqual( self.dtree.reconcileDirectoryUsage( 0, 10 )['Value']['Corrected'], 0 )
+
+  def testNewDirectories( self ):
+    """ the usage of the directories created after the snapshot is kept """
+    self.dtree._rebuildDirectoryUsage()
+    self.db.parents[ 5 ] = 4
+    self.db.newDirIDs.add( 5 )
+    self.db.usage[ ( 5, 0 ) ] = [ 1, 1 ]
+    self.db.usage[ ( 9, 0 ) ] = [ 1, 1 ]
+    result = self.dtree.reconcileDirectoryUsage( 2, 10 )
+    self.assertEqual( result['Value'], { 'Checked' : 2, 'Corrected' : 0, 'Cursor' : 0 } )
+    self.assertEqual( self.db.usage[ ( 5, 0 ) ], [ 1, 1 ] )
+    self.failIf( ( 9, 0 ) in self.db.usage )
+
+  def testLocked( self ):
+    """ nothing is checked while another server reconciles the usage """
+    self.db.locked = True
+    self.db.usage[ ( 9, 0 ) ] = [ 1, 1 ]
+    result = self.dtree.reconcileDirectoryUsage( 2, 10 )
+    self.assertEqual( result['Value'], { 'Checked' : 0, 'Corrected' : 0, 'Cursor' : 2 } )
+    self.assertEqual( self.db.usage, { ( 9, 0 ) : [ 1, 1 ] } )
+    self.assertEqual( self.db.transactions, [] )
+    self.failIf( self.dtree._rebuildDirectoryUsage()['OK'] )
+
+class FakeTree( object ):
+
+  def __init__( self, parents ):
+    self.parents = parents
+
+  def getPathIDsByID( self, dirID ):
+    pathIDs = []
+    while dirID:
+      pathIDs.insert( 0, dirID )
+      dirID = self.parents[dirID]
+    return S_OK( pathIDs )
+
+class FakeCatalogDB( object ):
+  """ FC_Files, FC_Replicas and FC_DirectoryUsage of the directories 1:/ 2:/vo 3:/vo/a """
+
+  def __init__( self ):
+    self.dtree = FakeTree( { 1 : 0, 2 : 1, 3 : 2 } )
+    self.dtree.getTreeTable = lambda : 'FC_DirectoryLevelTree'
+    self.directoryCache = mock.Mock()
+    self.seManager = mock.Mock()
+    self.seManager.findSE.side_effect = lambda seName : S_OK( int( seName[2:] ) )
+    # FileID : ( DirID, Size )
+    self.files = { 1 : ( 3, 10 ), 2 : ( 3, 20 ) }
+    # RepID : ( FileID, SEID )
+    self.replicas = { 1 : ( 1, 1 ), 2 : ( 2, 1 ) }
+    self.usage = {}
+    for dirID in ( 1, 2, 3 ):
+      self.usage[ ( dirID, 0 ) ] = [ 30, 2 ]
+      self.usage[ ( dirID, 1 ) ] = [ 30, 2 ]
+
+  def _getConnection( self ):
+    return S_OK( 'connection' )
+
+  def transactionStart( self ):
+    return S_OK()
+
+  def transactionCommit( self ):
+    return S_OK()
+
+  def transactionRollback( self ):
+    return S_OK()
+
+  def __ids( self, req ):
+    return [ int( x ) for x in re.search( r"IN \(([0-9,]*)\)", req, re.I ).group( 1 ).split( ',' ) ]
+
+  def _query( self, req, connection = False ):
+    if req.startswith( "SELECT StatusID FROM FC_Statuses" ):
+      return S_OK( ( ( 1, ), ) )
+    if req.startswith( "SELECT DirID FROM FC_DirectoryLevelTree" ):
+      return S_OK( [ ( dirID, ) for dirID in self.__ids( req ) if dirID in self.dtree.parents ] )
+    if req.startswith( "SELECT FileID,DirID FROM FC_Files" ):
+      return S_OK( [ ( fileID, self.files[fileID][0] ) for fileID in self.__ids( req ) if fileID in self.files ] )
+    if req.startswith( "SELECT FileID,DirID,Size FROM FC_Files" ):
+      return S_OK( [ ( fileID, ) + self.files[fileID] for fileID in self.__ids( req ) if fileID in self.files ] )
+    if req.startswith( "SELECT RepID,FileID,SEID FROM FC_Replicas" ):
+      fileIDs = self.__ids( req )
+      return S_OK( [ ( repID, ) + replica for repID, replica in self.replicas.items() if replica[0] in fileIDs ] )
+    if req.startswith( "SELECT R.RepID,R.SEID,F.DirID,F.Size FROM FC_Files F JOIN FC_Replicas R" ):
+      pairs = [ tuple( [ int( x ) for x in pair ] ) for pair in re.findall( r"\((\d+),(\d+)\)", req ) ]
+      return S_OK( [ ( repID, replica[1] ) + self.files[replica[0]] for repID, replica in self.replicas.items()
+                     if replica in pairs and replica[0] in self.files ] )
+    raise AssertionError( "Unexpected query %s" % req )
+
+  def _update( self, req, connection = False ):
+    if req.startswith( "DELETE FROM FC_Replicas" ):
+      for repID in self.__ids( req ):
+        self.replicas.pop( repID, None )
+    elif req.startswith( "DELETE FROM FC_Files" ):
+      for fileID in self.__ids( req ):
+        self.files.pop( fileID, None )
+    elif req.startswith( "INSERT INTO FC_DirectoryUsage" ):
+      for dirID, seID, size, files in re.findall( r"\((\d+),(\d+),(-?\d+),(-?\d+),UTC_TIMESTAMP\(\)\)", req ):
+        row = self.usage.setdefault( ( int( dirID ), int( seID ) ), [0, 0] )
+        row[0] += int( size )
+        row[1] += int( files )
+    elif not req.startswith( "DELETE FROM FC_FileInfo" ) and not req.startswith( "DELETE FROM FC_ReplicaInfo" ):
+      raise AssertionError( "Unexpected update %s" % req )
+    return S_OK()
+
+class FileUsageTestCase( unittest.TestCase ):
+
+  def setUp( self ):
+    self.db = FakeCatalogDB()
+    self.fileManager = FileManager( self.db )
+    # What _findFiles returned to the removals, before they start their transaction
+    self.lfns = { '/vo/a/f1' : { 'DirID' : 3, 'FileID' : 1, 'Size' : 10 } }
+
+  def testDoubleRemoveFile( self ):
+    """ two removals of the same file decrease the usage once """
+    for _i in range( 2 ):
+      self.assert_( self.fileManager._deleteFilesWithDirectoryUsage( self.lfns )['OK'] )
+    self.assertEqual( self.db.files, { 2 : ( 3, 20 ) } )
+    self.assertEqual( self.db.replicas, { 2 : ( 2, 1 ) } )
+    for dirID in ( 1, 2, 3 ):
+      self.assertEqual( self.db.usage[ ( dirID, 0 ) ], [ 20, 1 ] )
+      self.assertEqual( self.db.usage[ ( dirID, 1 ) ], [ 20, 1 ] )
+
+  def testReplicaAddedBeforeRemoval( self ):
+    """ a replica added after the lookup of the file is removed with its usage """
+    self.db.replicas[ 3 ] = ( 1, 2 )
+    for dirID in ( 1, 2, 3 ):
+      self.db.usage[ ( dirID, 2 ) ] = [ 10, 1 ]
+    self.assert_( self.fileManager._deleteFilesWithDirectoryUsage( self.lfns )['OK'] )
+    self.assertEqual( self.db.replicas, { 2 : ( 2, 1 ) } )
+    for dirID in ( 1, 2, 3 ):
+      self.assertEqual( self.db.usage[ ( dirID, 2 ) ], [ 0, 0 ] )
+
+  def testDoubleRemoveReplica( self ):
+    """ two removals of the same replica decrease the usage once """
+    found = S_OK( { 'Successful' : self.lfns, 'Failed' : {} } )
+    with mock.patch.object( self.fileManager, '_findFiles', return_value = found ):
+      for _i in range( 2 ):
+        result = self.fileManager._deleteReplicas( { '/vo/a/f1' : { 'SE' : 'SE1' } } )
+        self.assertEqual( result['Value']['Successful'], { '/vo/a/f1' : True } )
+    self.assertEqual( self.db.replicas, { 2 : ( 2, 1 ) } )
+    for dirID in ( 1, 2, 3 ):
+      self.assertEqual( self.db.usage[ ( dirID, 0 ) ], [ 30, 2 ] )
+      self.assertEqual( self.db.usage[ ( dirID, 1 ) ], [ 20, 1 ] )
+
+  def testAddFileToRemovedDirectory( self ):
+    """ the files of a directory removed since its lookup are not added """
+    del self.db.dtree.parents[ 3 ]
+    lfns = { '/vo/a/f3' : { 'DirID' : 3, 'Size' : 5, 'Checksum' : '', 'GUID' : 'guid' } }
+    result = self.fileManager._insertFiles( lfns, 1, 1 )
+    self.assertEqual( result['Value'], { 'Successful' : {}, 'Failed' : { '/vo/a/f3' : 'No such directory' } } )
+    self.db.directoryCache.invalidate.assert_called_with( '/vo/a' )
+    self.assertEqual( self.db.usage[ ( 3, 0 ) ], [ 30, 2 ] )
+
+  def testAddReplicaToRemovedFile( self ):
+    """ the replicas of a file removed since its lookup are not added """
+    self.assert_( self.fileManager._deleteFilesWithDirectoryUsage( self.lfns )['OK'] )
+    lfns = { '/vo/a/f1' : { 'DirID' : 3, 'FileID' : 1, 'Size' : 10, 'SE' : 'SE2', 'PFN' : 'pfn' } }
+    result = self.fileManager._insertReplicas( lfns, master = True )
+    self.assertEqual( result['Value'], { 'Successful' : {}, 'Failed' : { '/vo/a/f1' : 'No such file or directory' } } )
+    self.assertEqual( self.db.replicas, { 2 : ( 2, 1 ) } )
+    self.failIf( ( 3, 2 ) in self.db.usage )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( DirectoryUsageTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( FileUsageTestCase ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
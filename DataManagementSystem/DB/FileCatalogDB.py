@@ -18,6 +18,7 @@ from DIRAC.DataManagementSystem.DB.FileCatalogComponents.SEManager             i
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.SecurityManager       import NoSecurityManager, DirectorySecurityManager, FullSecurityManager, DirectorySecurityManagerWithDelete, PolicyBasedSecurityManager
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.UserAndGroupManager   import UserAndGroupManagerCS,UserAndGroupManagerDB
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DatasetManager        import DatasetManager
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryCache        import DirectoryCache
 from DIRAC.Resources.Catalog.Utilities                                         import checkArgumentFormat
 
 #############################################################################
@@ -34,6 +35,8 @@ class FileCatalogDB( DB ):
       db = 'DataManagement/' + db
 
     DB.__init__( self, 'FileCatalogDB', db )
+    # DirID the next directory usage reconciliation starts after
+    self.__usageCursor = 0
 
   def setConfig( self, databaseConfig ):
 
@@ -59,6 +62,10 @@ class FileCatalogDB( DB ):
     self.validReplicaStatus = databaseConfig['ValidReplicaStatus']
     self.visibleFileStatus = databaseConfig['VisibleFileStatus']
     self.visibleReplicaStatus = databaseConfig['VisibleReplicaStatus']
+    # Directory IDs and permissions shared by all the directory trees
+    self.directoryCache = DirectoryCache( databaseConfig.get( 'DirectoryCacheSize', 100000 ),
+                                          databaseConfig.get( 'DirectoryCacheLifetime', 60 ),
+                                          databaseConfig.get( 'PermissionCacheSize', 100000 ) )
 
     try:
       # Obtain the plugins to be used for DB interaction
@@ -953,6 +960,41 @@ class FileCatalogDB( DB ):
     successful = res['Value']['Successful']
     return S_OK( { 'Successful':successful, 'Failed':failed, 'SEPrefixes': res['Value'].get( 'SEPrefixes', {} )} )
 
+  def __checkDirectoryPermission( self, operation, path, credDict ):
+    res = self._checkPathPermissions( operation, {path:True}, credDict )
+    if not res['OK']:
+      return res
+    if path in res['Value']['Failed']:
+      return S_ERROR( res['Value']['Failed'][path] )
+    return S_OK()
+
+  def listDirectoryPage( self, path, cursor, maxFiles, credDict, verbose = False ):
+    """
+        List a directory by pages of files
+
+        :param str path: directory
+        :param int cursor: 0 for the first page, then the Cursor of the previous page
+        :param int maxFiles: maximum number of files of the page
+        :param creDict: credential
+
+        :return: dictionary indexed "Files", "Datasets", "SubDirs", "Links" and "Cursor", 0 after the last page
+    """
+    res = self.__checkDirectoryPermission( 'listDirectory', path, credDict )
+    if not res['OK']:
+      return res
+    return self.dtree.getDirectoryContentsPage( path, cursor, maxFiles, details = verbose )
+
+  def getDirectoryReplicasPage( self, path, cursor, maxFiles, allStatus, credDict ):
+    """
+        Get the replicas of the files of a directory by pages of files
+
+        :return: dictionary indexed "Replicas", "Cursor", 0 after the last page, and "SEPrefixes"
+    """
+    res = self.__checkDirectoryPermission( 'getDirectoryReplicas', path, credDict )
+    if not res['OK']:
+      return res
+    return self.dtree.getDirectoryReplicasPage( path, cursor, maxFiles, allStatus )
+
   def getDirectorySize( self, lfns, longOutput, fromFiles, credDict ):
     """
         Get the sizes of a list of directories
@@ -1004,12 +1046,22 @@ class FileCatalogDB( DB ):
     return S_OK( { 'Successful': successful, 'Failed': failed } )
 
   def rebuildDirectoryUsage( self ):
-    """ Rebuild DirectoryUsage table from scratch
+    """ Reconcile the usage of all the directories
     """
 
     result = self.dtree._rebuildDirectoryUsage()
     return result
 
+  def reconcileDirectoryUsage( self, maxDirectories ):
+    """ Reconcile the usage of the next maxDirectories directories, each call going on from
+        where the previous one stopped, back to the first directory at the end of the tree
+    """
+    result = self.dtree.reconcileDirectoryUsage( self.__usageCursor, maxDirectories )
+    if not result['OK']:
+      return result
+    self.__usageCursor = result['Value']['Cursor']
+    return result
+
   def repairCatalog( self, directoryFlag = True, credDict = {} ):
     """ Repair catalog inconsistencies
     """
@@ -1126,6 +1178,15 @@ class FileCatalogDB( DB ):
     if not res['OK']:
       return res
     counterDict.update( res['Value'] )
+    if self.directoryCache.isEnabled():
+      cacheStats = self.directoryCache.getStats()
+      counterDict['Directory cache entries'] = cacheStats['entries']
+      counterDict['Directory cache hits'] = cacheStats['hits']
+      counterDict['Directory cache misses'] = cacheStats['misses']
+      counterDict['Directory cache hit ratio'] = round( cacheStats['hitRatio'], 3 )
+      cacheStats = self.directoryCache.getPermissionStats()
+      counterDict['Permission cache entries'] = cacheStats['entries']
+      counterDict['Permission cache hit ratio'] = round( cacheStats['hitRatio'], 3 )
     return S_OK( counterDict )
 
   ########################################################################
@@ -16,17 +16,34 @@ import os
 from types import IntType, LongType, DictType, StringTypes, BooleanType, ListType
 ## from DIRAC
 from DIRAC.Core.DISET.RequestHandler import RequestHandler, getServiceOption
+from DIRAC.Core.Utilities import DEncode
+from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
 from DIRAC import gLogger, S_OK, S_ERROR
 from DIRAC.FrameworkSystem.Client.MonitoringClient import gMonitor
 from DIRAC.DataManagementSystem.DB.FileCatalogDB import FileCatalogDB
 
 # This is a global instance of the FileCatalogDB class
 gFileCatalogDB = None
+# Maximum number of files in a page of a directory listing
+MAX_PAGE_SIZE = 10000
+# Number of directories of each periodic directory usage reconciliation
+gUsageReconcileBatch = 1000
+
+def reconcileDirectoryUsage():
+  """ Periodic task reconciling the usage of the next batch of directories """
+  result = gFileCatalogDB.reconcileDirectoryUsage( gUsageReconcileBatch )
+  if not result['OK']:
+    gLogger.error( "Failed to reconcile the directory usage", result['Message'] )
+  elif result['Value']['Corrected']:
+    gLogger.info( "Reconciled the usage of %s directories, %s corrected" % ( result['Value']['Checked'],
+                                                                            result['Value']['Corrected'] ) )
+  return result
 
 def initializeFileCatalogHandler( serviceInfo ):
   """ handler initialisation """
 
   global gFileCatalogDB
+  global gUsageReconcileBatch
 
   dbLocation = getServiceOption( serviceInfo, 'Database', 'DataManagement/FileCatalogDB' )
   gFileCatalogDB = FileCatalogDB( dbLocation )
@@ -58,7 +75,10 @@ def initializeFileCatalogHandler( serviceInfo ):
                     'ValidFileStatus'     : ['AprioriGood','Trash','Removing','Probing'],
                     'ValidReplicaStatus'  : ['AprioriGood','Trash','Removing','Probing'],
                     'VisibleFileStatus'   : ['AprioriGood'],
-                    'VisibleReplicaStatus': ['AprioriGood']}
+                    'VisibleReplicaStatus': ['AprioriGood'],
+                    'DirectoryCacheSize'  : 100000,
+                    'DirectoryCacheLifetime' : 60,
+                    'PermissionCacheSize' : 100000 }
   for configKey in sorted( defaultConfig.keys() ):
     defaultValue = defaultConfig[configKey]
     configValue = getServiceOption( serviceInfo, configKey, defaultValue )
@@ -66,6 +86,14 @@ def initializeFileCatalogHandler( serviceInfo ):
     databaseConfig[configKey] = configValue
   res = gFileCatalogDB.setConfig( databaseConfig )
 
+  # The usage is maintained with each change of the files and replicas, the reconciliation
+  # only catches the drift, a bounded number of directories at a time
+  reconcilePeriod = getServiceOption( serviceInfo, 'DirectoryUsageReconcilePeriod', 300 )
+  gUsageReconcileBatch = getServiceOption( serviceInfo, 'DirectoryUsageReconcileBatch', 1000 )
+  if res['OK'] and reconcilePeriod > 0 and gUsageReconcileBatch > 0:
+    gLogger.info( "Reconciling the usage of %s directories every %s seconds" % ( gUsageReconcileBatch, reconcilePeriod ) )
+    gThreadScheduler.addPeriodicTask( reconcilePeriod, reconcileDirectoryUsage )
+
   gMonitor.registerActivity( "AddFile", "Amount of addFile calls",
                                "FileCatalogHandler", "calls/min", gMonitor.OP_SUM )
   gMonitor.registerActivity( "AddFileSuccessful", "Files successfully added",
@@ -382,6 +410,67 @@ class FileCatalogHandler( RequestHandler ):
     """ Get replicas for files in the supplied directory """
     return gFileCatalogDB.getDirectoryReplicas( lfns, allStatus, self.getRemoteCredentials() )
 
+  types_listDirectoryPage = [ list( StringTypes ), [ IntType, LongType ], IntType, BooleanType ]
+  def export_listDirectoryPage( self, path, cursor, maxFiles, verbose ):
+    """ List the contents of the supplied directory by pages of files """
+    gMonitor.addMark( 'ListDirectory', 1 )
+    maxFiles = max( 1, min( maxFiles, MAX_PAGE_SIZE ) )
+    return gFileCatalogDB.listDirectoryPage( path, cursor, maxFiles, self.getRemoteCredentials(), verbose = verbose )
+
+  types_getDirectoryReplicasPage = [ list( StringTypes ), [ IntType, LongType ], IntType, BooleanType ]
+  def export_getDirectoryReplicasPage( self, path, cursor, maxFiles, allStatus ):
+    """ Get replicas for files in the supplied directory by pages of files """
+    maxFiles = max( 1, min( maxFiles, MAX_PAGE_SIZE ) )
+    return gFileCatalogDB.getDirectoryReplicasPage( path, cursor, maxFiles, allStatus, self.getRemoteCredentials() )
+
+  def transfer_toClient( self, fileId, token, fileHelper ):
+    """ Stream all the pages of a directory listing. fileId is ( method, path, flag, page size )
+        with method listDirectory, flag being verbose, or getDirectoryReplicas, flag being allStatus.
+        The pages are sent as the items of an encoded list as soon as they are read
+    """
+    try:
+      method, path, flag, pageSize = fileId
+      pageSize = max( 1, min( int( pageSize ), MAX_PAGE_SIZE ) )
+    except ( TypeError, ValueError ):
+      fileHelper.markAsTransferred()
+      return S_ERROR( "Invalid stream request %s" % str( fileId ) )
+    credDict = self.getRemoteCredentials()
+    if method == 'listDirectory':
+      gMonitor.addMark( 'ListDirectory', 1 )
+      getPage = lambda cursor: gFileCatalogDB.listDirectoryPage( path, cursor, pageSize, credDict, verbose = flag )
+    elif method == 'getDirectoryReplicas':
+      getPage = lambda cursor: gFileCatalogDB.getDirectoryReplicasPage( path, cursor, pageSize, flag, credDict )
+    else:
+      fileHelper.markAsTransferred()
+      return S_ERROR( "Unknown stream method %s" % method )
+
+    result = getPage( 0 )
+    if not result['OK']:
+      fileHelper.markAsTransferred()
+      return result
+    prefix = "l"
+    numPages = 0
+    while True:
+      page = result['Value']
+      sendResult = fileHelper.sendData( prefix + DEncode.encode( page ) )
+      if not sendResult['OK']:
+        return sendResult
+      if sendResult.get( 'AbortTransfer' ):
+        return S_OK( numPages )
+      prefix = ""
+      numPages += 1
+      if not page['Cursor']:
+        break
+      result = getPage( page['Cursor'] )
+      if not result['OK']:
+        fileHelper.sendError( result['Message'] )
+        return result
+    sendResult = fileHelper.sendData( "e" )
+    if not sendResult['OK']:
+      return sendResult
+    fileHelper.sendEOF()
+    return S_OK( numPages )
+
   ########################################################################
   #
   # Administrative database operations
@@ -395,7 +484,7 @@ class FileCatalogHandler( RequestHandler ):
   types_rebuildDirectoryUsage = []
   @staticmethod
   def export_rebuildDirectoryUsage():
-    """ Rebuild DirectoryUsage table from scratch """
+    """ Reconcile the DirectoryUsage table with all the files and replicas """
     return gFileCatalogDB.rebuildDirectoryUsage()
 
   types_repairCatalog = []
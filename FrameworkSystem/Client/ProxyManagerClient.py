@@ -5,7 +5,7 @@ __RCSID__ = "$Id$"
 import os
 import datetime
 from DIRAC.Core.Utilities import ThreadSafe, DIRACSingleton
-from DIRAC.Core.Utilities.DictCache import DictCache
+from DIRAC.Core.Utilities.DictCache import DictCache, LRUDictCache
 from DIRAC.Core.Security import Locations, CS
 from DIRAC.Core.Security.ProxyFile import multiProxyArgument, deleteMultiProxy
 from DIRAC.Core.Security.X509Chain import X509Chain, g_X509ChainType
@@ -23,9 +23,9 @@ class ProxyManagerClient:
 
   def __init__( self ):
     self.__usersCache = DictCache()
-    self.__proxiesCache = DictCache()
-    self.__vomsProxiesCache = DictCache()
-    self.__pilotProxiesCache = DictCache()
+    self.__proxiesCache = LRUDictCache( maxEntries = 10000 )
+    self.__vomsProxiesCache = LRUDictCache( maxEntries = 10000 )
+    self.__pilotProxiesCache = LRUDictCache( maxEntries = 10000 )
     self.__filesCache = DictCache( self.__deleteTemporalFile )
 
   def __deleteTemporalFile( self, filename ):
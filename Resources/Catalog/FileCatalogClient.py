@@ -8,6 +8,8 @@ __RCSID__ = "$Id$"
 import os
 
 from DIRAC import S_OK, S_ERROR
+from DIRAC.Core.DISET.TransferClient                   import TransferClient
+from DIRAC.Core.Utilities.DEncode                      import StreamDecoder
 from DIRAC.ConfigurationSystem.Client.Helpers.Registry import getVOMSAttributeForGroup, getDNForUsername
 from DIRAC.Resources.Catalog.Utilities                 import checkCatalogArguments
 from DIRAC.Resources.Catalog.FileCatalogClientBase     import FileCatalogClientBase
@@ -20,7 +22,8 @@ READ_METHODS = ['exists', 'isFile', 'getFileMetadata', 'getReplicas',
                 'findFilesByMetadata','getMetadataFields','getDirectoryUserMetadata',
                 'findDirectoriesByMetadata','getReplicasByMetadata','findFilesByMetadataDetailed',
                 'findFilesByMetadataWeb','getCompatibleMetadata','getMetadataSet', 'getDatasets',
-                'checkDataset', 'getDatasetParameters', 'getDatasetFiles', 'getDatasetAnnotation']
+                'checkDataset', 'getDatasetParameters', 'getDatasetFiles', 'getDatasetAnnotation',
+                'listDirectoryPage', 'getDirectoryReplicasPage']
 
 WRITE_METHODS = ['createLink', 'removeLink', 'addFile', 'setFileStatus', 'addReplica', 'removeReplica',
                  'removeFile', 'setReplicaStatus', 'setReplicaHost', 'setReplicaProblematic', 'createDirectory',
@@ -164,16 +167,58 @@ class FileCatalogClient( FileCatalogClientBase ):
     result = rpcClient.listDirectory( lfn, verbose )
     if not result['OK']:
       return result
-    # Force returned directory entries to be LFNs
-    for entryType in ['Files', 'SubDirs', 'Links']:
-      for path in result['Value']['Successful']:
-        entryDict = result['Value']['Successful'][path][entryType]
-        for fname in entryDict.keys():
-          detailsDict = entryDict.pop( fname )
-          lfn = os.path.join( path, os.path.basename( fname ) )
-          entryDict[lfn] = detailsDict
+    for path in result['Value']['Successful']:
+      self.__entriesToLFNs( path, result['Value']['Successful'][path] )
     return result
 
+  def listDirectoryPage( self, path, cursor = 0, maxFiles = 1000, verbose = False, timeout = 120 ):
+    """ List the given directory's contents by pages of at most maxFiles files. The sub
+        directories come with the first page, cursor 0, and the 'Cursor' of each page
+        is the one of the next page, 0 after the last page
+    """
+    rpcClient = self._getRPC( timeout = timeout )
+    result = rpcClient.listDirectoryPage( path, cursor, maxFiles, verbose )
+    if not result['OK']:
+      return result
+    self.__entriesToLFNs( path, result['Value'] )
+    return result
+
+  def streamDirectory( self, path, pageCallback, verbose = False, pageSize = 1000 ):
+    """ List the given directory's contents in one streamed transfer. pageCallback
+        is called with each page, as returned by listDirectoryPage, as soon as it arrives,
+        so that only one page at a time is kept in memory
+
+        :return: S_OK( number of pages )
+    """
+    def lfnPageCallback( page ):
+      self.__entriesToLFNs( path, page )
+      pageCallback( page )
+    return self.__streamPages( ( 'listDirectory', path, verbose, pageSize ), lfnPageCallback )
+
+  @staticmethod
+  def __entriesToLFNs( path, pathDict ):
+    """ Force the returned directory entries to be LFNs
+    """
+    for entryType in ['Files', 'SubDirs', 'Links']:
+      entryDict = pathDict[entryType]
+      for fname in entryDict.keys():
+        detailsDict = entryDict.pop( fname )
+        lfn = os.path.join( path, os.path.basename( fname ) )
+        entryDict[lfn] = detailsDict
+
+  def __streamPages( self, streamId, pageCallback ):
+    """ Receive the pages streamed by the service and give them to pageCallback
+    """
+    pageSink = _PageSink( pageCallback )
+    result = TransferClient( self.serverURL ).receiveFile( pageSink, streamId )
+    if not result['OK']:
+      return result
+    try:
+      pageSink.close()
+    except ValueError as excp:
+      return S_ERROR( "Incomplete directory stream: %s" % excp )
+    return S_OK( pageSink.pages )
+
   @checkCatalogArguments
   def getDirectoryMetadata( self, lfns, timeout = 120 ):
     ''' Get standard directory metadata
@@ -212,16 +257,43 @@ class FileCatalogClient( FileCatalogClientBase ):
 
     seDict = result['Value'].get( 'SEPrefixes', {} )
     for path in result['Value']['Successful']:
-      pathDict = result['Value']['Successful'][path]
-      for fname in pathDict.keys():
-        detailsDict = pathDict.pop( fname )
-        lfn = '%s/%s' % ( path, os.path.basename( fname ) )
-        for se in detailsDict:
-          if not detailsDict[se] and se in seDict:
-            detailsDict[se] = seDict[se] + lfn
-        pathDict[lfn] = detailsDict
+      self.__replicasToLFNs( path, result['Value']['Successful'][path], seDict )
     return result
 
+  def getDirectoryReplicasPage( self, path, cursor = 0, maxFiles = 1000, allStatus = False, timeout = 120 ):
+    """ Find the given directory's replicas by pages of at most maxFiles files, the
+        'Cursor' of each page is the one of the next page, 0 after the last page
+    """
+    rpcClient = self._getRPC( timeout = timeout )
+    result = rpcClient.getDirectoryReplicasPage( path, cursor, maxFiles, allStatus )
+    if not result['OK']:
+      return result
+    self.__replicasToLFNs( path, result['Value']['Replicas'], result['Value'].get( 'SEPrefixes', {} ) )
+    return result
+
+  def streamDirectoryReplicas( self, path, pageCallback, allStatus = False, pageSize = 1000 ):
+    """ Find the given directory's replicas in one streamed transfer. pageCallback is
+        called with each page, as returned by getDirectoryReplicasPage, as soon as it arrives
+
+        :return: S_OK( number of pages )
+    """
+    def lfnPageCallback( page ):
+      self.__replicasToLFNs( path, page['Replicas'], page.get( 'SEPrefixes', {} ) )
+      pageCallback( page )
+    return self.__streamPages( ( 'getDirectoryReplicas', path, allStatus, pageSize ), lfnPageCallback )
+
+  @staticmethod
+  def __replicasToLFNs( path, pathDict, seDict ):
+    """ Force the returned files to be LFNs, and the empty PFNs to be built from the SE prefixes
+    """
+    for fname in pathDict.keys():
+      detailsDict = pathDict.pop( fname )
+      lfn = '%s/%s' % ( path, os.path.basename( fname ) )
+      for se in detailsDict:
+        if not detailsDict[se] and se in seDict:
+          detailsDict[se] = seDict[se] + lfn
+      pathDict[lfn] = detailsDict
+
   def findFilesByMetadata( self, metaDict, path = '/', timeout = 120 ):
     """ Find files given the meta data query and the path
     """
@@ -656,5 +728,24 @@ class FileCatalogClient( FileCatalogClientBase ):
     """
     return self._getRPC( timeout = timeout ).getDatasetFiles( datasets )
 
+class _PageSink( object ):
+  """ Data sink of a streamed directory listing: the pages are decoded and given to
+      the callback as soon as they are complete
+  """
+
+  def __init__( self, pageCallback ):
+    self.__decoder = StreamDecoder()
+    self.__pageCallback = pageCallback
+    self.pages = 0
+
+  def write( self, data ):
+    self.__decoder.feed( data )
+    self.__processPages()
 
+  def close( self ):
+    self.__processPages( lastChunk = True )
 
+  def __processPages( self, lastChunk = False ):
+    for page in self.__decoder.getItems( lastChunk = lastChunk ):
+      self.pages += 1
+      self.__pageCallback( page )
@@ -0,0 +1,42 @@
+"""
+   Testing the decoding of the streamed directory listings
+"""
+__RCSID__ = "$Id$"
+
+import unittest
+
+from DIRAC.Core.Utilities import DEncode
+from DIRAC.Resources.Catalog.FileCatalogClient import _PageSink
+
+class TestPageSink( unittest.TestCase ):
+
+  def setUp( self ):
+    self.pages = [ { 'Files' : dict( [ ( 'file%d' % i, { 'MetaData' : { 'FileID' : i } } ) for i in range( 10 ) ] ),
+                     'SubDirs' : { 'sub' : True }, 'Links' : {}, 'Datasets' : {}, 'Cursor' : 9 },
+                   { 'Files' : { 'file10' : { 'MetaData' : { 'FileID' : 10 } } },
+                     'SubDirs' : {}, 'Links' : {}, 'Datasets' : {}, 'Cursor' : 0 } ]
+    # As sent by the service
+    self.data = "l" + "".join( [ DEncode.encode( page ) for page in self.pages ] ) + "e"
+
+  def test_pages( self ):
+    """ pages are given to the callback as soon as they are complete """
+    received = []
+    sink = _PageSink( received.append )
+    firstPageLen = len( DEncode.encode( self.pages[0] ) ) + 1
+    for pos in range( 0, len( self.data ), 7 ):
+      sink.write( self.data[ pos : pos + 7 ] )
+      if pos + 7 <= firstPageLen:
+        self.assertEqual( received, [] )
+    sink.close()
+    self.assertEqual( received, self.pages )
+    self.assertEqual( sink.pages, 2 )
+
+  def test_incomplete( self ):
+    """ a stream without its end is an error """
+    sink = _PageSink( lambda page: None )
+    sink.write( self.data[:-1] )
+    self.assertRaises( ValueError, sink.close )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( TestPageSink )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -83,6 +83,10 @@ class JobCleaningAgent( AgentModule ):
     self.removeStatusDelay['Killed'] = self.am_getOption( 'RemoveStatusDelay/Killed', 7 )
     self.removeStatusDelay['Failed'] = self.am_getOption( 'RemoveStatusDelay/Failed', 7 )
 
+    #The JobDB counts again the jobs when it creates the job counters
+    self.countersRebuildPeriod = self.am_getOption( 'JobCountersRebuildPeriod', 24 ) * 3600
+    self.lastCountersRebuild = time.time()
+
     return S_OK()
 
   def __getAllowedJobTypes( self ):
@@ -102,6 +106,11 @@ class JobCleaningAgent( AgentModule ):
   def execute( self ):
     """ Remove jobs in various status
     """
+    #Before removing jobs: the records of a table are only left to its partitions
+    #once it's partitioned, and this must happen even if there is nothing to remove
+    result = self.maintainPartitions()
+    if not result['OK']:
+      gLogger.warn( 'Failed to maintain the JobID partitions', result['Message'] )
     #Delete jobs in "Deleted" state
     result = self.removeJobsByStatus( { 'Status' : 'Deleted' } )
     if not result[ 'OK' ]:
@@ -111,20 +120,44 @@ class JobCleaningAgent( AgentModule ):
     if not result[ 'OK' ]:
       return result
     
-    # No jobs in the system subject to removal
-    if not result['Value']:
+    # Remove jobs with final status, if there are jobs in the system subject to removal
+    if result['Value']:
+      baseCond = { 'JobType' : result[ 'Value' ] }
+      for status in self.removeStatusDelay:
+        delay = self.removeStatusDelay[ status ]
+        condDict = dict( baseCond )
+        condDict[ 'Status' ] = status
+        delTime = str( Time.dateTime() - delay * Time.day )
+        result = self.removeJobsByStatus( condDict, delTime )
+        if not result['OK']:
+          gLogger.warn( 'Failed to remove jobs in status %s' % status )
+    if self.jobDB.jobCounters and time.time() - self.lastCountersRebuild > self.countersRebuildPeriod:
+      self.lastCountersRebuild = time.time()
+      result = self.jobDB.rebuildJobCounters()
+      if not result['OK']:
+        gLogger.warn( 'Failed to rebuild the job counters', result['Message'] )
+    return S_OK()
+
+  def maintainPartitions( self ):
+    """ Create the partitions of the coming jobs in the tables partitioned by JobID
+        and drop the ones whose jobs have all been removed
+    """
+    dbList = [ db for db in ( self.jobDB, self.jobLoggingDB ) if db.jobIDPartitions ]
+    if not dbList:
       return S_OK()
-    
-    baseCond = { 'JobType' : result[ 'Value' ] }
-    # Remove jobs with final status
-    for status in self.removeStatusDelay:
-      delay = self.removeStatusDelay[ status ]
-      condDict = dict( baseCond )
-      condDict[ 'Status' ] = status
-      delTime = str( Time.dateTime() - delay * Time.day )
-      result = self.removeJobsByStatus( condDict, delTime )
+    result = self.jobDB.getMaxJobID()
+    if not result['OK']:
+      return result
+    maxJobID = result['Value']
+    for db in dbList:
+      result = db.jobIDPartitions.check( maxJobID )
+      if not result['OK']:
+        return result
+      result = db.jobIDPartitions.dropUnused( maxJobID, self.jobDB.hasJobsInRange )
       if not result['OK']:
-        gLogger.warn( 'Failed to remove jobs in status %s' % status )
+        return result
+      if result['Value']:
+        self.log.notice( "Dropped %s partitions of %s" % ( result['Value'], db.dbName ) )
     return S_OK()
 
   def removeJobsByStatus( self, condDict, delay = False ):
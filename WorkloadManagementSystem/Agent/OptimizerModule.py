@@ -118,12 +118,16 @@ class OptimizerModule( AgentModule ):
           self.log.error( "No JDL for job", "%s" % job )
           return S_ERROR( "No JDL for job" )
         jobDef[ 'jdl' ] = result[ 'Value' ]
-      if 'jdl' == self.requiredJobInfo:
-        result = self.jobDB.getJobJDL( job )
+      if 'jdl' == self.requiredJobInfo and not 'classad' in jobDef:
+        #The JDL is only needed to get its classad
+        result = self.jobDB.getJobClassAd( job )
         if not result[ 'OK' ]:
           self.log.error( "No JDL for job", "%s" % job )
           return S_ERROR( "No JDL for job" )
-        jobDef[ 'jdl' ] = result[ 'Value' ]
+        if not result[ 'Value' ].isOK():
+          self.log.debug( "Warning: illegal JDL for job %s, will be marked problematic" % ( job ) )
+          return S_ERROR( 'Illegal Job JDL' )
+        jobDef[ 'classad' ] = result[ 'Value' ]
     #Load the classad if needed
     if 'jdl' in jobDef and not 'classad' in jobDef:
       try:
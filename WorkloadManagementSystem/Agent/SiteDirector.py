@@ -12,6 +12,8 @@ import tempfile
 import random
 import socket
 import hashlib
+import time
+import threading
 
 import DIRAC
 from DIRAC                                                 import S_OK, S_ERROR, gConfig
@@ -29,6 +31,7 @@ from DIRAC.Core.Security                                   import CS
 from DIRAC.Core.Utilities.SiteCEMapping                    import getSiteForCE
 from DIRAC.Core.Utilities.Time                             import dateTime, second
 from DIRAC.Core.Utilities.List                             import fromChar
+from DIRAC.Core.Utilities.ThreadPool                       import ThreadPool
 
 from collections import defaultdict
 
@@ -74,6 +77,15 @@ class SiteDirector( AgentModule ):
     self.firstPass = True
     self.maxJobsInFillMode = MAX_JOBS_IN_FILLMODE
     self.maxPilotsToSubmit = MAX_PILOTS_TO_SUBMIT
+    self.submissionThreads = 10
+    self.maxSubmissionsPerCE = 1
+    self.ceSubmissionInterval = 0.
+    self.threadPool = None
+    self.ceLimits = {}
+    self.ceLimitsLock = threading.Lock()
+    # Pilot wrapper templates by queue hash
+    self.pilotWrapperCache = {}
+    self.pilotWrapperFiles = None
 
     self.gridEnv = ''
     self.vo = ''
@@ -144,6 +156,15 @@ class SiteDirector( AgentModule ):
     self.pilotWaitingTime = self.am_getOption( 'MaxPilotWaitingTime', 3600 )
     self.failedQueueCycleFactor = self.am_getOption( 'FailedQueueCycleFactor', 10 )
     self.pilotStatusUpdateCycleFactor = self.am_getOption( 'PilotStatusUpdateCycleFactor', 10 )
+    self.submissionThreads = self.am_getOption( 'SubmissionThreads', self.submissionThreads )
+    self.maxSubmissionsPerCE = max( 1, self.am_getOption( 'MaxSubmissionsPerCE', self.maxSubmissionsPerCE ) )
+    self.ceSubmissionInterval = self.am_getOption( 'CESubmissionInterval', self.ceSubmissionInterval )
+
+    # The pilot wrappers have to be generated again if the pilot files change
+    pilotWrapperFiles = ( self.pilot, self.install, tuple( self.extraModules ) )
+    if pilotWrapperFiles != self.pilotWrapperFiles:
+      self.pilotWrapperCache = {}
+      self.pilotWrapperFiles = pilotWrapperFiles
 
     # Flags
     self.updateStatus = self.am_getOption( 'UpdatePilotStatus', True )
@@ -332,6 +353,11 @@ class SiteDirector( AgentModule ):
           if site not in self.sites:
             self.sites.append( site )
 
+    queueHashes = set( [ self.queueCECache[queueName]['Hash'] for queueName in self.queueDict ] )
+    for queueHash in self.pilotWrapperCache.keys():
+      if queueHash not in queueHashes:
+        del self.pilotWrapperCache[queueHash]
+
     return S_OK()
 
   def execute( self ):
@@ -425,8 +451,8 @@ class SiteDirector( AgentModule ):
 
     queues = self.queueDict.keys()
     random.shuffle( queues )
-    totalSubmittedPilots = 0
-    matchedQueues = 0
+    ceDicts = {}
+    queueCPUTimes = {}
     for queue in queues:
 
       # Check if the queue failed previously
@@ -438,7 +464,6 @@ class SiteDirector( AgentModule ):
 
       ce = self.queueDict[queue]['CE']
       ceName = self.queueDict[queue]['CEName']
-      ceType = self.queueDict[queue]['CEType']
       queueName = self.queueDict[queue]['QueueName']
       siteName = self.queueDict[queue]['Site']
       platform = self.queueDict[queue]['Platform']
@@ -480,140 +505,297 @@ class SiteDirector( AgentModule ):
       if not result['OK']:
         continue
       ceDict['Platform'] = result['Value']
+      ceDicts[queue] = ceDict
+      queueCPUTimes[queue] = queueCPUTime
 
-      # Get the number of eligible jobs for the target site/queue
-      result = rpcMatcher.getMatchingTaskQueues( ceDict )
-      if not result['OK']:
-        self.log.error( 'Could not retrieve TaskQueues from TaskQueueDB', result['Message'] )
-        return result
-      taskQueueDict = result['Value']
-      if not taskQueueDict:
-        self.log.verbose( 'No matching TQs found for %s' % queue )
+    if not ceDicts:
+      self.log.verbose( 'No queue can get work in this cycle' )
+      return S_OK()
+
+    # Get the eligible task queues of all the queues at once
+    result = self.__getMatchingTaskQueues( rpcMatcher, ceDicts )
+    if not result['OK']:
+      return result
+    taskQueues = result['Value']['TaskQueues']
+    queueTQs = {}
+    for queue, tqIDList in result['Value']['Matches'].items():
+      queueTQs[queue] = [ tqID for tqID in tqIDList if tqID in taskQueues ]
+
+    # Get the number of already waiting pilots for all the task queues
+    waitingPilots = self.__getWaitingPilots( taskQueues.keys() )
+
+    # The jobs of each task queue that still need a pilot
+    tqJobsLeft = {}
+    for tqID in taskQueues:
+      tqJobsLeft[tqID] = taskQueues[tqID]['Jobs'] - waitingPilots.get( tqID, 0 )
+
+    matchedQueues = 0
+    queueArgs = {}
+    for queue in queues:
+      tqIDList = queueTQs.get( queue )
+      if not tqIDList:
+        if queue in ceDicts:
+          self.log.verbose( 'No matching TQs found for %s' % queue )
         continue
 
       matchedQueues += 1
-      totalTQJobs = 0
-      tqIDList = taskQueueDict.keys()
-      for tq in taskQueueDict:
-        totalTQJobs += taskQueueDict[tq]['Jobs']
-
+      totalTQJobs = sum( [ taskQueues[tqID]['Jobs'] for tqID in tqIDList ] )
       self.log.verbose( '%d job(s) from %d task queue(s) are eligible for %s queue' % (totalTQJobs, len( tqIDList ), queue) )
 
-      # Get the number of already waiting pilots for these task queues
-      totalWaitingPilots = 0
-      if self.pilotWaitingFlag:
-        lastUpdateTime = dateTime() - self.pilotWaitingTime * second
-        result = pilotAgentsDB.countPilots( { 'TaskQueueID': tqIDList,
-                                              'Status': WAITING_PILOT_STATUS },
-                                              None, lastUpdateTime )
-        if not result['OK']:
-          self.log.error( 'Failed to get Number of Waiting pilots', result['Message'] )
-          totalWaitingPilots = 0
-        else:
-          totalWaitingPilots = result['Value']
-          self.log.verbose( 'Waiting Pilots for TaskQueue %s:' % tqIDList, totalWaitingPilots )
+      totalWaitingPilots = sum( [ waitingPilots.get( tqID, 0 ) for tqID in tqIDList ] )
       if totalWaitingPilots >= totalTQJobs:
         self.log.verbose( "%d waiting pilots already for all the available jobs" % totalWaitingPilots )
         continue
 
       self.log.verbose( "%d waiting pilots for the total of %d eligible jobs for %s" % (totalWaitingPilots, totalTQJobs, queue) )
+      queueArgs[queue] = ( queueCPUTimes[queue] + 86400, )
 
-      # Get the working proxy
-      cpuTime = queueCPUTime + 86400
-      self.log.verbose( "Getting pilot proxy for %s/%s %d long" % ( self.pilotDN, self.pilotGroup, cpuTime ) )
-      result = gProxyManager.getPilotProxyFromDIRACGroup( self.pilotDN, self.pilotGroup, cpuTime )
+    # Get the pilot proxies and the number of available slots of the queues in parallel
+    queueProxySlots = {}
+    def slotsCallback( queue, result ):
       if not result['OK']:
-        return result
-      self.proxy = result['Value']
-      ce.setProxy( self.proxy, cpuTime - 60 )
+        self.log.error( 'Cannot prepare the submission to %s' % queue, result['Message'] )
+      else:
+        queueProxySlots[queue] = result['Value']
+    self.__runInThreads( self.__prepareQueue, queueArgs, slotsCallback )
 
-      # Get the number of available slots on the target site/queue
-      totalSlots = self.__getQueueSlots( queue )
+    queueArgs = self._planPilots( queues, queueTQs, taskQueues, tqJobsLeft, queueProxySlots )
+
+    # Submit the pilots to the queues in parallel
+    submittedPilots = [ 0 ]
+    def submitCallback( queue, result ):
+      if not result['OK']:
+        self.log.error( 'Failed submission to queue %s:\n' % queue, result['Message'] )
+        return
+      numPilots, failed = result['Value']
+      self.queueSlots[queue]['AvailableSlots'] -= numPilots
+      submittedPilots[0] += numPilots
+      if failed:
+        self.failedQueues[queue] += 1
+    self.__runInThreads( self.__submitPilots, queueArgs, submitCallback )
+
+    self.log.info( "%d pilots submitted in total in this cycle, %d matched queues" % ( submittedPilots[0], matchedQueues ) )
+    return S_OK()
+
+  def _planPilots( self, queues, queueTQs, taskQueues, tqJobsLeft, queueProxySlots ):
+    """ Plan the submission in the given order of the queues. The pilots planned for a queue
+        are taken out of tqJobsLeft, the jobs of its task queues still needing a pilot, so queues
+        sharing task queues don't get pilots for the same jobs.
+        Returns the { queue : ( pilotsToSubmit, proxy, taskQueueDict ) } to submit
+    """
+    queueArgs = {}
+    for queue in queues:
+      if queue not in queueProxySlots:
+        continue
+      proxy, totalSlots = queueProxySlots[queue]
       if totalSlots == 0:
         self.log.debug( '%s: No slots available' % queue )
         continue
 
+      tqIDList = queueTQs[queue]
+      totalTQJobs = sum( [ taskQueues[tqID]['Jobs'] for tqID in tqIDList ] )
+      totalWaitingPilots = totalTQJobs - sum( [ tqJobsLeft[tqID] for tqID in tqIDList ] )
       pilotsToSubmit = max( 0, min( totalSlots, totalTQJobs - totalWaitingPilots ) )
       self.log.info( '%s: Slots=%d, TQ jobs=%d, Pilots: waiting %d, to submit=%d' % \
                               ( queue, totalSlots, totalTQJobs, totalWaitingPilots, pilotsToSubmit ) )
 
       # Limit the number of pilots to submit to MAX_PILOTS_TO_SUBMIT
       pilotsToSubmit = min( self.maxPilotsToSubmit, pilotsToSubmit )
+      if pilotsToSubmit == 0:
+        continue
 
-      while pilotsToSubmit > 0:
-        self.log.info( 'Going to submit %d pilots to %s queue' % ( pilotsToSubmit, queue ) )
+      pilotsLeft = pilotsToSubmit
+      for tqID in tqIDList:
+        if tqJobsLeft[tqID] > 0:
+          planned = min( pilotsLeft, tqJobsLeft[tqID] )
+          tqJobsLeft[tqID] -= planned
+          pilotsLeft -= planned
+          if pilotsLeft == 0:
+            break
+
+      taskQueueDict = dict( [ ( tqID, taskQueues[tqID] ) for tqID in tqIDList ] )
+      queueArgs[queue] = ( pilotsToSubmit, proxy, taskQueueDict )
+    return queueArgs
+
+  def __runInThreads( self, function, queueArgs, callback ):
+    """ Execute function( queue, *args ) in the thread pool for each of the { queue : args } given.
+        callback( queue, result ) is called in this thread for each of them
+    """
+    if not queueArgs:
+      return
+    if not self.threadPool:
+      self.threadPool = ThreadPool( 1, self.submissionThreads )
+    done = set()
+    def resultCallback( threadedJob, result ):
+      done.add( threadedJob.jobId() )
+      callback( threadedJob.jobId(), result )
+    def exceptionCallback( threadedJob, exceptionInfo ):
+      done.add( threadedJob.jobId() )
+      self.log.error( "Exception while processing queue %s" % threadedJob.jobId(), str( exceptionInfo[1] ) )
+      callback( threadedJob.jobId(), S_ERROR( "Exception: %s" % exceptionInfo[1] ) )
+    for queue in queueArgs:
+      self.threadPool.generateJobAndQueueIt( function, args = ( queue, ) + queueArgs[queue], sTJId = queue,
+                                             oCallback = resultCallback, oExceptionCallback = exceptionCallback )
+    while len( done ) < len( queueArgs ):
+      self.threadPool.processAllResults()
+
+  def __getMatchingTaskQueues( self, rpcMatcher, ceDicts ):
+    """ Get the task queues matching each of the { queue : ceDict } given with a single call.
+        Matchers not providing the bulk call are asked queue by queue
+    """
+    result = rpcMatcher.getMatchingTaskQueuesForResources( ceDicts )
+    if result['OK']:
+      return result
+    self.log.warn( 'Cannot get the TaskQueues of all the queues at once', result['Message'] )
+    taskQueues = {}
+    matches = {}
+    for queue in ceDicts:
+      result = rpcMatcher.getMatchingTaskQueues( ceDicts[queue] )
+      if not result['OK']:
+        self.log.error( 'Could not retrieve TaskQueues from TaskQueueDB', result['Message'] )
+        return result
+      taskQueues.update( result['Value'] )
+      matches[queue] = result['Value'].keys()
+    return S_OK( { 'TaskQueues' : taskQueues, 'Matches' : matches } )
 
-        bundleProxy = self.queueDict[queue].get( 'BundleProxy', False )
-        jobExecDir = ''
-        jobExecDir = self.queueDict[queue]['ParametersDict'].get( 'JobExecDir', jobExecDir )
-        httpProxy = self.queueDict[queue]['ParametersDict'].get( 'HttpProxy', '' )
+  def __getWaitingPilots( self, tqIDList ):
+    """ Get the number of waiting pilots of each of the task queues
+    """
+    if not self.pilotWaitingFlag or not tqIDList:
+      return {}
+    lastUpdateTime = dateTime() - self.pilotWaitingTime * second
+    result = pilotAgentsDB.countPilotsPerTaskQueue( { 'TaskQueueID': tqIDList,
+                                                      'Status': WAITING_PILOT_STATUS },
+                                                      None, lastUpdateTime )
+    if not result['OK']:
+      self.log.error( 'Failed to get Number of Waiting pilots', result['Message'] )
+      return {}
+    self.log.verbose( 'Waiting Pilots for TaskQueues:', result['Value'] )
+    return result['Value']
 
-        result = self.__getExecutable( queue, pilotsToSubmit, bundleProxy, httpProxy, jobExecDir )
-        if not result['OK']:
-          return result
+  def __prepareQueue( self, queue, cpuTime ):
+    """ Set the pilot proxy of the queue CE and get the number of available slots
+    """
+    self.log.verbose( "Getting pilot proxy for %s/%s %d long" % ( self.pilotDN, self.pilotGroup, cpuTime ) )
+    result = gProxyManager.getPilotProxyFromDIRACGroup( self.pilotDN, self.pilotGroup, cpuTime )
+    if not result['OK']:
+      return result
+    proxy = result['Value']
+    self.queueDict[queue]['CE'].setProxy( proxy, cpuTime - 60 )
+    return S_OK( ( proxy, self.__getQueueSlots( queue ) ) )
+
+  def __acquireCE( self, ceName ):
+    """ Wait until a submission to the CE is allowed by the per CE limits
+    """
+    self.ceLimitsLock.acquire()
+    try:
+      if ceName not in self.ceLimits:
+        self.ceLimits[ceName] = { 'Semaphore' : threading.Semaphore( self.maxSubmissionsPerCE ),
+                                  'NextSubmission' : 0. }
+      ceLimits = self.ceLimits[ceName]
+    finally:
+      self.ceLimitsLock.release()
+    ceLimits['Semaphore'].acquire()
+    self.ceLimitsLock.acquire()
+    try:
+      now = time.time()
+      submissionTime = max( now, ceLimits['NextSubmission'] )
+      ceLimits['NextSubmission'] = submissionTime + self.ceSubmissionInterval
+    finally:
+      self.ceLimitsLock.release()
+    if submissionTime > now:
+      time.sleep( submissionTime - now )
+
+  def __releaseCE( self, ceName ):
+    self.ceLimits[ceName]['Semaphore'].release()
+
+  def __submitPilots( self, queue, pilotsToSubmit, proxy, taskQueueDict ):
+    """ Submit the pilots to the queue and assign them to the task queues, executed in the thread pool.
+        Returns the number of submitted pilots and whether a submission failed
+    """
+    ce = self.queueDict[queue]['CE']
+    ceName = self.queueDict[queue]['CEName']
+    ceType = self.queueDict[queue]['CEType']
+    queueName = self.queueDict[queue]['QueueName']
+    siteName = self.queueDict[queue]['Site']
+
+    bundleProxy = self.queueDict[queue].get( 'BundleProxy', False )
+    jobExecDir = ''
+    jobExecDir = self.queueDict[queue]['ParametersDict'].get( 'JobExecDir', jobExecDir )
+    httpProxy = self.queueDict[queue]['ParametersDict'].get( 'HttpProxy', '' )
+    if not bundleProxy:
+      proxy = None
 
-        executable, pilotSubmissionChunk = result['Value']
+    totalSubmittedPilots = 0
+    while pilotsToSubmit > 0:
+      self.log.info( 'Going to submit %d pilots to %s queue' % ( pilotsToSubmit, queue ) )
+
+      result = self.__getExecutable( queue, pilotsToSubmit, proxy, httpProxy, jobExecDir )
+      if not result['OK']:
+        return result
+
+      executable, pilotSubmissionChunk = result['Value']
+      self.__acquireCE( ceName )
+      try:
         result = ce.submitJob( executable, '', pilotSubmissionChunk )
-        ### FIXME: The condor thing only transfers the file with some
-        ### delay, so when we unlink here the script is gone
-        ### FIXME 2: but at some time we need to clean up the pilot wrapper scripts...
-        if ceType != 'HTCondorCE':
-          os.unlink( executable )
+      finally:
+        self.__releaseCE( ceName )
+      ### FIXME: The condor thing only transfers the file with some
+      ### delay, so when we unlink here the script is gone
+      ### FIXME 2: but at some time we need to clean up the pilot wrapper scripts...
+      if ceType != 'HTCondorCE':
+        os.unlink( executable )
+      if not result['OK']:
+        self.log.error( 'Failed submission to queue %s:\n' % queue, result['Message'] )
+        return S_OK( ( totalSubmittedPilots, True ) )
+
+      pilotsToSubmit = pilotsToSubmit - pilotSubmissionChunk
+      # Add pilots to the PilotAgentsDB assign pilots to TaskQueue proportionally to the
+      # task queue priorities
+      pilotList = result['Value']
+      totalSubmittedPilots += len( pilotList )
+      self.log.info( 'Submitted %d pilots to %s@%s' % ( len( pilotList ), queueName, ceName ) )
+      stampDict = {}
+      if result.has_key( 'PilotStampDict' ):
+        stampDict = result['PilotStampDict']
+      tqPriorityList = []
+      sumPriority = 0.
+      for tq in taskQueueDict:
+        sumPriority += taskQueueDict[tq]['Priority']
+        tqPriorityList.append( ( tq, sumPriority ) )
+      rndm = random.random()*sumPriority
+      tqDict = {}
+      for pilotID in pilotList:
+        rndm = random.random() * sumPriority
+        for tq, prio in tqPriorityList:
+          if rndm < prio:
+            tqID = tq
+            break
+        if not tqDict.has_key( tqID ):
+          tqDict[tqID] = []
+        tqDict[tqID].append( pilotID )
+
+      for tqID, pilotList in tqDict.items():
+        result = pilotAgentsDB.addPilotTQReference( pilotList,
+                                                    tqID,
+                                                    self.pilotDN,
+                                                    self.pilotGroup,
+                                                    self.localhost,
+                                                    ceType,
+                                                    '',
+                                                    stampDict )
         if not result['OK']:
-          self.log.error( 'Failed submission to queue %s:\n' % queue, result['Message'] )
-          pilotsToSubmit = 0
-          self.failedQueues[queue] += 1
+          self.log.error( 'Failed add pilots to the PilotAgentsDB: ', result['Message'] )
           continue
-
-        pilotsToSubmit = pilotsToSubmit - pilotSubmissionChunk
-        # Add pilots to the PilotAgentsDB assign pilots to TaskQueue proportionally to the
-        # task queue priorities
-        pilotList = result['Value']
-        self.queueSlots[queue]['AvailableSlots'] -= len( pilotList )
-        totalSubmittedPilots += len( pilotList )
-        self.log.info( 'Submitted %d pilots to %s@%s' % ( len( pilotList ), queueName, ceName ) )
-        stampDict = {}
-        if result.has_key( 'PilotStampDict' ):
-          stampDict = result['PilotStampDict']
-        tqPriorityList = []
-        sumPriority = 0.
-        for tq in taskQueueDict:
-          sumPriority += taskQueueDict[tq]['Priority']
-          tqPriorityList.append( ( tq, sumPriority ) )
-        rndm = random.random()*sumPriority
-        tqDict = {}
-        for pilotID in pilotList:
-          rndm = random.random() * sumPriority
-          for tq, prio in tqPriorityList:
-            if rndm < prio:
-              tqID = tq
-              break
-          if not tqDict.has_key( tqID ):
-            tqDict[tqID] = []
-          tqDict[tqID].append( pilotID )
-
-        for tqID, pilotList in tqDict.items():
-          result = pilotAgentsDB.addPilotTQReference( pilotList,
-                                                      tqID,
-                                                      self.pilotDN,
-                                                      self.pilotGroup,
-                                                      self.localhost,
-                                                      ceType,
-                                                      '',
-                                                      stampDict )
+        for pilot in pilotList:
+          result = pilotAgentsDB.setPilotStatus( pilot, 'Submitted', ceName,
+                                                'Successfully submitted by the SiteDirector',
+                                                siteName, queueName )
           if not result['OK']:
-            self.log.error( 'Failed add pilots to the PilotAgentsDB: ', result['Message'] )
+            self.log.error( 'Failed to set pilot status: ', result['Message'] )
             continue
-          for pilot in pilotList:
-            result = pilotAgentsDB.setPilotStatus( pilot, 'Submitted', ceName,
-                                                  'Successfully submitted by the SiteDirector',
-                                                  siteName, queueName )
-            if not result['OK']:
-              self.log.error( 'Failed to set pilot status: ', result['Message'] )
-              continue
 
-    self.log.info( "%d pilots submitted in total in this cycle, %d matched queues" % ( totalSubmittedPilots, matchedQueues ) )
-    return S_OK()
+    return S_OK( ( totalSubmittedPilots, False ) )
 
   def __getQueueSlots( self, queue ):
     """ Get the number of available slots in the queue
@@ -653,19 +835,17 @@ class SiteDirector( AgentModule ):
     return totalSlots
 
 #####################################################################################
-  def __getExecutable( self, queue, pilotsToSubmit, bundleProxy = True, httpProxy = '', jobExecDir = '' ):
-    """ Prepare the full executable for queue
+  def __getExecutable( self, queue, pilotsToSubmit, proxy = None, httpProxy = '', jobExecDir = '' ):
+    """ Prepare the full executable for queue, the proxy is bundled if given
     """
 
-    proxy = None
-    if bundleProxy:
-      proxy = self.proxy
     pilotOptions, pilotsToSubmit = self._getPilotOptions( queue, pilotsToSubmit )
     if pilotOptions is None:
       self.log.error( "Pilot options empty, error in compilation" )
       return S_ERROR( "Errors in compiling pilot options" )
     self.log.verbose( 'pilotOptions: ', ' '.join( pilotOptions ) )
-    executable = self._writePilotScript( self.workingDirectory, pilotOptions, proxy, httpProxy, jobExecDir )
+    executable = self._writePilotScript( self.workingDirectory, pilotOptions, proxy, httpProxy, jobExecDir,
+                                         queueHash = self.queueCECache[queue]['Hash'] )
     return S_OK( [ executable, pilotsToSubmit ] )
 
 #####################################################################################
@@ -779,8 +959,10 @@ class SiteDirector( AgentModule ):
 
 #####################################################################################
   def _writePilotScript( self, workingDirectory, pilotOptions, proxy = None,
-                         httpProxy = '', pilotExecDir = '' ):
-    """ Bundle together and write out the pilot executable script, admix the proxy if given
+                         httpProxy = '', pilotExecDir = '', queueHash = None ):
+    """ Bundle together and write out the pilot executable script, admix the proxy if given.
+        If a queue hash is given, the wrapper generated for the queue is reused and only
+        the options and the proxy are filled in
     """
 
     try:
@@ -789,6 +971,35 @@ class SiteDirector( AgentModule ):
       if proxy is not None:
         compressedAndEncodedProxy = base64.encodestring( bz2.compress( proxy.dumpAllToString()['Value'] ) )
         proxyFlag = 'True'
+    except:
+      self.log.exception( 'Exception during file compression of proxy' )
+      return S_ERROR( 'Exception during file compression of proxy' )
+
+    pilotWrapperTemplate = self.pilotWrapperCache.get( queueHash )
+    if not pilotWrapperTemplate:
+      result = self.__getPilotWrapperTemplate( httpProxy, pilotExecDir )
+      if not result['OK']:
+        return result
+      pilotWrapperTemplate = result['Value']
+      if queueHash:
+        self.pilotWrapperCache[queueHash] = pilotWrapperTemplate
+
+    localPilot = pilotWrapperTemplate % { 'compressedAndEncodedProxy': compressedAndEncodedProxy,
+                                          'pilotOptions': ' '.join( pilotOptions ),
+                                          'proxyFlag': proxyFlag }
+
+    fd, name = tempfile.mkstemp( suffix = '_pilotwrapper.py', prefix = 'DIRAC_', dir = workingDirectory )
+    pilotWrapper = os.fdopen( fd, 'w' )
+    pilotWrapper.write( localPilot )
+    pilotWrapper.close()
+    return name
+
+  def __getPilotWrapperTemplate( self, httpProxy = '', pilotExecDir = '' ):
+    """ Get the pilot wrapper with the pilot files bundled. The proxy and the pilot options are
+        left as compressedAndEncodedProxy, proxyFlag and pilotOptions format fields
+    """
+
+    try:
       compressedAndEncodedPilot = base64.encodestring( bz2.compress( open( self.pilot, "rb" ).read(), 9 ) )
       compressedAndEncodedInstall = base64.encodestring( bz2.compress( open( self.install, "rb" ).read(), 9 ) )
       compressedAndEncodedExtra = {}
@@ -796,8 +1007,8 @@ class SiteDirector( AgentModule ):
         moduleName = os.path.basename( module )
         compressedAndEncodedExtra[moduleName] = base64.encodestring( bz2.compress( open( module, "rb" ).read(), 9 ) )
     except:
-      self.log.exception( 'Exception during file compression of proxy, dirac-pilot or dirac-install' )
-      return S_ERROR( 'Exception during file compression of proxy, dirac-pilot or dirac-install' )
+      self.log.exception( 'Exception during file compression of dirac-pilot or dirac-install' )
+      return S_ERROR( 'Exception during file compression of dirac-pilot or dirac-install' )
 
     # Extra modules
     mStringList = []
@@ -850,22 +1061,20 @@ os.system( cmd )
 shutil.rmtree( pilotWorkingDirectory )
 
 EOF
-""" % { 'compressedAndEncodedProxy': compressedAndEncodedProxy,
-        'compressedAndEncodedPilot': compressedAndEncodedPilot,
-        'compressedAndEncodedInstall': compressedAndEncodedInstall,
-        'extraModuleString': extraModuleString,
-        'httpProxy': httpProxy,
-        'pilotExecDir': pilotExecDir,
-        'pilotScript': os.path.basename( self.pilot ),
-        'installScript': os.path.basename( self.install ),
-        'pilotOptions': ' '.join( pilotOptions ),
-        'proxyFlag': proxyFlag }
-
-    fd, name = tempfile.mkstemp( suffix = '_pilotwrapper.py', prefix = 'DIRAC_', dir = workingDirectory )
-    pilotWrapper = os.fdopen( fd, 'w' )
-    pilotWrapper.write( localPilot )
-    pilotWrapper.close()
-    return name
+"""
+    # The fixed values are escaped to go through the formatting of the options and the proxy
+    wrapperValues = { 'compressedAndEncodedPilot': compressedAndEncodedPilot,
+                      'compressedAndEncodedInstall': compressedAndEncodedInstall,
+                      'extraModuleString': extraModuleString,
+                      'httpProxy': httpProxy,
+                      'pilotExecDir': pilotExecDir,
+                      'pilotScript': os.path.basename( self.pilot ),
+                      'installScript': os.path.basename( self.install ) }
+    for key in wrapperValues:
+      wrapperValues[key] = wrapperValues[key].replace( '%', '%%' )
+    for key in ( 'compressedAndEncodedProxy', 'pilotOptions', 'proxyFlag' ):
+      wrapperValues[key] = '%%(%s)s' % key
+    return S_OK( localPilot % wrapperValues )
 
   def updatePilotStatus( self ):
     """ Update status of pilots in transient states
@@ -980,7 +1189,7 @@ EOF
         result = gProxyManager.getPilotProxyFromDIRACGroup( self.pilotDN, self.pilotGroup, 1000 )
         if not result['OK']:
           return result
-        ce.setProxy( self.proxy, 940 )
+        ce.setProxy( result['Value'], 940 )
 
       ceName = self.queueDict[queue]['CEName']
       queueName = self.queueDict[queue]['QueueName']
@@ -2,6 +2,7 @@
 """
 
 # imports
+import os, shutil, tempfile, time, threading
 import unittest, importlib
 from mock import MagicMock
 
@@ -36,6 +37,84 @@ class SiteDirectorBaseSuccess( AgentsTestCase ):
     self.sd.queueDict['aQueue']['ParametersDict'] = {}
     _res = self.sd._getPilotOptions( 'aQueue', 10 )
 
+  def test__writePilotScript( self ):
+    workDir = tempfile.mkdtemp()
+    try:
+      for fileName in ( 'dirac-pilot.py', 'dirac-install.py', 'pilotCommands.py' ):
+        open( os.path.join( workDir, fileName ), 'w' ).write( 'print "100% done"\n' )
+      self.sd.pilot = os.path.join( workDir, 'dirac-pilot.py' )
+      self.sd.install = os.path.join( workDir, 'dirac-install.py' )
+      self.sd.extraModules = [ os.path.join( workDir, 'pilotCommands.py' ) ]
+      wrapper = self.sd._writePilotScript( workDir, [ '-o', '/Some/Option=50%' ], None, 'http://proxy:3128/%7E', '',
+                                           queueHash = 'aHash' )
+      self.assertEqual( self.sd.pilotWrapperCache.keys(), [ 'aHash' ] )
+      wrapperText = open( wrapper ).read()
+      self.assert_( "-o /Some/Option=50%" in wrapperText )
+      self.assert_( "http://proxy:3128/%7E" in wrapperText )
+      #The cached wrapper only changes with the options
+      cachedWrapper = self.sd._writePilotScript( workDir, [ '-o', '/Some/Option=50%' ], None, 'http://proxy:3128/%7E', '',
+                                                 queueHash = 'aHash' )
+      self.assertEqual( open( cachedWrapper ).read(), wrapperText )
+    finally:
+      shutil.rmtree( workDir )
+
+  def test__planPilots( self ):
+    taskQueues = { 1 : { 'Jobs' : 5 }, 2 : { 'Jobs' : 3 } }
+    queueTQs = { 'q1' : [ 1 ], 'q2' : [ 1, 2 ], 'q3' : [ 2 ], 'q4' : [ 1 ], 'q5' : [ 2 ] }
+    #One pilot is already waiting for the first task queue
+    tqJobsLeft = { 1 : 4, 2 : 3 }
+    queueProxySlots = { 'q1' : ( 'proxy1', 3 ), 'q2' : ( 'proxy2', 10 ), 'q3' : ( 'proxy3', 10 ),
+                        'q4' : ( 'proxy4', 0 ) }
+    queueArgs = self.sd._planPilots( [ 'q4', 'q5', 'q1', 'q2', 'q3' ], queueTQs, taskQueues, tqJobsLeft,
+                                     queueProxySlots )
+    #q4 has no slots and q5 has no proxy, q2 gets what q1 left and q3 nothing
+    self.assertEqual( sorted( queueArgs ), [ 'q1', 'q2' ] )
+    self.assertEqual( queueArgs['q1'], ( 3, 'proxy1', { 1 : { 'Jobs' : 5 } } ) )
+    self.assertEqual( queueArgs['q2'], ( 4, 'proxy2', taskQueues ) )
+    self.assertEqual( tqJobsLeft, { 1 : 0, 2 : 0 } )
+
+  def test__planPilotsMaxPilots( self ):
+    self.sd.maxPilotsToSubmit = 2
+    tqJobsLeft = { 1 : 5 }
+    queueArgs = self.sd._planPilots( [ 'q1', 'q2' ], { 'q1' : [ 1 ], 'q2' : [ 1 ] }, { 1 : { 'Jobs' : 5 } },
+                                     tqJobsLeft, { 'q1' : ( 'proxy', 10 ), 'q2' : ( 'proxy', 10 ) } )
+    self.assertEqual( queueArgs['q1'][0], 2 )
+    self.assertEqual( queueArgs['q2'][0], 2 )
+    self.assertEqual( tqJobsLeft, { 1 : 1 } )
+
+  def test__acquireCESemaphore( self ):
+    self.sd.maxSubmissionsPerCE = 2
+    acquireCE = self.sd._SiteDirector__acquireCE
+    releaseCE = self.sd._SiteDirector__releaseCE
+    acquireCE( 'ce1' )
+    acquireCE( 'ce1' )
+    #Other CEs have their own limit
+    acquireCE( 'ce2' )
+    acquired = threading.Event()
+    def acquire():
+      acquireCE( 'ce1' )
+      acquired.set()
+    thread = threading.Thread( target = acquire )
+    thread.start()
+    acquired.wait( 0.2 )
+    self.assertFalse( acquired.isSet() )
+    releaseCE( 'ce1' )
+    acquired.wait( 5 )
+    self.assert_( acquired.isSet() )
+    thread.join()
+
+  def test__acquireCEInterval( self ):
+    self.sd.maxSubmissionsPerCE = 10
+    self.sd.ceSubmissionInterval = 0.2
+    acquireCE = self.sd._SiteDirector__acquireCE
+    start = time.time()
+    acquireCE( 'ce1' )
+    acquireCE( 'ce2' )
+    self.assert_( time.time() - start < 0.2 )
+    acquireCE( 'ce1' )
+    acquireCE( 'ce1' )
+    self.assert_( time.time() - start >= 0.4 )
+
 
 #############################################################################
 # Test Suite run
@@ -8,7 +8,7 @@ __RCSID__ = "$Id"
 from DIRAC import S_OK, S_ERROR
 from DIRAC import gLogger
 
-from DIRAC.Core.Utilities.DictCache import DictCache
+from DIRAC.Core.Utilities.DictCache import DictCache, LRUDictCache
 from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
 from DIRAC.WorkloadManagementSystem.DB.JobDB import JobDB
 
@@ -19,8 +19,8 @@ class Limiter( object ):
     """
     self.__runningLimitSection = "JobScheduling/RunningLimit"
     self.__matchingDelaySection = "JobScheduling/MatchingDelay"
-    self.csDictCache = DictCache()
-    self.condCache = DictCache()
+    self.csDictCache = LRUDictCache( maxEntries = 10000 )
+    self.condCache = LRUDictCache( maxEntries = 10000 )
     self.delayMem = {}
 
     if jobDB:
@@ -161,7 +161,7 @@ class Limiter( object ):
       cK = "Running:%s:%s" % ( siteName, attName )
       data = self.condCache.get( cK )
       if not data:
-        result = self.jobDB.getCounters( 'Jobs', [ attName ], { 'Site' : siteName, 'Status' : [ 'Running', 'Matched', 'Stalled' ] } )
+        result = self.jobDB.getJobCounters( [ attName ], { 'Site' : siteName, 'Status' : [ 'Running', 'Matched', 'Stalled' ] } )
         if not result[ 'OK' ]:
           return result
         data = result[ 'Value' ]
@@ -126,6 +126,88 @@ class Matcher( object ):
 
     return resultDict
 
+  def selectJobs( self, resourceDescription, credDict, numJobs ):
+    """ Select up to numJobs jobs for a resource with several slots ( multi core or whole node pilots ).
+        The jobs are taken out of the TQs together and their status, JDLs and parameters
+        are handled with bulk queries
+    """
+
+    startTime = time.time()
+
+    resourceDict = self._getResourceDict( resourceDescription, credDict )
+
+    negativeCond = self.limiter.getNegativeCondForSite( resourceDict['Site'] )
+    result = self.tqDB.matchAndGetJobs( resourceDict, numJobs = numJobs, negativeCond = negativeCond )
+
+    if not result['OK']:
+      raise RuntimeError( result['Message'] )
+    jobIDs = [ jobID for jobID, _tqID in result['Value']['jobs'] ]
+    if not jobIDs:
+      self.log.info( "No match found" )
+      return []
+
+    resAtt = self.jobDB.getAttributesForJobList( jobIDs, ['OwnerDN', 'OwnerGroup', 'Status'] )
+    if not resAtt['OK']:
+      raise RuntimeError( 'Could not retrieve job attributes' )
+    jobsAttributes = resAtt['Value']
+    waitingJobs = []
+    for jobID in jobIDs:
+      if jobID not in jobsAttributes:
+        self.log.error( 'No attributes returned for job', str( jobID ) )
+      elif jobsAttributes[jobID]['Status'] != 'Waiting':
+        # It is already out of the TQs
+        self.log.error( 'Job matched by the TQ is not in Waiting state', str( jobID ) )
+      else:
+        waitingJobs.append( jobID )
+    if not waitingJobs:
+      raise RuntimeError( "Jobs %s are not in Waiting state" % ','.join( [ str( jobID ) for jobID in jobIDs ] ) )
+
+    result = self.jobDB.getJDLsForJobList( waitingJobs )
+    if not result['OK']:
+      raise RuntimeError( "Failed to get the job JDLs" )
+    jdls = result['Value']
+    noJDLJobs = [ jobID for jobID in waitingJobs if jobID not in jdls ]
+    if noJDLJobs:
+      # They are already out of the TQs and can't run without a JDL
+      self.log.error( 'No JDL returned for jobs', ','.join( [ str( jobID ) for jobID in noJDLJobs ] ) )
+      self._reportFailedJobs( noJDLJobs, 'No JDL found' )
+      waitingJobs = [ jobID for jobID in waitingJobs if jobID in jdls ]
+      if not waitingJobs:
+        raise RuntimeError( "Failed to get the job JDLs" )
+
+    self._reportStatusForJobList( resourceDict, waitingJobs )
+
+    resOpt = self.jobDB.getOptParametersForJobList( waitingJobs )
+    if resOpt['OK']:
+      optParameters = resOpt['Value']
+    else:
+      optParameters = {}
+
+    matchTime = time.time() - startTime
+    self.log.info( "Match time for %s jobs: [%s]" % ( len( waitingJobs ), str( matchTime ) ) )
+    gMonitor.addMark( "matchTime", matchTime )
+
+    if self.opsHelper.getValue( "JobScheduling/CheckMatchingDelay", True ):
+      for jobID in waitingJobs:
+        self.limiter.updateDelayCounters( resourceDict['Site'], jobID )
+
+    pilotInfoReportedFlag = resourceDict.get( 'PilotInfoReportedFlag', False )
+    if not pilotInfoReportedFlag:
+      self._updatePilotInfo( resourceDict )
+    self._updatePilotJobsMapping( resourceDict, waitingJobs )
+
+    resultList = []
+    for jobID in waitingJobs:
+      resultDict = dict( optParameters.get( jobID, {} ) )
+      resultDict['JDL'] = jdls[jobID]
+      resultDict['JobID'] = jobID
+      resultDict['DN'] = jobsAttributes[jobID]['OwnerDN']
+      resultDict['Group'] = jobsAttributes[jobID]['OwnerGroup']
+      resultDict['PilotInfoReportedFlag'] = True
+      resultList.append( resultDict )
+
+    return resultList
+
 
   def _getResourceDict( self, resourceDescription, credDict ):
     """ from resourceDescription to resourceDict (just various mods)
@@ -238,6 +320,43 @@ class Matcher( object ):
       self.log.verbose( "Added logging record for jobID %s" % jobID )
 
 
+  def _reportFailedJobs( self, jobIDs, minorStatus ):
+    """ Fail the matched jobs that can't be sent to the pilot
+
+        Do not fail if errors happen here
+    """
+    for jobID in jobIDs:
+      result = self.jobDB.setJobStatus( jobID, status = 'Failed', minor = minorStatus )
+      if not result['OK']:
+        self.log.error( "Problem reporting job status", "setJobStatus, jobID = %s: %s" % ( jobID, result['Message'] ) )
+      result = self.jlDB.addLoggingRecord( jobID, status = 'Failed', minor = minorStatus, source = 'Matcher' )
+      if not result['OK']:
+        self.log.error( "Problem reporting job status", "addLoggingRecord, jobID = %s: %s" % ( jobID, result['Message'] ) )
+
+
+  def _reportStatusForJobList( self, resourceDict, jobIDs ):
+    """ Reports the status of the matched jobs with one update in jobDB and one insert in jobLoggingDB
+
+        Do not fail if errors happen here
+    """
+    attNames = ['Status', 'MinorStatus', 'ApplicationStatus', 'Site']
+    attValues = ['Matched', 'Assigned', 'Unknown', resourceDict['Site']]
+    result = self.jobDB.setAttributesForJobList( jobIDs, attNames, attValues )
+    if not result['OK']:
+      self.log.error( "Problem reporting job status", "setAttributesForJobList, jobIDs = %s: %s" % ( jobIDs, result['Message'] ) )
+    else:
+      self.log.verbose( "Set job attributes for jobIDs %s" % jobIDs )
+
+    result = self.jlDB.addLoggingRecords( jobIDs,
+                                          status = 'Matched',
+                                          minor = 'Assigned',
+                                          source = 'Matcher' )
+    if not result['OK']:
+      self.log.error( "Problem reporting job status", "addLoggingRecords, jobIDs = %s: %s" % ( jobIDs, result['Message'] ) )
+    else:
+      self.log.verbose( "Added logging records for jobIDs %s" % jobIDs )
+
+
   def _checkMask( self, resourceDict ):
     """ Check the mask: are we allowed to run normal jobs?
 
@@ -289,6 +408,20 @@ class Matcher( object ):
         self.log.error( "Problem updating pilot information",
                         "; setJobForPilot. pilotReference: %s; %s" % ( pilotReference, result['Message'] ) )
 
+  def _updatePilotJobsMapping( self, resourceDict, jobIDs ):
+    """ Update pilot to job mapping information for the jobs matched together
+    """
+    pilotReference = resourceDict.get( 'PilotReference', '' )
+    if pilotReference:
+      result = self.pilotAgentsDB.setCurrentJobID( pilotReference, jobIDs[-1] )
+      if not result['OK']:
+        self.log.error( "Problem updating pilot information",
+                        ";setCurrentJobID. pilotReference: %s; %s" % ( pilotReference, result['Message'] ) )
+      result = self.pilotAgentsDB.setJobsForPilot( jobIDs, pilotReference )
+      if not result['OK']:
+        self.log.error( "Problem updating pilot information",
+                        "; setJobsForPilot. pilotReference: %s; %s" % ( pilotReference, result['Message'] ) )
+
   def _checkCredentials( self, resourceDict, credDict ):
     """ Check if we can get a job given the passed credentials
     """
@@ -147,6 +147,51 @@ class MatcherTestCase( ClientsTestCase ):
 
     self.assertEqual( res, resExpected )
 
+  def test_selectJobs( self ):
+
+    self.matcher._getResourceDict = MagicMock( return_value = {'Site': 'DIRAC.Jenkins.ch', 'PilotReference': 'somePilotReference'} )
+    self.matcher.limiter = MagicMock()
+    self.matcher.limiter.getNegativeCondForSite.return_value = {}
+    self.tqDBMock.matchAndGetJobs.return_value = S_OK( {'matchFound': True, 'jobs': [( 1, 10 ), ( 2, 10 ), ( 3, 11 )]} )
+    self.jobDBMock.getAttributesForJobList.return_value = S_OK( {1: {'OwnerDN': 'dn', 'OwnerGroup': 'group', 'Status': 'Waiting'},
+                                                                 2: {'OwnerDN': 'dn', 'OwnerGroup': 'group', 'Status': 'Running'},
+                                                                 3: {'OwnerDN': 'dn', 'OwnerGroup': 'group', 'Status': 'Waiting'}} )
+    self.jobDBMock.getJDLsForJobList.return_value = S_OK( {1: '[JDL1]', 3: '[JDL3]'} )
+    self.jobDBMock.getOptParametersForJobList.return_value = S_OK( {1: {'OptParam': 'value'}, 3: {}} )
+
+    res = self.matcher.selectJobs( {}, {}, 3 )
+    self.assertEqual( [ resultDict['JobID'] for resultDict in res ], [1, 3] )
+    self.assertEqual( res[0]['JDL'], '[JDL1]' )
+    self.assertEqual( res[0]['OptParam'], 'value' )
+    self.assertEqual( res[1]['DN'], 'dn' )
+    #Status reported for both jobs at once
+    self.jobDBMock.setAttributesForJobList.assert_called_once_with( [1, 3], ['Status', 'MinorStatus', 'ApplicationStatus', 'Site'],
+                                                                    ['Matched', 'Assigned', 'Unknown', 'DIRAC.Jenkins.ch'] )
+    self.jlDBMock.addLoggingRecords.assert_called_once_with( [1, 3], status = 'Matched', minor = 'Assigned', source = 'Matcher' )
+    self.pilotAgentsDBMock.setJobsForPilot.assert_called_once_with( [1, 3], 'somePilotReference' )
+
+  def test_selectJobsNoJDL( self ):
+
+    self.matcher._getResourceDict = MagicMock( return_value = {'Site': 'DIRAC.Jenkins.ch', 'PilotReference': 'somePilotReference'} )
+    self.matcher.limiter = MagicMock()
+    self.matcher.limiter.getNegativeCondForSite.return_value = {}
+    self.tqDBMock.matchAndGetJobs.return_value = S_OK( {'matchFound': True, 'jobs': [( 1, 10 ), ( 2, 10 )]} )
+    self.jobDBMock.getAttributesForJobList.return_value = S_OK( {1: {'OwnerDN': 'dn', 'OwnerGroup': 'group', 'Status': 'Waiting'},
+                                                                 2: {'OwnerDN': 'dn', 'OwnerGroup': 'group', 'Status': 'Waiting'}} )
+    self.jobDBMock.getJDLsForJobList.return_value = S_OK( {1: '[JDL1]'} )
+    self.jobDBMock.getOptParametersForJobList.return_value = S_OK( {} )
+
+    #The job without JDL is failed instead of being left Matched
+    res = self.matcher.selectJobs( {}, {}, 2 )
+    self.assertEqual( [ resultDict['JobID'] for resultDict in res ], [1] )
+    self.jobDBMock.setJobStatus.assert_called_once_with( 2, status = 'Failed', minor = 'No JDL found' )
+    self.jobDBMock.setAttributesForJobList.assert_called_once_with( [1], ['Status', 'MinorStatus', 'ApplicationStatus', 'Site'],
+                                                                    ['Matched', 'Assigned', 'Unknown', 'DIRAC.Jenkins.ch'] )
+    self.pilotAgentsDBMock.setJobsForPilot.assert_called_once_with( [1], 'somePilotReference' )
+
+    self.jobDBMock.getJDLsForJobList.return_value = S_OK( {} )
+    self.assertRaises( RuntimeError, self.matcher.selectJobs, {}, {}, 2 )
+
 #############################################################################
 
 class SandboxStoreTestCaseSuccess( ClientsTestCase ):
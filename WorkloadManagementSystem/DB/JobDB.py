@@ -14,6 +14,7 @@
     getAllJobParameters()
     getInputData()
     getJobJDL()
+    getJobClassAd()
 
     selectJobs()
     selectJobsWithStatus()
@@ -27,7 +28,10 @@
     setInputData()
 
     insertNewJobIntoDB()
+    insertNewJobsIntoDB()
     removeJobFromDB()
+    getMaxJobID()
+    hasJobsInRange()
 
     rescheduleJob()
     rescheduleJobs()
@@ -38,12 +42,15 @@
     banSiteInMask()
 
     getCounters()
+    getJobCounters()
+    rebuildJobCounters()
 """
 
 __RCSID__ = "$Id$"
 
 import sys
 import operator
+import itertools
 
 from DIRAC.Core.Utilities.ClassAd.ClassAdLight               import ClassAd
 from DIRAC.Core.Utilities.ReturnValues                       import S_OK, S_ERROR
@@ -53,6 +60,22 @@ from DIRAC.ConfigurationSystem.Client.Helpers.Registry       import getVOForGrou
 from DIRAC.Core.Base.DB                                      import DB
 from DIRAC.ConfigurationSystem.Client.Helpers.Resources      import getDIRACPlatform
 from DIRAC.WorkloadManagementSystem.Client.JobState.JobManifest   import JobManifest
+from DIRAC.WorkloadManagementSystem.private.JobIDPartitions  import JobIDPartitions
+
+#Attributes of the jobs the JobCounters table counts by, and their definition in the Jobs table
+JOB_COUNTER_FIELDS = ( 'DIRACSetup', 'Status', 'MinorStatus', 'Site', 'Owner', 'OwnerGroup',
+                       'JobGroup', 'JobType', 'JobSplitType' )
+JOB_COUNTER_FIELD_TYPES = { 'DIRACSetup' : "VARCHAR(32) NOT NULL",
+                            'Status' : "VARCHAR(32) NOT NULL",
+                            'MinorStatus' : "VARCHAR(128) NOT NULL",
+                            'Site' : "VARCHAR(100) NOT NULL",
+                            'Owner' : "VARCHAR(32) NOT NULL",
+                            'OwnerGroup' : "VARCHAR(128) NOT NULL",
+                            'JobGroup' : "VARCHAR(32) NOT NULL",
+                            'JobType' : "VARCHAR(32) NOT NULL",
+                            'JobSplitType' : "ENUM('Single','Master','Subjob','DAGNode') NOT NULL" }
+#Counters corrected with each statement when rebuilding them
+JOB_COUNTERS_CHUNK_SIZE = 1000
 
 #############################################################################
 
@@ -65,6 +88,29 @@ class JobDB( DB ):
     DB.__init__( self, 'JobDB', 'WorkloadManagement/JobDB' )
 
     self.maxRescheduling = self.getCSOption( 'MaxRescheduling', 3 )
+    #Known once the first bulk of jobs is inserted
+    self.__consecutiveAutoInc = None
+
+    #The heart beats can be kept in partitions of JobIDPartitionSize jobs, dropped by the JobCleaningAgent
+    self.jobIDPartitions = None
+    partitionSize = self.getCSOption( 'JobIDPartitionSize', 0 )
+    if partitionSize:
+      self.jobIDPartitions = JobIDPartitions( self, [ 'HeartBeatLoggingInfo' ], partitionSize )
+
+    #The number of jobs per combination of JOB_COUNTER_FIELDS can be kept up to date by triggers
+    self.jobCounters = False
+    if self.getCSOption( 'UseJobCounters', False ):
+      result = self.__initializeJobCounters()
+      if result['OK']:
+        self.jobCounters = True
+      else:
+        self.log.error( "Cannot set up the job counters. Counting from the Jobs table", result['Message'] )
+
+    #The parsed JDLs are stored if the JobJDLs table has the ParsedJDL column
+    self.storeParsedJDL = False
+    result = self._query( "SHOW COLUMNS FROM JobJDLs LIKE 'ParsedJDL'" )
+    if result['OK'] and result['Value']:
+      self.storeParsedJDL = True
 
     self.jobAttributeNames = []
 
@@ -141,6 +187,43 @@ class JobDB( DB ):
     except Exception as x:
       return S_ERROR( 'JobDB.getAttributesForJobList: Failed\n%s' % str( x ) )
 
+#############################################################################
+  def getJDLsForJobList( self, jobIDList, original = False ):
+    """ Get the JDLs of the jobs in the jobIDList as a { jobID : JDL } dictionary
+    """
+    if not jobIDList:
+      return S_OK( {} )
+    jobList = ','.join( [ str( int( x ) ) for x in jobIDList ] )
+    if original:
+      cmd = "SELECT JobID, OriginalJDL FROM JobJDLs WHERE JobID in ( %s )" % jobList
+    else:
+      cmd = "SELECT JobID, JDL FROM JobJDLs WHERE JobID in ( %s )" % jobList
+    result = self._query( cmd )
+    if not result['OK']:
+      return result
+    return S_OK( dict( [ ( int( jobID ), jdl ) for jobID, jdl in result['Value'] ] ) )
+
+#############################################################################
+  def getOptParametersForJobList( self, jobIDList ):
+    """ Get the optimizer parameters of the jobs in the jobIDList as a
+        { jobID : { name : value } } dictionary
+    """
+    if not jobIDList:
+      return S_OK( {} )
+    jobList = ','.join( [ str( int( x ) ) for x in jobIDList ] )
+    cmd = "SELECT JobID, Name, Value from OptimizerParameters WHERE JobID in ( %s )" % jobList
+    result = self._query( cmd )
+    if not result['OK']:
+      return S_ERROR( 'JobDB.getOptParametersForJobList: failed to retrieve parameters' )
+    resultDict = dict( [ ( int( jobID ), {} ) for jobID in jobIDList ] )
+    for jobID, name, value in result['Value']:
+      try:
+        value = value.tostring()
+      except Exception:
+        pass
+      resultDict.setdefault( int( jobID ), {} )[name] = value
+    return S_OK( resultDict )
+
 
 #############################################################################
   def getDistinctJobAttributes( self, attribute, condDict = None, older = None,
@@ -657,6 +740,34 @@ class JobDB( DB ):
     else:
       return S_ERROR( 'JobDB.setAttributes: failed to set attribute' )
 
+#############################################################################
+  def setAttributesForJobList( self, jobIDList, attrNames, attrValues, update = False ):
+    """ Set the same attribute values for all the jobs in the jobIDList with a single update.
+        The LastUpdate time stamp is refreshed if explicitely requested
+    """
+    if not jobIDList:
+      return S_OK( 0 )
+    if len( attrNames ) != len( attrValues ):
+      return S_ERROR( 'JobDB.setAttributesForJobList: incompatible Argument length' )
+
+    attr = []
+    for i in range( len( attrNames ) ):
+      ret = self._escapeString( attrValues[i] )
+      if not ret['OK']:
+        return ret
+      attr.append( "%s=%s" % ( attrNames[i], ret['Value'] ) )
+    if update:
+      attr.append( "LastUpdateTime=UTC_TIMESTAMP()" )
+    if len( attr ) == 0:
+      return S_ERROR( 'JobDB.setAttributesForJobList: Nothing to do' )
+
+    jobList = ','.join( [ str( int( x ) ) for x in jobIDList ] )
+    cmd = 'UPDATE Jobs SET %s WHERE JobID in ( %s )' % ( ', '.join( attr ), jobList )
+    res = self._update( cmd )
+    if res['OK']:
+      return res
+    return S_ERROR( 'JobDB.setAttributesForJobList: failed to set attributes' )
+
 #############################################################################
   def setJobStatus( self, jobID, status = '', minor = '', application = '', appCounter = None ):
     """ Set status of the job specified by its jobID
@@ -902,6 +1013,14 @@ class JobDB( DB ):
         cmd = "UPDATE JobJDLs Set JDL=%s WHERE JobID=%s" % ( e_JDL, jobID )
       else:
         cmd = "INSERT INTO JobJDLs (JobID,JDL) VALUES (%s,%s)" % ( jobID, e_JDL )
+      if self.storeParsedJDL:
+        ret = self._escapeString( ClassAd( jdl ).serialize() )
+        if not ret['OK']:
+          return ret
+        if updateFlag:
+          cmd = "UPDATE JobJDLs Set JDL=%s, ParsedJDL=%s WHERE JobID=%s" % ( e_JDL, ret['Value'], jobID )
+        else:
+          cmd = "INSERT INTO JobJDLs (JobID,JDL,ParsedJDL) VALUES (%s,%s,%s)" % ( jobID, e_JDL, ret['Value'] )
       result = self._update( cmd )
       if not result['OK']:
         return result
@@ -971,6 +1090,30 @@ class JobDB( DB ):
     else:
       return result
 
+  def getJobClassAd( self, jobID ):
+    """ Get the ClassAd of the current JDL of the job. Its parsed form is used when stored
+    """
+    if not self.storeParsedJDL:
+      result = self.getJobJDL( jobID )
+      if not result['OK']:
+        return result
+      if not result['Value']:
+        return S_ERROR( 'No JDL for job %s' % jobID )
+      return S_OK( ClassAd( result['Value'] ) )
+
+    result = self._query( "SELECT JDL, ParsedJDL FROM JobJDLs WHERE JobID=%d" % int( jobID ) )
+    if not result['OK']:
+      return result
+    if not result['Value'] or not result['Value'][0][0]:
+      return S_ERROR( 'No JDL for job %s' % jobID )
+    jdl, parsedJDL = result['Value'][0]
+    if parsedJDL:
+      try:
+        return S_OK( ClassAd.deserialize( parsedJDL ) )
+      except Exception as excp:
+        self.log.warn( 'Cannot load the parsed JDL of job %s' % jobID, str( excp ) )
+    return S_OK( ClassAd( jdl ) )
+
 #############################################################################
   def insertNewJobIntoDB( self, jdl, owner, ownerDN, ownerGroup, diracSetup ):
     """ Insert the initial JDL into the Job database,
@@ -1051,6 +1194,59 @@ class JobDB( DB ):
     if not result['OK']:
       return result
 
+    jobJDL = self.__completeNewJob( jobID, classAdJob, classAdReq, jobAttrNames, jobAttrValues )
+
+    result = self.setJobJDL( jobID, jobJDL )
+    if not result['OK']:
+      return result
+
+    # Adding the job in the Jobs table
+    result = self.insertFields( 'Jobs', jobAttrNames, jobAttrValues )
+    if not result['OK']:
+      return result
+
+    # Setting the Job parameters
+    result = self.__setInitialJobParameters( classAdJob, jobID )
+    if not result['OK']:
+      return result
+
+    # Looking for the Input Data
+    inputData = []
+    if classAdJob.lookupAttribute( 'InputData' ):
+      inputData = classAdJob.getListFromExpression( 'InputData' )
+    values = []
+
+    ret = self._escapeString( jobID )
+    if not ret['OK']:
+      return ret
+    e_jobID = ret['Value']
+
+    for lfn in inputData:
+      # some jobs are setting empty string as InputData
+      if not lfn:
+        continue
+      ret = self._escapeString( lfn.strip() )
+      if not ret['OK']:
+        return ret
+      lfn = ret['Value']
+
+      values.append( '(%s, %s )' % ( e_jobID, lfn ) )
+
+    if values:
+      cmd = 'INSERT INTO InputData (JobID,LFN) VALUES %s' % ', '.join( values )
+      result = self._update( cmd )
+      if not result['OK']:
+        return result
+
+    retVal['Status'] = 'Received'
+    retVal['MinorStatus'] = 'Job accepted'
+
+    return retVal
+
+  def __completeNewJob( self, jobID, classAdJob, classAdReq, jobAttrNames, jobAttrValues ):
+    """ Add the attributes taken from the checked JDL of a new job and
+        return its final JDL
+    """
     priority = classAdJob.getAttributeInt( 'Priority' )
     jobAttrNames.append( 'UserPriority' )
     jobAttrValues.append( priority )
@@ -1087,53 +1283,181 @@ class JobDB( DB ):
     # Replace the JobID placeholder if any
     if jobJDL.find( '%j' ) != -1:
       jobJDL = jobJDL.replace( '%j', str( jobID ) )
+    return jobJDL
+
+  def insertNewJobsIntoDB( self, jdlList, owner, ownerDN, ownerGroup, diracSetup, bulkSize = 500 ):
+    """ Insert several new jobs at once, e.g. the jobs of a parametric bulk.
+        jdlList can be any iterable, it is only read bulkSize JDLs at a time and
+        each block is inserted in a single transaction.
+        Return the list of { 'JobID', 'Status', 'MinorStatus' } of the new jobs. If it fails
+        the jobs inserted before are in the 'Jobs' key of the error
+    """
+    insertedJobs = []
+    jdlIterator = iter( jdlList )
+    while True:
+      jdls = list( itertools.islice( jdlIterator, max( 1, bulkSize ) ) )
+      if not jdls:
+        break
+      result = self.__insertNewJobsBlock( jdls, owner, ownerDN, ownerGroup, diracSetup )
+      if not result['OK']:
+        result['Jobs'] = insertedJobs
+        return result
+      insertedJobs.extend( result['Value'] )
+    return S_OK( insertedJobs )
 
-    result = self.setJobJDL( jobID, jobJDL )
+  def __insertNewJobsBlock( self, jdls, owner, ownerDN, ownerGroup, diracSetup ):
+    """ Insert a block of new jobs with multi-row statements in one transaction
+    """
+    jobManifests = []
+    for jdl in jdls:
+      jobManifest = JobManifest()
+      result = jobManifest.load( jdl )
+      if not result['OK']:
+        return result
+      jobManifest.setOptionsFromDict( { 'OwnerName' : owner,
+                                        'OwnerDN' : ownerDN,
+                                        'OwnerGroup' : ownerGroup,
+                                        'DIRACSetup' : diracSetup } )
+      result = jobManifest.check()
+      if not result['OK']:
+        return result
+      jobManifests.append( jobManifest )
+
+    result = self.transactionStart()
     if not result['OK']:
       return result
-
-    # Adding the job in the Jobs table
-    result = self.insertFields( 'Jobs', jobAttrNames, jobAttrValues )
+    result = self.__insertNewJDLs( jdls )
+    if not result['OK']:
+      self.transactionRollback()
+      return S_ERROR( 'Can not insert JDL in to DB' )
+    jobIDs = result['Value']
+
+    jobs = []
+    jobRows = {}
+    jdlRows = []
+    parameterRows = []
+    inputDataRows = []
+    now = Time.toString()
+    for jobID, jobManifest in zip( jobIDs, jobManifests ):
+      jobManifest.setOption( 'JobID', jobID )
+      jobAttrNames = [ 'JobID', 'LastUpdateTime', 'SubmissionTime', 'Owner', 'OwnerDN', 'OwnerGroup', 'DIRACSetup' ]
+      jobAttrValues = [ jobID, now, now, owner, ownerDN, ownerGroup, diracSetup ]
+      classAdJob = ClassAd( jobManifest.dumpAsJDL() )
+      error = ''
+      if not classAdJob.isOK():
+        error = 'Error in JDL syntax'
+      else:
+        classAdJob.insertAttributeInt( 'JobID', jobID )
+        classAdReq = ClassAd( '[]' )
+        error = self.__checkJobDescription( classAdJob, classAdReq, owner, ownerDN, ownerGroup, diracSetup )
+      if error:
+        jobAttrNames.extend( [ 'Status', 'MinorStatus' ] )
+        jobAttrValues.extend( [ 'Failed', error ] )
+      else:
+        jdlRows.append( ( jobID, self.__completeNewJob( jobID, classAdJob, classAdReq, jobAttrNames, jobAttrValues ) ) )
+        if classAdJob.lookupAttribute( 'Parameters' ):
+          for name, value in classAdJob.getDictionaryFromSubJDL( 'Parameters' ).items():
+            parameterRows.append( ( jobID, name, value ) )
+        if classAdJob.lookupAttribute( 'InputData' ):
+          for lfn in classAdJob.getListFromExpression( 'InputData' ):
+            # some jobs are setting empty string as InputData
+            if lfn:
+              inputDataRows.append( ( jobID, lfn.strip() ) )
+      #Jobs with the same attributes are inserted together
+      jobRows.setdefault( tuple( jobAttrNames ), [] ).append( jobAttrValues )
+      jobs.append( { 'JobID' : jobID,
+                     'Status' : jobAttrValues[ jobAttrNames.index( 'Status' ) ],
+                     'MinorStatus' : jobAttrValues[ jobAttrNames.index( 'MinorStatus' ) ] } )
+
+    if self.storeParsedJDL:
+      jdlRows = [ ( jobID, jobJDL, ClassAd( jobJDL ).serialize() ) for jobID, jobJDL in jdlRows ]
+      result = self.__insertRows( 'INSERT INTO JobJDLs (JobID,JDL,ParsedJDL) VALUES', jdlRows,
+                                  'ON DUPLICATE KEY UPDATE JDL=VALUES(JDL), ParsedJDL=VALUES(ParsedJDL)' )
+    else:
+      result = self.__insertRows( 'INSERT INTO JobJDLs (JobID,JDL) VALUES', jdlRows,
+                                  'ON DUPLICATE KEY UPDATE JDL=VALUES(JDL)' )
+    for jobAttrNames, rows in jobRows.items():
+      if not result['OK']:
+        break
+      attrNames = ", ".join( [ "`%s`" % name for name in jobAttrNames ] )
+      result = self.__insertRows( 'INSERT INTO Jobs (%s) VALUES' % attrNames, rows )
+    if result['OK']:
+      result = self.__insertRows( 'REPLACE JobParameters (JobID,Name,Value) VALUES', parameterRows )
+    if result['OK']:
+      result = self.__insertRows( 'INSERT INTO InputData (JobID,LFN) VALUES', inputDataRows )
+    if not result['OK']:
+      self.transactionRollback()
+      return S_ERROR( 'Can not insert the new jobs: %s' % result['Message'] )
+    result = self.transactionCommit()
     if not result['OK']:
       return result
+    self.log.info( 'JobDB: New JobIDs served %s-%s' % ( jobIDs[0], jobIDs[-1] ) )
+    return S_OK( jobs )
 
-    # Setting the Job parameters
-    result = self.__setInitialJobParameters( classAdJob, jobID )
+  def __insertNewJDLs( self, jdls ):
+    """ Insert several new JDLs, this produces the new JobIDs. A multi-row insert gets
+        consecutive IDs unless InnoDB interleaves the auto increments of concurrent inserts
+    """
+    jdls = [ jdl.strip()[0].find( '[' ) != 0 and '[' + jdl + ']' or jdl for jdl in jdls ]
+    if self.__consecutiveAutoInc is None:
+      result = self._query( "SELECT @@innodb_autoinc_lock_mode" )
+      self.__consecutiveAutoInc = result['OK'] and int( result['Value'][0][0] ) < 2
+    if not self.__consecutiveAutoInc:
+      jobIDs = []
+      for jdl in jdls:
+        result = self.__insertNewJDL( jdl )
+        if not result['OK']:
+          return result
+        jobIDs.append( result['Value'] )
+      return S_OK( jobIDs )
+
+    result = self._escapeValues( jdls )
     if not result['OK']:
       return result
-
-    # Looking for the Input Data
-    inputData = []
-    if classAdJob.lookupAttribute( 'InputData' ):
-      inputData = classAdJob.getListFromExpression( 'InputData' )
+    jobIDs = []
+    for values in self.__splitRows( [ '(%s)' % jdl for jdl in result['Value'] ] ):
+      result = self._update( 'INSERT INTO JobJDLs (OriginalJDL) VALUES %s' % ', '.join( values ) )
+      if not result['OK']:
+        return result
+      if not 'lastRowId' in result:
+        return S_ERROR( 'JobDB.__insertNewJDLs: Failed to retrieve the new Ids.' )
+      #The last insert id is the one of the first row
+      firstJobID = int( result['lastRowId'] )
+      jobIDs.extend( range( firstJobID, firstJobID + len( values ) ) )
+    return S_OK( jobIDs )
+
+  def __insertRows( self, cmdPrefix, rows, cmdSuffix = '' ):
+    """ Insert the rows, tuples of values, with as few statements as possible
+    """
     values = []
-
-    ret = self._escapeString( jobID )
-    if not ret['OK']:
-      return ret
-    e_jobID = ret['Value']
-
-    for lfn in inputData:
-      # some jobs are setting empty string as InputData
-      if not lfn:
-        continue
-      ret = self._escapeString( lfn.strip() )
-      if not ret['OK']:
-        return ret
-      lfn = ret['Value']
-
-      values.append( '(%s, %s )' % ( e_jobID, lfn ) )
-
-    if values:
-      cmd = 'INSERT INTO InputData (JobID,LFN) VALUES %s' % ', '.join( values )
-      result = self._update( cmd )
+    for row in rows:
+      result = self._escapeValues( list( row ) )
       if not result['OK']:
         return result
+      values.append( '(%s)' % ','.join( result['Value'] ) )
+    inserted = 0
+    for block in self.__splitRows( values ):
+      result = self._update( '%s %s %s' % ( cmdPrefix, ', '.join( block ), cmdSuffix ) )
+      if not result['OK']:
+        return result
+      inserted += result['Value']
+    return S_OK( inserted )
 
-    retVal['Status'] = 'Received'
-    retVal['MinorStatus'] = 'Job accepted'
-
-    return retVal
+  @staticmethod
+  def __splitRows( values, maxLength = 1000000 ):
+    """ Group the row values into statements below the max_allowed_packet of the server
+    """
+    block = []
+    length = 0
+    for value in values:
+      if block and length + len( value ) > maxLength:
+        yield block
+        block = []
+        length = 0
+      block.append( value )
+      length += len( value ) + 2
+    if block:
+      yield block
 
   def __checkAndPrepareJob( self, jobID, classAdJob, classAdReq, owner, ownerDN,
                             ownerGroup, diracSetup, jobAttrNames, jobAttrValues ):
@@ -1141,6 +1465,31 @@ class JobDB( DB ):
       Check Consistency of Submitted JDL and set some defaults
       Prepare subJDL with Job Requirements
     """
+    error = self.__checkJobDescription( classAdJob, classAdReq, owner, ownerDN, ownerGroup, diracSetup )
+    if error:
+
+      retVal = S_ERROR( error )
+      retVal['JobId'] = jobID
+      retVal['Status'] = 'Failed'
+      retVal['MinorStatus'] = error
+
+      jobAttrNames.append( 'Status' )
+      jobAttrValues.append( 'Failed' )
+
+      jobAttrNames.append( 'MinorStatus' )
+      jobAttrValues.append( error )
+      resultInsert = self.setJobAttributes( jobID, jobAttrNames, jobAttrValues )
+      if not resultInsert['OK']:
+        retVal['MinorStatus'] += '; %s' % resultInsert['Message']
+
+      return retVal
+
+    return S_OK()
+
+  def __checkJobDescription( self, classAdJob, classAdReq, owner, ownerDN, ownerGroup, diracSetup ):
+    """ Check the JDL of a new job, set some defaults and fill the requirements.
+        Return the error found, if any
+    """
     error = ''
     vo = getVOForGroup( ownerGroup )
 
@@ -1213,25 +1562,7 @@ class JobDB( DB ):
       else:
         error = "OS compatibility info not found"
 
-    if error:
-
-      retVal = S_ERROR( error )
-      retVal['JobId'] = jobID
-      retVal['Status'] = 'Failed'
-      retVal['MinorStatus'] = error
-
-      jobAttrNames.append( 'Status' )
-      jobAttrValues.append( 'Failed' )
-
-      jobAttrNames.append( 'MinorStatus' )
-      jobAttrValues.append( error )
-      resultInsert = self.setJobAttributes( jobID, jobAttrNames, jobAttrValues )
-      if not resultInsert['OK']:
-        retVal['MinorStatus'] += '; %s' % resultInsert['Message']
-
-      return retVal
-
-    return S_OK()
+    return error
 
 
 #############################################################################
@@ -1252,6 +1583,15 @@ class JobDB( DB ):
     else:
       jobIDList = jobIDs
 
+    #The records of partitioned tables go away when the partition of the jobs is dropped
+    partitionedTables = []
+    if self.jobIDPartitions:
+      result = self.jobIDPartitions.getPartitionedTables()
+      if result['OK']:
+        partitionedTables = result['Value']
+      else:
+        self.log.warn( 'Cannot check the partitioned tables, deleting their records', result['Message'] )
+
     failedTablesList = []
     jobIDString = ','.join( [str( j ) for j in jobIDList] )
     for table in ['InputData',
@@ -1262,6 +1602,8 @@ class JobDB( DB ):
                   'JobCommands',
                   'Jobs',
                   'JobJDLs']:
+      if table in partitionedTables:
+        continue
 
       cmd = 'DELETE FROM %s WHERE JobID in (%s)' % ( table, jobIDString )
       result = self._update( cmd )
@@ -1275,6 +1617,25 @@ class JobDB( DB ):
 
     return result
 
+#################################################################
+  def getMaxJobID( self ):
+    """ Highest JobID given so far
+    """
+    result = self._query( "SELECT MAX(JobID) FROM Jobs" )
+    if not result['OK']:
+      return result
+    return S_OK( int( result['Value'][0][0] or 0 ) )
+
+#################################################################
+  def hasJobsInRange( self, minJobID, maxJobID ):
+    """ Check if there is any job with minJobID <= JobID < maxJobID
+    """
+    result = self._query( "SELECT JobID FROM Jobs WHERE JobID >= %d AND JobID < %d LIMIT 1" % ( int( minJobID ),
+                                                                                              int( maxJobID ) ) )
+    if not result['OK']:
+      return result
+    return S_OK( len( result['Value'] ) > 0 )
+
 #################################################################
   def rescheduleJobs( self, jobIDs ):
     """ Reschedule all the jobs in the given list
@@ -1877,16 +2238,98 @@ class JobDB( DB ):
     else:
       return S_ERROR( 'Failed to store some or all the parameters' )
 
+#####################################################################################
+  def setHeartBeatDataBulk( self, heartBeats ):
+    """ Add the heart beat data of several jobs at once. heartBeats is a list of
+        ( jobID, staticDataDict, dynamicDataDict, heartBeatTime ) tuples, the time
+        being a 'YYYY-MM-DD hh:mm:ss' string. Heart beats of jobs not in the DB are ignored
+    """
+    if not heartBeats:
+      return S_OK( 0 )
+
+    jobIDs = list( set( [ int( heartBeat[0] ) for heartBeat in heartBeats ] ) )
+    req = "SELECT JobID FROM Jobs WHERE JobID IN ( %s )" % ','.join( [ str( jobID ) for jobID in jobIDs ] )
+    result = self._query( req )
+    if not result['OK']:
+      return result
+    existingJobs = set( [ row[0] for row in result['Value'] ] )
+
+    #Only the last heart beat time and static values of each job are kept
+    heartBeatTimes = {}
+    parameters = {}
+    logValues = {}
+    for jobID, staticDataDict, dynamicDataDict, heartBeatTime in heartBeats:
+      jobID = int( jobID )
+      if jobID not in existingJobs:
+        continue
+      heartBeatTimes[ jobID ] = max( heartBeatTime, heartBeatTimes.get( jobID, heartBeatTime ) )
+      for name, value in staticDataDict.items():
+        parameters[ ( jobID, name ) ] = value
+      for name, value in dynamicDataDict.items():
+        logValues[ ( jobID, name, heartBeatTime ) ] = value
+    if not heartBeatTimes:
+      return S_OK( 0 )
+
+    e_jobIDs = ','.join( [ str( jobID ) for jobID in heartBeatTimes ] )
+    caseList = [ "WHEN %s THEN '%s'" % ( jobID, heartBeatTimes[ jobID ] ) for jobID in heartBeatTimes ]
+    #A delayed heart beat must not bring back to Running a job that has finished meanwhile
+    e_finalStates = ','.join( [ "'%s'" % status for status in self.JOB_FINAL_STATES ] )
+    req = "UPDATE Jobs SET HeartBeatTime = CASE JobID %s END, " % " ".join( caseList )
+    req += "Status = IF( Status IN ( %s ), Status, 'Running' ) WHERE JobID IN ( %s )" % ( e_finalStates, e_jobIDs )
+    result = self._update( req )
+    if not result['OK']:
+      return S_ERROR( 'Failed to set the heart beat time: ' + result['Message'] )
+
+    ok = True
+    valueList = []
+    for ( jobID, name ), value in parameters.items():
+      result = self._escapeString( name )
+      if not result['OK']:
+        self.log.warn( 'Failed to escape string ' + name )
+        continue
+      e_name = result['Value']
+      result = self._escapeString( value )
+      if not result['OK']:
+        self.log.warn( 'Failed to escape string ' + value )
+        continue
+      valueList.append( "(%s,%s,%s)" % ( jobID, e_name, result['Value'] ) )
+    if valueList:
+      result = self._update( 'REPLACE JobParameters (JobID,Name,Value) VALUES %s' % ','.join( valueList ) )
+      if not result['OK']:
+        ok = False
+        self.log.warn( result['Message'] )
+
+    valueList = []
+    for ( jobID, name, heartBeatTime ), value in logValues.items():
+      result = self._escapeString( name )
+      if not result['OK']:
+        self.log.warn( 'Failed to escape string ' + name )
+        continue
+      e_name = result['Value']
+      result = self._escapeString( value )
+      if not result['OK']:
+        self.log.warn( 'Failed to escape string ' + value )
+        continue
+      valueList.append( "(%s,%s,%s,'%s')" % ( jobID, e_name, result['Value'], heartBeatTime ) )
+    if valueList:
+      #IGNORE makes writing again the same heart beats harmless
+      req = "INSERT IGNORE INTO HeartBeatLoggingInfo (JobID,Name,Value,HeartBeatTime) VALUES %s" % ','.join( valueList )
+      result = self._update( req )
+      if not result['OK']:
+        ok = False
+        self.log.warn( result['Message'] )
+
+    if ok:
+      return S_OK( len( heartBeatTimes ) )
+    else:
+      return S_ERROR( 'Failed to store some or all the parameters' )
+
 #####################################################################################
   def getHeartBeatData( self, jobID ):
     """ Retrieve the job's heart beat data
     """
-    ret = self._escapeString( jobID )
-    if not ret['OK']:
-      return ret
-    jobID = ret['Value']
-
-    cmd = 'SELECT Name,Value,HeartBeatTime from HeartBeatLoggingInfo WHERE JobID=%s' % jobID
+    #A plain integer lets MySQL read only the partition of the job
+    cmd = 'SELECT Name,Value,HeartBeatTime from HeartBeatLoggingInfo WHERE JobID=%d' % int( jobID )
     res = self._query( cmd )
     if not res['OK']:
       return res
@@ -1991,8 +2434,160 @@ class JobDB( DB ):
     valueFields = [ 'COUNT(JobID)', 'SUM(RescheduleCounter)' ]
     defString = ", ".join( defFields )
     valueString = ", ".join( valueFields )
-    sqlCmd = "SELECT %s, %s From Jobs GROUP BY %s" % ( defString, valueString, defString )
+    if self.__useJobCounters( defFields ):
+      sqlCmd = "SELECT %s, SUM(Jobs), SUM(Reschedules) FROM JobCounters GROUP BY %s HAVING SUM(Jobs) > 0" % ( defString,
+                                                                                                         defString )
+    else:
+      sqlCmd = "SELECT %s, %s From Jobs GROUP BY %s" % ( defString, valueString, defString )
     result = self._query( sqlCmd )
     if not result[ 'OK' ]:
       return result
-    return S_OK( ( ( defFields + valueFields ), result[ 'Value' ] ) )
+    #SUM gives decimals
+    values = [ row[:-2] + ( int( row[-2] ), int( row[-1] ) ) for row in result[ 'Value' ] ]
+    return S_OK( ( ( defFields + valueFields ), values ) )
+
+#####################################################################################
+  def __useJobCounters( self, fieldList ):
+    """ Check if the JobCounters table can give the counts grouped and selected by these fields
+    """
+    if not self.jobCounters:
+      return False
+    for field in fieldList:
+      if isinstance( field, tuple ):
+        if not self.__useJobCounters( field ):
+          return False
+      elif field not in JOB_COUNTER_FIELDS:
+        return False
+    return True
+
+  def getJobCounters( self, attrList, condDict = None, older = None, newer = None, timeStamp = None ):
+    """ Same as getCounters( 'Jobs', ... ) but reading the JobCounters table instead of
+        the Jobs when it is enabled and the attributes and conditions allow it
+    """
+    if not condDict:
+      condDict = {}
+    if older or newer or not self.__useJobCounters( list( attrList ) + list( condDict ) ):
+      return self.getCounters( 'Jobs', attrList, condDict, older = older, newer = newer, timeStamp = timeStamp )
+
+    try:
+      cond = self.buildCondition( condDict = condDict )
+    except Exception, x:
+      return S_ERROR( str( x ) )
+    attrNames = ", ".join( [ "`%s`" % attr for attr in attrList ] )
+    cmd = "SELECT %s, SUM(Jobs) FROM JobCounters %s GROUP BY %s HAVING SUM(Jobs) > 0 ORDER BY %s" % ( attrNames, cond,
+                                                                                                     attrNames,
+                                                                                                     attrNames )
+    result = self._query( cmd )
+    if not result['OK']:
+      return result
+    resultList = []
+    for row in result['Value']:
+      attrDict = dict( zip( attrList, row[:-1] ) )
+      resultList.append( ( attrDict, int( row[-1] ) ) )
+    return S_OK( resultList )
+
+  def __initializeJobCounters( self ):
+    """ Create the JobCounters table and the triggers of the Jobs table keeping it up to date
+    """
+    result = self._query( "SHOW TABLES LIKE 'JobCounters'" )
+    if not result['OK']:
+      return result
+    if not result['Value']:
+      fields = dict( [ ( field, JOB_COUNTER_FIELD_TYPES[ field ] ) for field in JOB_COUNTER_FIELDS ] )
+      fields[ 'Jobs' ] = "INTEGER NOT NULL DEFAULT 0"
+      fields[ 'Reschedules' ] = "INTEGER NOT NULL DEFAULT 0"
+      result = self._createTables( { 'JobCounters' : { 'Fields' : fields,
+                                                       'PrimaryKey' : list( JOB_COUNTER_FIELDS ) } } )
+      if not result['OK']:
+        return result
+
+    result = self._query( "SHOW TRIGGERS LIKE 'Jobs'" )
+    if not result['OK']:
+      return result
+    existingTriggers = set( [ row[0] for row in result['Value'] ] )
+    triggers = self.__getJobCountersTriggers()
+    if set( triggers ).issubset( existingTriggers ):
+      return S_OK()
+
+    self.log.info( "Creating the triggers of the job counters" )
+    for triggerName in triggers:
+      result = self._update( "DROP TRIGGER IF EXISTS `%s`" % triggerName )
+      if result['OK']:
+        result = self._update( triggers[ triggerName ] )
+      if not result['OK']:
+        #Without all of them the counters are not used, so none is left to slow down the Jobs updates
+        for triggerName in triggers:
+          self._update( "DROP TRIGGER IF EXISTS `%s`" % triggerName )
+        return result
+    #Count the jobs inserted before the triggers existed
+    return self.rebuildJobCounters()
+
+  def __getJobCountersTriggers( self ):
+    """ Triggers adding and subtracting the jobs to their combination in the JobCounters table
+    """
+    fieldString = ", ".join( JOB_COUNTER_FIELDS )
+
+    def addJob( row ):
+      values = ", ".join( [ "%s.%s" % ( row, field ) for field in JOB_COUNTER_FIELDS ] )
+      sqlCmd = "INSERT INTO JobCounters ( %s, Jobs, Reschedules ) VALUES ( %s, 1, %s.RescheduleCounter )" % ( fieldString,
+                                                                                                           values, row )
+      sqlCmd += " ON DUPLICATE KEY UPDATE Jobs = Jobs + 1, Reschedules = Reschedules + %s.RescheduleCounter" % row
+      return sqlCmd
+
+    def removeJob( row ):
+      cond = " AND ".join( [ "%s = %s.%s" % ( field, row, field ) for field in JOB_COUNTER_FIELDS ] )
+      return "UPDATE JobCounters SET Jobs = Jobs - 1, Reschedules = Reschedules - %s.RescheduleCounter WHERE %s" % ( row,
+                                                                                                                   cond )
+
+    #Most of the updates, like the heart beats, don't change the counters
+    unchanged = " AND ".join( [ "OLD.%s = NEW.%s" % ( field, field )
+                                for field in JOB_COUNTER_FIELDS + ( 'RescheduleCounter', ) ] )
+    return { 'JobCountersInsert' : "CREATE TRIGGER JobCountersInsert AFTER INSERT ON Jobs FOR EACH ROW %s" % addJob( "NEW" ),
+             'JobCountersDelete' : "CREATE TRIGGER JobCountersDelete AFTER DELETE ON Jobs FOR EACH ROW %s" % removeJob( "OLD" ),
+             'JobCountersUpdate' : "CREATE TRIGGER JobCountersUpdate AFTER UPDATE ON Jobs FOR EACH ROW BEGIN " \
+                                   "IF NOT ( %s ) THEN %s; %s; END IF; END" % ( unchanged, removeJob( "OLD" ), addJob( "NEW" ) ) }
+
+  def rebuildJobCounters( self ):
+    """ Count again all the jobs and correct the JobCounters table with the difference.
+        The Jobs and the counters are read in the same snapshot, which doesn't lock the
+        jobs, and the corrections are added to the counters as they are then, keeping
+        what the triggers changed meanwhile
+    """
+    fieldString = ", ".join( JOB_COUNTER_FIELDS )
+    result = self.transactionStart()
+    if not result['OK']:
+      return result
+    #( values of JOB_COUNTER_FIELDS ) -> [ jobs, reschedules ]
+    drift = {}
+    for sqlCmd, sign in ( ( "SELECT %s, COUNT(*), SUM(RescheduleCounter) FROM Jobs GROUP BY %s" % ( fieldString,
+                                                                                                  fieldString ), 1 ),
+                          ( "SELECT %s, Jobs, Reschedules FROM JobCounters" % fieldString, -1 ) ):
+      result = self._query( sqlCmd )
+      if not result['OK']:
+        self.transactionRollback()
+        return S_ERROR( "Cannot rebuild the job counters: %s" % result['Message'] )
+      for row in result['Value']:
+        delta = drift.setdefault( tuple( row[:-2] ), [ 0, 0 ] )
+        delta[0] += sign * int( row[-2] )
+        delta[1] += sign * int( row[-1] or 0 )
+    self.transactionCommit()
+
+    corrections = [ ( key, delta ) for key, delta in drift.items() if delta != [ 0, 0 ] ]
+    if corrections:
+      self.log.info( "Correcting %d job counters" % len( corrections ) )
+    for i in range( 0, len( corrections ), JOB_COUNTERS_CHUNK_SIZE ):
+      valuesList = []
+      for key, delta in corrections[i:i + JOB_COUNTERS_CHUNK_SIZE]:
+        result = self._escapeValues( list( key ) )
+        if not result['OK']:
+          return result
+        valuesList.append( "( %s, %d, %d )" % ( ", ".join( result['Value'] ), delta[0], delta[1] ) )
+      sqlCmd = "INSERT INTO JobCounters ( %s, Jobs, Reschedules ) VALUES %s" % ( fieldString, ", ".join( valuesList ) )
+      sqlCmd += " ON DUPLICATE KEY UPDATE Jobs = Jobs + VALUES( Jobs ), Reschedules = Reschedules + VALUES( Reschedules )"
+      result = self._update( sqlCmd )
+      if not result['OK']:
+        return S_ERROR( "Cannot rebuild the job counters: %s" % result['Message'] )
+    result = self._update( "DELETE FROM JobCounters WHERE Jobs = 0 AND Reschedules = 0" )
+    if not result['OK']:
+      return result
+    return S_OK( len( corrections ) )
@@ -18,8 +18,8 @@
 --
 -- Must set passwords for database user by replacing "must_be_set".
 --
--- GRANT SELECT,INSERT,LOCK TABLES,UPDATE,DELETE,CREATE,DROP,ALTER ON JobDB.* TO Dirac@localhost IDENTIFIED BY 'must_be_set';
--- GRANT SELECT,INSERT,LOCK TABLES,UPDATE,DELETE,CREATE,DROP,ALTER ON JobDB.* TO Dirac@'%' IDENTIFIED BY 'must_be_set';
+-- GRANT SELECT,INSERT,LOCK TABLES,UPDATE,DELETE,CREATE,DROP,ALTER,TRIGGER ON JobDB.* TO Dirac@localhost IDENTIFIED BY 'must_be_set';
+-- GRANT SELECT,INSERT,LOCK TABLES,UPDATE,DELETE,CREATE,DROP,ALTER,TRIGGER ON JobDB.* TO Dirac@'%' IDENTIFIED BY 'must_be_set';
 -- FLUSH PRIVILEGES;
 
 -- -----------------------------------------------------------------------------
@@ -32,8 +32,11 @@ CREATE TABLE `JobJDLs` (
   `JDL` MEDIUMBLOB NOT NULL,
   `JobRequirements` BLOB NOT NULL,
   `OriginalJDL` MEDIUMBLOB NOT NULL,
+  `ParsedJDL` MEDIUMBLOB,
   PRIMARY KEY (`JobID`)
 ) ENGINE=InnoDB DEFAULT CHARSET=latin1;
+-- ParsedJDL keeps the serialized ClassAd of the JDL, existing installations can add it with
+-- ALTER TABLE `JobJDLs` ADD COLUMN `ParsedJDL` MEDIUMBLOB;
 
 -- ------------------------------------------------------------------------------
 DROP TABLE IF EXISTS `Jobs`;
@@ -151,6 +154,8 @@ CREATE TABLE `SiteMaskLogging` (
 ) ENGINE=InnoDB DEFAULT CHARSET=latin1;
 
 -- ------------------------------------------------------------------------------
+-- With the JobIDPartitionSize option the JobCleaningAgent partitions this table by
+-- ranges of JobID, dropping its foreign key, and drops the partitions of removed jobs
 DROP TABLE IF EXISTS `HeartBeatLoggingInfo`;
 CREATE TABLE `HeartBeatLoggingInfo` (
   `JobID` INT(11) UNSIGNED NOT NULL,
@@ -2,8 +2,12 @@
     The following methods are provided
 
     addLoggingRecord()
+    addLoggingRecords()
     getJobLoggingInfo()
     getWMSTimeStamps()
+
+    With the JobIDPartitionSize option the LoggingInfo table is partitioned by blocks
+    of JobIDs. The records of the deleted jobs are then removed dropping the partitions
 """
 
 import time
@@ -11,6 +15,7 @@ import time
 from DIRAC                import gLogger, S_OK, S_ERROR
 from DIRAC.Core.Utilities import Time
 from DIRAC.Core.Base.DB   import DB
+from DIRAC.WorkloadManagementSystem.private.JobIDPartitions import JobIDPartitions
 
 __RCSID__ = "$Id$"
 
@@ -29,6 +34,10 @@ class JobLoggingDB( DB ):
 
     DB.__init__( self, 'JobLoggingDB', 'WorkloadManagement/JobLoggingDB' )
     self.gLogger = gLogger
+    self.jobIDPartitions = None
+    partitionSize = self.getCSOption( 'JobIDPartitionSize', 0 )
+    if partitionSize:
+      self.jobIDPartitions = JobIDPartitions( self, [ 'LoggingInfo' ], partitionSize )
 
 #############################################################################
   def addLoggingRecord( self,
@@ -48,6 +57,45 @@ class JobLoggingDB( DB ):
     event = 'status/minor/app=%s/%s/%s' % ( status, minor, application )
     self.gLogger.info( "Adding record for job " + str( jobID ) + ": '" + event + "' from " + source )
 
+    _date, time_order = self.__getStatusTime( date )
+
+    cmd = "INSERT INTO LoggingInfo (JobId, Status, MinorStatus, ApplicationStatus, " + \
+          "StatusTime, StatusTimeOrder, StatusSource) VALUES (%d,'%s','%s','%s','%s',%f,'%s')" % \
+           ( int( jobID ), status, minor, application, str( _date ), time_order, source )
+
+    return self._update( cmd )
+
+#############################################################################
+  def addLoggingRecords( self,
+                         jobIDs,
+                         status = 'idem',
+                         minor = 'idem',
+                         application = 'idem',
+                         date = '',
+                         source = 'Unknown' ):
+    """ Add the same logging record to several jobs with a single insert,
+        the arguments are the ones of addLoggingRecord
+    """
+    if not jobIDs:
+      return S_OK( 0 )
+
+    event = 'status/minor/app=%s/%s/%s' % ( status, minor, application )
+    self.gLogger.info( "Adding record for %s jobs: '%s' from %s" % ( len( jobIDs ), event, source ) )
+
+    _date, time_order = self.__getStatusTime( date )
+
+    values = ",".join( [ "(%d,'%s','%s','%s','%s',%f,'%s')" % ( int( jobID ), status, minor, application,
+                                                                str( _date ), time_order, source )
+                         for jobID in jobIDs ] )
+    cmd = "INSERT INTO LoggingInfo (JobId, Status, MinorStatus, ApplicationStatus, " + \
+          "StatusTime, StatusTimeOrder, StatusSource) VALUES " + values
+
+    return self._update( cmd )
+
+#############################################################################
+  def __getStatusTime( self, date ):
+    """ Time stamp of a record and its order as seconds since the MAGIC_EPOC_NUMBER
+    """
     if not date:
       # Make the UTC datetime string and float
       _date = Time.dateTime()
@@ -75,11 +123,7 @@ class JobLoggingDB( DB ):
         epoc = time.mktime( _date.timetuple() ) - MAGIC_EPOC_NUMBER
         time_order = round( epoc, 3 )
 
-    cmd = "INSERT INTO LoggingInfo (JobId, Status, MinorStatus, ApplicationStatus, " + \
-          "StatusTime, StatusTimeOrder, StatusSource) VALUES (%d,'%s','%s','%s','%s',%f,'%s')" % \
-           ( int( jobID ), status, minor, application, str( _date ), time_order, source )
-
-    return self._update( cmd )
+    return _date, time_order
 
 #############################################################################
   def getJobLoggingInfo( self, jobID ):
@@ -115,6 +159,13 @@ class JobLoggingDB( DB ):
   def deleteJob( self, jobID ):
     """ Delete logging records for given jobs
     """
+    #They are removed with the partition of the jobs once the table is partitioned
+    if self.jobIDPartitions:
+      result = self.jobIDPartitions.getPartitionedTables()
+      if not result['OK']:
+        self.log.warn( 'Cannot check the partitioned tables, deleting the records', result['Message'] )
+      elif 'LoggingInfo' in result['Value']:
+        return S_OK()
 
     # Make sure that we have a list of jobs
     if isinstance( jobID, (int, long) ):
@@ -26,6 +26,8 @@
 USE JobLoggingDB;
 
 -- ------------------------------------------------------------------------------
+-- With the JobIDPartitionSize option the JobCleaningAgent partitions this table by
+-- ranges of JobID and drops the partitions of removed jobs
 DROP TABLE IF EXISTS LoggingInfo;
 CREATE TABLE LoggingInfo (
     JobID INTEGER NOT NULL,
@@ -168,6 +168,18 @@ class PilotAgentsDB( DB ):
 
     return S_OK( result['Value'][0][0] )
 
+##########################################################################################
+  def countPilotsPerTaskQueue( self, condDict, older = None, newer = None, timeStamp = 'SubmissionTime' ):
+    """ Count the pilots selected as in countPilots for each task queue,
+        returns { TaskQueueID : count }
+    """
+
+    result = self.getCounters( 'PilotAgents', ['TaskQueueID'], condDict, older, newer, timeStamp )
+    if not result['OK']:
+      return result
+
+    return S_OK( dict( [ ( attrDict['TaskQueueID'], count ) for attrDict, count in result['Value'] ] ) )
+
 
 ##########################################################################################
   def getPilotGroups( self, groupList = ['Status', 'OwnerDN', 'OwnerGroup', 'GridType'], condDict = {} ):
@@ -448,6 +460,20 @@ class PilotAgentsDB( DB ):
     else:
       return S_ERROR( 'PilotJobReference ' + pilotRef + ' not found' )
 
+##########################################################################################
+  def setJobsForPilot( self, jobIDs, pilotRef ):
+    """ Store the jobIDs of the jobs matched together by the pilot with reference pilotRef
+    """
+
+    pilotID = self.__getPilotID( pilotRef )
+    if not pilotID:
+      return S_ERROR( 'PilotJobReference ' + pilotRef + ' not found' )
+    if not jobIDs:
+      return S_OK( 0 )
+    values = ",".join( [ "(%d,%d,UTC_TIMESTAMP())" % ( pilotID, int( jobID ) ) for jobID in jobIDs ] )
+    req = "INSERT INTO JobToPilotMapping (PilotID,JobID,StartTime) VALUES %s" % values
+    return self._update( req )
+
 ##########################################################################################
   def setCurrentJobID( self, pilotRef, jobID ):
     """ Set the pilot agent current DIRAC job ID
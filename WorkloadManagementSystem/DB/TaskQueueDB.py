@@ -10,7 +10,7 @@ from DIRAC.WorkloadManagementSystem.private.SharesCorrector import SharesCorrect
 from DIRAC.WorkloadManagementSystem.private.Queues import maxCPUSegments
 from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
 from DIRAC.Core.Utilities import List
-from DIRAC.Core.Utilities.DictCache import DictCache
+from DIRAC.Core.Utilities.DictCache import LRUDictCache
 from DIRAC.Core.Base.DB import DB
 from DIRAC.Core.Security import Properties, CS
 
@@ -38,7 +38,11 @@ class TaskQueueDB( DB ):
     self.__maxMatchRetry = 3
     self.__jobPriorityBoundaries = ( 0.001, 10 )
     self.__groupShares = {}
-    self.__deleteTQWithDelay = DictCache( self.__deleteTQIfEmpty )
+    #Not bounded, evicting would delete the task queues before their delay
+    self.__deleteTQWithDelay = LRUDictCache( self.__deleteTQIfEmpty )
+    #Optional in memory index to match the TQs
+    self.__tqIndex = None
+    self.__tqIndexPending = set()
     self.__opsHelper = Operations()
     self.__ensureInsertionIsSingle = False
     self.__sharesCorrector = SharesCorrector( self.__opsHelper )
@@ -59,6 +63,66 @@ class TaskQueueDB( DB ):
       return result
     return S_OK( [ row[0] for row in result[ 'Value' ] ] )
 
+  def setTaskQueueIndex( self, tqIndex ):
+    """ Match the task queues with an in memory TaskQueueIndex, the DB is then only
+        used to extract the jobs. The index has to be refreshed periodically
+    """
+    self.__tqIndex = tqIndex
+    return self.refreshTaskQueueIndex( fullReload = True )
+
+  def refreshTaskQueueIndex( self, fullReload = False ):
+    """ Load in the index the TQs created since the last refresh, or reload all of them
+        to drop the ones deleted by other processes and get the new priorities
+    """
+    if not self.__tqIndex:
+      return S_OK( 0 )
+    knownTQs = set( self.__tqIndex.getTQIds() )
+    if fullReload:
+      minTQId = 0
+    else:
+      minTQId = self.__tqIndex.getMaxTQId()
+      if self.__tqIndexPending:
+        minTQId = min( minTQId, min( self.__tqIndexPending ) - 1 )
+    result = self.__loadTaskQueueDefinitions( minTQId )
+    if not result[ 'OK' ]:
+      self.log.error( "Could not refresh the task queue index", result[ 'Message' ] )
+      return result
+    tqDefs = result[ 'Value' ]
+    #New TQs are created disabled, wait until their definition is complete
+    pending = set( [ tqId for tqId in tqDefs if tqDefs[ tqId ][ 'Enabled' ] < 1 and tqId not in knownTQs ] )
+    for tqId in pending:
+      tqDefs.pop( tqId )
+    self.__tqIndexPending = pending
+    if fullReload:
+      self.__tqIndex.load( tqDefs )
+    else:
+      self.__tqIndex.addTaskQueues( tqDefs )
+    return S_OK( len( tqDefs ) )
+
+  def __loadTaskQueueDefinitions( self, minTQId = 0 ):
+    """ Get the definition of the TQs with id bigger than minTQId
+    """
+    sqlCmd = "SELECT TQId, Enabled, Priority, %s FROM `tq_TaskQueues` WHERE TQId > %d" % ( ", ".join( singleValueDefFields ),
+                                                                                           minTQId )
+    result = self._query( sqlCmd )
+    if not result[ 'OK' ]:
+      return result
+    tqDefs = {}
+    for record in result[ 'Value' ]:
+      tqDef = { 'Enabled' : record[1], 'Priority' : record[2] }
+      for iP in range( len( singleValueDefFields ) ):
+        tqDef[ singleValueDefFields[ iP ] ] = record[ iP + 3 ]
+      tqDefs[ record[0] ] = tqDef
+    for field in multiValueDefFields:
+      result = self._query( "SELECT TQId, Value FROM `tq_TQTo%s` WHERE TQId > %d" % ( field, minTQId ) )
+      if not result[ 'OK' ]:
+        return result
+      for tqId, value in result[ 'Value' ]:
+        #Values of TQs created after the first query are ignored
+        if tqId in tqDefs:
+          tqDefs[ tqId ].setdefault( field, [] ).append( value )
+    return S_OK( tqDefs )
+
   def isSharesCorrectionEnabled( self ):
     return self.__getCSOption( "EnableSharesCorrection", False )
 
@@ -495,6 +559,8 @@ class TaskQueueDB( DB ):
     """
     #Make a copy to avoid modification of original if escaping needs to be done
     tqMatchDict = dict( tqMatchDict )
+    #The index works with the values before escaping
+    rawMatchDict = dict( tqMatchDict )
     self.log.info( "Starting match for requirements", self.__strDict( tqMatchDict ) )
     retVal = self._checkMatchDefinition( tqMatchDict )
     if not retVal[ 'OK' ]:
@@ -515,6 +581,10 @@ class TaskQueueDB( DB ):
                                             skipMatchDictDef = True,
                                             connObj = connObj )
         preJobSQL = "%s AND `tq_Jobs`.JobId = %s " % ( preJobSQL, tqMatchDict['JobID'] )
+      elif self.__tqIndex:
+        retVal = S_OK( self.__tqIndex.match( rawMatchDict,
+                                             numQueuesToGet = numQueuesPerTry,
+                                             negativeCond = negativeCond ) )
       else:
         retVal = self.matchAndGetTaskQueue( tqMatchDict,
                                             numQueuesToGet = numQueuesPerTry,
@@ -558,6 +628,98 @@ class TaskQueueDB( DB ):
     self.log.info( "Could not find a match after %s match retries" % self.__maxMatchRetry )
     return S_ERROR( "Could not find a match after %s match retries" % self.__maxMatchRetry )
 
+  def matchAndGetJobs( self, tqMatchDict, numJobs = 1, numQueuesPerTry = 10, negativeCond = {} ):
+    """
+    Match up to numJobs jobs for a resource with several slots. Each slot gets a TQ in
+    the same RAND() / Priority order as matchAndGetJob and all the jobs are taken out
+    of the TQs in a single transaction
+      Returns S_OK( { 'matchFound' : bool, 'jobs' : [ ( jobId, tqId ) ] } ) / S_ERROR
+    """
+    if 'JobID' in tqMatchDict or numJobs <= 1:
+      result = self.matchAndGetJob( tqMatchDict, numQueuesPerTry = numQueuesPerTry, negativeCond = negativeCond )
+      if not result[ 'OK' ]:
+        return result
+      jobs = []
+      if result[ 'Value' ][ 'matchFound' ]:
+        jobs.append( ( result[ 'Value' ][ 'jobId' ], result[ 'Value' ][ 'taskQueueId' ] ) )
+      return S_OK( { 'matchFound' : bool( jobs ), 'jobs' : jobs, 'tqMatch' : result[ 'Value' ][ 'tqMatch' ] } )
+    tqMatchDict = dict( tqMatchDict )
+    rawMatchDict = dict( tqMatchDict )
+    self.log.info( "Starting match of %s jobs for requirements" % numJobs, self.__strDict( tqMatchDict ) )
+    retVal = self._checkMatchDefinition( tqMatchDict )
+    if not retVal[ 'OK' ]:
+      self.log.error( "TQ match request check failed", retVal[ 'Message' ] )
+      return retVal
+    candidateSQL = "( SELECT `tq_Jobs`.JobId, `tq_Jobs`.TQId FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s"
+    candidateSQL += " ORDER BY RAND() / `tq_Jobs`.RealPriority ASC LIMIT %s )"
+    matchedJobs = []
+    for _ in range( self.__maxMatchRetry ):
+      numQueues = max( numQueuesPerTry, numJobs - len( matchedJobs ) )
+      if self.__tqIndex:
+        tqList = self.__tqIndex.match( rawMatchDict, numQueuesToGet = numQueues, negativeCond = negativeCond )
+      else:
+        retVal = self.matchAndGetTaskQueue( tqMatchDict, numQueuesToGet = numQueues,
+                                            skipMatchDictDef = True, negativeCond = negativeCond )
+        if not retVal[ 'OK' ]:
+          return retVal
+        tqList = retVal[ 'Value' ]
+      if not tqList:
+        self.log.info( "No TQ matches requirements" )
+        break
+      #Give a slot to each TQ in order, the first ones get more if there are less TQs than slots
+      slotsPerTQ = {}
+      for iSlot in range( numJobs - len( matchedJobs ) ):
+        tqId = tqList[ iSlot % len( tqList ) ][0]
+        slotsPerTQ[ tqId ] = slotsPerTQ.get( tqId, 0 ) + 1
+      sqlCmd = " UNION ALL ".join( [ candidateSQL % ( tqId, slotsPerTQ[ tqId ] ) for tqId in slotsPerTQ ] )
+      retVal = self._query( sqlCmd )
+      if not retVal[ 'OK' ]:
+        return S_ERROR( "Can't retrieve jobs to match: %s" % retVal[ 'Message' ] )
+      candidates = [ ( row[0], row[1] ) for row in retVal[ 'Value' ] ]
+      tqsWithJobs = set( [ tqId for _jobId, tqId in candidates ] )
+      for tqId, tqOwnerDN, tqOwnerGroup in tqList:
+        if tqId in slotsPerTQ and tqId not in tqsWithJobs:
+          gLogger.info( "Task queue %s seems to be empty, triggering a cleaning" % tqId )
+          self.__deleteTQWithDelay.add( tqId, 300, ( tqId, tqOwnerDN, tqOwnerGroup ) )
+      if not candidates:
+        continue
+      retVal = self.__extractJobs( candidates )
+      if not retVal[ 'OK' ]:
+        return retVal
+      tqOwners = dict( [ ( tqTuple[0], tqTuple ) for tqTuple in tqList ] )
+      for tqId in set( [ tqId for _jobId, tqId in retVal[ 'Value' ] if tqId in tqOwners ] ):
+        self.__deleteTQWithDelay.add( tqId, 300, tqOwners[ tqId ] )
+      matchedJobs.extend( retVal[ 'Value' ] )
+      if len( matchedJobs ) >= numJobs:
+        break
+    self.log.info( "Extracted %s jobs from the TQs" % len( matchedJobs ) )
+    return S_OK( { 'matchFound' : bool( matchedJobs ), 'jobs' : matchedJobs, 'tqMatch' : tqMatchDict } )
+
+  def __extractJobs( self, candidates ):
+    """
+    Take out of the TQs the ( jobId, tqId ) candidates in a transaction, returns the ones
+    that were still there ( others may have been taken by other matchers )
+    """
+    jobString = ", ".join( [ str( jobId ) for jobId, _tqId in candidates ] )
+    retVal = self.transactionStart()
+    if not retVal[ 'OK' ]:
+      return retVal
+    retVal = self._query( "SELECT JobId, TQId FROM `tq_Jobs` WHERE JobId IN ( %s ) FOR UPDATE" % jobString )
+    if retVal[ 'OK' ] and retVal[ 'Value' ]:
+      extracted = [ ( row[0], row[1] ) for row in retVal[ 'Value' ] ]
+      retVal = self._update( "DELETE FROM `tq_Jobs` WHERE JobId IN ( %s )" % ", ".join( [ str( row[0] ) for row in extracted ] ) )
+    else:
+      extracted = []
+    if not retVal[ 'OK' ]:
+      self.transactionRollback()
+      return S_ERROR( "Could not take jobs out of the TQs: %s" % retVal[ 'Message' ] )
+    retVal = self.transactionCommit()
+    if not retVal[ 'OK' ]:
+      return retVal
+    for jobId, tqId in extracted:
+      self.log.info( "Extracted job %s from TQ %s" % ( jobId, tqId ) )
+    return S_OK( extracted )
+
   def matchAndGetTaskQueue( self, tqMatchDict, numQueuesToGet = 1, skipMatchDictDef = False,
                             negativeCond = {}, connObj = False ):
     """ Get a queue that matches the requirements
@@ -889,6 +1051,8 @@ class TaskQueueDB( DB ):
         retVal = self._update( "DELETE FROM `tq_TQTo%s` WHERE TQId = %s" % ( mvField, tqId ), conn = connObj )
         if not retVal[ 'OK' ]:
           return retVal
+      if self.__tqIndex:
+        self.__tqIndex.removeTaskQueue( tqId )
       self.recalculateTQSharesForEntity( tqOwnerDN, tqOwnerGroup, connObj = connObj )
       self.log.info( "Deleted empty and enabled TQ %s" % tqId )
       return S_OK( True )
@@ -917,6 +1081,8 @@ class TaskQueueDB( DB ):
     if not retVal[ 'OK' ]:
       return S_ERROR( "Could not delete task queue %s: %s" % ( tqId, retVal[ 'Message' ] ) )
     delTQ = retVal[ 'Value' ]
+    if self.__tqIndex:
+      self.__tqIndex.removeTaskQueue( tqId )
     sqlCmd = "DELETE FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s" % tqId
     retVal = self._update( sqlCmd, conn = connObj )
     if not retVal[ 'OK' ]:
@@ -955,6 +1121,28 @@ class TaskQueueDB( DB ):
       return result
     return self.retrieveTaskQueues( [ tqTuple[0] for tqTuple in result[ 'Value' ] ] )
 
+  def retrieveTaskQueuesThatMatchResources( self, tqMatchDicts, negativeConds = None ):
+    """
+    Get the task queues that match each of the { key : tqMatchDict } resources. The task queue
+    info is retrieved once for all of them. Returns { 'TaskQueues' : { TQId : info },
+    'Matches' : { key : [ TQIds ] } }
+    """
+    if not negativeConds:
+      negativeConds = {}
+    matches = {}
+    tqIdSet = set()
+    for key in tqMatchDicts:
+      result = self.matchAndGetTaskQueue( tqMatchDicts[ key ], numQueuesToGet = 0,
+                                          negativeCond = negativeConds.get( key, {} ) )
+      if not result[ 'OK' ]:
+        return result
+      matches[ key ] = [ tqTuple[0] for tqTuple in result[ 'Value' ] ]
+      tqIdSet.update( matches[ key ] )
+    result = self.retrieveTaskQueues( list( tqIdSet ) )
+    if not result[ 'OK' ]:
+      return result
+    return S_OK( { 'TaskQueues' : result[ 'Value' ], 'Matches' : matches } )
+
   def retrieveTaskQueues( self, tqIdList = False ):
     """
     Get all the task queues
@@ -1169,6 +1357,8 @@ class TaskQueueDB( DB ):
       tqList = ", ".join( [ str( tqId ) for tqId in prioDict[ prio ] ] )
       updateSQL = "UPDATE `tq_TaskQueues` SET Priority=%.4f WHERE TQId in ( %s )" % ( prio, tqList )
       self._update( updateSQL, conn = connObj )
+    if self.__tqIndex:
+      self.__tqIndex.setPriorities( tqDict )
     return S_OK()
 
   def getGroupShares( self ):
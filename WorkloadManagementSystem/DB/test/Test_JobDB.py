@@ -0,0 +1,192 @@
+""" Test cases for the job counters and the bulk insertion of jobs of the JobDB
+"""
+
+__RCSID__ = "$Id$"
+
+import unittest
+
+from mock import patch
+
+from DIRAC import gLogger, S_OK, S_ERROR
+from DIRAC.Core.Base.DB import DB
+
+# sut
+from DIRAC.WorkloadManagementSystem.DB import JobDB as JobDBModule
+from DIRAC.WorkloadManagementSystem.DB.JobDB import JobDB
+
+def fakeDBInit( self, dbname, fullname, debug = False ):
+  self.log = gLogger.getSubLogger( dbname )
+
+class FakeJobDB( JobDB ):
+  """ JobDB answering its queries with the rows of the test instead of MySQL """
+
+  def __init__( self, options, failedStatement = None ):
+    self.options = options
+    self.failedStatement = failedStatement
+    self.updates = []
+    self.queries = []
+    #Rows of the Jobs and JobCounters tables grouped by the counter fields
+    self.jobRows = []
+    self.counterRows = []
+    self.counters = []
+    self.transactions = []
+    self.lastRowId = 0
+    with patch.object( DB, '__init__', fakeDBInit ):
+      JobDB.__init__( self )
+
+  def getCSOption( self, optionName, defaultValue = None ):
+    return self.options.get( optionName, defaultValue )
+
+  def transactionStart( self ):
+    self.transactions.append( 'start' )
+    return S_OK()
+
+  def transactionCommit( self ):
+    self.transactions.append( 'commit' )
+    return S_OK()
+
+  def transactionRollback( self ):
+    self.transactions.append( 'rollback' )
+    return S_OK()
+
+  def _escapeValues( self, inValues = None ):
+    return S_OK( [ "'%s'" % value for value in inValues ] )
+
+  def _query( self, cmd, conn = None, debug = False ):
+    self.queries.append( cmd )
+    if cmd.startswith( "SHOW TABLES LIKE 'JobCounters'" ):
+      return S_OK( ( ( 'JobCounters', ), ) )
+    if cmd.startswith( "SELECT @@innodb_autoinc_lock_mode" ):
+      return S_OK( ( ( 1, ), ) )
+    if cmd.startswith( "DESCRIBE Jobs" ):
+      return S_OK( ( ( 'JobID', ), ( 'Status', ) ) )
+    if cmd.endswith( "FROM Jobs GROUP BY %s" % ", ".join( JobDBModule.JOB_COUNTER_FIELDS ) ):
+      return S_OK( tuple( self.jobRows ) )
+    if " FROM JobCounters" in cmd:
+      return S_OK( tuple( self.counterRows ) )
+    return S_OK( () )
+
+  def _update( self, cmd, conn = None, debug = False ):
+    self.updates.append( cmd )
+    if self.failedStatement and self.failedStatement in cmd:
+      return S_ERROR( "Statement failed" )
+    result = S_OK( cmd.count( '(' ) )
+    if cmd.startswith( "INSERT INTO JobJDLs (OriginalJDL)" ):
+      #The id of the first row inserted
+      result['lastRowId'] = self.lastRowId + 1
+      self.lastRowId += cmd.count( "'[" )
+    return result
+
+  def getCounters( self, table, attrList, condDict, older = None, newer = None, timeStamp = None ):
+    self.counters.append( ( table, attrList, condDict, older ) )
+    return S_OK( [] )
+
+def counterRow( status, site, jobs, reschedules ):
+  """ Row of the counter fields with the given Status and Site """
+  values = { 'DIRACSetup' : 'Test', 'Status' : status, 'MinorStatus' : 'Minor', 'Site' : site, 'Owner' : 'owner',
+             'OwnerGroup' : 'group', 'JobGroup' : '00001', 'JobType' : 'User', 'JobSplitType' : 'Single' }
+  return tuple( [ values[ field ] for field in JobDBModule.JOB_COUNTER_FIELDS ] ) + ( jobs, reschedules )
+
+class JobCountersTestCase( unittest.TestCase ):
+
+  def testTriggersFailure( self ):
+    """ without all the triggers the jobs are counted from the Jobs table, and no trigger is left """
+    jobDB = FakeJobDB( { 'UseJobCounters' : True }, failedStatement = "CREATE TRIGGER JobCountersDelete" )
+    self.assertFalse( jobDB.jobCounters )
+    self.assertEqual( sorted( jobDB.updates[-3:] ), [ "DROP TRIGGER IF EXISTS `%s`" % name
+                                                      for name in ( 'JobCountersDelete', 'JobCountersInsert',
+                                                                    'JobCountersUpdate' ) ] )
+    jobDB.getJobCounters( [ 'Status' ] )
+    self.assertEqual( jobDB.counters, [ ( 'Jobs', [ 'Status' ], {}, None ) ] )
+
+  def testCounterQueries( self ):
+    """ the counters are read when the attributes and conditions are all counter fields """
+    jobDB = FakeJobDB( { 'UseJobCounters' : True } )
+    self.assert_( jobDB.jobCounters )
+    jobDB.counterRows = [ ( 'Running', 3.0 ), ( 'Waiting', 2.0 ) ]
+    result = jobDB.getJobCounters( [ 'Status' ], { 'Site' : 'LCG.CERN.ch' } )
+    self.assertEqual( result[ 'Value' ], [ ( { 'Status' : 'Running' }, 3 ), ( { 'Status' : 'Waiting' }, 2 ) ] )
+    self.assert_( jobDB.queries[-1].startswith( "SELECT `Status`, SUM(Jobs) FROM JobCounters" ) )
+    self.assert_( "'LCG.CERN.ch'" in jobDB.queries[-1] )
+    self.assertEqual( jobDB.counters, [] )
+    #Not counted by these fields or with a time cut
+    jobDB.getJobCounters( [ 'Status' ], { 'JobName' : 'test' } )
+    jobDB.getJobCounters( [ 'Status' ], older = '2016-01-01' )
+    self.assertEqual( [ counter[0] for counter in jobDB.counters ], [ 'Jobs', 'Jobs' ] )
+
+  def testRebuild( self ):
+    """ only the difference with the jobs is added to the counters, in chunks """
+    jobDB = FakeJobDB( { 'UseJobCounters' : True } )
+    jobDB.jobRows = [ counterRow( 'Running', 'LCG.CERN.ch', 3, 1 ), counterRow( 'Waiting', 'LCG.CERN.ch', 2, None ),
+                      counterRow( 'Done', 'LCG.CNAF.it', 1, 0 ) ]
+    jobDB.counterRows = [ counterRow( 'Running', 'LCG.CERN.ch', 3, 1 ), counterRow( 'Waiting', 'LCG.CERN.ch', 5, 0 ),
+                          counterRow( 'Failed', 'LCG.CNAF.it', 1, 2 ) ]
+    del jobDB.updates[:]
+    with patch.object( JobDBModule, 'JOB_COUNTERS_CHUNK_SIZE', 2 ):
+      result = jobDB.rebuildJobCounters()
+    self.assertEqual( result[ 'Value' ], 3 )
+    inserts = [ cmd for cmd in jobDB.updates if cmd.startswith( "INSERT INTO JobCounters" ) ]
+    self.assertEqual( len( inserts ), 2 )
+    allValues = " ".join( inserts )
+    self.assert_( "'Waiting', 'Minor', 'LCG.CERN.ch', 'owner', 'group', '00001', 'User', 'Single', -3, 0 )" in allValues )
+    self.assert_( "'Done', 'Minor', 'LCG.CNAF.it', 'owner', 'group', '00001', 'User', 'Single', 1, 0 )" in allValues )
+    self.assert_( "'Failed', 'Minor', 'LCG.CNAF.it', 'owner', 'group', '00001', 'User', 'Single', -1, -2 )" in allValues )
+    self.assertFalse( "'Running'" in allValues )
+    #The counters are never emptied, the changes of the triggers meanwhile are kept
+    self.assertEqual( jobDB.updates[-1], "DELETE FROM JobCounters WHERE Jobs = 0 AND Reschedules = 0" )
+
+def jobJDL( name, inputData = None, owner = None ):
+  jdl = '[ Executable = "run.sh"; JobName = "%s"' % name
+  if inputData:
+    jdl += '; InputData = { "%s" }' % inputData
+  if owner:
+    jdl += '; Owner = "%s"' % owner
+  return jdl + ' ]'
+
+class InsertNewJobsTestCase( unittest.TestCase ):
+
+  def setUp( self ):
+    self.jobDB = FakeJobDB( {} )
+    del self.jobDB.updates[:]
+
+  def __insert( self, jdls, bulkSize = 500 ):
+    return self.jobDB.insertNewJobsIntoDB( jdls, 'owner', '/DN=owner', 'group', 'Test', bulkSize = bulkSize )
+
+  def testBulkInsert( self ):
+    """ a block of jobs is inserted with one statement per table in one transaction """
+    result = self.__insert( ( jobJDL( 'job%d' % n, inputData = '/vo/file%d' % n ) for n in range( 3 ) ) )
+    self.assertEqual( result[ 'Value' ], [ { 'JobID' : jobID, 'Status' : 'Received', 'MinorStatus' : 'Job accepted' }
+                                           for jobID in ( 1, 2, 3 ) ] )
+    self.assertEqual( self.jobDB.transactions, [ 'start', 'commit' ] )
+    tables = [ cmd.split( ' VALUES' )[0].split()[2] for cmd in self.jobDB.updates ]
+    self.assertEqual( sorted( tables ), [ 'InputData', 'JobJDLs', 'JobJDLs', 'Jobs' ] )
+    inputData = [ cmd for cmd in self.jobDB.updates if cmd.startswith( 'INSERT INTO InputData' ) ][0]
+    self.assert_( "('2','/vo/file1')" in inputData )
+
+  def testFailedJobs( self ):
+    """ jobs failing the checks are stored as Failed without stopping the others """
+    result = self.__insert( [ jobJDL( 'job0' ), jobJDL( 'job1', owner = 'other' ), jobJDL( 'job2' ) ] )
+    self.assertEqual( [ ( job[ 'JobID' ], job[ 'Status' ], job[ 'MinorStatus' ] ) for job in result[ 'Value' ] ],
+                      [ ( 1, 'Received', 'Job accepted' ), ( 2, 'Failed', 'Wrong Owner in JDL' ),
+                        ( 3, 'Received', 'Job accepted' ) ] )
+    #No JDL for the failed job
+    jdlInsert = [ cmd for cmd in self.jobDB.updates if cmd.startswith( 'INSERT INTO JobJDLs (JobID' ) ][0]
+    self.assertEqual( [ jdlInsert.count( "('%d'," % jobID ) for jobID in ( 1, 2, 3 ) ], [ 1, 0, 1 ] )
+    jobInserts = [ cmd for cmd in self.jobDB.updates if cmd.startswith( 'INSERT INTO Jobs' ) ]
+    self.assertEqual( len( jobInserts ), 2 )
+
+  def testFailedBlock( self ):
+    """ a failing block is rolled back and the jobs of the blocks before are returned with the error """
+    self.jobDB.failedStatement = '/vo/bad'
+    jdls = [ jobJDL( 'job0' ), jobJDL( 'job1' ), jobJDL( 'job2', inputData = '/vo/bad' ), jobJDL( 'job3' ) ]
+    result = self.__insert( jdls, bulkSize = 2 )
+    self.assertFalse( result[ 'OK' ] )
+    self.assertEqual( [ job[ 'JobID' ] for job in result[ 'Jobs' ] ], [ 1, 2 ] )
+    self.assertEqual( self.jobDB.transactions, [ 'start', 'commit', 'start', 'rollback' ] )
+    #The JDLs after the failed block are not even read
+    self.assertEqual( len( [ cmd for cmd in self.jobDB.updates if cmd.startswith( 'INSERT INTO JobJDLs (OriginalJDL)' ) ] ), 2 )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( JobCountersTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( InsertNewJobsTestCase ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -97,6 +97,15 @@ class OptimizerExecutor( ExecutorModule ):
   def optimizeJob( self, jid, jobState ):
     raise Exception( "You need to overwrite this method to optimize the job!" )
 
+  def prepareTasks( self, jobStates ):
+    return self.prepareJobs( jobStates )
+
+  def prepareJobs( self, jobStates ):
+    """ Called with the dict jid -> jobState of the jobs received together before optimizing
+        them one by one. Overwrite it to fetch at once what optimizeJob needs for all of them
+    """
+    return S_OK()
+
   def setNextOptimizer( self, jobState = None ):
     if not jobState:
       jobState = self.__jobData.jobState
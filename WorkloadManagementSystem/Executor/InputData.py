@@ -39,6 +39,9 @@ class InputData( OptimizerExecutor ):
     cls.__SEToSiteMap = {}
     cls.__lastCacheUpdate = 0
     cls.__cacheLifeTime = 600
+    # replicas and metadata looked up at once for the jobs received together, by VO
+    cls.__batchReplicas = {}
+    cls.__batchMetadata = {}
 
     # Note: this is a default, that right now is generically the default for user jobs, at least for main DIRAC users
     # (since this now doesn't run for production jobs)
@@ -73,6 +76,86 @@ class InputData( OptimizerExecutor ):
         return None
       return self.__fcDict[vo]
 
+  @staticmethod
+  def __getLFNs( inputData ):
+    lfns = []
+    for lfn in inputData:
+      if lfn[:4].lower() == "lfn:":
+        lfns.append( lfn[4:] )
+      else:
+        lfns.append( lfn )
+    return lfns
+
+  def prepareJobs( self, jobStates ):
+    """ Look up in one go the replicas and metadata of the input data of all the jobs
+        that optimizeJob will have to resolve
+    """
+    self.__batchReplicas = {}
+    self.__batchMetadata = {}
+    # Lookups with the user proxy can't be shared between jobs
+    if len( jobStates ) < 2 or self.checkWithUserProxy:
+      return S_OK()
+    prodTypes = Operations().getValue( 'Transformations/DataProcessing', [] )
+    voLFNs = {}
+    for jobState in jobStates.values():
+      result = jobState.getAttribute( "JobType" )
+      if not result['OK'] or result['Value'] in prodTypes:
+        continue
+      result = jobState.getOptParameter( self.ex_getProperty( 'optimizerName' ) )
+      if result['OK'] and result['Value']:
+        continue
+      result = jobState.getInputData()
+      if not result['OK'] or not result['Value']:
+        continue
+      inputData = result['Value']
+      result = jobState.getManifest()
+      if not result['OK']:
+        continue
+      vo = result['Value'].getOption( 'VirtualOrganization' )
+      voLFNs.setdefault( vo, set() ).update( self.__getLFNs( inputData ) )
+
+    for vo in voLFNs:
+      lfns = list( voLFNs[ vo ] )
+      startTime = time.time()
+      dm = self.__getDataManager( vo )
+      if dm is None:
+        continue
+      result = dm.getActiveReplicas( lfns, preferDisk = True )
+      if not result['OK']:
+        self.log.warn( "Bulk replicas lookup failed, resolving job by job", result['Message'] )
+        continue
+      self.__batchReplicas[ vo ] = result['Value']
+      if self.ex_getOption( 'CheckFileMetadata', True ):
+        fc = self.__getFileCatalog( vo )
+        if fc is not None:
+          result = fc.getFileMetadata( lfns )
+          if result['OK']:
+            self.__batchMetadata[ vo ] = result['Value']
+          else:
+            self.log.warn( "Bulk metadata lookup failed, resolving job by job", result['Message'] )
+      self.log.info( "Catalog lookup of %s LFNs for %s jobs took %.2f seconds" % ( len( lfns ), len( jobStates ),
+                                                                                   time.time() - startTime ) )
+    return S_OK()
+
+  @staticmethod
+  def __getBatchResult( batchDict, vo, lfns ):
+    """ Successful/Failed dict for the lfns out of the bulk lookup, None if any of them was not looked up
+    """
+    if vo not in batchDict:
+      return None
+    successful = batchDict[ vo ].get( 'Successful', {} )
+    failed = batchDict[ vo ].get( 'Failed', {} )
+    lfnDict = { 'Successful' : {}, 'Failed' : {} }
+    for lfn in lfns:
+      if lfn in successful:
+        # Copied, the caller modifies it
+        lfnDict['Successful'][ lfn ] = dict( successful[ lfn ] )
+      elif lfn in failed:
+        lfnDict['Failed'][ lfn ] = failed[ lfn ]
+      else:
+        return None
+    return lfnDict
+
   def optimizeJob( self, jid, jobState ):
     """ This is the method that needs to be implemented by each and every Executor
 
@@ -132,12 +215,7 @@ class InputData( OptimizerExecutor ):
   def _resolveInputData( self, jobState, inputData ):
     """ This method checks the file catalog for replica information.
     """
-    lfns = []
-    for lfn in inputData:
-      if lfn[:4].lower() == "lfn:":
-        lfns.append( lfn[4:] )
-      else:
-        lfns.append( lfn )
+    lfns = self.__getLFNs( inputData )
 
     result = jobState.getManifest()
     if not result['OK']:
@@ -145,13 +223,16 @@ class InputData( OptimizerExecutor ):
     manifest = result['Value']
     vo = manifest.getOption( 'VirtualOrganization' )
     startTime = time.time()
-    dm = self.__getDataManager( vo )
-    if dm is None:
-      return S_ERROR( 'Failed to instantiate DataManager for vo %s' % vo )
+    replicaDict = self.__getBatchResult( self.__batchReplicas, vo, lfns )
+    if replicaDict is not None:
+      result = S_OK( replicaDict )
     else:
+      dm = self.__getDataManager( vo )
+      if dm is None:
+        return S_ERROR( 'Failed to instantiate DataManager for vo %s' % vo )
       # This will return already active replicas, excluding banned SEs, and removing tape replicas if there are disk replicas
       result = dm.getActiveReplicas( lfns, preferDisk = True )
-    self.jobLog.info( 'Catalog replicas lookup time: %.2f seconds ' % ( time.time() - startTime ) )
+      self.jobLog.info( 'Catalog replicas lookup time: %.2f seconds ' % ( time.time() - startTime ) )
     if not result['OK']:
       self.log.warn( result['Message'] )
       return result
@@ -173,12 +254,15 @@ class InputData( OptimizerExecutor ):
         return result
       manifest = result['Value']
       vo = manifest.getOption( 'VirtualOrganization' )
-      fc = self.__getFileCatalog( vo )
-      if fc is None:
-        return S_ERROR( 'Failed to instantiate FileCatalog for vo %s' % vo )
+      metadataDict = self.__getBatchResult( self.__batchMetadata, vo, lfns )
+      if metadataDict is not None:
+        guidDict = S_OK( metadataDict )
       else:
+        fc = self.__getFileCatalog( vo )
+        if fc is None:
+          return S_ERROR( 'Failed to instantiate FileCatalog for vo %s' % vo )
         guidDict = fc.getFileMetadata( lfns )
-      self.jobLog.info( 'Catalog Metadata Lookup Time: %.2f seconds ' % ( time.time() - startTime ) )
+        self.jobLog.info( 'Catalog Metadata Lookup Time: %.2f seconds ' % ( time.time() - startTime ) )
 
       if not guidDict['OK']:
         self.log.warn( guidDict['Message'] )
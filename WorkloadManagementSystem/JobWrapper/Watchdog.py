@@ -65,6 +65,8 @@ class Watchdog( object ):
     self.testMemoryLimit = 0
     self.testTimeLeft = 1
     self.pollingTime = 10  # 10 seconds
+    self.samplingTime = 60  # 1 minute
+    self.lastSampleTime = 0
     self.checkingTime = 30 * 60  # 30 minute period
     self.minCheckingTime = 20 * 60  # 20 mins
     self.maxWallClockTime = 3 * 24 * 60 * 60  # e.g. 4 days
@@ -128,6 +130,11 @@ class Watchdog( object ):
     if self.checkingTime < self.minCheckingTime:
       self.log.info( 'Requested CheckingTime of %s setting to %s seconds (minimum)' % ( self.checkingTime, self.minCheckingTime ) )
       self.checkingTime = self.minCheckingTime
+    # Resource usage samples between checks, the heart beat reports their statistics
+    self.samplingTime = max( self.pollingTime, gConfig.getValue( self.section + '/SamplingTime', 60 ) )
+    maxSamples = gConfig.getValue( self.section + '/MaxSamples', int( self.checkingTime / self.samplingTime ) )
+    self.processMonitor.setMaxSamples( maxSamples )
+    self.processMonitor.useCgroups = gConfig.getValue( self.section + '/UseCgroups', True )
 
     # The time left is returned in seconds @ 250 SI00 = 1 HS06,
     # the self.checkingTime and self.pollingTime are in seconds,
@@ -196,6 +203,9 @@ class Watchdog( object ):
       return S_OK()
     else:
       # self.log.debug('Application thread is alive: checking count is %s' %(self.checkCount))
+      # The checks take their own sample
+      if time.time() - self.lastSampleTime >= self.samplingTime:
+        self.__sampleResources()
       return S_OK()
 
 
@@ -232,10 +242,12 @@ class Watchdog( object ):
         self.parameters['MemoryUsed'] = []
       self.parameters['MemoryUsed'].append( memoryUsed )
 
-    result = self.processMonitor.getMemoryConsumed( self.wrapperPID )
+    sample = None
+    result = self.__sampleResources()
     if result['OK']:
-      vsize = result['Value']['Vsize']/1024.
-      rss = result['Value']['RSS']/1024.
+      sample = result['Value']
+      vsize = sample['Vsize']/1024.
+      rss = sample['RSS']/1024.
       heartBeatDict['Vsize'] = vsize
       heartBeatDict['RSS'] = rss
       self.parameters.setdefault( 'Vsize', [] )
@@ -244,6 +256,11 @@ class Watchdog( object ):
       self.parameters['RSS'].append( rss )
       msg += "Job Vsize: %.1f kb " % vsize
       msg += "Job RSS: %.1f kb " % rss
+      if 'ReadBytes' in sample:
+        heartBeatDict['ReadBytes'] = sample['ReadBytes']
+        heartBeatDict['WriteBytes'] = sample['WriteBytes']
+        msg += "Job IO: %.1f MB read %.1f MB written " % ( sample['ReadBytes'] / 1048576., sample['WriteBytes'] / 1048576. )
+      heartBeatDict.update( self.__getSamplesSummary() )
     result = self.getDiskSpace()
     if not result['OK']:
       self.log.warn( "Could not establish DiskSpace", result['Message'] )
@@ -255,7 +272,7 @@ class Watchdog( object ):
       self.parameters['DiskSpace'].append( result['Value'] )
       heartBeatDict['AvailableDiskSpace'] = result['Value']
     
-    cpu = self.__getCPU()
+    cpu = self.__getCPU( sample )
     if not cpu['OK']:
       msg += 'CPU: ERROR '
       hmsCPU = 0
@@ -333,11 +350,36 @@ class Watchdog( object ):
     return S_OK( 'Watchdog checking cycle complete' )
 
   #############################################################################
-  def __getCPU( self ):
-    """Uses os.times() to get CPU time and returns HH:MM:SS after conversion.
+  def __sampleResources( self ):
+    """ Takes a sample of the resources used by the job, kept by the process monitor
+    """
+    self.lastSampleTime = time.time()
+    result = self.processMonitor.sampleResources( self.wrapperPID )
+    if not result['OK']:
+      self.log.warn( 'Could not sample the resources used by the job', result['Message'] )
+    return result
+
+  #############################################################################
+  def __getSamplesSummary( self ):
+    """ Statistics of the resources used over the last samples, memory in kb
+    """
+    summary = {}
+    for name, stats in self.processMonitor.getSamplesSummary( ( 'RSS', 'Vsize', 'CPUUsage' ) ).items():
+      for stat, value in stats.items():
+        if name in ( 'RSS', 'Vsize' ):
+          value = value / 1024.
+        summary[ '%s%s' % ( name, stat ) ] = value
+    return summary
+
+  #############################################################################
+  def __getCPU( self, sample = None ):
+    """Uses the CPU time of the sample, or measures it, and returns HH:MM:SS after conversion.
     """
     try:
-      cpuTime = self.processMonitor.getCPUConsumed( self.wrapperPID )
+      if sample:
+        cpuTime = S_OK( sample['CPU'] )
+      else:
+        cpuTime = self.processMonitor.getCPUConsumed( self.wrapperPID )
       if not cpuTime['OK']:
         self.log.warn( 'Problem while checking consumed CPU' )
         return cpuTime
@@ -674,13 +716,15 @@ class Watchdog( object ):
     self.initialValues['MemoryUsed'] = memUsed
     self.parameters['MemoryUsed'] = []
     
-    result = self.processMonitor.getMemoryConsumed( self.wrapperPID )
-    self.log.verbose( 'Job Memory: %s' % ( result['Value'] ) )
+    result = self.__sampleResources()
     if not result['OK']:
       self.log.warn( 'Could not get job memory usage' )
-
-    self.initialValues['Vsize'] = result['Value']['Vsize']/1024.
-    self.initialValues['RSS'] = result['Value']['RSS']/1024.
+      self.initialValues['Vsize'] = 0.
+      self.initialValues['RSS'] = 0.
+    else:
+      self.log.verbose( 'Job Memory: Vsize %s RSS %s' % ( result['Value']['Vsize'], result['Value']['RSS'] ) )
+      self.initialValues['Vsize'] = result['Value']['Vsize']/1024.
+      self.initialValues['RSS'] = result['Value']['RSS']/1024.
     self.parameters['Vsize'] = []
     self.parameters['RSS'] = []
 
@@ -13,10 +13,11 @@
 __RCSID__ = "$Id$"
 
 from DIRAC.WorkloadManagementSystem.JobWrapper.Watchdog  import Watchdog
-from DIRAC.Core.Utilities.Subprocess                     import shellCall
 from DIRAC                                               import S_OK, S_ERROR
 from DIRAC.Core.Utilities.Os import getDiskSpace
 
+import os
+import pwd
 import string
 import socket
 
@@ -49,9 +50,10 @@ class WatchdogLinux( Watchdog ):
       memInfo.close()
       result["Memory(kB)"] = string.replace( string.replace( string.split( info[3], ":" )[1], " ", "" ), "\n", "" )
       account = 'Unknown'
-      localID = shellCall(10,'whoami')
-      if localID['OK']:
-        account = localID['Value'][1].strip()
+      try:
+        account = pwd.getpwuid( os.getuid() ).pw_name
+      except KeyError:
+        pass
       result["LocalAccount"] = account
     except Exception as x:
       self.log.fatal('Watchdog failed to obtain node information with Exception:')
@@ -66,24 +68,25 @@ class WatchdogLinux( Watchdog ):
   def getLoadAverage(self):
     """Obtains the load average.
     """
-    comm = '/bin/cat /proc/loadavg'
-    loadAvgDict = shellCall( 5, comm )
-    if loadAvgDict['OK']:
-      return S_OK( float( string.split( loadAvgDict['Value'][1] )[0] ) )
-    else:
+    try:
+      return S_OK( os.getloadavg()[0] )
+    except OSError:
       self.log.warn( 'Could not obtain load average' )
       return S_ERROR( 'Could not obtain load average' )
 
   #############################################################################
   def getMemoryUsed(self):
-    """Obtains the memory used.
+    """Obtains the memory used in kB, total minus free.
     """
-    comm = '/usr/bin/free'
-    memDict = shellCall( 5, comm )
-    if memDict['OK']:
-      mem = string.split(memDict['Value'][1]) [8]
-      return S_OK( float( mem ) )
-    else:
+    memInfo = {}
+    try:
+      with open( '/proc/meminfo', 'r' ) as fopen:
+        for line in fopen:
+          fields = line.split()
+          if len( fields ) >= 2:
+            memInfo[ fields[0].rstrip( ':' ) ] = float( fields[1] )
+      return S_OK( memInfo['MemTotal'] - memInfo['MemFree'] )
+    except ( IOError, KeyError, ValueError ):
       self.log.warn( 'Could not obtain memory used' )
       return S_ERROR( 'Could not obtain memory used' )
 
@@ -23,6 +23,7 @@ from DIRAC.WorkloadManagementSystem.Service.JobPolicy import JobPolicy, \
                                                              RIGHT_SUBMIT, RIGHT_RESCHEDULE, \
                                                              RIGHT_DELETE, RIGHT_KILL, RIGHT_RESET
 from DIRAC.Core.Utilities.ClassAd.ClassAdLight import ClassAd
+from DIRAC.WorkloadManagementSystem.Utilities.ParametricJob import generateParametricJobs
 from DIRAC.FrameworkSystem.Client.ProxyManagerClient import gProxyManager
 from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
 from DIRAC.StorageManagementSystem.Client.StorageManagerClient import StorageManagerClient
@@ -161,35 +162,21 @@ class JobManagerHandler( RequestHandler ):
       if len( parameterList ) > self.maxParametricJobs:
         return S_ERROR( 'The number of parametric jobs exceeded the limit of %d' % self.maxParametricJobs )
 
-      jobDescList = []
-      nParam = len( parameterList ) - 1
-      for n, p in enumerate( parameterList ):
-        newJobDesc = jobDesc.replace( '%s', str( p ) ).replace( '%n', str( n ).zfill( len( str( nParam ) ) ) )
-        newClassAd = ClassAd( newJobDesc )
-        for attr in ['Parameters', 'ParameterStep', 'ParameterFactor']:
-          newClassAd.deleteAttribute( attr )
-        if type( p ) == type ( ' ' ) and p.startswith( '{' ):
-          newClassAd.insertAttributeInt( 'Parameter', str( p ) )
-        else:
-          newClassAd.insertAttributeString( 'Parameter', str( p ) )
-        newClassAd.insertAttributeInt( 'ParameterNumber', n )
-        newJDL = newClassAd.asJDL()
-        jobDescList.append( newJDL )
+      #The JDLs of the jobs are only generated while they are inserted in bulk
+      result = gJobDB.insertNewJobsIntoDB( generateParametricJobs( jobClassAd, parameterList ),
+                                           self.owner, self.ownerDN, self.ownerGroup, self.diracSetup )
+      if not result['OK']:
+        #The jobs inserted before the failure are handled anyway
+        self.__registerNewJobs( result.get( 'Jobs', [] ) )
+        return result
+      newJobs = result['Value']
     else:
-      jobDescList = [ jobDesc ]
-
-    jobIDList = []
-    for jobDescription in jobDescList:
-      result = gJobDB.insertNewJobIntoDB( jobDescription, self.owner, self.ownerDN, self.ownerGroup, self.diracSetup )
+      result = gJobDB.insertNewJobIntoDB( jobDesc, self.owner, self.ownerDN, self.ownerGroup, self.diracSetup )
       if not result['OK']:
         return result
+      newJobs = [ { 'JobID' : result['JobID'], 'Status' : result['Status'], 'MinorStatus' : result['MinorStatus'] } ]
 
-      jobID = result['JobID']
-      gLogger.info( 'Job %s added to the JobDB for %s/%s' % ( jobID, self.ownerDN, self.ownerGroup ) )
-
-      gJobLoggingDB.addLoggingRecord( jobID, result['Status'], result['MinorStatus'], source = 'JobManager' )
-
-      jobIDList.append( jobID )
+    jobIDList = [ job['JobID'] for job in newJobs ]
 
     #Set persistency flag
     retVal = gProxyManager.getUserPersistence( self.ownerDN, self.ownerGroup )
@@ -203,9 +190,26 @@ class JobManagerHandler( RequestHandler ):
 
     result['JobID'] = result['Value']
     result[ 'requireProxyUpload' ] = self.__checkIfProxyUploadIsRequired()
-    self.__sendJobsToOptimizationMind( jobIDList )
+    self.__registerNewJobs( newJobs )
     return result
 
+  def __registerNewJobs( self, newJobs ):
+    """ Add the initial logging records of the new jobs and send them to the optimizers in one go
+    """
+    if not newJobs:
+      return
+    jobIDList = [ job['JobID'] for job in newJobs ]
+    gLogger.info( '%s jobs added to the JobDB for %s/%s' % ( len( jobIDList ), self.ownerDN, self.ownerGroup ),
+                  '%s-%s' % ( jobIDList[0], jobIDList[-1] ) )
+    jobsByStatus = {}
+    for job in newJobs:
+      jobsByStatus.setdefault( ( job['Status'], job['MinorStatus'] ), [] ).append( job['JobID'] )
+    for ( status, minorStatus ), jobIDs in jobsByStatus.items():
+      result = gJobLoggingDB.addLoggingRecords( jobIDs, status, minorStatus, source = 'JobManager' )
+      if not result['OK']:
+        gLogger.error( 'Cannot add the logging records of the new jobs', result['Message'] )
+    self.__sendJobsToOptimizationMind( jobIDList )
+
 ###########################################################################
   def __checkIfProxyUploadIsRequired( self ):
     result = gProxyManager.userHasProxy( self.ownerDN, self.ownerGroup, validSeconds = 18000 )
@@ -172,7 +172,7 @@ class JobMonitoringHandler( RequestHandler ):
     if not attrDict:
       attrDict = {}
 
-    return gJobDB.getCounters( 'Jobs', attrList, attrDict, newer = cutDate, timeStamp = 'LastUpdateTime' )
+    return gJobDB.getJobCounters( attrList, attrDict, newer = cutDate, timeStamp = 'LastUpdateTime' )
 
 ##############################################################################
   types_getCurrentJobCounters = [ ]
@@ -184,7 +184,7 @@ class JobMonitoringHandler( RequestHandler ):
 
     if not attrDict:
       attrDict = {}
-    result = gJobDB.getCounters( 'Jobs', ['Status'], attrDict, timeStamp = 'LastUpdateTime' )
+    result = gJobDB.getJobCounters( ['Status'], attrDict, timeStamp = 'LastUpdateTime' )
     if not result['OK']:
       return result
     last_update = Time.dateTime() - Time.day
@@ -335,10 +335,10 @@ class JobMonitoringHandler( RequestHandler ):
       orderAttribute = None
 
     statusDict = {}
-    result = gJobDB.getCounters( 'Jobs', ['Status'], selectDict,
-                               newer = startDate,
-                               older = endDate,
-                               timeStamp = 'LastUpdateTime' )
+    result = gJobDB.getJobCounters( ['Status'], selectDict,
+                                    newer = startDate,
+                                    older = endDate,
+                                    timeStamp = 'LastUpdateTime' )
 
     nJobs = 0
     if result['OK']:
@@ -430,10 +430,10 @@ class JobMonitoringHandler( RequestHandler ):
     if endDate:
       del selectDict['ToDate']
 
-    result = gJobDB.getCounters( 'Jobs', [attribute], selectDict,
-                               newer = startDate,
-                               older = endDate,
-                               timeStamp = 'LastUpdateTime' )
+    result = gJobDB.getJobCounters( [attribute], selectDict,
+                                    newer = startDate,
+                                    older = endDate,
+                                    timeStamp = 'LastUpdateTime' )
     resultDict = {}
     if result['OK']:
       for cDict, count in result['Value']:
@@ -16,15 +16,20 @@ __RCSID__ = "$Id$"
 from types import StringTypes, IntType, LongType, ListType, DictType
 # from types import *
 import time
-from DIRAC.Core.DISET.RequestHandler import RequestHandler
+from DIRAC.Core.DISET.RequestHandler import RequestHandler, getServiceOption
 from DIRAC.Core.Utilities import Time
+from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
 from DIRAC import gLogger, S_OK, S_ERROR
+from DIRAC.FrameworkSystem.Client.MonitoringClient import gMonitor
 from DIRAC.WorkloadManagementSystem.DB.JobDB import JobDB
 from DIRAC.WorkloadManagementSystem.DB.JobLoggingDB import JobLoggingDB
+from DIRAC.WorkloadManagementSystem.private.HeartBeatBuffer import HeartBeatBuffer
 
 # This is a global instance of the JobDB class
 jobDB = False
 logDB = False
+# Heart beats waiting to be written in the JobDB, if buffering is enabled
+heartBeatBuffer = False
 
 JOB_FINAL_STATES = ['Done', 'Completed', 'Failed']
 
@@ -32,10 +37,39 @@ def initializeJobStateUpdateHandler( serviceInfo ):
 
   global jobDB
   global logDB
+  global heartBeatBuffer
   jobDB = JobDB()
   logDB = JobLoggingDB()
+  if getServiceOption( serviceInfo, "HeartBeatBuffering", False ):
+    gMonitor.registerActivity( 'heartBeatsWritten', "Heart beats written",
+                               'JobStateUpdate', "heart beats", gMonitor.OP_RATE, 300 )
+    gMonitor.registerActivity( 'heartBeatFlushTime', "Heart beat flush time",
+                               'JobStateUpdate', "secs", gMonitor.OP_MEAN, 300 )
+    gMonitor.registerActivity( 'heartBeatQueue', "Heart beats waiting",
+                               'JobStateUpdate', "heart beats", gMonitor.OP_MEAN, 300 )
+    heartBeatBuffer = HeartBeatBuffer( jobDB,
+                                       flushPeriod = getServiceOption( serviceInfo, "HeartBeatFlushPeriod", 1.0 ),
+                                       flushSize = getServiceOption( serviceInfo, "HeartBeatFlushSize", 500 ),
+                                       maxSize = getServiceOption( serviceInfo, "HeartBeatBufferSize", 50000 ),
+                                       flushCallback = markHeartBeatFlush )
+    heartBeatBuffer.start()
+    gThreadScheduler.addPeriodicTask( 60, sendHeartBeatQueueDepth )
   return S_OK()
 
+def finalizeJobStateUpdateHandler():
+  """ Write the buffered heart beats before stopping
+  """
+  if not heartBeatBuffer:
+    return S_OK()
+  return heartBeatBuffer.stop()
+
+def markHeartBeatFlush( numHeartBeats, flushTime ):
+  gMonitor.addMark( 'heartBeatsWritten', numHeartBeats )
+  gMonitor.addMark( 'heartBeatFlushTime', flushTime )
+
+def sendHeartBeatQueueDepth():
+  gMonitor.addMark( 'heartBeatQueue', len( heartBeatBuffer ) )
+
 class JobStateUpdateHandler( RequestHandler ):
 
   ###########################################################################
@@ -316,7 +350,12 @@ class JobStateUpdateHandler( RequestHandler ):
     """ Send a heart beat sign of life for a job jobID
     """
 
-    result = jobDB.setHeartBeatData( int( jobID ), staticData, dynamicData )
+    result = S_ERROR()
+    if heartBeatBuffer:
+      result = heartBeatBuffer.add( int( jobID ), staticData, dynamicData )
+    #Written straight away if the buffer is disabled or full
+    if not result['OK']:
+      result = jobDB.setHeartBeatData( int( jobID ), staticData, dynamicData )
     if not result['OK']:
       gLogger.warn( 'Failed to set the heart beat data for job %d ' % int( jobID ) )
 
@@ -6,22 +6,24 @@
 
 __RCSID__ = "$Id$"
 
-from types import StringTypes, DictType, StringTypes
+from types import StringTypes, DictType, StringTypes, IntType, LongType
 
 from DIRAC                                               import gLogger, S_OK, S_ERROR
 
 from DIRAC.Core.Utilities.ThreadScheduler                import gThreadScheduler
-from DIRAC.Core.DISET.RequestHandler                     import RequestHandler
+from DIRAC.Core.DISET.RequestHandler                     import RequestHandler, getServiceOption
 
 from DIRAC.FrameworkSystem.Client.MonitoringClient       import gMonitor
 
 from DIRAC.WorkloadManagementSystem.DB.JobDB             import JobDB
-from DIRAC.WorkloadManagementSystem.DB.TaskQueueDB       import TaskQueueDB
+from DIRAC.WorkloadManagementSystem.DB.TaskQueueDB       import TaskQueueDB, multiValueMatchFields, tagMatchFields, \
+                                                                bannedJobMatchFields, strictRequireMatchFields
 from DIRAC.WorkloadManagementSystem.DB.JobLoggingDB      import JobLoggingDB
 from DIRAC.WorkloadManagementSystem.DB.PilotAgentsDB     import PilotAgentsDB
 
 from DIRAC.WorkloadManagementSystem.Client.Matcher       import Matcher
 from DIRAC.WorkloadManagementSystem.Client.Limiter       import Limiter
+from DIRAC.WorkloadManagementSystem.private.TaskQueueIndex import TaskQueueIndex
 from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
 
 gJobDB = False
@@ -53,6 +55,19 @@ def initializeMatcherHandler( serviceInfo ):
 
   gTaskQueueDB.recalculateTQSharesForAll()
   gThreadScheduler.addPeriodicTask( 120, gTaskQueueDB.recalculateTQSharesForAll )
+
+  if getServiceOption( serviceInfo, "UseTaskQueueIndex", False ):
+    tqIndex = TaskQueueIndex( multiValueMatchFields, tagMatchFields,
+                              bannedJobMatchFields, strictRequireMatchFields )
+    result = gTaskQueueDB.setTaskQueueIndex( tqIndex )
+    if not result[ 'OK' ]:
+      return result
+    gLogger.info( "Matching with the task queue index", "%s task queues loaded" % result[ 'Value' ] )
+    #TQs are created by other processes, pick them up and reconcile the index from time to time
+    gThreadScheduler.addPeriodicTask( getServiceOption( serviceInfo, "TaskQueueIndexRefresh", 10 ),
+                                      gTaskQueueDB.refreshTaskQueueIndex )
+    gThreadScheduler.addPeriodicTask( getServiceOption( serviceInfo, "TaskQueueIndexReload", 600 ),
+                                      gTaskQueueDB.refreshTaskQueueIndex, taskArgs = ( True, ) )
   gThreadScheduler.addPeriodicTask( 60, sendNumTaskQueues )
 
   sendNumTaskQueues()
@@ -102,6 +117,36 @@ class MatcherHandler( RequestHandler ):
       # FIXME: This is correctly interpreted by the JobAgent, but DErrno should be used instead
       return S_ERROR( "No match found" )
 
+##############################################################################
+  types_requestJobs = [ list( StringTypes ) + [DictType], [ IntType, LongType ] ]
+  def export_requestJobs( self, resourceDescription, numJobs ):
+    """ Serve up to numJobs jobs to a resource with several slots ( multi core
+        or whole node pilots ) with a single matching
+    """
+
+    numJobs = max( 1, min( numJobs, self.srv_getCSOption( "MaxJobsPerRequest", 64 ) ) )
+    resourceDescription['Setup'] = self.serviceInfoDict['clientSetup']
+    credDict = self.getRemoteCredentials()
+
+    try:
+      opsHelper = Operations( group = credDict['group'] )
+      matcher = Matcher( pilotAgentsDB = pilotAgentsDB,
+                         jobDB = gJobDB,
+                         tqDB = gTaskQueueDB,
+                         jlDB = jlDB,
+                         opsHelper = opsHelper )
+      result = matcher.selectJobs( resourceDescription, credDict, numJobs )
+    except RuntimeError, rte:
+      self.log.error( "Error requesting jobs: ", rte )
+      return S_ERROR( "Error requesting jobs" )
+
+    gMonitor.addMark( "matchesDone" )
+    if result:
+      gMonitor.addMark( "matchesOK", len( result ) )
+      return S_OK( result )
+    else:
+      return S_ERROR( "No match found" )
+
 ##############################################################################
   types_getActiveTaskQueues = []
   def export_getActiveTaskQueues( self ):
@@ -120,6 +165,25 @@ class MatcherHandler( RequestHandler ):
       negativeCond = self.limiter.getNegativeCond()
     return gTaskQueueDB.retrieveTaskQueuesThatMatch( resourceDict, negativeCond = negativeCond )
 
+##############################################################################
+  types_getMatchingTaskQueuesForResources = [ DictType ]
+  def export_getMatchingTaskQueuesForResources( self, resourceDicts ):
+    """ Return the task queues matching each of the { key : resourceDict } resources
+    """
+    negativeConds = {}
+    siteConds = {}
+    for key in resourceDicts:
+      site = resourceDicts[ key ].get( 'Site' )
+      if type( site ) not in StringTypes:
+        site = None
+      if site not in siteConds:
+        if site:
+          siteConds[ site ] = self.limiter.getNegativeCondForSite( site )
+        else:
+          siteConds[ site ] = self.limiter.getNegativeCond()
+      negativeConds[ key ] = siteConds[ site ]
+    return gTaskQueueDB.retrieveTaskQueuesThatMatchResources( resourceDicts, negativeConds )
+
 ##############################################################################
   types_matchAndGetTaskQueue = [ DictType ]
   def export_matchAndGetTaskQueue( self, resourceDict ):
@@ -593,6 +593,14 @@ class WMSAdministratorHandler(RequestHandler):
     result = pilotDB.countPilots(condDict, older, newer, timeStamp )
     return result
 
+  ##########################################################################################
+  types_countPilotsPerTaskQueue = [ DictType ]
+  def export_countPilotsPerTaskQueue(self,condDict, older=None, newer=None, timeStamp='SubmissionTime'):
+    """ Count the pilots of each task queue
+    """
+
+    return pilotDB.countPilotsPerTaskQueue(condDict, older, newer, timeStamp )
+
   ##########################################################################################
   types_getCounters = [ StringTypes, ListType, DictType ]
   def export_getCounters(self, table, keys, condDict, newer=None, timeStamp='SubmissionTime'):
@@ -0,0 +1,24 @@
+""" Generation of the jobs of a parametric job from its template
+"""
+__RCSID__ = "$Id$"
+
+from DIRAC.Core.Utilities.ClassAd.ClassAdLight import ClassAd
+
+def generateParametricJobs( jobClassAd, parameterList ):
+  """ Yield the JDLs of the jobs of a parametric job, one per parameter, from its already
+      parsed template. %s is replaced by the parameter and %n by the parameter number
+  """
+  for attr in ['Parameters', 'ParameterStep', 'ParameterFactor']:
+    jobClassAd.deleteAttribute( attr )
+  nParam = len( parameterList ) - 1
+  for n, p in enumerate( parameterList ):
+    pNumber = str( n ).zfill( len( str( nParam ) ) )
+    newClassAd = ClassAd( '[]' )
+    for name, value in jobClassAd.contents.items():
+      newClassAd.set_expression( name, value.replace( '%s', str( p ) ).replace( '%n', pNumber ) )
+    if type( p ) == type ( ' ' ) and p.startswith( '{' ):
+      newClassAd.insertAttributeInt( 'Parameter', str( p ) )
+    else:
+      newClassAd.insertAttributeString( 'Parameter', str( p ) )
+    newClassAd.insertAttributeInt( 'ParameterNumber', n )
+    yield newClassAd.asJDL()
@@ -0,0 +1,43 @@
+""" Test cases for the generation of the jobs of parametric jobs
+"""
+
+__RCSID__ = "$Id$"
+
+import unittest
+
+from DIRAC.Core.Utilities.ClassAd.ClassAdLight import ClassAd
+
+# sut
+from DIRAC.WorkloadManagementSystem.Utilities.ParametricJob import generateParametricJobs
+
+class ParametricJobTestCase( unittest.TestCase ):
+
+  def testGeneration( self ):
+    """ one JDL per parameter, with the placeholders replaced """
+    template = ClassAd( '[ Executable = "run.sh"; Arguments = "%s %n"; JobName = "job_%n"; '
+                        'Parameters = 11; ParameterStart = 1; ParameterStep = 2 ]' )
+    parameterList = [ 1 + 2 * n for n in range( 11 ) ]
+    jdls = generateParametricJobs( template, parameterList )
+    #Generated while they are consumed
+    self.assertFalse( isinstance( jdls, list ) )
+    jobs = [ ClassAd( jdl ) for jdl in jdls ]
+    self.assertEqual( len( jobs ), 11 )
+    self.assertEqual( jobs[0].getAttributeString( 'Arguments' ), '1 00' )
+    self.assertEqual( jobs[10].getAttributeString( 'Arguments' ), '21 10' )
+    self.assertEqual( jobs[3].getAttributeString( 'JobName' ), 'job_03' )
+    self.assertEqual( jobs[3].getAttributeString( 'Parameter' ), '7' )
+    self.assertEqual( jobs[3].getAttributeInt( 'ParameterNumber' ), 3 )
+    for attr in ( 'Parameters', 'ParameterStep', 'ParameterFactor' ):
+      self.assertFalse( jobs[0].lookupAttribute( attr ) )
+
+  def testListParameters( self ):
+    """ parameters given as a list, including sub JDLs """
+    template = ClassAd( '[ Executable = "run.sh"; Arguments = "%s"; Parameters = { "a", "b" } ]' )
+    jobs = [ ClassAd( jdl ) for jdl in generateParametricJobs( template, [ 'a', '{ "x", "y" }' ] ) ]
+    self.assertEqual( jobs[0].getAttributeString( 'Arguments' ), 'a' )
+    self.assertEqual( jobs[0].getAttributeString( 'Parameter' ), 'a' )
+    self.assertEqual( jobs[1].getListFromExpression( 'Parameter' ), [ 'x', 'y' ] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( ParametricJobTestCase )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,149 @@
+""" HeartBeatBuffer keeps the heart beats received by the JobStateUpdate service
+    in memory and writes them in the JobDB in bulk
+"""
+
+__RCSID__ = "$Id$"
+
+import time
+import threading
+
+from DIRAC import gLogger, S_OK, S_ERROR
+from DIRAC.Core.Utilities import Time
+
+class HeartBeatBuffer( object ):
+
+  def __init__( self, jobDB, flushPeriod = 1.0, flushSize = 500, maxSize = 50000, flushCallback = None ):
+    """ Heart beats are written every flushPeriod seconds, or as soon as flushSize
+        of them are waiting. At most maxSize are kept while the DB can't be written.
+        flushCallback( numHeartBeats, flushTime ) is called after each successful flush
+    """
+    self.__jobDB = jobDB
+    self.__flushPeriod = max( 0.01, flushPeriod )
+    self.__flushSize = max( 1, flushSize )
+    self.__maxSize = max( self.__flushSize, maxSize )
+    self.__flushCallback = flushCallback
+    self.__heartBeats = []
+    self.__cond = threading.Condition()
+    self.__flushLock = threading.Lock()
+    self.__alive = False
+    self.__thread = None
+    self.__stats = { 'received' : 0, 'flushed' : 0, 'flushes' : 0, 'failedFlushes' : 0,
+                     'dropped' : 0, 'lastFlushTime' : 0.0 }
+    self.log = gLogger.getSubLogger( "HeartBeatBuffer" )
+
+  def __len__( self ):
+    return len( self.__heartBeats )
+
+  def start( self ):
+    """ Start the thread flushing the buffer """
+    if self.__thread and self.__thread.isAlive():
+      return
+    self.__alive = True
+    self.__thread = threading.Thread( target = self.__flushLoop, name = "HeartBeatBuffer" )
+    self.__thread.setDaemon( 1 )
+    self.__thread.start()
+
+  def stop( self, timeout = 30 ):
+    """ Stop the flushing thread and write the heart beats still waiting """
+    self.__cond.acquire()
+    try:
+      self.__alive = False
+      self.__cond.notify()
+    finally:
+      self.__cond.release()
+    if self.__thread:
+      self.__thread.join( timeout )
+      self.__thread = None
+    return self.flush()
+
+  def add( self, jobID, staticData, dynamicData ):
+    """ Queue the heart beat of a job. Fails if the buffer is full
+    """
+    heartBeatTime = Time.dateTime().strftime( "%Y-%m-%d %H:%M:%S" )
+    self.__cond.acquire()
+    try:
+      if len( self.__heartBeats ) >= self.__maxSize:
+        return S_ERROR( "Heart beat buffer is full" )
+      self.__heartBeats.append( ( jobID, staticData, dynamicData, heartBeatTime ) )
+      self.__stats[ 'received' ] += 1
+      if len( self.__heartBeats ) >= self.__flushSize:
+        self.__cond.notify()
+    finally:
+      self.__cond.release()
+    return S_OK()
+
+  def getStats( self ):
+    self.__cond.acquire()
+    try:
+      stats = dict( self.__stats )
+      stats[ 'queued' ] = len( self.__heartBeats )
+    finally:
+      self.__cond.release()
+    return stats
+
+  def flush( self ):
+    """ Write the waiting heart beats in the JobDB
+    """
+    self.__flushLock.acquire()
+    try:
+      self.__cond.acquire()
+      try:
+        heartBeats = self.__heartBeats
+        self.__heartBeats = []
+      finally:
+        self.__cond.release()
+      if not heartBeats:
+        return S_OK( 0 )
+      start = time.time()
+      try:
+        result = self.__jobDB.setHeartBeatDataBulk( heartBeats )
+      except Exception as excp:
+        self.log.exception( "Exception while writing heart beats" )
+        result = S_ERROR( "Exception while writing heart beats: %s" % excp )
+      flushTime = time.time() - start
+      if not result[ 'OK' ]:
+        self.log.error( "Cannot write %s heart beats" % len( heartBeats ), result[ 'Message' ] )
+        self.__requeue( heartBeats )
+        return result
+      self.__cond.acquire()
+      try:
+        self.__stats[ 'flushed' ] += len( heartBeats )
+        self.__stats[ 'flushes' ] += 1
+        self.__stats[ 'lastFlushTime' ] = flushTime
+      finally:
+        self.__cond.release()
+      if self.__flushCallback:
+        self.__flushCallback( len( heartBeats ), flushTime )
+      return S_OK( len( heartBeats ) )
+    finally:
+      self.__flushLock.release()
+
+  def __requeue( self, heartBeats ):
+    """ Put back heart beats that could not be written, dropping the oldest ones if there is no room
+    """
+    self.__cond.acquire()
+    try:
+      self.__stats[ 'failedFlushes' ] += 1
+      heartBeats = heartBeats + self.__heartBeats
+      dropped = len( heartBeats ) - self.__maxSize
+      if dropped > 0:
+        self.__stats[ 'dropped' ] += dropped
+        self.log.warn( "Heart beat buffer is full. Dropping %s heart beats" % dropped )
+        heartBeats = heartBeats[ dropped: ]
+      self.__heartBeats = heartBeats
+    finally:
+      self.__cond.release()
+
+  def __flushLoop( self ):
+    while True:
+      self.__cond.acquire()
+      try:
+        if self.__alive and len( self.__heartBeats ) < self.__flushSize:
+          self.__cond.wait( self.__flushPeriod )
+        if not self.__alive:
+          return
+      finally:
+        self.__cond.release()
+      if not self.flush()[ 'OK' ]:
+        #Don't hammer a DB that can't be written
+        time.sleep( self.__flushPeriod )
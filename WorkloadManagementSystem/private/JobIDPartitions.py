@@ -0,0 +1,97 @@
+""" JobIDPartitions keeps the tables holding per job records, like the heart beats or
+    the logging records, partitioned by blocks of JobIDs. The queries by JobID only read
+    the partition of the job, and once all the jobs of a block have been removed from
+    the JobDB its partition is dropped at once instead of deleting its rows
+"""
+
+__RCSID__ = "$Id$"
+
+from DIRAC import gLogger, S_OK
+
+class JobIDPartitions( object ):
+
+  def __init__( self, db, tables, partitionSize, partitionsAhead = 2 ):
+    """ db is the MySQL DB holding the tables, partitionSize the number of JobIDs of
+        each block and partitionsAhead the number of blocks created in advance
+    """
+    self.__db = db
+    self.__tables = list( tables )
+    self.__partitionSize = max( 1, int( partitionSize ) )
+    self.__partitionsAhead = max( 1, partitionsAhead )
+    #Tables known to be partitioned, they never go back
+    self.__partitioned = set()
+    self.log = gLogger.getSubLogger( "JobIDPartitions" )
+
+  def getTables( self ):
+    return list( self.__tables )
+
+  def getPartitionedTables( self ):
+    """ Tables that are already partitioned in the DB. Until a table is, its records
+        have to be deleted as usual
+    """
+    for table in self.__tables:
+      if table in self.__partitioned:
+        continue
+      result = self.__db._getRangePartitions( table )
+      if not result[ 'OK' ]:
+        return result
+      if result[ 'Value' ]:
+        self.__partitioned.add( table )
+    return S_OK( [ table for table in self.__tables if table in self.__partitioned ] )
+
+  def getBoundaries( self, maxJobID ):
+    """ Upper bounds of the blocks up to the one of maxJobID plus the ones ahead
+    """
+    lastBlock = int( maxJobID ) // self.__partitionSize + self.__partitionsAhead
+    return [ block * self.__partitionSize for block in range( 1, lastBlock + 1 ) ]
+
+  def check( self, maxJobID ):
+    """ Partition the tables that are not yet, and add the partitions of the coming jobs
+    """
+    boundaries = self.getBoundaries( maxJobID )
+    added = 0
+    for table in self.__tables:
+      result = self.__db._getRangePartitions( table )
+      if not result[ 'OK' ]:
+        return result
+      if result[ 'Value' ]:
+        result = self.__db._addRangePartitions( table, boundaries )
+      else:
+        self.log.info( "Partitioning %s by blocks of %s JobIDs" % ( table, self.__partitionSize ) )
+        result = self.__db._partitionByRange( table, 'JobID', boundaries )
+      if not result[ 'OK' ]:
+        return result
+      self.__partitioned.add( table )
+      added += result[ 'Value' ]
+    return S_OK( added )
+
+  def dropUnused( self, maxJobID, hasJobsInRange ):
+    """ Drop the partitions of the blocks below maxJobID without jobs left.
+        hasJobsInRange( minJobID, maxJobID ) returns S_OK( True ) if a job of the range
+        is still in the JobDB
+    """
+    dropped = 0
+    for table in self.__tables:
+      result = self.__db._getRangePartitions( table )
+      if not result[ 'OK' ]:
+        return result
+      toDrop = []
+      lowBound = 0
+      for name, bound in result[ 'Value' ]:
+        #The block of maxJobID and the following ones still receive jobs
+        if bound is None or bound > maxJobID:
+          break
+        result = hasJobsInRange( lowBound, bound )
+        if not result[ 'OK' ]:
+          self.log.warn( "Cannot check the jobs of partition %s of %s" % ( name, table ), result[ 'Message' ] )
+        elif not result[ 'Value' ]:
+          toDrop.append( name )
+        lowBound = bound
+      if not toDrop:
+        continue
+      self.log.info( "Dropping partitions of %s" % table, ", ".join( toDrop ) )
+      result = self.__db._dropPartitions( table, toDrop )
+      if not result[ 'OK' ]:
+        return result
+      dropped += result[ 'Value' ]
+    return S_OK( dropped )
@@ -0,0 +1,323 @@
+""" In memory index of the task queues used by the Matcher
+
+    The task queue definitions are kept in inverted indexes ( value -> TQIds ) for the
+    multi value fields, the Setup, the owner group and the CPU time segments, so matching
+    a resource is a few set intersections instead of the TQ match query. The conditions
+    are the same ones the TaskQueueDB applies in SQL and the queues are returned in the
+    same RAND() / Priority order. Jobs are still extracted from the DB.
+"""
+
+__RCSID__ = "$Id$"
+
+import bisect
+import heapq
+import random
+import threading
+
+class TaskQueueIndex( object ):
+  """ Inverted index of the task queue definitions
+  """
+
+  def __init__( self, multiValueFields, tagFields, bannedJobFields, strictFields, jobSharingFunction = None ):
+    """ c'tor
+
+        :param multiValueFields: multi value match fields ( Site, Platform, ... )
+        :param tagFields: fields that match as tags ( all the TQ values have to be in the resource )
+        :param bannedJobFields: fields whose value can be banned by the jobs
+        :param strictFields: fields the TQs cannot require if the resource does not define them
+        :param jobSharingFunction: function telling if a group has the JobSharing property
+    """
+    self.__multiValueFields = tuple( multiValueFields )
+    self.__tagFields = tuple( tagFields )
+    self.__bannedJobFields = tuple( bannedJobFields )
+    self.__strictFields = tuple( strictFields )
+    if jobSharingFunction is None:
+      jobSharingFunction = self.__isJobSharingGroup
+    self.__jobSharingFunction = jobSharingFunction
+    self.__lock = threading.Lock()
+    self.__reset()
+
+  def __isJobSharingGroup( self, group ):
+    from DIRAC.Core.Security import Properties, CS
+    return Properties.JOB_SHARING in CS.getPropertiesForGroup( group )
+
+  def __reset( self ):
+    #TQId -> definition
+    self.__tqs = {}
+    #TQId -> 1 / Priority
+    self.__invPriorities = {}
+    self.__bySetup = {}
+    self.__byGroup = {}
+    self.__byDN = {}
+    self.__byCPUTime = {}
+    self.__cpuTimes = []
+    #Field -> value -> TQIds
+    self.__byValue = dict( [ ( field, {} ) for field in self.__multiValueFields + self.__bannedFields() ] )
+    #Field -> TQIds without values
+    self.__noValue = dict( [ ( field, set() ) for field in self.__multiValueFields ] )
+
+  def __bannedFields( self ):
+    return tuple( [ "Banned%s" % field for field in self.__bannedJobFields ] )
+
+  def __len__( self ):
+    return len( self.__tqs )
+
+  def getTQIds( self ):
+    self.__lock.acquire()
+    try:
+      return self.__tqs.keys()
+    finally:
+      self.__lock.release()
+
+  def getMaxTQId( self ):
+    self.__lock.acquire()
+    try:
+      if not self.__tqs:
+        return 0
+      return max( self.__tqs )
+    finally:
+      self.__lock.release()
+
+  def __toList( self, value ):
+    if isinstance( value, ( list, tuple, set, frozenset ) ):
+      return [ str( v ).strip() for v in value ]
+    return [ str( value ).strip() ]
+
+  def __insert( self, tqId, tqDef ):
+    """ Index a task queue, the lock has to be held
+        tqDef has the single value fields, the Priority and the multi value fields
+        named as the TQ tables ( Sites, BannedSites, Platforms... )
+    """
+    if tqId in self.__tqs:
+      self.__remove( tqId )
+    tq = { 'OwnerDN' : tqDef[ 'OwnerDN' ],
+           'OwnerGroup' : tqDef[ 'OwnerGroup' ],
+           'Setup' : tqDef[ 'Setup' ],
+           'CPUTime' : int( tqDef[ 'CPUTime' ] ) }
+    for field in self.__multiValueFields + self.__bannedFields():
+      values = frozenset( [ value for value in self.__toList( tqDef.get( "%ss" % field, [] ) ) if value ] )
+      tq[ field ] = values
+      for value in values:
+        self.__byValue[ field ].setdefault( value, set() ).add( tqId )
+      if not values and field in self.__noValue:
+        self.__noValue[ field ].add( tqId )
+    self.__tqs[ tqId ] = tq
+    self.__invPriorities[ tqId ] = 1.0 / max( float( tqDef.get( 'Priority', 1 ) ), 0.000001 )
+    self.__bySetup.setdefault( tq[ 'Setup' ], set() ).add( tqId )
+    self.__byGroup.setdefault( tq[ 'OwnerGroup' ], set() ).add( tqId )
+    self.__byDN.setdefault( tq[ 'OwnerDN' ], set() ).add( tqId )
+    cpuTime = tq[ 'CPUTime' ]
+    if cpuTime not in self.__byCPUTime:
+      self.__byCPUTime[ cpuTime ] = set()
+      bisect.insort( self.__cpuTimes, cpuTime )
+    self.__byCPUTime[ cpuTime ].add( tqId )
+
+  def __discard( self, indexDict, key, tqId ):
+    tqIds = indexDict.get( key )
+    if tqIds is None:
+      return False
+    tqIds.discard( tqId )
+    if not tqIds:
+      del indexDict[ key ]
+      return True
+    return False
+
+  def __remove( self, tqId ):
+    """ Drop a task queue from the indexes, the lock has to be held
+    """
+    tq = self.__tqs.pop( tqId, None )
+    if tq is None:
+      return False
+    self.__invPriorities.pop( tqId, None )
+    self.__discard( self.__bySetup, tq[ 'Setup' ], tqId )
+    self.__discard( self.__byGroup, tq[ 'OwnerGroup' ], tqId )
+    self.__discard( self.__byDN, tq[ 'OwnerDN' ], tqId )
+    if self.__discard( self.__byCPUTime, tq[ 'CPUTime' ], tqId ):
+      self.__cpuTimes.remove( tq[ 'CPUTime' ] )
+    for field in self.__multiValueFields + self.__bannedFields():
+      for value in tq[ field ]:
+        self.__discard( self.__byValue[ field ], value, tqId )
+      if field in self.__noValue:
+        self.__noValue[ field ].discard( tqId )
+    return True
+
+  def load( self, tqDefs ):
+    """ Replace the contents of the index with the { TQId : definition } given
+    """
+    self.__lock.acquire()
+    try:
+      self.__reset()
+      for tqId in tqDefs:
+        self.__insert( tqId, tqDefs[ tqId ] )
+    finally:
+      self.__lock.release()
+
+  def addTaskQueues( self, tqDefs ):
+    """ Add or replace the { TQId : definition } given
+    """
+    self.__lock.acquire()
+    try:
+      for tqId in tqDefs:
+        self.__insert( tqId, tqDefs[ tqId ] )
+    finally:
+      self.__lock.release()
+
+  def removeTaskQueue( self, tqId ):
+    self.__lock.acquire()
+    try:
+      return self.__remove( tqId )
+    finally:
+      self.__lock.release()
+
+  def setPriorities( self, priorities ):
+    """ Update the priorities with a { TQId : Priority } dict
+    """
+    self.__lock.acquire()
+    try:
+      for tqId in priorities:
+        if tqId in self.__invPriorities:
+          self.__invPriorities[ tqId ] = 1.0 / max( float( priorities[ tqId ] ), 0.000001 )
+    finally:
+      self.__lock.release()
+
+  def __buckets( self, indexDict, values ):
+    """ Sets of TQIds of the values, a TQ in any of them matches
+    """
+    return [ indexDict[ value ] for value in values if value in indexDict ]
+
+  def __intersection( self, indexDict, values ):
+    tqIds = None
+    for value in values:
+      if value not in indexDict:
+        return set()
+      if tqIds is None:
+        tqIds = set( indexDict[ value ] )
+      else:
+        tqIds.intersection_update( indexDict[ value ] )
+    return tqIds or set()
+
+  def __getCandidates( self, matchDict, sharingGroups ):
+    """ TQIds matching the resource, the lock has to be held
+    """
+    #Each restriction is a list of sets, the TQs have to be in one of them
+    restrictions = []
+    exclusions = []
+    if 'CPUTime' in matchDict:
+      maxCPUTime = max( [ int( v ) for v in self.__toList( matchDict[ 'CPUTime' ] ) ] )
+      restrictions.append( self.__buckets( self.__byCPUTime,
+                                           self.__cpuTimes[ :bisect.bisect_right( self.__cpuTimes, maxCPUTime ) ] ) )
+    if 'Setup' in matchDict:
+      restrictions.append( self.__buckets( self.__bySetup, self.__toList( matchDict[ 'Setup' ] ) ) )
+    if 'OwnerGroup' in matchDict:
+      restrictions.append( self.__buckets( self.__byGroup, self.__toList( matchDict[ 'OwnerGroup' ] ) ) )
+    if 'OwnerDN' in matchDict:
+      buckets = self.__buckets( self.__byDN, self.__toList( matchDict[ 'OwnerDN' ] ) )
+      #Groups with JobSharing match every TQ of the group
+      if 'OwnerGroup' in matchDict:
+        buckets.extend( self.__buckets( self.__byGroup, sharingGroups ) )
+      restrictions.append( buckets )
+    for field in self.__multiValueFields:
+      if field in matchDict and matchDict[ field ]:
+        values = self.__toList( matchDict[ field ] )
+        if field in self.__tagFields:
+          #All the tags of the TQ have to be provided by the resource
+          if values != [ "Any" ]:
+            exclusions.extend( [ self.__byValue[ field ][ tag ] for tag in self.__byValue[ field ] if tag not in values ] )
+          #Required tags have to be in the TQ
+          requiredTags = matchDict.get( "Required%s" % field )
+          for tag in self.__toList( requiredTags or [] ):
+            restrictions.append( self.__buckets( self.__byValue[ field ], [ tag ] ) )
+        else:
+          restrictions.append( self.__buckets( self.__byValue[ field ], values ) + [ self.__noValue[ field ] ] )
+        #TQs banning all the values
+        if field in self.__bannedJobFields:
+          exclusions.append( self.__intersection( self.__byValue[ "Banned%s" % field ], values ) )
+      elif field in self.__strictFields and field not in matchDict:
+        restrictions.append( [ self.__noValue[ field ] ] )
+      #Resource banning: TQs requiring all the banned values
+      bannedValues = matchDict.get( "Banned%s" % field )
+      if bannedValues:
+        exclusions.append( self.__intersection( self.__byValue[ field ], self.__toList( bannedValues ) ) )
+    if not restrictions:
+      candidates = set( self.__tqs )
+    else:
+      #Start with the smallest one and filter the candidates with the rest,
+      #set operations go through the smaller set
+      restrictions.sort( key = lambda buckets: sum( [ len( tqIds ) for tqIds in buckets ] ) )
+      candidates = set().union( *restrictions[0] )
+      for buckets in restrictions[1:]:
+        if not candidates:
+          break
+        if len( buckets ) == 1:
+          candidates.intersection_update( buckets[0] )
+        else:
+          candidates = set().union( *[ candidates.intersection( tqIds ) for tqIds in buckets ] )
+    for tqIds in exclusions:
+      if not candidates:
+        break
+      candidates = candidates.difference( tqIds )
+    return candidates
+
+  def __getNegativeExclusion( self, condDict ):
+    """ TQIds matching all the conditions of a negative condition dict, as
+        not ( cond1 and cond2 ) = ( not cond1 or not cond2 ) in the TaskQueueDB
+    """
+    singleValueIndexes = { 'OwnerDN' : self.__byDN,
+                           'OwnerGroup' : self.__byGroup,
+                           'Setup' : self.__bySetup,
+                           'CPUTime' : self.__byCPUTime }
+    excluded = None
+    for field in condDict:
+      values = self.__toList( condDict[ field ] )
+      if field in self.__multiValueFields:
+        tqIds = set().union( *self.__buckets( self.__byValue[ field ], values ) )
+      elif field in singleValueIndexes:
+        indexDict = singleValueIndexes[ field ]
+        if field == 'CPUTime':
+          values = [ long( value ) for value in values ]
+        #A TQ cannot be equal to different values
+        if len( set( values ) ) != 1:
+          tqIds = set()
+        else:
+          tqIds = set( indexDict.get( values[0], [] ) )
+      else:
+        continue
+      if excluded is None:
+        excluded = tqIds
+      else:
+        excluded.intersection_update( tqIds )
+    return excluded or set()
+
+  def match( self, matchDict, numQueuesToGet = 1, negativeCond = None ):
+    """ Get the task queues that match the resource as ( TQId, OwnerDN, OwnerGroup ) tuples,
+        numQueuesToGet = 0 returns all of them. The match dict has the raw ( not escaped ) values
+    """
+    matchDict = dict( matchDict )
+    for alias in ( 'LHCbPlatform', 'SystemConfig' ):
+      if alias in matchDict and 'Platform' not in matchDict:
+        matchDict[ 'Platform' ] = matchDict[ alias ]
+    sharingGroups = []
+    if 'OwnerDN' in matchDict and 'OwnerGroup' in matchDict:
+      sharingGroups = [ group for group in self.__toList( matchDict[ 'OwnerGroup' ] ) if self.__jobSharingFunction( group ) ]
+    if isinstance( negativeCond, dict ):
+      negativeCond = [ negativeCond ]
+    self.__lock.acquire()
+    try:
+      candidates = self.__getCandidates( matchDict, sharingGroups )
+      if negativeCond and candidates:
+        #Excluded if all the dicts are matched
+        excluded = self.__getNegativeExclusion( negativeCond[0] )
+        for condDict in negativeCond[1:]:
+          excluded.intersection_update( self.__getNegativeExclusion( condDict ) )
+        candidates.difference_update( excluded )
+      #Same order as RAND() / Priority
+      rand = random.random
+      invPriorities = self.__invPriorities
+      weighted = [ ( rand() * invPriorities[ tqId ], tqId ) for tqId in candidates ]
+      if numQueuesToGet:
+        weighted = heapq.nsmallest( numQueuesToGet, weighted )
+      else:
+        weighted.sort()
+      return [ ( tqId, self.__tqs[ tqId ][ 'OwnerDN' ], self.__tqs[ tqId ][ 'OwnerGroup' ] ) for _w, tqId in weighted ]
+    finally:
+      self.__lock.release()
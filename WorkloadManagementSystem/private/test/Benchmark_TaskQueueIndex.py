@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+""" Matching time of the TaskQueueIndex
+
+    Builds a fixture of task queues spread over sites, platforms, tags and CPU
+    segments and times the match of pilot like resources:
+
+      python Benchmark_TaskQueueIndex.py [numTaskQueues] [numMatches]
+
+    With "db" as first argument the fixture is the content of the configured
+    TaskQueueDB and the index is compared with the SQL match of the TQs:
+
+      python Benchmark_TaskQueueIndex.py db [numMatches]
+"""
+
+__RCSID__ = "$Id$"
+
+import sys
+import time
+import random
+
+from DIRAC.WorkloadManagementSystem.private.TaskQueueIndex import TaskQueueIndex
+
+MULTI_VALUE_FIELDS = ( 'GridCE', 'Site', 'GridMiddleware', 'Platform',
+                       'PilotType', 'SubmitPool', 'JobType', 'Tag' )
+CPU_SEGMENTS = ( 360, 1800, 3600, 21600, 86400, 259200 )
+SITES = [ "LCG.Site%d.org" % i for i in range( 200 ) ]
+PLATFORMS = [ "x86_64-slc5", "x86_64-slc6", "x86_64-centos7" ]
+JOB_TYPES = [ "User", "MCSimulation", "Merge", "DataReconstruction" ]
+GROUPS = [ "user", "prod", "admin" ]
+
+def getTaskQueueIndex():
+  return TaskQueueIndex( MULTI_VALUE_FIELDS, ( 'Tag', ), ( 'Site', ),
+                         ( 'SubmitPool', 'Platform', 'PilotType', 'Tag' ),
+                         jobSharingFunction = lambda group: group == "prod" )
+
+def generateFixture( numTQs ):
+  """ { TQId : definition } of numTQs random task queues """
+  tqDefs = {}
+  for tqId in range( 1, numTQs + 1 ):
+    group = random.choice( GROUPS )
+    tqDef = { 'OwnerDN' : "/DC=org/CN=user%d" % random.randint( 0, 100 ),
+              'OwnerGroup' : group,
+              'Setup' : "Production",
+              'CPUTime' : random.choice( CPU_SEGMENTS ),
+              'Priority' : random.uniform( 0.001, 1000 ),
+              'JobTypes' : [ random.choice( JOB_TYPES ) ] }
+    if random.random() < 0.5:
+      tqDef[ 'Sites' ] = random.sample( SITES, random.randint( 1, 5 ) )
+    elif random.random() < 0.3:
+      tqDef[ 'BannedSites' ] = random.sample( SITES, random.randint( 1, 10 ) )
+    if random.random() < 0.7:
+      tqDef[ 'Platforms' ] = random.sample( PLATFORMS, random.randint( 1, 2 ) )
+    if random.random() < 0.1:
+      tqDef[ 'Tags' ] = [ "MultiProcessor" ]
+    tqDefs[ tqId ] = tqDef
+  return tqDefs
+
+def generateResources( numMatches, setup = "Production" ):
+  resources = []
+  for _i in range( numMatches ):
+    resources.append( { 'Setup' : setup,
+                        'CPUTime' : random.choice( CPU_SEGMENTS ),
+                        'Site' : random.choice( SITES ),
+                        'Platform' : random.sample( PLATFORMS, 2 ),
+                        'Tag' : random.choice( [ [], [ "MultiProcessor" ] ] ),
+                        'OwnerGroup' : GROUPS,
+                        'OwnerDN' : "/DC=org/CN=user%d" % random.randint( 0, 100 ) } )
+  return resources
+
+def timeMatches( matchFunction, resources ):
+  """ Milliseconds per match and number of matched resources """
+  matched = 0
+  start = time.time()
+  for resourceDict in resources:
+    if matchFunction( resourceDict ):
+      matched += 1
+  return ( time.time() - start ) * 1000.0 / len( resources ), matched
+
+def runBenchmark( numTQs, numMatches ):
+  tqDefs = generateFixture( numTQs )
+  tqIndex = getTaskQueueIndex()
+  start = time.time()
+  tqIndex.load( tqDefs )
+  print "Loaded %s task queues in %.2f secs" % ( numTQs, time.time() - start )
+  resources = generateResources( numMatches )
+  for numQueues in ( 10, 0 ):
+    msPerMatch, matched = timeMatches( lambda rD: tqIndex.match( rD, numQueuesToGet = numQueues ), resources )
+    print "%-24s %10.3f ms/match %8d matched" % ( "index ( %s queues )" % ( numQueues or "all" ), msPerMatch, matched )
+
+def runDBBenchmark( numMatches ):
+  from DIRAC.Core.Base import Script
+  Script.parseCommandLine()
+  from DIRAC.WorkloadManagementSystem.DB.TaskQueueDB import TaskQueueDB
+  tqDB = TaskQueueDB()
+  result = tqDB.retrieveTaskQueues()
+  if not result[ 'OK' ]:
+    raise RuntimeError( result[ 'Message' ] )
+  tqData = result[ 'Value' ]
+  setups = list( set( [ tqData[ tqId ][ 'Setup' ] for tqId in tqData ] ) ) or [ "Production" ]
+  tqIndex = getTaskQueueIndex()
+  start = time.time()
+  result = tqDB.setTaskQueueIndex( tqIndex )
+  if not result[ 'OK' ]:
+    raise RuntimeError( result[ 'Message' ] )
+  print "Loaded %s task queues in %.2f secs" % ( result[ 'Value' ], time.time() - start )
+  resources = generateResources( numMatches, setup = random.choice( setups ) )
+  for name, matchFunction in ( ( "SQL", lambda rD: tqDB.matchAndGetTaskQueue( rD, numQueuesToGet = 10 )[ 'Value' ] ),
+                               ( "index", lambda rD: tqIndex.match( rD, numQueuesToGet = 10 ) ) ):
+    msPerMatch, matched = timeMatches( matchFunction, resources )
+    print "%-24s %10.3f ms/match %8d matched" % ( name, msPerMatch, matched )
+
+if __name__ == "__main__":
+  if len( sys.argv ) > 1 and sys.argv[1] == "db":
+    matches = 1000
+    if len( sys.argv ) > 2:
+      matches = int( sys.argv[2] )
+    runDBBenchmark( matches )
+  else:
+    tqs = 20000
+    matches = 10000
+    if len( sys.argv ) > 1:
+      tqs = int( sys.argv[1] )
+    if len( sys.argv ) > 2:
+      matches = int( sys.argv[2] )
+    runBenchmark( tqs, matches )
@@ -0,0 +1,82 @@
+""" Test cases for the buffering of the heart beats
+"""
+
+__RCSID__ = "$Id$"
+
+import time
+import unittest
+
+from DIRAC import S_OK, S_ERROR
+
+# sut
+from DIRAC.WorkloadManagementSystem.private.HeartBeatBuffer import HeartBeatBuffer
+
+class FakeJobDB( object ):
+
+  def __init__( self ):
+    self.written = []
+    self.fail = False
+
+  def setHeartBeatDataBulk( self, heartBeats ):
+    if self.fail:
+      return S_ERROR( "DB is down" )
+    self.written.append( [ heartBeat[0] for heartBeat in heartBeats ] )
+    return S_OK( len( heartBeats ) )
+
+class HeartBeatBufferTestCase( unittest.TestCase ):
+
+  def setUp( self ):
+    self.jobDB = FakeJobDB()
+    self.flushes = []
+
+  def __waitWritten( self, numWrites ):
+    for _i in range( 100 ):
+      if len( self.jobDB.written ) >= numWrites:
+        break
+      time.sleep( 0.01 )
+
+  def testFlushSize( self ):
+    """ heart beats are written together once flushSize of them are waiting """
+    hbBuffer = HeartBeatBuffer( self.jobDB, flushPeriod = 100, flushSize = 3,
+                                flushCallback = lambda num, _t: self.flushes.append( num ) )
+    hbBuffer.start()
+    for jobID in ( 1, 2, 3 ):
+      self.assert_( hbBuffer.add( jobID, {}, { 'CPU' : '1' } )[ 'OK' ] )
+    self.__waitWritten( 1 )
+    self.assertEqual( self.jobDB.written, [ [ 1, 2, 3 ] ] )
+    hbBuffer.add( 4, {}, {} )
+    self.assertEqual( len( hbBuffer ), 1 )
+    #What is left is written when stopping
+    self.assert_( hbBuffer.stop()[ 'OK' ] )
+    self.assertEqual( self.jobDB.written, [ [ 1, 2, 3 ], [ 4 ] ] )
+    self.assertEqual( self.flushes, [ 3, 1 ] )
+    stats = hbBuffer.getStats()
+    self.assertEqual( ( stats[ 'received' ], stats[ 'flushed' ], stats[ 'queued' ] ), ( 4, 4, 0 ) )
+
+  def testFlushPeriod( self ):
+    """ heart beats don't wait more than flushPeriod """
+    hbBuffer = HeartBeatBuffer( self.jobDB, flushPeriod = 0.05, flushSize = 100 )
+    hbBuffer.start()
+    hbBuffer.add( 1, {}, {} )
+    self.__waitWritten( 1 )
+    self.assertEqual( self.jobDB.written, [ [ 1 ] ] )
+    hbBuffer.stop()
+
+  def testFailures( self ):
+    """ heart beats are kept while the DB fails, up to maxSize """
+    hbBuffer = HeartBeatBuffer( self.jobDB, flushSize = 2, maxSize = 3 )
+    self.jobDB.fail = True
+    for jobID in ( 1, 2, 3 ):
+      self.assert_( hbBuffer.add( jobID, {}, {} )[ 'OK' ] )
+    self.assertFalse( hbBuffer.add( 4, {}, {} )[ 'OK' ] )
+    self.assertFalse( hbBuffer.flush()[ 'OK' ] )
+    self.assertEqual( len( hbBuffer ), 3 )
+    self.jobDB.fail = False
+    self.assertEqual( hbBuffer.flush()[ 'Value' ], 3 )
+    self.assertEqual( self.jobDB.written, [ [ 1, 2, 3 ] ] )
+    stats = hbBuffer.getStats()
+    self.assertEqual( ( stats[ 'failedFlushes' ], stats[ 'dropped' ] ), ( 1, 0 ) )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( HeartBeatBufferTestCase )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,84 @@
+""" Test cases for the partitioning of the tables by JobID
+"""
+
+__RCSID__ = "$Id$"
+
+import unittest
+
+from DIRAC import S_OK
+
+# sut
+from DIRAC.WorkloadManagementSystem.private.JobIDPartitions import JobIDPartitions
+
+class FakeDB( object ):
+  """ Keeps the partitions of the tables as MySQL does """
+
+  def __init__( self ):
+    self.partitions = {}
+
+  def _getRangePartitions( self, table ):
+    return S_OK( list( self.partitions.get( table, [] ) ) )
+
+  def _partitionByRange( self, table, field, boundaries ):
+    self.partitions[ table ] = [ ( "p%d" % bound, bound ) for bound in boundaries ] + [ ( "pmax", None ) ]
+    return S_OK( 0 )
+
+  def _addRangePartitions( self, table, boundaries ):
+    partitions = self.partitions[ table ][:-1]
+    lastBound = partitions and partitions[-1][1] or 0
+    newBounds = [ bound for bound in boundaries if bound > lastBound ]
+    self.partitions[ table ] = partitions + [ ( "p%d" % bound, bound ) for bound in newBounds ] + [ ( "pmax", None ) ]
+    return S_OK( len( newBounds ) )
+
+  def _dropPartitions( self, table, names ):
+    self.partitions[ table ] = [ part for part in self.partitions[ table ] if part[0] not in names ]
+    return S_OK( len( names ) )
+
+class JobIDPartitionsTestCase( unittest.TestCase ):
+
+  def setUp( self ):
+    self.db = FakeDB()
+    self.partitions = JobIDPartitions( self.db, [ 'LoggingInfo' ], 100 )
+
+  def __bounds( self ):
+    return [ bound for _name, bound in self.db.partitions[ 'LoggingInfo' ] ]
+
+  def testCheck( self ):
+    """ the tables are partitioned and extended ahead of the last job """
+    self.assertEqual( self.partitions.getBoundaries( 250 ), [ 100, 200, 300, 400 ] )
+    self.assert_( self.partitions.check( 250 )[ 'OK' ] )
+    self.assertEqual( self.__bounds(), [ 100, 200, 300, 400, None ] )
+    self.assertEqual( self.partitions.check( 320 )[ 'Value' ], 1 )
+    self.assertEqual( self.__bounds(), [ 100, 200, 300, 400, 500, None ] )
+    self.assertEqual( self.partitions.check( 320 )[ 'Value' ], 0 )
+
+  def testPartitionedTables( self ):
+    """ the records are only left to the partitions once the table is partitioned """
+    self.assertEqual( self.partitions.getPartitionedTables()[ 'Value' ], [] )
+    self.partitions.check( 50 )
+    self.assertEqual( self.partitions.getPartitionedTables()[ 'Value' ], [ 'LoggingInfo' ] )
+    #Partitioned by another process
+    partitions = JobIDPartitions( self.db, [ 'LoggingInfo', 'HeartBeatLoggingInfo' ], 100 )
+    self.assertEqual( partitions.getPartitionedTables()[ 'Value' ], [ 'LoggingInfo' ] )
+
+  def testDropUnused( self ):
+    """ only the blocks below the last job without jobs left are dropped """
+    self.partitions.check( 450 )
+    liveJobs = [ 150, 420 ]
+    checked = []
+    def hasJobsInRange( minJobID, maxJobID ):
+      checked.append( ( minJobID, maxJobID ) )
+      return S_OK( len( [ jobID for jobID in liveJobs if minJobID <= jobID < maxJobID ] ) > 0 )
+    self.assertEqual( self.partitions.dropUnused( 450, hasJobsInRange )[ 'Value' ], 3 )
+    self.assertEqual( checked, [ ( 0, 100 ), ( 100, 200 ), ( 200, 300 ), ( 300, 400 ) ] )
+    self.assertEqual( self.__bounds(), [ 200, 500, 600, None ] )
+    #Once the block of job 150 is empty it goes too, its range now starts at 0
+    liveJobs = [ 420 ]
+    del checked[:]
+    self.assertEqual( self.partitions.dropUnused( 450, hasJobsInRange )[ 'Value' ], 1 )
+    self.assertEqual( checked, [ ( 0, 200 ) ] )
+    self.assertEqual( self.__bounds(), [ 500, 600, None ] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( JobIDPartitionsTestCase )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
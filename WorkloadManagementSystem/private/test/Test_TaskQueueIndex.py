@@ -0,0 +1,80 @@
+""" Test cases for the in memory index of the task queues
+"""
+
+__RCSID__ = "$Id$"
+
+import unittest
+
+# sut
+from DIRAC.WorkloadManagementSystem.private.TaskQueueIndex import TaskQueueIndex
+
+#As defined in the TaskQueueDB
+multiValueMatchFields = ( 'GridCE', 'Site', 'GridMiddleware', 'Platform',
+                          'PilotType', 'SubmitPool', 'JobType', 'Tag' )
+
+def getTQDef( **kwargs ):
+  tqDef = { 'OwnerDN' : '/DN/user', 'OwnerGroup' : 'user', 'Setup' : 'Test', 'CPUTime' : 86400, 'Priority' : 1 }
+  tqDef.update( kwargs )
+  return tqDef
+
+class TaskQueueIndexTestCase( unittest.TestCase ):
+
+  def setUp( self ):
+    self.index = TaskQueueIndex( multiValueMatchFields, ( 'Tag', ), ( 'Site', ),
+                                 ( 'SubmitPool', 'Platform', 'PilotType', 'Tag' ),
+                                 jobSharingFunction = lambda group: group == 'prod' )
+    self.index.load( { 1 : getTQDef(),
+                       2 : getTQDef( Sites = [ 'A', 'B' ], CPUTime = 3600 ),
+                       3 : getTQDef( BannedSites = [ 'A' ], JobTypes = [ 'MC' ] ),
+                       4 : getTQDef( Platforms = [ 'slc6' ], Tags = [ 'MultiProcessor' ] ),
+                       5 : getTQDef( OwnerDN = '/DN/prod', OwnerGroup = 'prod', Setup = 'Other' ) } )
+
+  def __match( self, negativeCond = None, **kwargs ):
+    matchDict = { 'Setup' : 'Test', 'CPUTime' : 100000 }
+    matchDict.update( kwargs )
+    return sorted( [ tq[0] for tq in self.index.match( matchDict, numQueuesToGet = 0, negativeCond = negativeCond ) ] )
+
+  def testMatch( self ):
+    """ the conditions of the TaskQueueDB match are applied """
+    self.assertEqual( self.__match(), [ 1, 2, 3 ] )
+    self.assertEqual( self.__match( CPUTime = 7200 ), [ 2 ] )
+    self.assertEqual( self.__match( Site = 'A' ), [ 1, 2 ] )
+    self.assertEqual( self.__match( Site = 'C' ), [ 1, 3 ] )
+    self.assertEqual( self.__match( JobType = [ 'User', 'MC' ] ), [ 1, 2, 3 ] )
+    self.assertEqual( self.__match( JobType = 'User' ), [ 1, 2 ] )
+    self.assertEqual( self.__match( BannedJobType = 'MC' ), [ 1, 2 ] )
+    self.assertEqual( self.__match( Setup = 'None' ), [] )
+    #Platforms and tags of the TQ have to be provided by the resource
+    self.assertEqual( self.__match( Platform = 'slc6' ), [ 1, 2, 3 ] )
+    self.assertEqual( self.__match( Platform = 'slc6', Tag = [ 'MultiProcessor', 'GPU' ] ), [ 1, 2, 3, 4 ] )
+    self.assertEqual( self.__match( LHCbPlatform = 'slc6', Tag = 'MultiProcessor', RequiredTag = 'MultiProcessor' ), [ 4 ] )
+
+  def testOwner( self ):
+    """ TQs of groups with job sharing match any DN """
+    self.assertEqual( self.__match( OwnerDN = '/DN/other', OwnerGroup = 'user' ), [] )
+    self.assertEqual( self.__match( OwnerDN = '/DN/user', OwnerGroup = [ 'user', 'prod' ] ), [ 1, 2, 3 ] )
+    self.assertEqual( self.__match( OwnerDN = '/DN/other', OwnerGroup = 'prod', Setup = 'Other' ), [ 5 ] )
+
+  def testNegativeCond( self ):
+    """ TQs matching a negative condition dict, or all the dicts of a list, are excluded """
+    self.assertEqual( self.__match( negativeCond = { 'JobType' : [ 'MC' ] } ), [ 1, 2 ] )
+    self.assertEqual( self.__match( negativeCond = [ { 'JobType' : 'MC' }, { 'CPUTime' : [ 86400 ] } ] ), [ 1, 2 ] )
+    self.assertEqual( self.__match( negativeCond = { 'CPUTime' : [ 3600 ] } ), [ 1, 3 ] )
+
+  def testUpdates( self ):
+    """ TQs can be added, removed and reprioritized """
+    self.index.addTaskQueues( { 6 : getTQDef( Sites = [ 'C' ] ) } )
+    self.assertEqual( self.__match( Site = 'C' ), [ 1, 3, 6 ] )
+    self.assert_( self.index.removeTaskQueue( 6 ) )
+    self.assertFalse( self.index.removeTaskQueue( 6 ) )
+    self.assertEqual( self.__match( Site = 'C' ), [ 1, 3 ] )
+    self.assertEqual( self.index.getMaxTQId(), 5 )
+    self.index.setPriorities( { 1 : 1000000, 2 : 0.001, 3 : 0.001 } )
+    self.assertEqual( self.index.match( { 'Setup' : 'Test', 'CPUTime' : 100000 } )[0], ( 1, '/DN/user', 'user' ) )
+    self.index.load( {} )
+    self.assertEqual( len( self.index ), 0 )
+    self.assertEqual( self.__match(), [] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( TaskQueueIndexTestCase )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )